@@ -0,0 +1 @@
+"""Offline benchmarks of oju against a local fake provider server."""
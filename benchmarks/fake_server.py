@@ -0,0 +1,564 @@
+"""
+A local HTTP server that speaks the OpenAI, Anthropic and Gemini wire formats.
+
+The server answers the chat completions, messages and generateContent
+endpoints with canned text, optionally after a fixed latency, as a stream of
+server-sent events (or, for Gemini, a streamed JSON array) and with injected
+rate limit or server errors. Prompt caching is simulated too: repeated large
+OpenAI prefixes and Anthropic ``cache_control`` blocks are reported as cache
+reads, and Gemini cached contents can be created, extended and referenced. It
+lets the benchmarks and integration tests drive ``oju`` through the real SDK
+code paths without network access.
+
+Point the SDKs at it with ``base_url``:
+
+* OpenAI: ``server.url + "/v1"``
+* Anthropic: ``server.url``
+* Gemini: ``server.url`` (sync REST transport only)
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+
+@dataclass
+class FakeServerConfig:
+    """
+    Behaviour of the fake provider server.
+
+    Attributes:
+        latency: Seconds to wait before sending the response headers.
+        chunk_interval: Seconds between streamed chunks.
+        response_words: Number of words in every completion.
+        error_rate: Fraction of requests answered with an error.
+        error_status: HTTP status of injected errors (429 or 5xx).
+        retry_after: Value of the Retry-After header sent with injected errors.
+        seed: Seed for the error injection, for reproducible runs.
+    """
+
+    latency: float = 0.0
+    chunk_interval: float = 0.0
+    response_words: int = 50
+    error_rate: float = 0.0
+    error_status: int = 429
+    retry_after: Optional[float] = None
+    seed: Optional[int] = None
+
+
+_GEMINI_PATH = re.compile(r"^/v1beta/models/(?P<model>[^:]+):(?P<method>\w+)")
+_GEMINI_CACHE_PATH = "/v1beta/cachedContents"
+# Smallest OpenAI prompt prefix, in tokens, that is cached automatically
+_OPENAI_CACHE_MIN_TOKENS = 1024
+_GEMINI_STATUS = {
+    400: "INVALID_ARGUMENT",
+    429: "RESOURCE_EXHAUSTED",
+    500: "INTERNAL",
+    503: "UNAVAILABLE",
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; avoid Nagle/delayed-ACK stalls
+    disable_nagle_algorithm = True
+    server: "_Server"
+    request_index = 0
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        path = self.path.split("?", 1)[0]
+        started = time.perf_counter()
+        self.request_index = self.server.fake._arrived(path)
+        try:
+            self._handle(path, body)
+        finally:
+            self.server.fake._record(time.perf_counter() - started)
+
+    def do_PATCH(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        path = self.path.split("?", 1)[0]
+        started = time.perf_counter()
+        self.server.fake._arrived(path)
+        try:
+            content = self.server.fake._extend_cached_content(
+                path[len("/v1beta/"):], body
+            )
+            if content is None:
+                self._send_json(404, {"error": {
+                    "code": 404,
+                    "message": "Cached content not found",
+                    "status": "NOT_FOUND",
+                }})
+            else:
+                self._send_json(200, content)
+        finally:
+            self.server.fake._record(time.perf_counter() - started)
+
+    def _handle(self, path: str, body: Dict[str, Any]) -> None:
+        fake = self.server.fake
+        config = fake.config
+        if config.latency:
+            time.sleep(config.latency)
+
+        if path == _GEMINI_CACHE_PATH:
+            self._send_json(200, fake._create_cached_content(body))
+            return
+
+        match = _GEMINI_PATH.match(path)
+        if path.endswith("/chat/completions"):
+            provider = "openai"
+        elif path.endswith("/messages"):
+            provider = "claude"
+        elif match is not None:
+            provider = "gemini"
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {path}"}})
+            return
+
+        if fake._should_fail():
+            self._send_error(provider, config)
+            return
+
+        words = fake.words()
+        usage = fake._prompt_usage(provider, body)
+        if provider == "openai":
+            model = body.get("model", "")
+            if body.get("stream"):
+                self._send_events(_openai_events(model, words, usage), config)
+            else:
+                self._send_json(
+                    200, _openai_completion(model, words, usage),
+                    {"x-request-id": f"req_{self.request_index}"},
+                )
+        elif provider == "claude":
+            model = body.get("model", "")
+            if body.get("stream"):
+                self._send_events(_claude_events(model, words, usage), config)
+            else:
+                self._send_json(
+                    200, _claude_message(model, words, usage),
+                    {"request-id": f"req_{self.request_index}"},
+                )
+        elif match.group("method") == "streamGenerateContent":
+            self._send_json_array(_gemini_chunks(words, usage), config)
+        else:
+            self._send_json(200, _gemini_response("".join(words), usage, len(words)))
+
+    def _send_json(
+        self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None
+    ) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, provider: str, config: FakeServerConfig) -> None:
+        status = config.error_status
+        headers = {}
+        if config.retry_after is not None:
+            headers["retry-after"] = str(config.retry_after)
+        message = "Rate limit reached" if status == 429 else "Injected server error"
+        if provider == "openai":
+            payload: Dict[str, Any] = {
+                "error": {"message": message, "type": "requests", "code": str(status)}
+            }
+        elif provider == "claude":
+            error_type = "rate_limit_error" if status == 429 else "api_error"
+            payload = {
+                "type": "error", "error": {"type": error_type, "message": message}
+            }
+        else:
+            payload = {
+                "error": {
+                    "code": status,
+                    "message": message,
+                    "status": _GEMINI_STATUS.get(status, "UNKNOWN"),
+                }
+            }
+        self._send_json(status, payload, headers)
+
+    def _start_chunked(self, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _send_events(
+        self, events: Iterator[Tuple[Optional[str], Any]], config: FakeServerConfig
+    ) -> None:
+        self._start_chunked("text/event-stream")
+        for index, (name, data) in enumerate(events):
+            if index and config.chunk_interval:
+                time.sleep(config.chunk_interval)
+            text = data if isinstance(data, str) else json.dumps(data)
+            event = f"event: {name}\n" if name else ""
+            self._write_chunk(f"{event}data: {text}\n\n".encode("utf-8"))
+        self._write_chunk(b"")
+
+    def _send_json_array(self, items: Iterator[Any], config: FakeServerConfig) -> None:
+        self._start_chunked("application/json")
+        self._write_chunk(b"[")
+        for index, item in enumerate(items):
+            if index and config.chunk_interval:
+                time.sleep(config.chunk_interval)
+            prefix = b",\r\n" if index else b""
+            self._write_chunk(prefix + json.dumps(item).encode("utf-8"))
+        self._write_chunk(b"]")
+        self._write_chunk(b"")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+    fake: "FakeProviderServer"
+
+
+@dataclass
+class PromptUsage:
+    """
+    Prompt token counts of one request.
+
+    Attributes:
+        tokens: Prompt tokens, including cached ones.
+        cache_read: Tokens served from the simulated prompt cache.
+        cache_write: Tokens written to the simulated prompt cache.
+    """
+
+    tokens: int
+    cache_read: int = 0
+    cache_write: int = 0
+
+
+def _count_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def _claude_system_text(system: Any) -> str:
+    if isinstance(system, list):
+        return "".join(block.get("text", "") for block in system)
+    return str(system or "")
+
+
+def _count_prompt_tokens(provider: str, body: Dict[str, Any]) -> int:
+    if provider == "openai":
+        text = " ".join(str(m.get("content", "")) for m in body.get("messages", []))
+    elif provider == "claude":
+        text = _claude_system_text(body.get("system")) + " ".join(
+            str(m.get("content", "")) for m in body.get("messages", [])
+        )
+    else:
+        text = json.dumps(body.get("contents", "")) + json.dumps(
+            body.get("systemInstruction", "")
+        )
+    return max(_count_tokens(text), 1)
+
+
+def _openai_usage(usage: PromptUsage, output_tokens: int) -> Dict[str, Any]:
+    return {
+        "prompt_tokens": usage.tokens,
+        "completion_tokens": output_tokens,
+        "total_tokens": usage.tokens + output_tokens,
+        "prompt_tokens_details": {"cached_tokens": usage.cache_read},
+    }
+
+
+def _openai_completion(
+    model: str, words: List[str], usage: PromptUsage
+) -> Dict[str, Any]:
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(words)},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": _openai_usage(usage, len(words)),
+    }
+
+
+def _openai_events(
+    model: str, words: List[str], usage: PromptUsage
+) -> Iterator[Tuple[Optional[str], Any]]:
+    base = {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": model,
+    }
+    for word in words:
+        delta = {"index": 0, "delta": {"content": word}, "finish_reason": None}
+        yield None, {**base, "choices": [delta]}
+    yield None, {
+        **base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+    }
+    yield None, {**base, "choices": [], "usage": _openai_usage(usage, len(words))}
+    yield None, "[DONE]"
+
+
+def _claude_message(model: str, words: List[str], usage: PromptUsage) -> Dict[str, Any]:
+    return {
+        "id": "msg_fake",
+        "type": "message",
+        "role": "assistant",
+        "model": model,
+        "content": [{"type": "text", "text": "".join(words)}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        # Claude reports cached prompt tokens separately from input_tokens
+        "usage": {
+            "input_tokens": usage.tokens - usage.cache_read - usage.cache_write,
+            "cache_read_input_tokens": usage.cache_read,
+            "cache_creation_input_tokens": usage.cache_write,
+            "output_tokens": len(words),
+        },
+    }
+
+
+def _claude_events(
+    model: str, words: List[str], usage: PromptUsage
+) -> Iterator[Tuple[Optional[str], Any]]:
+    message = _claude_message(model, [], usage)
+    message["stop_reason"] = None
+    message["usage"]["output_tokens"] = 1
+    yield "message_start", {"type": "message_start", "message": message}
+    yield "content_block_start", {
+        "type": "content_block_start",
+        "index": 0,
+        "content_block": {"type": "text", "text": ""},
+    }
+    for word in words:
+        yield "content_block_delta", {
+            "type": "content_block_delta",
+            "index": 0,
+            "delta": {"type": "text_delta", "text": word},
+        }
+    yield "content_block_stop", {"type": "content_block_stop", "index": 0}
+    yield "message_delta", {
+        "type": "message_delta",
+        "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+        "usage": {"output_tokens": len(words)},
+    }
+    yield "message_stop", {"type": "message_stop"}
+
+
+def _gemini_response(
+    text: str,
+    usage: PromptUsage,
+    output_tokens: int,
+    finish_reason: Optional[str] = "STOP",
+) -> Dict[str, Any]:
+    candidate: Dict[str, Any] = {
+        "content": {"parts": [{"text": text}], "role": "model"},
+        "index": 0,
+    }
+    if finish_reason:
+        candidate["finishReason"] = finish_reason
+    return {
+        "candidates": [candidate],
+        "usageMetadata": {
+            "promptTokenCount": usage.tokens,
+            "cachedContentTokenCount": usage.cache_read,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": usage.tokens + output_tokens,
+        },
+    }
+
+
+def _gemini_chunks(words: List[str], usage: PromptUsage) -> Iterator[Dict[str, Any]]:
+    for index, word in enumerate(words):
+        last = index == len(words) - 1
+        yield _gemini_response(word, usage, index + 1, "STOP" if last else None)
+
+
+class FakeProviderServer:
+    """
+    A fake OpenAI/Anthropic/Gemini endpoint running on a background thread.
+
+    Use it as a context manager; ``url`` is available once it has started.
+    ``requests``, ``paths`` and ``busy_time`` count the requests served and
+    the seconds spent handling them, which the benchmarks subtract from the
+    client-observed latency.
+    """
+
+    def __init__(
+        self,
+        config: Optional[FakeServerConfig] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        """
+        Initialize the server without starting it.
+
+        Args:
+            config: Latency, streaming and error injection settings.
+            host: Interface to bind.
+            port: Port to bind; 0 picks a free one.
+        """
+        self.config = config or FakeServerConfig()
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.busy_time = 0.0
+        self.paths: Dict[str, int] = {}
+        # Gemini cached content name -> (token count, expiry time)
+        self.cached_contents: Dict[str, Tuple[int, float]] = {}
+        self._prompt_prefixes: Set[str] = set()
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._server: Optional[_Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Base URL of the running server."""
+        if self._server is None:
+            raise RuntimeError("The fake server is not running")
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def words(self) -> List[str]:
+        """Return the completion text, one list item per streamed chunk."""
+        return [f"word{i} " for i in range(self.config.response_words)]
+
+    def start(self) -> "FakeProviderServer":
+        """Bind the socket and start serving on a daemon thread."""
+        self._server = _Server((self.host, self.port), _Handler)
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving and close the socket."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FakeProviderServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def reset_stats(self) -> None:
+        """Zero the request counters."""
+        with self._lock:
+            self.requests = 0
+            self.busy_time = 0.0
+            self.paths = {}
+
+    def mean_busy_time(self) -> float:
+        """Mean seconds spent handling a request since the last reset."""
+        with self._lock:
+            return self.busy_time / self.requests if self.requests else 0.0
+
+    def _arrived(self, path: str) -> int:
+        """Count a request as soon as it arrives; return its 0-based index."""
+        with self._lock:
+            self.requests += 1
+            self.paths[path] = self.paths.get(path, 0) + 1
+            return self.requests - 1
+
+    def _record(self, elapsed: float) -> None:
+        with self._lock:
+            self.busy_time += elapsed
+
+    def _seen_prefix(self, prefix: str) -> bool:
+        """Remember a cacheable prompt prefix; return whether it was already cached."""
+        with self._lock:
+            seen = prefix in self._prompt_prefixes
+            self._prompt_prefixes.add(prefix)
+        return seen
+
+    def _prompt_usage(self, provider: str, body: Dict[str, Any]) -> PromptUsage:
+        usage = PromptUsage(_count_prompt_tokens(provider, body))
+        if provider == "openai":
+            messages = body.get("messages", [])
+            if messages and messages[0].get("role") == "system":
+                prefix = str(messages[0].get("content", ""))
+                tokens = _count_tokens(prefix)
+                if tokens >= _OPENAI_CACHE_MIN_TOKENS and self._seen_prefix(
+                    "openai" + prefix
+                ):
+                    usage.cache_read = tokens
+        elif provider == "claude":
+            system = body.get("system")
+            if isinstance(system, list) and any("cache_control" in b for b in system):
+                prefix = _claude_system_text(system)
+                tokens = _count_tokens(prefix)
+                if self._seen_prefix("claude" + prefix):
+                    usage.cache_read = tokens
+                else:
+                    usage.cache_write = tokens
+        else:
+            name = body.get("cachedContent")
+            with self._lock:
+                cached = self.cached_contents.get(name) if name else None
+            if cached is not None:
+                usage.cache_read = cached[0]
+                usage.tokens += cached[0]
+        return usage
+
+    def _cached_content(
+        self, name: str, model: str, tokens: int, expires: float
+    ) -> Dict[str, Any]:
+        return {
+            "name": name,
+            "model": model,
+            "expireTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(expires)),
+            "usageMetadata": {"totalTokenCount": tokens},
+        }
+
+    def _create_cached_content(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        text = json.dumps(body.get("systemInstruction", "")) + json.dumps(
+            body.get("contents", "")
+        )
+        tokens = _count_tokens(text)
+        expires = time.time() + float(str(body.get("ttl", "3600s")).rstrip("s"))
+        with self._lock:
+            name = f"cachedContents/fake-{len(self.cached_contents)}"
+            self.cached_contents[name] = (tokens, expires)
+        return self._cached_content(name, body.get("model", ""), tokens, expires)
+
+    def _extend_cached_content(
+        self, name: str, body: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cached = self.cached_contents.get(name)
+            if cached is None:
+                return None
+            expires = time.time() + float(str(body.get("ttl", "3600s")).rstrip("s"))
+            self.cached_contents[name] = (cached[0], expires)
+        return self._cached_content(name, "", cached[0], expires)
+
+    def _should_fail(self) -> bool:
+        if not self.config.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.config.error_rate
@@ -0,0 +1,376 @@
+"""
+Offline benchmarks of oju's own overhead.
+
+Starts a :class:`~benchmarks.fake_server.FakeProviderServer` on localhost and
+drives :func:`oju.agent.Agent` (or ``AsyncAgent``) through the real OpenAI,
+Anthropic and Gemini SDKs at rising concurrency. For every provider and
+concurrency level it reports throughput, p50/p99 latency and the per-call
+overhead, i.e. the client-observed latency minus the time the server spent on
+the request.
+
+Run from the repository root::
+
+    python -m benchmarks.run
+    python -m benchmarks.run --providers openai --concurrency 1 16 64 --stream
+    python -m benchmarks.run --session
+    python -m benchmarks.run --quick --max-overhead-ms 25 --json results.json
+
+With ``--max-overhead-ms`` the exit status is 1 if any level's median overhead
+exceeds the budget, which lets CI catch performance regressions.
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import math
+import sys
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from benchmarks.fake_server import FakeProviderServer, FakeServerConfig
+
+PROVIDERS = ("openai", "claude", "gemini")
+
+MODELS = {
+    "openai": "gpt-4o-mini",
+    "claude": "claude-3-5-haiku-latest",
+    "gemini": "gemini-1.5-flash",
+}
+
+SYSTEM_PROMPT = "You are a concise assistant used for benchmarking."
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Return the nearest-rank percentile ``q`` (0-100) of the values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100.0 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+@dataclass
+class LevelResult:
+    """
+    Measurements for one provider at one concurrency level.
+
+    Attributes:
+        provider: Provider name.
+        mode: 'sync' or 'async', plus '+session' when calling an AgentSession
+            and '+stream' when streaming.
+        concurrency: Requests in flight at once.
+        requests: Requests sent.
+        errors: Requests that raised.
+        wall_time: Seconds for the whole level.
+        server_time: Mean seconds the server spent per request.
+        latencies: Client-observed seconds per request.
+    """
+
+    provider: str
+    mode: str
+    concurrency: int
+    requests: int
+    errors: int
+    wall_time: float
+    server_time: float
+    latencies: List[float] = field(default_factory=list, repr=False)
+
+    @property
+    def throughput(self) -> float:
+        """Completed requests per second."""
+        return self.requests / self.wall_time if self.wall_time else 0.0
+
+    @property
+    def p50(self) -> float:
+        return percentile(self.latencies, 50)
+
+    @property
+    def p99(self) -> float:
+        return percentile(self.latencies, 99)
+
+    @property
+    def overhead(self) -> float:
+        """Median client latency minus mean server time, in seconds."""
+        return max(self.p50 - self.server_time, 0.0)
+
+    def summary(self) -> Dict[str, Any]:
+        """Return the result as a JSON-friendly dict without raw latencies."""
+        data = asdict(self)
+        del data["latencies"]
+        data.update(
+            throughput=self.throughput,
+            p50=self.p50,
+            p99=self.p99,
+            overhead=self.overhead,
+        )
+        return data
+
+
+def _base_url(server: FakeProviderServer, provider: str) -> str:
+    return server.url + "/v1" if provider == "openai" else server.url
+
+
+def _agent_kwargs(
+    server: FakeProviderServer, provider: str, stream: bool, retry: Any
+) -> Dict[str, Any]:
+    kwargs: Dict[str, Any] = {
+        "agent_name": "benchmark",
+        "model": MODELS[provider],
+        "provider": provider,
+        "api_key": "benchmark-key",
+        "custom_system_prompt": SYSTEM_PROMPT,
+        "stream": stream,
+        "base_url": _base_url(server, provider),
+    }
+    if retry is not None:
+        kwargs["retry"] = retry
+    return kwargs
+
+
+def _session_kwargs(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    return {name: value for name, value in kwargs.items() if name != "stream"}
+
+
+def run_sync_level(
+    server: FakeProviderServer,
+    provider: str,
+    concurrency: int,
+    requests: int,
+    stream: bool = False,
+    retry: Any = None,
+    session: bool = False,
+) -> LevelResult:
+    """
+    Send ``requests`` calls through ``Agent`` from ``concurrency`` threads.
+
+    With ``session`` the calls go through one shared ``AgentSession`` instead.
+    """
+    from oju.agent import Agent, AgentSession
+
+    kwargs = _agent_kwargs(server, provider, stream, retry)
+    call = Agent
+    if session:
+        call = functools.partial(AgentSession(**_session_kwargs(kwargs)), stream=stream)
+
+    def one(index: int) -> Optional[float]:
+        started = time.perf_counter()
+        try:
+            if session:
+                response = call(f"Benchmark request {index}")
+            else:
+                response = call(prompt_input=f"Benchmark request {index}", **kwargs)
+            if stream:
+                response.read()
+        except Exception:
+            return None
+        return time.perf_counter() - started
+
+    server.reset_stats()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(one, range(requests)))
+    wall_time = time.perf_counter() - started
+    mode = "sync+session" if session else "sync"
+    return _level_result(
+        server, provider, mode, stream, concurrency, outcomes, wall_time
+    )
+
+
+def run_async_level(
+    server: FakeProviderServer,
+    provider: str,
+    concurrency: int,
+    requests: int,
+    stream: bool = False,
+    retry: Any = None,
+    session: bool = False,
+) -> LevelResult:
+    """
+    Send ``requests`` calls through ``AsyncAgent`` with ``concurrency`` in flight.
+
+    With ``session`` the calls go through one shared ``AgentSession`` instead.
+    """
+    from oju.agent import AgentSession, AsyncAgent
+
+    kwargs = _agent_kwargs(server, provider, stream, retry)
+    shared = AgentSession(**_session_kwargs(kwargs)) if session else None
+
+    async def main() -> List[Optional[float]]:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(index: int) -> Optional[float]:
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    prompt_input = f"Benchmark request {index}"
+                    if shared is not None:
+                        response = await shared.acall(prompt_input, stream=stream)
+                    else:
+                        response = await AsyncAgent(prompt_input=prompt_input, **kwargs)
+                    if stream:
+                        await response.read()
+                except Exception:
+                    return None
+                return time.perf_counter() - started
+
+        return await asyncio.gather(*(one(i) for i in range(requests)))
+
+    server.reset_stats()
+    started = time.perf_counter()
+    outcomes = asyncio.run(main())
+    wall_time = time.perf_counter() - started
+    mode = "async+session" if session else "async"
+    return _level_result(
+        server, provider, mode, stream, concurrency, outcomes, wall_time
+    )
+
+
+def _level_result(
+    server: FakeProviderServer,
+    provider: str,
+    mode: str,
+    stream: bool,
+    concurrency: int,
+    outcomes: List[Optional[float]],
+    wall_time: float,
+) -> LevelResult:
+    latencies = [latency for latency in outcomes if latency is not None]
+    return LevelResult(
+        provider=provider,
+        mode=mode + ("+stream" if stream else ""),
+        concurrency=concurrency,
+        requests=len(outcomes),
+        errors=len(outcomes) - len(latencies),
+        wall_time=wall_time,
+        server_time=server.mean_busy_time(),
+        latencies=latencies,
+    )
+
+
+def format_table(results: Sequence[LevelResult]) -> str:
+    """Render results as a fixed-width text table."""
+    header = (
+        f"{'provider':<8} {'mode':<20} {'conc':>5} {'reqs':>6} {'errors':>6} "
+        f"{'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'overhead ms':>11}"
+    )
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(
+            f"{r.provider:<8} {r.mode:<20} {r.concurrency:>5} {r.requests:>6} "
+            f"{r.errors:>6} "
+            f"{r.throughput:>9.1f} {r.p50 * 1000:>8.2f} {r.p99 * 1000:>8.2f} "
+            f"{r.overhead * 1000:>11.2f}"
+        )
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run",
+        description="Benchmark oju against a local fake provider server.",
+    )
+    parser.add_argument(
+        "--providers", nargs="+", choices=PROVIDERS, default=list(PROVIDERS)
+    )
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16, 64])
+    parser.add_argument(
+        "--requests", type=int, default=None,
+        help="requests per level (default: max(50, 4 x concurrency))",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="server latency in seconds"
+    )
+    parser.add_argument("--chunk-interval", type=float, default=0.0)
+    parser.add_argument("--words", type=int, default=50, help="words per completion")
+    parser.add_argument(
+        "--stream", action="store_true", help="benchmark streaming calls"
+    )
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="use AsyncAgent (Gemini is skipped: no async REST "
+                        "transport)")
+    parser.add_argument("--session", action="store_true",
+                        help="call one shared AgentSession instead of Agent")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--retries", type=int, default=0,
+                        help="retry failed calls up to N times with a short backoff")
+    parser.add_argument("--quick", action="store_true",
+                        help="small run for CI: concurrency 1 and 8, 40 requests")
+    parser.add_argument("--json", metavar="PATH", help="also write results as JSON")
+    parser.add_argument("--max-overhead-ms", type=float, default=None,
+                        help="exit with status 1 if any median overhead exceeds this")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.concurrency = [1, 8]
+        args.requests = args.requests or 40
+    return args
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Run the benchmarks and return the process exit status."""
+    args = parse_args(argv)
+    # google-generativeai warns about its deprecation on import
+    warnings.simplefilter("ignore", FutureWarning)
+
+    from oju.retry import RetryPolicy
+
+    retry = None
+    if args.retries:
+        retry = RetryPolicy(
+            max_attempts=args.retries + 1,
+            initial_delay=0.01,
+            max_delay=0.1,
+            deadline=None,
+        )
+    config = FakeServerConfig(
+        latency=args.latency,
+        chunk_interval=args.chunk_interval,
+        response_words=args.words,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=0,
+    )
+    run_level = run_async_level if args.use_async else run_sync_level
+    providers = [
+        p for p in args.providers if not (args.use_async and p == "gemini")
+    ]
+
+    results = []
+    with FakeProviderServer(config) as server:
+        for provider in providers:
+            # Warm up imports, clients and connections outside the measurement
+            run_level(server, provider, 1, 3, args.stream, retry, args.session)
+            for concurrency in args.concurrency:
+                requests = args.requests or max(50, 4 * concurrency)
+                results.append(
+                    run_level(
+                        server, provider, concurrency, requests, args.stream, retry,
+                        args.session,
+                    )
+                )
+                print(format_table(results[-1:]).splitlines()[-1], file=sys.stderr)
+
+    print(format_table(results))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([r.summary() for r in results], f, indent=2)
+
+    if args.max_overhead_ms is not None:
+        slow = [r for r in results if r.overhead * 1000 > args.max_overhead_ms]
+        for r in slow:
+            print(
+                f"Overhead budget exceeded: {r.provider} {r.mode} x{r.concurrency} "
+                f"{r.overhead * 1000:.2f} ms > {args.max_overhead_ms} ms",
+                file=sys.stderr,
+            )
+        if slow:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+"""Allow ``python -m oju`` as an alternative to the ``oju`` command."""
+
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -1,80 +1,1011 @@
-import os
-from typing import Optional
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 from . import providers
+from . import metrics
+from .cache import ResponseCache
+from .circuit import CircuitBreaker
+from .coalesce import SingleFlight
+from .deadline import (
+    CallCancelledError,
+    CancelToken,
+    Deadline,
+    DeadlineExceededError,
+    aguard_stream,
+    call_cancellable,
+    guard_stream,
+    resolve_deadline,
+    run_cancellable,
+)
+from .keypool import KeyPool
+from .prompt_cache import prompt_cache
+from .ratelimit import RateLimiter
+from .retry import RetryPolicy, RetryStats
+from .semantic_cache import SemanticCache
+from .streaming import AsyncTextStream, TextStream
+from .tokens import Preflight, TokenBudget
+
+
+@dataclass
+class AgentResult:
+    """
+    The response of an agent call with its metadata, normalized across providers.
+
+    Returned by :func:`Agent` and :func:`AsyncAgent` when ``return_result`` is
+    True. ``str(result)`` is the response text.
+
+    Attributes:
+        text: The generated response.
+        provider: Provider name (e.g., 'openai').
+        model: Model name.
+        finish_reason: Why the model stopped: 'stop', 'length', 'tool_calls'
+            or 'content_filter' (see :func:`oju.providers.normalize_finish_reason`).
+        stop_reason: The finish reason exactly as the provider reported it.
+        input_tokens: Prompt tokens, including cached ones, if reported.
+        output_tokens: Completion tokens, if reported.
+        cached_tokens: Prompt tokens served from the provider's prompt cache,
+            if reported.
+        cache_write_tokens: Prompt tokens written to the provider's prompt
+            cache, if reported.
+        request_id: The provider's request ID, if it returns one.
+        duration: Wall-clock seconds for the whole call, including queueing
+            and retries.
+        time_to_first_byte: Seconds from sending the final attempt to its
+            response; ``None`` for cache hits.
+        queue_wait: Seconds spent waiting for rate limit budget.
+        retries: Attempts made after the first one.
+        cache_hit: Whether the response came from a ResponseCache, in which
+            case only ``text`` and the timings are set.
+    """
+
+    text: str
+    provider: str
+    model: str
+    finish_reason: Optional[str] = None
+    stop_reason: Optional[str] = None
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    cache_write_tokens: Optional[int] = None
+    request_id: Optional[str] = None
+    duration: float = 0.0
+    time_to_first_byte: Optional[float] = None
+    queue_wait: float = 0.0
+    retries: int = 0
+    cache_hit: bool = False
+
+    @property
+    def truncated(self) -> bool:
+        """Whether the response was cut off by the output token limit."""
+        return self.finish_reason == "length"
+
+    def __str__(self) -> str:
+        return self.text
+
+
+def _agent_result(
+    recorder: metrics.CallRecorder,
+    text: str,
+    completion: Optional[providers.Completion] = None,
+) -> AgentResult:
+    """Build an AgentResult from a finished call."""
+    call = recorder.metrics
+    result = AgentResult(
+        text=text,
+        provider=call.provider,
+        model=call.model,
+        duration=call.duration,
+        time_to_first_byte=call.ttfb,
+        queue_wait=call.queue_wait,
+        retries=call.retries,
+        cache_hit=call.cache_hit,
+    )
+    if completion is not None:
+        result.finish_reason = providers.normalize_finish_reason(
+            completion.finish_reason
+        )
+        result.stop_reason = completion.finish_reason
+        result.input_tokens = completion.input_tokens
+        result.output_tokens = completion.output_tokens
+        result.cached_tokens = completion.cached_tokens
+        result.cache_write_tokens = completion.cache_write_tokens
+        result.request_id = completion.request_id
+    return result
+
+
+def _check_call_args(stream: bool, return_result: bool) -> None:
+    """Reject argument combinations a call cannot honour."""
+    if return_result and stream:
+        raise ValueError(
+            "return_result is not supported with stream=True; use the stream's summary"
+        )
+
+
+# Agent arguments that belong to one call of a session, not to the session
+CALL_ARGUMENTS = frozenset(
+    {"stream", "return_result", "retry_stats", "deadline", "cancel"}
+)
+
+
+def split_agent_kwargs(
+    agent_kwargs: Dict[str, Any]
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Split :func:`Agent` keyword arguments into session and call arguments.
+
+    For code that takes Agent's arguments but runs the agent over many
+    inputs, so it can build one :class:`AgentSession` and call it per input.
+
+    Returns:
+        The AgentSession arguments and the keyword arguments of each call.
+    """
+    session_kwargs = {
+        name: value for name, value in agent_kwargs.items()
+        if name not in CALL_ARGUMENTS
+    }
+    call_kwargs = {
+        name: value for name, value in agent_kwargs.items() if name in CALL_ARGUMENTS
+    }
+    return session_kwargs, call_kwargs
+
+
+def _start_call(
+    agent_name: str, provider: str, model: str, stream: bool, return_result: bool
+) -> Optional[metrics.CallRecorder]:
+    """Return a recorder if hooks are registered or the caller wants an AgentResult."""
+    _check_call_args(stream, return_result)
+    recorder = metrics.start_call(agent_name, provider, model, stream)
+    if recorder is None and return_result:
+        recorder = metrics.CallRecorder(agent_name, provider, model, stream)
+    return recorder
+
+
+class _ProviderFunctions(NamedTuple):
+    """The functions of one provider for plain, instrumented and streamed calls."""
+
+    call: Callable[..., Any]
+    complete: Callable[..., Any]
+    stream: Callable[..., Any]
+
+
+def _provider_functions(asynchronous: bool) -> Dict[str, _ProviderFunctions]:
+    """Map supported providers to their respective functions or coroutine functions."""
+    if asynchronous:
+        return {
+            "openai": _ProviderFunctions(
+                providers.acall_openai, providers.acomplete_openai,
+                providers.astream_openai
+            ),
+            "claude": _ProviderFunctions(
+                providers.acall_claude, providers.acomplete_claude,
+                providers.astream_claude
+            ),
+            "gemini": _ProviderFunctions(
+                providers.acall_gemini, providers.acomplete_gemini,
+                providers.astream_gemini
+            ),
+        }
+    return {
+        "openai": _ProviderFunctions(
+            providers.call_openai, providers.complete_openai, providers.stream_openai
+        ),
+        "claude": _ProviderFunctions(
+            providers.call_claude, providers.complete_claude, providers.stream_claude
+        ),
+        "gemini": _ProviderFunctions(
+            providers.call_gemini, providers.complete_gemini, providers.stream_gemini
+        ),
+    }
+
+
+def _cache_hit(
+    recorder: Optional[metrics.CallRecorder], response: str, return_result: bool
+) -> Union[str, AgentResult]:
+    """Report a response served from a cache and return it as the caller asked."""
+    if recorder is not None:
+        recorder.finish(cache_hit=True)
+        if return_result:
+            return _agent_result(recorder, response)
+    return response
+
+
+class _Call(NamedTuple):
+    """The state of one session call before its first attempt."""
+
+    recorder: Optional[metrics.CallRecorder]
+    budget: Preflight
+    cache_key: Optional[str]
+    semantic_vector: Any
+    cached: Optional[str]
+
+
+class AgentSession:
+    """
+    An agent bound to its provider, model, system prompt and call settings.
+
+    :func:`Agent` validates its arguments, loads the system prompt and looks up
+    the provider functions on every call. A session does all of that once,
+    when it is created, together with the request arguments and cache scopes
+    that do not depend on the input, so a call only does the work specific to
+    its input. Calls never change the session, so one session can serve any
+    number of threads and tasks at once.
+
+    The system prompt is read when the session is created; create a new
+    session to pick up an edited prompt file.
+
+    Example:
+        >>> session = AgentSession("backend_coding_agent", "gpt-4", "openai", key)
+        >>> answers = [session(question) for question in questions]
+        >>> answer = await session.acall("What is a REST API?")
+    """
+
+    def __init__(
+        self,
+        agent_name: str,
+        model: str,
+        provider: str,
+        api_key: Union[str, KeyPool],
+        custom_system_prompt: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        retry: Optional[RetryPolicy] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        base_url: Optional[str] = None,
+        coalesce: Optional[SingleFlight] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        semantic_cache: Optional[SemanticCache] = None,
+        max_tokens: Optional[int] = None,
+        on_overflow: str = "error",
+        timeout: Optional[float] = None,
+    ) -> None:
+        """
+        Resolve the agent's configuration.
+
+        Takes the arguments of :func:`Agent` that are the same for every call;
+        see there for their meaning.
+
+        Raises:
+            FileNotFoundError: If the prompt file is not found.
+            ValueError: If the prompt file is empty, an argument is missing or
+                invalid, or the provider is unsupported.
+        """
+        # Use custom prompt if provided, otherwise load from file
+        if custom_system_prompt is not None:
+            system_prompt = custom_system_prompt.strip()
+        else:
+            system_prompt = prompt_cache.get(agent_name)
+
+        if not api_key:
+            raise ValueError(f"API key for {provider} is required")
+
+        functions = _provider_functions(asynchronous=False)
+        if provider not in functions:
+            raise ValueError(
+                f"Unsupported provider: {provider}. "
+                f"Supported providers are: {', '.join(functions.keys())}"
+            )
+        # Validates max_tokens and on_overflow
+        self._budget = TokenBudget(
+            provider, model, system_prompt, max_tokens, on_overflow
+        )
+        if timeout is not None and timeout <= 0:
+            raise ValueError("timeout must be positive")
+
+        self.agent_name = agent_name
+        self.model = model
+        self.provider = provider
+        self.api_key = api_key
+        self.system_prompt = system_prompt
+        self.max_tokens = max_tokens
+        self.on_overflow = on_overflow
+        self.timeout = timeout
+        self._cache = cache
+        self._retry = retry
+        self._rate_limiter = rate_limiter
+        self._coalesce = coalesce
+        self._circuit_breaker = circuit_breaker
+        self._semantic_cache = semantic_cache
+        self._functions = functions[provider]
+        self._async_functions = _provider_functions(asynchronous=True)[provider]
+
+        # Provider arguments shared by every attempt, optional ones only when set
+        self._request: Dict[str, Any] = {"model": model, "system_prompt": system_prompt}
+        if base_url is not None:
+            self._request["base_url"] = base_url
+        if retry is not None:
+            self._request["sdk_retries"] = False
+
+        self._generation_params = dict(providers.GENERATION_DEFAULTS[provider])
+        if max_tokens is not None:
+            self._generation_params["max_tokens"] = max_tokens
+        self._semantic_scope = None
+        if semantic_cache is not None:
+            self._semantic_scope = SemanticCache.make_scope(
+                provider, model, system_prompt, self._generation_params
+            )
+        # Identical requests are only shared within one API key and endpoint
+        account = f"pool:{id(api_key)}" if isinstance(api_key, KeyPool) else api_key
+        self._account = hashlib.sha256(
+            f"{account}\0{base_url or ''}".encode("utf-8")
+        ).hexdigest()[:16]
+
+    def __repr__(self) -> str:
+        return (
+            f"AgentSession(agent_name={self.agent_name!r}, model={self.model!r}, "
+            f"provider={self.provider!r})"
+        )
+
+    def _cache_key(self, prompt_input: str) -> str:
+        """Build the response cache key for an input."""
+        return ResponseCache.make_key(
+            self.provider, self.model, self.system_prompt, prompt_input,
+            self._generation_params
+        )
+
+    def _coalesce_key(self, prompt_input: str) -> str:
+        """Key identical requests; the API key and endpoint are part of the identity."""
+        return f"{self._cache_key(prompt_input)}:{self._account}"
+
+    def _start(self, prompt_input: str, stream: bool, return_result: bool) -> _Call:
+        """Check an input against its budget and look it up in the caches."""
+        recorder = _start_call(
+            self.agent_name, self.provider, self.model, stream, return_result
+        )
+        if not prompt_input or not prompt_input.strip():
+            raise ValueError("Prompt input cannot be empty")
+        # Checked locally instead of failing after a round trip
+        budget = self._budget.check(prompt_input)
+        prompt_input = budget.prompt_input
+
+        cache_key = semantic_vector = cached = None
+        if self._cache is not None and not stream:
+            cache_key = self._cache_key(prompt_input)
+            cached = self._cache.get(cache_key)
+        if cached is None and self._semantic_cache is not None and not stream:
+            # Embedded once for both the lookup and the store after a miss
+            semantic_vector = self._semantic_cache.embed([prompt_input])[0]
+            match = self._semantic_cache.get(
+                self._semantic_scope, prompt_input, self.agent_name, semantic_vector
+            )
+            if match is not None:
+                cached = match.response
+        return _Call(recorder, budget, cache_key, semantic_vector, cached)
+
+    def _function(
+        self,
+        functions: _ProviderFunctions,
+        recorder: Optional[metrics.CallRecorder],
+        stream: bool,
+    ) -> Callable[..., Any]:
+        if stream:
+            return functions.stream
+        if (
+            recorder is not None
+            or self._coalesce is not None
+            or isinstance(self.api_key, KeyPool)
+        ):
+            # Instrumented and shared calls need the token usage of the full
+            # completion, key pools its rate limit headers
+            return functions.complete
+        return functions.call
+
+    def _request_kwargs(self, budget: Preflight, key: str) -> Dict[str, Any]:
+        """Build the provider call arguments of one attempt."""
+        kwargs = dict(self._request, prompt=budget.prompt_input, api_key=key)
+        if budget.max_tokens is not None:
+            kwargs["max_tokens"] = budget.max_tokens
+        return kwargs
+
+    def _bounded(
+        self,
+        attempt: Callable[..., Any],
+        deadline: Optional[Deadline],
+        cancel: Optional[CancelToken],
+        retry_stats: Optional[RetryStats],
+    ) -> Callable[[], Any]:
+        """Give an attempt its share of the deadline and skip it once cancelled."""
+
+        def bounded() -> Any:
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            if deadline is None:
+                return attempt()
+            attempts_left = 1
+            if self._retry is not None:
+                attempts_left = self._retry.max_attempts - retry_stats.attempts + 1
+            # SDK retries would each get the whole share
+            return attempt(
+                timeout=deadline.attempt_timeout(attempts_left), sdk_retries=False
+            )
+
+        return bounded
+
+    def _finish(
+        self,
+        call: _Call,
+        response: Any,
+        retry_stats: Optional[RetryStats],
+        return_result: bool,
+    ) -> Union[str, AgentResult]:
+        """Report a completed call, fill the caches and return the response."""
+        completion = None
+        if call.recorder is not None:
+            call.recorder.finish(completion=response, retry_stats=retry_stats)
+        if isinstance(response, providers.Completion):
+            completion, response = response, response.text
+
+        if call.cache_key is not None:
+            self._cache.set(call.cache_key, response)
+        if self._semantic_scope is not None:
+            self._semantic_cache.set(
+                self._semantic_scope, call.budget.prompt_input, response,
+                call.semantic_vector
+            )
+        if return_result:
+            return _agent_result(call.recorder, response, completion)
+        return response
+
+    def __call__(
+        self,
+        prompt_input: str,
+        stream: bool = False,
+        return_result: bool = False,
+        retry_stats: Optional[RetryStats] = None,
+        deadline: Optional[Deadline] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> Union[str, AgentResult, TextStream]:
+        """
+        Run the agent on an input.
+
+        Args:
+            prompt_input: User input to be processed by the agent.
+            stream: Return a TextStream of text deltas instead of waiting for
+                the full response.
+            return_result: Return an AgentResult instead of the plain text.
+                Not supported with ``stream``.
+            retry_stats: Optional RetryStats filled in with the attempts made.
+            deadline: Optional Deadline the call has to finish by. The
+                session's timeout applies too; the earlier one wins.
+            cancel: Optional CancelToken that gives up on the call. The
+                request runs on a worker thread, so cancelling releases the
+                caller at once while the request finishes in the background.
+
+        Returns:
+            str: The generated response from the model, an AgentResult if
+            ``return_result`` is True, or a TextStream if ``stream`` is True.
+
+        Raises:
+            ValueError: If the input is empty or ``return_result`` is combined
+                with ``stream``.
+            ContextLengthError: If the request cannot fit the model's context
+                window and on_overflow is 'error'.
+            DeadlineExceededError: If the deadline passes first.
+            CallCancelledError: If the token is cancelled first.
+            ImportError: If the provider's SDK is not installed.
+            Exception: For errors during API calls to the model providers.
+        """
+        deadline = resolve_deadline(self.timeout, deadline)
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        call = self._start(prompt_input, stream, return_result)
+        recorder = call.recorder
+        if call.cached is not None:
+            return _cache_hit(recorder, call.cached, return_result)
+
+        on_wait = None
+        if recorder is not None:
+            on_wait = recorder.add_queue_wait
+        if self._retry is not None and retry_stats is None:
+            if recorder is not None or deadline is not None:
+                retry_stats = RetryStats()
+        function = self._function(self._functions, recorder, stream)
+        tokens = call.budget.total_tokens
+
+        def key_attempt(key: str) -> "Callable[[], Any]":
+            """Build one attempt sent with the given API key."""
+            attempt = functools.partial(
+                function, **self._request_kwargs(call.budget, key)
+            )
+            if deadline is not None or cancel is not None:
+                attempt = self._bounded(attempt, deadline, cancel, retry_stats)
+            if cancel is not None:
+                # Cancelling releases the caller; the request ends on its own
+                attempt = functools.partial(call_cancellable, attempt, cancel)
+            if self._circuit_breaker is not None:
+                attempt = self._circuit_breaker.wrap(
+                    attempt, self.provider, self.model, key
+                )
+            if recorder is not None:
+                attempt = recorder.wrap_attempt(attempt)
+            if self._rate_limiter is not None:
+                attempt = self._rate_limiter.wrap(
+                    attempt, self.provider, self.model, key, tokens,
+                    on_wait=on_wait, deadline=deadline, cancel=cancel,
+                )
+            return attempt
+
+        if isinstance(self.api_key, KeyPool):
+            # Every attempt, retries included, draws the key with the most headroom
+            attempt = self.api_key.wrap(
+                key_attempt, tokens, on_wait=on_wait, deadline=deadline, cancel=cancel
+            )
+        else:
+            attempt = key_attempt(self.api_key)
+        if self._retry is not None:
+            attempt = functools.partial(
+                self._retry.call, attempt, retry_stats, deadline, cancel
+            )
+        try:
+            # Call the appropriate provider function. Calls that can be
+            # cancelled are not shared, so cancelling one spares the others.
+            if self._coalesce is None or stream or cancel is not None:
+                response = attempt()
+            else:
+                response, joined = self._coalesce.do(
+                    self._coalesce_key(call.budget.prompt_input), attempt, deadline
+                )
+                if recorder is not None:
+                    recorder.metrics.coalesced = joined
+        except (ImportError, CallCancelledError, DeadlineExceededError) as e:
+            if recorder is not None:
+                recorder.finish(error=e, retry_stats=retry_stats)
+            # A missing provider SDK is a setup problem and a call given up
+            # by its caller did not fail; neither is a completion error
+            raise
+        except Exception as e:
+            if recorder is not None:
+                recorder.finish(error=e, retry_stats=retry_stats)
+            if deadline is not None and deadline.expired:
+                # Usually the timeout of the last attempt
+                raise DeadlineExceededError(deadline.timeout) from e
+            raise Exception(
+                f"Error getting completion from {self.provider} ({self.model}): "
+                f"{str(e)}"
+            ) from e
+
+        if stream:
+            if deadline is not None or cancel is not None:
+                response = guard_stream(response, deadline, cancel)
+            if recorder is not None:
+                return recorder.wrap_stream(response, retry_stats)
+            return response
+        return self._finish(call, response, retry_stats, return_result)
+
+    async def acall(
+        self,
+        prompt_input: str,
+        stream: bool = False,
+        return_result: bool = False,
+        retry_stats: Optional[RetryStats] = None,
+        deadline: Optional[Deadline] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> Union[str, AgentResult, AsyncTextStream]:
+        """
+        Run the agent on an input with the provider's async SDK client.
+
+        Takes the same arguments, returns the same result and raises the same
+        errors as calling the session, but returns an AsyncTextStream when
+        streaming. Cancelling the awaiting task or the token cancels the
+        request.
+        """
+        deadline = resolve_deadline(self.timeout, deadline)
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        call = self._start(prompt_input, stream, return_result)
+        recorder = call.recorder
+        if call.cached is not None:
+            return _cache_hit(recorder, call.cached, return_result)
+
+        on_wait = None
+        if recorder is not None:
+            on_wait = recorder.add_queue_wait
+        if self._retry is not None and retry_stats is None:
+            if recorder is not None or deadline is not None:
+                retry_stats = RetryStats()
+        function = self._function(self._async_functions, recorder, stream)
+        tokens = call.budget.total_tokens
+
+        def key_attempt(key: str) -> "Callable[[], Any]":
+            """Build one attempt sent with the given API key."""
+            attempt = functools.partial(
+                function, **self._request_kwargs(call.budget, key)
+            )
+            if deadline is not None or cancel is not None:
+                attempt = self._bounded(attempt, deadline, cancel, retry_stats)
+            if self._circuit_breaker is not None:
+                attempt = self._circuit_breaker.awrap(
+                    attempt, self.provider, self.model, key
+                )
+            if recorder is not None:
+                attempt = recorder.awrap_attempt(attempt)
+            if self._rate_limiter is not None:
+                attempt = self._rate_limiter.awrap(
+                    attempt, self.provider, self.model, key, tokens,
+                    on_wait=on_wait, deadline=deadline, cancel=cancel,
+                )
+            return attempt
+
+        if isinstance(self.api_key, KeyPool):
+            # Every attempt, retries included, draws the key with the most headroom
+            attempt = self.api_key.awrap(
+                key_attempt, tokens, on_wait=on_wait, deadline=deadline, cancel=cancel
+            )
+        else:
+            attempt = key_attempt(self.api_key)
+        if self._retry is not None:
+            attempt = functools.partial(
+                self._retry.acall, attempt, retry_stats, deadline
+            )
+        try:
+            if cancel is not None:
+                # Not shared, so cancelling it spares other callers
+                response = await run_cancellable(attempt(), cancel)
+            elif self._coalesce is None or stream:
+                response = await attempt()
+            else:
+                response, joined = await self._coalesce.ado(
+                    self._coalesce_key(call.budget.prompt_input), attempt, deadline
+                )
+                if recorder is not None:
+                    recorder.metrics.coalesced = joined
+        except (ImportError, CallCancelledError, DeadlineExceededError) as e:
+            if recorder is not None:
+                recorder.finish(error=e, retry_stats=retry_stats)
+            # A missing provider SDK is a setup problem and a call given up
+            # by its caller did not fail; neither is a completion error
+            raise
+        except Exception as e:
+            if recorder is not None:
+                recorder.finish(error=e, retry_stats=retry_stats)
+            if deadline is not None and deadline.expired:
+                # Usually the timeout of the last attempt
+                raise DeadlineExceededError(deadline.timeout) from e
+            raise Exception(
+                f"Error getting completion from {self.provider} ({self.model}): "
+                f"{str(e)}"
+            ) from e
+
+        if stream:
+            if deadline is not None or cancel is not None:
+                response = aguard_stream(response, deadline, cancel)
+            if recorder is not None:
+                return recorder.wrap_astream(response, retry_stats)
+            return response
+        return self._finish(call, response, retry_stats, return_result)
+
+
+# Sessions a SessionCache keeps by default
+SESSION_CACHE_SIZE = 64
+
+
+def _argument_key(value: Any) -> Hashable:
+    """A hashable stand-in for a session argument: the value, or else its id."""
+    try:
+        hash(value)
+    except TypeError:
+        # The cached session holds the value, so its id is not reused meanwhile
+        return ("id", id(value))
+    return value
+
+
+class SessionCache:
+    """
+    A thread-safe cache of AgentSessions by their arguments.
+
+    For long-lived objects that call agents on behalf of their callers, such
+    as routers and workflows, so that each configuration is resolved once
+    instead of on every call. A session using a prompt file is rebuilt once
+    the file has changed, so edited prompts are picked up as with
+    :func:`Agent`. The least recently used sessions are dropped first.
+    """
+
+    def __init__(self, max_sessions: int = SESSION_CACHE_SIZE) -> None:
+        """
+        Initialize the cache.
+
+        Args:
+            max_sessions: Sessions kept, least recently used dropped first.
+
+        Raises:
+            ValueError: If max_sessions is less than 1.
+        """
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[Hashable, AgentSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def get(self, **session_kwargs: Any) -> AgentSession:
+        """
+        Return the session for these :class:`AgentSession` arguments.
+
+        Raises:
+            FileNotFoundError: If the prompt file is not found.
+            ValueError: If the prompt file is empty, an argument is missing or
+                invalid, or the provider is unsupported.
+        """
+        key = tuple(sorted(
+            (name, _argument_key(value)) for name, value in session_kwargs.items()
+        ))
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+        if session is not None and not self._stale(session, session_kwargs):
+            return session
+        session = AgentSession(**session_kwargs)
+        with self._lock:
+            self._sessions[key] = session
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    @staticmethod
+    def _stale(session: AgentSession, session_kwargs: Dict[str, Any]) -> bool:
+        """Whether the prompt file changed since the session was created."""
+        if session_kwargs.get("custom_system_prompt") is not None:
+            return False
+        try:
+            prompt = prompt_cache.get(session_kwargs["agent_name"])
+        except (OSError, ValueError):
+            # Rebuilding raises the error to the caller
+            return True
+        return session.system_prompt != prompt
+
+    def clear(self) -> None:
+        """Drop every cached session."""
+        with self._lock:
+            self._sessions.clear()
+
 
 def Agent(
     agent_name: str,
     model: str,
     provider: str,
-    api_key: str,
+    api_key: Union[str, KeyPool],
     prompt_input: str,
-    custom_system_prompt: Optional[str] = None
-) -> str:
+    custom_system_prompt: Optional[str] = None,
+    stream: bool = False,
+    cache: Optional[ResponseCache] = None,
+    retry: Optional[RetryPolicy] = None,
+    retry_stats: Optional[RetryStats] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    base_url: Optional[str] = None,
+    return_result: bool = False,
+    coalesce: Optional[SingleFlight] = None,
+    circuit_breaker: Optional[CircuitBreaker] = None,
+    semantic_cache: Optional[SemanticCache] = None,
+    max_tokens: Optional[int] = None,
+    on_overflow: str = "error",
+    timeout: Optional[float] = None,
+    deadline: Optional[Deadline] = None,
+    cancel: Optional[CancelToken] = None,
+) -> Union[str, AgentResult, TextStream]:
     """
     Executes an agent using the specified model provider and prompt.
 
+    Resolves the agent's configuration for this call only; to call the same
+    agent many times, create an :class:`AgentSession` once and call that.
+
     Args:
         agent_name: Name of the agent (used to locate prompt file).
         model: Name of the model to use (e.g., 'gpt-4', 'claude-3-opus').
         provider: One of 'openai', 'claude', or 'gemini'.
-        api_key: API key for the respective provider.
+        api_key: API key for the respective provider, or a KeyPool to spread
+            attempts over several keys.
         prompt_input: User input to be processed by the agent.
-        custom_system_prompt: Optional custom system prompt that overrides the file-based one.
+        custom_system_prompt: Optional custom system prompt that overrides the
+            file-based one.
+        stream: Return a TextStream of text deltas instead of waiting for the
+            full response.
+        cache: Optional response cache consulted before calling the provider.
+            Streamed responses are not cached.
+        retry: Optional RetryPolicy for transient provider errors. The SDK's
+            own retries are disabled while a policy is in effect.
+        retry_stats: Optional RetryStats filled in with the attempts made.
+        rate_limiter: Optional RateLimiter that paces every attempt against
+            the provider's request and token budgets.
+        base_url: Optional override for the provider's API endpoint, e.g. a
+            proxy or a local test server.
+        return_result: Return an AgentResult with finish reason, token usage,
+            request ID and timings instead of the plain text. Not supported
+            with ``stream``.
+        coalesce: Optional SingleFlight shared by concurrent callers. Calls
+            with the same provider, model, prompts, API key and endpoint that
+            overlap share one provider call and its result or error. A caller
+            stops waiting for a shared call at its own deadline. Streams
+            are not coalesced.
+        circuit_breaker: Optional CircuitBreaker tracking the health of the
+            provider, model and API key. While its circuit is open, attempts
+            fail at once with a CircuitOpenError instead of reaching the
+            provider.
+        semantic_cache: Optional SemanticCache consulted after ``cache``. A
+            stored response for a sufficiently similar prompt of the same
+            agent setup is returned instead of calling the provider.
+            Streamed responses are not cached.
+        max_tokens: Optional limit of the response length. Lowered to the
+            room the model's context window leaves after the input; defaults
+            to the provider's default.
+        on_overflow: What to do when the system prompt and input leave no
+            room for a response in the model's context window: 'error'
+            raises a ContextLengthError before sending, 'truncate' cuts the
+            end of the input, 'ignore' sends the request unchanged.
+        timeout: Optional seconds the call may take, retries included. Each
+            attempt gets an even share of the time left, passed to the SDK
+            as its connect and read timeouts, and no retry is started once
+            it has run out.
+        deadline: Optional Deadline shared with other calls; the earlier of
+            it and ``timeout`` applies.
+        cancel: Optional CancelToken that gives up on the call from another
+            thread or task. The request runs on a worker thread, so
+            cancelling releases the caller at once while the request
+            finishes in the background.
 
     Returns:
-        str: The generated response from the model.
+        str: The generated response from the model, an AgentResult if
+        ``return_result`` is True, or a TextStream if ``stream`` is True.
 
     Raises:
         FileNotFoundError: If the prompt file is not found.
-        ValueError: If the prompt file is empty or provider is unsupported.
+        ValueError: If the prompt file is empty, provider is unsupported,
+            ``return_result`` is combined with ``stream`` or on_overflow is
+            not supported.
+        ContextLengthError: If the request cannot fit the model's context
+            window and on_overflow is 'error'.
+        DeadlineExceededError: If the timeout or deadline passes first.
+        CallCancelledError: If the token is cancelled first.
+        ImportError: If the provider's SDK is not installed.
         Exception: For errors during API calls to the model providers.
     """
-    # Use custom prompt if provided, otherwise load from file
-    if custom_system_prompt is not None:
-        system_prompt = custom_system_prompt.strip()
-    else:
-        prompt_path = os.path.join(
-            os.path.dirname(__file__), "prompts", agent_name, "prompt.txt"
-        )
-        try:
-            with open(prompt_path, "r", encoding='utf-8') as f:
-                system_prompt = f.read().strip()
-            if not system_prompt:
-                raise ValueError(f"Prompt file {prompt_path} is empty")
-        except FileNotFoundError as e:
-            raise FileNotFoundError(
-                f"Prompt file not found: {prompt_path}. "
-                "Please ensure the agent_name corresponds to an existing prompt directory."
-            ) from e
-    
-    if not api_key:
-        raise ValueError(f"API key for {provider} is required")
-    
-    if not prompt_input or not prompt_input.strip():
-        raise ValueError("Prompt input cannot be empty")
-    
-    # Map of supported providers to their respective functions
-    provider_functions = {
-        "openai": providers.call_openai,
-        "claude": providers.call_claude,
-        "gemini": providers.call_gemini,
-    }
-    
-    if provider not in provider_functions:
-        raise ValueError(
-            f"Unsupported provider: {provider}. "
-            f"Supported providers are: {', '.join(provider_functions.keys())}"
-        )
-    
-    try:
-        # Call the appropriate provider function
-        return provider_functions[provider](
-            model=model,
-            system_prompt=system_prompt,
-            prompt=prompt_input,
-            api_key=api_key
-        )
-    except Exception as e:
-        raise Exception(
-            f"Error getting completion from {provider} ({model}): {str(e)}"
-        ) from e
\ No newline at end of file
+    _check_call_args(stream, return_result)
+    session = AgentSession(
+        agent_name, model, provider, api_key, custom_system_prompt,
+        cache=cache,
+        retry=retry,
+        rate_limiter=rate_limiter,
+        base_url=base_url,
+        coalesce=coalesce,
+        circuit_breaker=circuit_breaker,
+        semantic_cache=semantic_cache,
+        max_tokens=max_tokens,
+        on_overflow=on_overflow,
+        timeout=timeout,
+    )
+    return session(
+        prompt_input, stream=stream, return_result=return_result,
+        retry_stats=retry_stats, deadline=deadline, cancel=cancel
+    )
+
+
+async def AsyncAgent(
+    agent_name: str,
+    model: str,
+    provider: str,
+    api_key: Union[str, KeyPool],
+    prompt_input: str,
+    custom_system_prompt: Optional[str] = None,
+    stream: bool = False,
+    cache: Optional[ResponseCache] = None,
+    retry: Optional[RetryPolicy] = None,
+    retry_stats: Optional[RetryStats] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    base_url: Optional[str] = None,
+    return_result: bool = False,
+    coalesce: Optional[SingleFlight] = None,
+    circuit_breaker: Optional[CircuitBreaker] = None,
+    semantic_cache: Optional[SemanticCache] = None,
+    max_tokens: Optional[int] = None,
+    on_overflow: str = "error",
+    timeout: Optional[float] = None,
+    deadline: Optional[Deadline] = None,
+    cancel: Optional[CancelToken] = None,
+) -> Union[str, AgentResult, AsyncTextStream]:
+    """
+    Asynchronously executes an agent using the specified model provider and prompt.
+
+    Takes the same arguments, returns the same result and raises the same
+    errors as :func:`Agent`, but awaits the provider's async SDK client instead
+    of blocking a thread. Cancelling the awaiting task cancels the request.
+
+    Args:
+        agent_name: Name of the agent (used to locate prompt file).
+        model: Name of the model to use (e.g., 'gpt-4', 'claude-3-opus').
+        provider: One of 'openai', 'claude', or 'gemini'.
+        api_key: API key for the respective provider, or a KeyPool to spread
+            attempts over several keys.
+        prompt_input: User input to be processed by the agent.
+        custom_system_prompt: Optional custom system prompt that overrides the
+            file-based one.
+        stream: Return an AsyncTextStream of text deltas instead of waiting
+            for the full response.
+        cache: Optional response cache consulted before calling the provider.
+            Streamed responses are not cached.
+        retry: Optional RetryPolicy for transient provider errors. The SDK's
+            own retries are disabled while a policy is in effect.
+        retry_stats: Optional RetryStats filled in with the attempts made.
+        rate_limiter: Optional RateLimiter that paces every attempt against
+            the provider's request and token budgets.
+        base_url: Optional override for the provider's API endpoint, e.g. a
+            proxy or a local test server.
+        return_result: Return an AgentResult with finish reason, token usage,
+            request ID and timings instead of the plain text. Not supported
+            with ``stream``.
+        coalesce: Optional SingleFlight shared by concurrent callers. Calls
+            with the same provider, model, prompts, API key and endpoint that
+            overlap share one provider call and its result or error. A caller
+            stops waiting for a shared call at its own deadline. Streams
+            are not coalesced.
+        circuit_breaker: Optional CircuitBreaker tracking the health of the
+            provider, model and API key. While its circuit is open, attempts
+            fail at once with a CircuitOpenError instead of reaching the
+            provider.
+        semantic_cache: Optional SemanticCache consulted after ``cache``. A
+            stored response for a sufficiently similar prompt of the same
+            agent setup is returned instead of calling the provider.
+            Streamed responses are not cached.
+        max_tokens: Optional limit of the response length. Lowered to the
+            room the model's context window leaves after the input; defaults
+            to the provider's default.
+        on_overflow: What to do when the system prompt and input leave no
+            room for a response in the model's context window: 'error'
+            raises a ContextLengthError before sending, 'truncate' cuts the
+            end of the input, 'ignore' sends the request unchanged.
+        timeout: Optional seconds the call may take, retries included. Each
+            attempt gets an even share of the time left, passed to the SDK
+            as its connect and read timeouts, and no retry is started once
+            it has run out.
+        deadline: Optional Deadline shared with other calls; the earlier of
+            it and ``timeout`` applies.
+        cancel: Optional CancelToken that gives up on the call from another
+            thread or task, aborting its request where the SDK allows it.
+
+    Returns:
+        str: The generated response from the model, an AgentResult if
+        ``return_result`` is True, or an AsyncTextStream if ``stream`` is True.
+
+    Raises:
+        FileNotFoundError: If the prompt file is not found.
+        ValueError: If the prompt file is empty, provider is unsupported,
+            ``return_result`` is combined with ``stream`` or on_overflow is
+            not supported.
+        ContextLengthError: If the request cannot fit the model's context
+            window and on_overflow is 'error'.
+        DeadlineExceededError: If the timeout or deadline passes first.
+        CallCancelledError: If the token is cancelled first.
+        ImportError: If the provider's SDK is not installed.
+        Exception: For errors during API calls to the model providers.
+    """
+    _check_call_args(stream, return_result)
+    session = AgentSession(
+        agent_name, model, provider, api_key, custom_system_prompt,
+        cache=cache,
+        retry=retry,
+        rate_limiter=rate_limiter,
+        base_url=base_url,
+        coalesce=coalesce,
+        circuit_breaker=circuit_breaker,
+        semantic_cache=semantic_cache,
+        max_tokens=max_tokens,
+        on_overflow=on_overflow,
+        timeout=timeout,
+    )
+    return await session.acall(
+        prompt_input, stream=stream, return_result=return_result,
+        retry_stats=retry_stats, deadline=deadline, cancel=cancel
+    )
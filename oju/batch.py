@@ -0,0 +1,281 @@
+"""
+Module for running one agent over many inputs.
+
+``run_batch`` and ``arun_batch`` read their inputs lazily and keep at most
+``max_concurrency`` requests in flight, so memory stays bounded even when the
+inputs come from a generator over millions of records. Every input produces a
+``BatchResult`` carrying either the output or the error, so one failing item
+never aborts the rest of the batch. ``iter_batch`` is the engine underneath,
+running any callable over the inputs the same way.
+"""
+
+import asyncio
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Iterable,
+    Iterator,
+    Optional,
+    Union,
+)
+
+from . import agent
+from .circuit import CircuitBreaker
+from .coalesce import SingleFlight
+from .keypool import KeyPool
+from .ratelimit import RateLimiter
+
+
+@dataclass
+class BatchResult:
+    """
+    The outcome of one batch item.
+
+    Attributes:
+        index: Position of the input in the batch.
+        input: The prompt input that was processed.
+        output: The generated response, or ``None`` if the item failed.
+        error: The exception raised for this item, or ``None`` on success.
+    """
+
+    index: int
+    input: str
+    output: Optional[str] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        """Whether the item completed successfully."""
+        return self.error is None
+
+
+def validate_concurrency(max_concurrency: int) -> None:
+    """
+    Check a concurrency limit before any work starts.
+
+    Raises:
+        ValueError: If max_concurrency is less than 1.
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1")
+
+
+def run_batch(
+    inputs: Iterable[str],
+    agent_name: str,
+    model: str,
+    provider: str,
+    api_key: Union[str, KeyPool],
+    custom_system_prompt: Optional[str] = None,
+    max_concurrency: int = 8,
+    ordered: bool = True,
+    rate_limiter: Optional[RateLimiter] = None,
+    coalesce: Optional[SingleFlight] = None,
+    circuit_breaker: Optional[CircuitBreaker] = None,
+) -> Iterator[BatchResult]:
+    """
+    Run an agent over many inputs with bounded concurrency.
+
+    Args:
+        inputs: Prompt inputs to process. Consumed lazily.
+        agent_name: Name of the agent (used to locate prompt file).
+        model: Name of the model to use (e.g., 'gpt-4', 'claude-3-opus').
+        provider: One of 'openai', 'claude', or 'gemini'.
+        api_key: API key for the respective provider, or a KeyPool to spread
+            requests over several keys.
+        custom_system_prompt: Optional custom system prompt that overrides the
+            file-based one.
+        max_concurrency: Maximum number of requests in flight at once.
+        ordered: Yield results in input order. When ``False``, results are
+            yielded as soon as they complete.
+        rate_limiter: Optional RateLimiter pacing the requests; items wait
+            for budget instead of failing with rate limit errors.
+        coalesce: Optional SingleFlight so that duplicate inputs in flight at
+            the same time share one provider call.
+        circuit_breaker: Optional CircuitBreaker; while the circuit is open
+            items fail fast with a CircuitOpenError in their result.
+
+    Yields:
+        BatchResult: One result per input.
+
+    Raises:
+        FileNotFoundError: If the prompt file is not found.
+        ValueError: If max_concurrency is less than 1, or the prompt file is
+            empty, the provider is unsupported or an argument is invalid.
+    """
+    validate_concurrency(max_concurrency)
+    # One session for the whole batch: the prompt is loaded once, not per item
+    session = agent.AgentSession(
+        agent_name, model, provider, api_key, custom_system_prompt,
+        rate_limiter=rate_limiter,
+        coalesce=coalesce,
+        circuit_breaker=circuit_breaker,
+    )
+    return iter_batch(inputs, session, max_concurrency, ordered)
+
+
+def iter_batch(
+    inputs: Iterable[str],
+    run: Callable[[str], Any],
+    max_concurrency: int = 8,
+    ordered: bool = True,
+) -> Iterator[BatchResult]:
+    """
+    Call ``run`` on many inputs from a thread pool with bounded concurrency.
+
+    The engine of :func:`run_batch`, for callers that build the call of one
+    item themselves.
+
+    Args:
+        inputs: Prompt inputs to process. Consumed lazily.
+        run: Called with one input; its return value becomes the output and
+            any exception it raises the error of the item's BatchResult.
+        max_concurrency: Maximum number of calls in flight at once.
+        ordered: Yield results in input order. When ``False``, results are
+            yielded as soon as they complete.
+
+    Yields:
+        BatchResult: One result per input.
+
+    Raises:
+        ValueError: If max_concurrency is less than 1.
+    """
+    validate_concurrency(max_concurrency)
+    return _iter_batch(inputs, run, max_concurrency, ordered)
+
+
+def _run_item(
+    index: int, prompt_input: str, run: Callable[[str], Any]
+) -> BatchResult:
+    try:
+        output = run(prompt_input)
+    except Exception as e:
+        return BatchResult(index=index, input=prompt_input, error=e)
+    return BatchResult(index=index, input=prompt_input, output=output)
+
+
+def _iter_batch(
+    inputs: Iterable[str],
+    run: Callable[[str], Any],
+    max_concurrency: int,
+    ordered: bool,
+) -> Iterator[BatchResult]:
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    pending: Deque["Future[BatchResult]"] = deque()
+    try:
+        for index, prompt_input in enumerate(inputs):
+            if len(pending) >= max_concurrency:
+                yield from _drain(pending, ordered)
+            pending.append(executor.submit(_run_item, index, prompt_input, run))
+        while pending:
+            yield from _drain(pending, ordered)
+    finally:
+        # Reached early when the caller stops iterating; drop queued work
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def _drain(
+    pending: Deque["Future[BatchResult]"], ordered: bool
+) -> Iterator[BatchResult]:
+    """Wait for and yield at least one finished item, removing it from pending."""
+    if ordered:
+        yield pending.popleft().result()
+        return
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in [f for f in pending if f in done]:
+        pending.remove(future)
+        yield future.result()
+
+
+async def arun_batch(
+    inputs: Union[Iterable[str], AsyncIterable[str]],
+    agent_name: str,
+    model: str,
+    provider: str,
+    api_key: Union[str, KeyPool],
+    custom_system_prompt: Optional[str] = None,
+    max_concurrency: int = 64,
+    ordered: bool = True,
+    rate_limiter: Optional[RateLimiter] = None,
+    coalesce: Optional[SingleFlight] = None,
+    circuit_breaker: Optional[CircuitBreaker] = None,
+) -> AsyncIterator[BatchResult]:
+    """
+    Asynchronously run an agent over many inputs with bounded concurrency.
+
+    Takes the same arguments as :func:`run_batch` but awaits
+    :meth:`oju.agent.AgentSession.acall` on the running event loop, and also
+    accepts an async iterable of inputs.
+
+    Yields:
+        BatchResult: One result per input.
+
+    Raises:
+        FileNotFoundError: If the prompt file is not found.
+        ValueError: If max_concurrency is less than 1, or the prompt file is
+            empty, the provider is unsupported or an argument is invalid.
+    """
+    validate_concurrency(max_concurrency)
+    # One session for the whole batch: the prompt is loaded once, not per item
+    session = agent.AgentSession(
+        agent_name, model, provider, api_key, custom_system_prompt,
+        rate_limiter=rate_limiter,
+        coalesce=coalesce,
+        circuit_breaker=circuit_breaker,
+    )
+
+    async def run_item(index: int, prompt_input: str) -> BatchResult:
+        try:
+            output = await session.acall(prompt_input)
+        except Exception as e:
+            return BatchResult(index=index, input=prompt_input, error=e)
+        return BatchResult(index=index, input=prompt_input, output=output)
+
+    pending: Deque["asyncio.Task[BatchResult]"] = deque()
+    try:
+        index = 0
+        async for prompt_input in _aiter(inputs):
+            if len(pending) >= max_concurrency:
+                async for result in _adrain(pending, ordered):
+                    yield result
+            pending.append(asyncio.ensure_future(run_item(index, prompt_input)))
+            index += 1
+        while pending:
+            async for result in _adrain(pending, ordered):
+                yield result
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _adrain(
+    pending: Deque["asyncio.Task[BatchResult]"], ordered: bool
+) -> AsyncIterator[BatchResult]:
+    """Await and yield at least one finished item, removing it from pending."""
+    if ordered:
+        yield await pending.popleft()
+        return
+    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    for task in [t for t in pending if t in done]:
+        pending.remove(task)
+        yield task.result()
+
+
+async def _aiter(
+    inputs: Union[Iterable[str], AsyncIterable[str]]
+) -> AsyncIterator[str]:
+    """Iterate over a sync or async iterable from async code."""
+    if hasattr(inputs, "__aiter__"):
+        async for item in inputs:  # type: ignore[union-attr]
+            yield item
+    else:
+        for item in inputs:  # type: ignore[union-attr]
+            yield item
@@ -0,0 +1,339 @@
+"""
+Module for caching provider responses.
+
+A ``ResponseCache`` sits in front of the provider dispatch in
+:func:`oju.agent.Agent`. Responses are keyed on the provider, the model, a hash
+of the system prompt, the user input and the generation parameters, and are
+looked up first in an in-memory LRU tier and then, if configured, in an
+on-disk SQLite tier that can be shared by every process on a host.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+
+@dataclass
+class CacheStats:
+    """
+    Hit and miss counters of a ResponseCache.
+
+    Attributes:
+        hits: Lookups answered from any tier.
+        misses: Lookups that found nothing.
+        memory_hits: Lookups answered from the in-memory tier.
+        disk_hits: Lookups answered from the SQLite tier.
+        writes: Responses stored.
+    """
+
+    hits: int = 0
+    misses: int = 0
+    memory_hits: int = 0
+    disk_hits: int = 0
+    writes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups that were hits."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class MemoryTier:
+    """A thread-safe in-memory LRU mapping of cache keys to responses."""
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None) -> None:
+        """
+        Initialize the tier.
+
+        Args:
+            max_entries: Maximum number of responses kept in memory.
+            ttl: Seconds after which an entry expires. ``None`` never expires.
+
+        Raises:
+            ValueError: If max_entries is less than 1.
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the response for a key, or ``None`` if absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, age: float = 0.0) -> None:
+        """
+        Store a response, evicting the least recently used one if full.
+
+        Args:
+            key: The cache key.
+            value: The response.
+            age: Seconds the response has already been cached elsewhere; it
+                expires that much sooner.
+        """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() - age)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteTier:
+    """
+    A persistent response store backed by SQLite.
+
+    The database runs in WAL mode with a busy timeout, so several threads and
+    processes can share one file. Each thread uses its own connection. Entries
+    older than ``ttl`` seconds are ignored and removed, and once the table
+    holds more than ``max_entries`` rows the oldest ones are evicted.
+    """
+
+    _SWEEP_EVERY = 128
+
+    def __init__(
+        self,
+        path: str,
+        ttl: Optional[float] = None,
+        max_entries: int = 100_000,
+    ) -> None:
+        """
+        Initialize the tier, creating the database file if needed.
+
+        Args:
+            path: Path of the SQLite database file.
+            ttl: Seconds after which an entry expires. ``None`` never expires.
+            max_entries: Maximum number of rows kept on disk.
+
+        Raises:
+            ValueError: If max_entries is less than 1 or ttl is not positive.
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl must be positive")
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_created_at "
+                "ON responses (created_at)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the response for a key, or ``None`` if absent or expired."""
+        entry = self.lookup(key)
+        return entry[0] if entry is not None else None
+
+    def lookup(self, key: str) -> Optional[Tuple[str, float]]:
+        """
+        Return the response for a key with its age in seconds.
+
+        An expired row is deleted when it is found.
+
+        Returns:
+            A ``(value, age)`` tuple, or ``None`` if absent or expired.
+        """
+        row = self._connection().execute(
+            "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, created_at = row
+        age = max(time.time() - created_at, 0.0)
+        if self.ttl is not None and age > self.ttl:
+            with self._connection() as conn:
+                # Matching created_at spares a row rewritten in the meantime
+                conn.execute(
+                    "DELETE FROM responses WHERE key = ? AND created_at = ?",
+                    (key, created_at),
+                )
+            return None
+        return value, age
+
+    def set(self, key: str, value: str) -> None:
+        """Store a response, periodically sweeping expired and excess rows."""
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at) "
+                "VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+        with self._writes_lock:
+            self._writes += 1
+            sweep = self._writes % self._SWEEP_EVERY == 0
+        if sweep:
+            self.evict()
+
+    def evict(self) -> None:
+        """Remove expired entries and trim the table to ``max_entries`` rows."""
+        with self._connection() as conn:
+            if self.ttl is not None:
+                conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?",
+                    (time.time() - self.ttl,),
+                )
+            conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        with self._connection() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def __len__(self) -> int:
+        row = self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()
+        return row[0]
+
+
+class ResponseCache:
+    """
+    A two-tier response cache: in-memory LRU backed by optional SQLite storage.
+
+    Safe to share between threads. With a ``path``, every process pointing at
+    the same file shares the disk tier.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        path: Optional[str] = None,
+        ttl: Optional[float] = None,
+        max_disk_entries: int = 100_000,
+    ) -> None:
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of responses kept in memory.
+            path: Optional SQLite database file for the persistent tier.
+            ttl: Seconds after which an entry expires. ``None`` never expires.
+            max_disk_entries: Maximum number of responses kept on disk.
+        """
+        self.memory = MemoryTier(max_entries, ttl)
+        self.disk = SQLiteTier(path, ttl, max_disk_entries) if path else None
+        self._stats = CacheStats()
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(
+        provider: str,
+        model: str,
+        system_prompt: str,
+        prompt: str,
+        params: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        Build the cache key for a request.
+
+        Args:
+            provider: Provider name (e.g., 'openai').
+            model: Model name.
+            system_prompt: The system prompt; only its hash is part of the key.
+            prompt: The user input.
+            params: Generation parameters such as temperature and max_tokens.
+
+        Returns:
+            str: A hex digest identifying the request.
+        """
+        system_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+        payload = json.dumps(
+            [provider, model, system_hash, prompt, params or {}],
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a response, promoting disk hits into memory.
+
+        Returns:
+            The cached response, or ``None`` on a miss.
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            self._count(hits=1, memory_hits=1)
+            return value
+        if self.disk is not None:
+            entry = self.disk.lookup(key)
+            if entry is not None:
+                value, age = entry
+                # Keeps the disk expiry instead of restarting the TTL
+                self.memory.set(key, value, age)
+                self._count(hits=1, disk_hits=1)
+                return value
+        self._count(misses=1)
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        """Store a response in every tier."""
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+        self._count(writes=1)
+
+    def clear(self) -> None:
+        """Remove every cached response from every tier."""
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    @property
+    def stats(self) -> CacheStats:
+        """A snapshot of the hit and miss counters."""
+        with self._stats_lock:
+            return CacheStats(**vars(self._stats))
+
+    def _count(self, **increments: int) -> None:
+        with self._stats_lock:
+            for name, amount in increments.items():
+                setattr(self._stats, name, getattr(self._stats, name) + amount)
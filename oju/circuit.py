@@ -0,0 +1,377 @@
+"""
+Module for failing fast while a provider endpoint is unhealthy.
+
+A ``CircuitBreaker`` keeps one circuit per provider, model and API key and
+watches the outcome and latency of every request sent through it:
+
+* **closed** - requests flow normally. Once the window holds at least
+  ``minimum_calls`` outcomes and the share of failures reaches
+  ``failure_rate``, the circuit opens.
+* **open** - requests are rejected at once with :class:`CircuitOpenError`
+  instead of waiting on a degraded provider. After ``open_for`` seconds the
+  circuit turns half-open.
+* **half-open** - up to ``half_open_probes`` trial requests are let through.
+  If they all succeed the circuit closes with a clean window; if one fails it
+  opens again.
+
+Rate limits (429), server errors (5xx), connection errors and timeouts count
+as failures, as do calls slower than ``slow_call_duration`` when it is set.
+Errors the provider answered deliberately, such as a bad request, show that
+the endpoint is up and count as successes.
+
+The state of every circuit is available through :meth:`CircuitBreaker.state`,
+:meth:`CircuitBreaker.allows` and :meth:`CircuitBreaker.health`, so that
+routing layers such as :class:`oju.routing.Router` can steer around
+unhealthy targets.
+"""
+
+import hashlib
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+from . import metrics
+from .deadline import CallCancelledError, DeadlineExceededError
+from .retry import is_retryable
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Provider, model and a hash of the API key
+CircuitKey = Tuple[str, str, str]
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while its circuit is open."""
+
+    def __init__(self, provider: str, model: str, retry_in: float) -> None:
+        super().__init__(
+            f"Circuit open for {provider} ({model}); "
+            f"next trial request in {retry_in:.1f}s"
+        )
+        self.provider = provider
+        self.model = model
+        self.retry_in = retry_in
+
+
+@dataclass
+class CircuitHealth:
+    """
+    A snapshot of one circuit.
+
+    Attributes:
+        state: 'closed', 'open' or 'half_open'.
+        calls: Outcomes in the rolling window.
+        failures: Failed or slow calls in the rolling window.
+        slow_calls: Calls in the window slower than ``slow_call_duration``.
+        rejected: Requests rejected since the circuit last opened.
+        retry_in: Seconds until an open circuit lets a trial request through.
+        p50: Median latency of the calls in the window.
+        p99: 99th percentile latency of the calls in the window.
+    """
+
+    state: str = CLOSED
+    calls: int = 0
+    failures: int = 0
+    slow_calls: int = 0
+    rejected: int = 0
+    retry_in: float = 0.0
+    p50: Optional[float] = None
+    p99: Optional[float] = None
+
+    @property
+    def error_rate(self) -> float:
+        """Share of the calls in the window that failed."""
+        return self.failures / self.calls if self.calls else 0.0
+
+
+class _Circuit:
+    """Mutable state of one circuit; guarded by the breaker's lock."""
+
+    __slots__ = (
+        "state", "outcomes", "opened_at", "probes", "probe_successes", "rejected"
+    )
+
+    def __init__(self) -> None:
+        self.state = CLOSED
+        # (finished at, failed, slow, latency)
+        self.outcomes: Deque[Tuple[float, bool, bool, float]] = deque()
+        self.opened_at = 0.0
+        self.probes = 0
+        self.probe_successes = 0
+        self.rejected = 0
+
+
+class CircuitBreaker:
+    """
+    Thread- and asyncio-safe circuit breakers keyed by provider, model and key.
+
+    Pass one to ``Agent``, ``AsyncAgent``, the batch API or a ``Router`` with
+    ``circuit_breaker=``. API keys are only kept as a hash.
+    """
+
+    def __init__(
+        self,
+        failure_rate: float = 0.5,
+        minimum_calls: int = 10,
+        window: float = 60.0,
+        open_for: float = 30.0,
+        half_open_probes: int = 1,
+        slow_call_duration: Optional[float] = None,
+    ) -> None:
+        """
+        Initialize the breaker.
+
+        Args:
+            failure_rate: Share of failed calls in the window, from 0 to 1,
+                at which a circuit opens.
+            minimum_calls: Outcomes the window must hold before the failure
+                rate is trusted.
+            window: Seconds of outcomes the failure rate and latencies cover.
+            open_for: Seconds an open circuit rejects requests before letting
+                trial requests through.
+            half_open_probes: Trial requests allowed at once while half-open,
+                and successes needed to close the circuit again.
+            slow_call_duration: Seconds after which a successful call counts
+                as a failure. ``None`` judges calls on errors only.
+
+        Raises:
+            ValueError: If an argument is out of range.
+        """
+        if not 0 < failure_rate <= 1:
+            raise ValueError("failure_rate must be in (0, 1]")
+        if minimum_calls < 1 or half_open_probes < 1:
+            raise ValueError("minimum_calls and half_open_probes must be at least 1")
+        if window <= 0 or open_for < 0:
+            raise ValueError("window must be positive and open_for not negative")
+        self.failure_rate = failure_rate
+        self.minimum_calls = minimum_calls
+        self.window = window
+        self.open_for = open_for
+        self.half_open_probes = half_open_probes
+        self.slow_call_duration = slow_call_duration
+        self._circuits: Dict[CircuitKey, _Circuit] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(provider: str, model: str, api_key: str) -> CircuitKey:
+        """Return the circuit key of a provider, model and API key."""
+        key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        return (provider, model, key_hash)
+
+    def _circuit(self, key: CircuitKey) -> _Circuit:
+        circuit = self._circuits.get(key)
+        if circuit is None:
+            circuit = self._circuits[key] = _Circuit()
+        return circuit
+
+    def _advance(self, circuit: _Circuit, now: float) -> None:
+        """Expire old outcomes and move an open circuit to half-open when due."""
+        while circuit.outcomes and circuit.outcomes[0][0] < now - self.window:
+            circuit.outcomes.popleft()
+        if circuit.state == OPEN and now - circuit.opened_at >= self.open_for:
+            circuit.state = HALF_OPEN
+            circuit.probes = 0
+            circuit.probe_successes = 0
+
+    def _open(self, circuit: _Circuit, now: float) -> None:
+        circuit.state = OPEN
+        circuit.opened_at = now
+        circuit.rejected = 0
+
+    def before_call(self, provider: str, model: str, api_key: str) -> bool:
+        """
+        Admit a request or reject it.
+
+        Every admitted request must be followed by :meth:`after_call` with the
+        returned flag.
+
+        Returns:
+            bool: Whether the request is a half-open trial request.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with all
+                trial slots taken.
+        """
+        now = time.monotonic()
+        with self._lock:
+            circuit = self._circuit(self.key(provider, model, api_key))
+            self._advance(circuit, now)
+            if circuit.state == CLOSED:
+                return False
+            if circuit.state == HALF_OPEN and circuit.probes < self.half_open_probes:
+                circuit.probes += 1
+                return True
+            circuit.rejected += 1
+            retry_in = max(circuit.opened_at + self.open_for - now, 0.0)
+        raise CircuitOpenError(provider, model, retry_in)
+
+    def after_call(
+        self,
+        provider: str,
+        model: str,
+        api_key: str,
+        latency: Optional[float],
+        error: Optional[BaseException] = None,
+        probe: bool = False,
+    ) -> None:
+        """
+        Record the outcome of an admitted request.
+
+        Args:
+            provider: Provider the request was sent to.
+            model: Model the request was sent to.
+            api_key: API key the request was sent with.
+            latency: Seconds the request took, or ``None`` if it was abandoned
+                (e.g. cancelled) and tells nothing about the endpoint.
+            error: The error the request raised, if any.
+            probe: The flag :meth:`before_call` returned.
+        """
+        now = time.monotonic()
+        failed = error is not None and is_retryable(error)
+        slow = (
+            error is None
+            and latency is not None
+            and self.slow_call_duration is not None
+            and latency > self.slow_call_duration
+        )
+        with self._lock:
+            circuit = self._circuit(self.key(provider, model, api_key))
+            self._advance(circuit, now)
+            if latency is None:
+                if probe and circuit.state == HALF_OPEN:
+                    circuit.probes -= 1
+                return
+            circuit.outcomes.append((now, failed or slow, slow, latency))
+            if circuit.state == HALF_OPEN and probe:
+                if failed or slow:
+                    self._open(circuit, now)
+                    return
+                circuit.probe_successes += 1
+                if circuit.probe_successes >= self.half_open_probes:
+                    circuit.state = CLOSED
+                    circuit.outcomes.clear()
+                return
+            if circuit.state == CLOSED and len(circuit.outcomes) >= self.minimum_calls:
+                failures = sum(1 for outcome in circuit.outcomes if outcome[1])
+                if failures >= self.failure_rate * len(circuit.outcomes):
+                    self._open(circuit, now)
+
+    def wrap(
+        self, func: Callable[[], T], provider: str, model: str, api_key: str
+    ) -> Callable[[], T]:
+        """Return a callable that runs ``func`` through the circuit."""
+
+        def guarded() -> T:
+            probe = self.before_call(provider, model, api_key)
+            started = time.perf_counter()
+            try:
+                result = func()
+            except (CallCancelledError, DeadlineExceededError):
+                # Given up by the caller: the endpoint's health is unknown
+                self.after_call(provider, model, api_key, None, probe=probe)
+                raise
+            except Exception as e:
+                self.after_call(
+                    provider, model, api_key, time.perf_counter() - started, e, probe
+                )
+                raise
+            except BaseException:
+                self.after_call(provider, model, api_key, None, probe=probe)
+                raise
+            self.after_call(
+                provider, model, api_key, time.perf_counter() - started, probe=probe
+            )
+            return result
+
+        return guarded
+
+    def awrap(
+        self, func: Callable[[], Awaitable[T]], provider: str, model: str, api_key: str
+    ) -> Callable[[], Awaitable[T]]:
+        """Return a coroutine function that awaits ``func()`` through the circuit."""
+
+        async def guarded() -> T:
+            probe = self.before_call(provider, model, api_key)
+            started = time.perf_counter()
+            try:
+                result = await func()
+            except (CallCancelledError, DeadlineExceededError):
+                self.after_call(provider, model, api_key, None, probe=probe)
+                raise
+            except Exception as e:
+                self.after_call(
+                    provider, model, api_key, time.perf_counter() - started, e, probe
+                )
+                raise
+            except BaseException:
+                # Cancelled: the endpoint's health is unknown
+                self.after_call(provider, model, api_key, None, probe=probe)
+                raise
+            self.after_call(
+                provider, model, api_key, time.perf_counter() - started, probe=probe
+            )
+            return result
+
+        return guarded
+
+    def state(self, provider: str, model: str, api_key: str) -> str:
+        """Return the state of a circuit: 'closed', 'open' or 'half_open'."""
+        return self.health(provider, model, api_key).state
+
+    def allows(self, provider: str, model: str, api_key: str) -> bool:
+        """Whether a request sent now would be admitted; admits nothing itself."""
+        with self._lock:
+            circuit = self._circuits.get(self.key(provider, model, api_key))
+            if circuit is None:
+                return True
+            self._advance(circuit, time.monotonic())
+            return circuit.state == CLOSED or (
+                circuit.state == HALF_OPEN and circuit.probes < self.half_open_probes
+            )
+
+    def _health(self, circuit: _Circuit, now: float) -> CircuitHealth:
+        self._advance(circuit, now)
+        latencies = [outcome[3] for outcome in circuit.outcomes]
+        return CircuitHealth(
+            state=circuit.state,
+            calls=len(circuit.outcomes),
+            failures=sum(1 for outcome in circuit.outcomes if outcome[1]),
+            slow_calls=sum(1 for outcome in circuit.outcomes if outcome[2]),
+            rejected=circuit.rejected,
+            retry_in=(
+                max(circuit.opened_at + self.open_for - now, 0.0)
+                if circuit.state == OPEN else 0.0
+            ),
+            p50=metrics.percentile(latencies, 50),
+            p99=metrics.percentile(latencies, 99),
+        )
+
+    def health(self, provider: str, model: str, api_key: str) -> CircuitHealth:
+        """Return a snapshot of one circuit; unknown circuits are closed."""
+        with self._lock:
+            circuit = self._circuits.get(self.key(provider, model, api_key))
+            if circuit is None:
+                return CircuitHealth()
+            return self._health(circuit, time.monotonic())
+
+    def snapshot(self) -> Dict[CircuitKey, CircuitHealth]:
+        """Return a snapshot of every circuit, keyed by :meth:`key`."""
+        now = time.monotonic()
+        with self._lock:
+            return {key: self._health(c, now) for key, c in self._circuits.items()}
+
+    def reset(self, provider: str, model: str, api_key: str) -> None:
+        """Close a circuit and forget its outcomes."""
+        with self._lock:
+            self._circuits.pop(self.key(provider, model, api_key), None)
+
+    def clear(self) -> None:
+        """Close every circuit and forget all outcomes."""
+        with self._lock:
+            self._circuits.clear()
@@ -0,0 +1,370 @@
+"""
+The ``oju`` command-line interface.
+
+Runs a named agent over one prompt, the lines of a file or stdin, or a JSONL
+stream, without a Python driver::
+
+    oju backend_coding_agent -p openai -m gpt-4 "What is a REST API?"
+    oju backend_coding_agent -p claude -m claude-3-haiku --stream "Explain gRPC"
+    oju backend_coding_agent -p openai -m gpt-4 -c 16 --rpm 500 --stats < in.txt
+    oju backend_coding_agent -p openai -m gpt-4 --jsonl -i in.jsonl -o out.jsonl
+
+With ``--output`` the run goes through :func:`oju.pipeline.run_pipeline`, so
+an interrupted run picks up where it stopped when started again.
+
+API keys come from ``--api-key`` or the provider's environment variable
+(``OPENAI_API_KEY``, ``ANTHROPIC_API_KEY``, ``GOOGLE_API_KEY``), falling back
+to a ``.env`` file. Several comma-separated keys are balanced with a
+:class:`oju.keypool.KeyPool`.
+
+Only the standard library is imported until the arguments have been parsed,
+and provider SDKs are imported on first use, so only the selected provider's
+SDK is ever loaded.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+PROVIDERS = ("openai", "claude", "gemini")
+
+# Environment variable holding each provider's API key or comma-separated keys
+API_KEY_VARIABLES = {
+    "openai": "OPENAI_API_KEY",
+    "claude": "ANTHROPIC_API_KEY",
+    "gemini": "GOOGLE_API_KEY",
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the argument parser of the ``oju`` command."""
+    from . import __version__
+
+    parser = argparse.ArgumentParser(
+        prog="oju",
+        description="Run an oju agent over a prompt, stdin, a file or a JSONL stream.",
+    )
+    parser.add_argument("agent", help="agent name, used to locate its prompt file")
+    parser.add_argument(
+        "prompt", nargs="?",
+        help="a single prompt; without it, every non-empty input line is one prompt",
+    )
+    parser.add_argument("-p", "--provider", required=True, choices=PROVIDERS)
+    parser.add_argument("-m", "--model", required=True)
+    parser.add_argument(
+        "--api-key",
+        help="API key, or comma-separated keys to balance over "
+             "(default: the provider's environment variable)",
+    )
+    parser.add_argument(
+        "--system-prompt", help="use this system prompt instead of the file"
+    )
+    parser.add_argument("--base-url", help="override the provider's API endpoint")
+
+    io = parser.add_argument_group("input and output")
+    io.add_argument("-i", "--input", default="-", help="input file (default: stdin)")
+    io.add_argument(
+        "--jsonl", action="store_true",
+        help="input lines are JSON records; results are printed as JSON lines",
+    )
+    io.add_argument(
+        "--input-field", default="input", help="record field holding the prompt"
+    )
+    io.add_argument("--id-field", help="record field copied to the results as 'id'")
+    io.add_argument(
+        "-o", "--output",
+        help="append results to this JSONL file with a checkpoint, resuming "
+             "earlier runs (needs a JSONL or CSV input file)",
+    )
+    io.add_argument(
+        "--stream", action="store_true",
+        help="print a single prompt's response as it is generated",
+    )
+
+    tuning = parser.add_argument_group("throughput")
+    tuning.add_argument(
+        "-c", "--concurrency", type=int, default=8,
+        help="requests in flight (default: 8)",
+    )
+    tuning.add_argument("--rpm", type=float, help="requests per minute per key")
+    tuning.add_argument("--tpm", type=float, help="estimated tokens per minute per key")
+    tuning.add_argument(
+        "--retries", type=int, default=3,
+        help="retries of rate limits and transient errors (default: 3)",
+    )
+    tuning.add_argument(
+        "--timeout", type=float, metavar="SECONDS",
+        help="give up on a prompt after this long, retries included",
+    )
+    tuning.add_argument("--cache", metavar="PATH", help="SQLite response cache file")
+    tuning.add_argument(
+        "--cache-ttl", type=float, help="seconds cached responses stay valid"
+    )
+    parser.add_argument(
+        "--stats", action="store_true",
+        help="print call counts, latency percentiles and token totals to stderr",
+    )
+    parser.add_argument(
+        "--version", action="version", version=f"%(prog)s {__version__}"
+    )
+    return parser
+
+
+def _api_key(parser: argparse.ArgumentParser, args: argparse.Namespace) -> Any:
+    """Resolve the API key or key pool; a missing key is a usage error."""
+    variable = API_KEY_VARIABLES[args.provider]
+    value = args.api_key or os.environ.get(variable)
+    if not value:
+        try:
+            from dotenv import load_dotenv
+        except ImportError:
+            pass
+        else:
+            load_dotenv()
+            value = os.environ.get(variable)
+    keys = [key.strip() for key in (value or "").split(",") if key.strip()]
+    if not keys:
+        parser.error(f"no API key: pass --api-key or set {variable}")
+    if len(keys) == 1:
+        return keys[0]
+    from .keypool import KeyPool
+
+    return KeyPool(keys)
+
+
+def _agent_kwargs(args: argparse.Namespace, api_key: Any) -> Dict[str, Any]:
+    """Build the AgentSession arguments the command-line options ask for."""
+    kwargs: Dict[str, Any] = {
+        "agent_name": args.agent,
+        "model": args.model,
+        "provider": args.provider,
+        "api_key": api_key,
+        "custom_system_prompt": args.system_prompt,
+    }
+    if args.base_url:
+        kwargs["base_url"] = args.base_url
+    if args.retries > 0:
+        from .retry import RetryPolicy
+
+        kwargs["retry"] = RetryPolicy(max_attempts=args.retries + 1)
+    if args.timeout:
+        kwargs["timeout"] = args.timeout
+    if args.rpm or args.tpm:
+        from .ratelimit import RateLimiter
+
+        kwargs["rate_limiter"] = RateLimiter(args.rpm, args.tpm)
+    if args.cache:
+        from .cache import ResponseCache
+
+        kwargs["cache"] = ResponseCache(path=args.cache, ttl=args.cache_ttl)
+    return kwargs
+
+
+def _lines(stream: TextIO) -> Iterator[str]:
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def _records(
+    stream: TextIO, input_field: str, id_field: Optional[str], ids: Dict[int, Any]
+) -> Iterator[str]:
+    """Yield the prompts of a JSONL stream, noting each record's id by position."""
+    for index, line in enumerate(_lines(stream)):
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError(
+                f"Invalid JSON on input line {index + 1}: {str(e)}"
+            ) from e
+        if isinstance(record, str):
+            yield record
+            continue
+        if not isinstance(record, dict) or input_field not in record:
+            raise ValueError(f"Input line {index + 1} has no '{input_field}' field")
+        if id_field is not None:
+            ids[index] = record.get(id_field)
+        yield str(record[input_field])
+
+
+def _run_single(args: argparse.Namespace, kwargs: Dict[str, Any], out: TextIO) -> int:
+    from . import agent
+
+    session = agent.AgentSession(**kwargs)
+    if not args.stream:
+        out.write(str(session(args.prompt)) + "\n")
+        return 0
+    with session(args.prompt, stream=True) as stream:
+        for delta in stream:
+            out.write(delta)
+            out.flush()
+    out.write("\n")
+    return 0
+
+
+def _run_lines(args: argparse.Namespace, kwargs: Dict[str, Any], out: TextIO) -> int:
+    """Run every input line and print the results in input order."""
+    from . import agent
+    from .batch import iter_batch
+
+    # One session for every line: the prompt is loaded once, not per line
+    session = agent.AgentSession(**kwargs)
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    ids: Dict[int, Any] = {}
+    failed = 0
+    try:
+        prompts = (
+            _records(source, args.input_field, args.id_field, ids)
+            if args.jsonl else _lines(source)
+        )
+        results = iter_batch(prompts, session, args.concurrency, ordered=True)
+        for result in results:
+            failed += not result.ok
+            if args.jsonl:
+                line: Dict[str, Any] = {"index": result.index}
+                if result.index in ids:
+                    line["id"] = ids.pop(result.index)
+                if result.ok:
+                    line["output"] = str(result.output)
+                else:
+                    line["error"] = str(result.error)
+                out.write(json.dumps(line, ensure_ascii=False) + "\n")
+            elif result.ok:
+                out.write(str(result.output) + "\n")
+            else:
+                sys.stderr.write(f"oju: input {result.index + 1}: {result.error}\n")
+            out.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    return 1 if failed else 0
+
+
+def _run_pipeline(args: argparse.Namespace, kwargs: Dict[str, Any]) -> int:
+    from .pipeline import format_progress, run_pipeline
+
+    def report(progress: Any) -> None:
+        sys.stderr.write(format_progress(progress) + "\n")
+
+    progress = run_pipeline(
+        args.input,
+        args.output,
+        input_field=args.input_field,
+        id_field=args.id_field,
+        input_format="jsonl" if args.jsonl else None,
+        max_concurrency=args.concurrency,
+        on_progress=report if sys.stderr.isatty() else None,
+        **kwargs,
+    )
+    if progress.skipped:
+        sys.stderr.write(
+            f"oju: skipped {progress.skipped} records done by earlier runs\n"
+        )
+    return 1 if progress.failed else 0
+
+
+def _format_seconds(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.3f}s"
+
+
+def format_stats(aggregator: Any, elapsed: float) -> str:
+    """Summarize a MetricsAggregator's calls, latency percentiles and token totals."""
+    from .metrics import Histogram
+
+    calls = errors = cache_hits = retries = 0
+    input_tokens = output_tokens = cached_tokens = 0
+    duration: Optional[Histogram] = None
+    ttfb: Optional[Histogram] = None
+    for series in aggregator.snapshot().values():
+        calls += series.calls
+        errors += sum(series.errors.values())
+        cache_hits += series.cache_hits
+        retries += series.retries
+        input_tokens += series.input_tokens
+        output_tokens += series.output_tokens
+        cached_tokens += series.cached_tokens
+        # One agent, provider and model per run, so there is one series
+        duration, ttfb = series.duration, series.ttfb
+    throughput = calls / elapsed if elapsed > 0 else 0.0
+    lines: List[str] = [
+        f"calls: {calls} ({errors} failed, {cache_hits} cached, {retries} retries) "
+        f"in {elapsed:.2f}s, {throughput:.2f} calls/s",
+    ]
+    quantiles: Sequence[Tuple[str, float]] = (
+        ("p50", 0.5), ("p95", 0.95), ("p99", 0.99)
+    )
+    for name, histogram in (("latency", duration), ("first byte", ttfb)):
+        values = "  ".join(
+            f"{label} {_format_seconds(histogram.quantile(q) if histogram else None)}"
+            for label, q in quantiles
+        )
+        lines.append(f"{name}: {values}")
+    lines.append(
+        f"tokens: {input_tokens} input ({cached_tokens} cached), {output_tokens} output"
+    )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """
+    Run the ``oju`` command.
+
+    Args:
+        argv: Arguments without the program name; defaults to ``sys.argv[1:]``.
+
+    Returns:
+        int: The exit status: 0 on success, 1 if any request failed, 2 for
+        usage errors.
+    """
+    parser = build_parser()
+    # Intermixed parsing lets the prompt follow options, as in
+    # ``oju NAME -p openai -m gpt-4 "prompt"``
+    args = parser.parse_intermixed_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.retries < 0:
+        parser.error("--retries cannot be negative")
+    if args.timeout is not None and args.timeout <= 0:
+        parser.error("--timeout must be positive")
+    if args.stream and args.prompt is None:
+        parser.error("--stream needs a single prompt argument")
+    if args.output and (args.prompt is not None or args.input == "-"):
+        parser.error("--output needs an input file given with --input")
+    kwargs = _agent_kwargs(args, _api_key(parser, args))
+
+    aggregator = None
+    if args.stats:
+        from . import metrics
+
+        aggregator = metrics.MetricsAggregator()
+        metrics.add_hook(aggregator)
+    started = time.monotonic()
+    try:
+        if args.prompt is not None:
+            status = _run_single(args, kwargs, sys.stdout)
+        elif args.output:
+            status = _run_pipeline(args, kwargs)
+        else:
+            status = _run_lines(args, kwargs, sys.stdout)
+    except KeyboardInterrupt:
+        sys.stderr.write("oju: interrupted\n")
+        status = 130
+    except Exception as e:
+        sys.stderr.write(f"oju: error: {e}\n")
+        status = 1
+    finally:
+        if aggregator is not None:
+            from . import metrics
+
+            metrics.remove_hook(aggregator)
+            elapsed = time.monotonic() - started
+            sys.stderr.write(format_stats(aggregator, elapsed) + "\n")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+Module for pooling provider SDK clients.
+
+Creating an SDK client is cheap in CPU terms but expensive on the wire: every
+new client owns a fresh HTTP connection pool, so the first request through it
+pays a TCP and TLS handshake. This module keeps clients alive between calls so
+that consecutive requests with the same credentials reuse warm connections.
+"""
+
+import asyncio
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+PoolKey = Tuple[str, str, Optional[str]]
+
+
+class ClientPool:
+    """
+    A thread-safe, size-bounded LRU pool of provider SDK clients.
+
+    Clients are keyed by ``(provider, api_key, base_url)``. When the pool grows
+    past ``max_size`` the least recently used client is evicted and closed.
+
+    Note that an evicted client is closed immediately, so a request still in
+    flight on it may fail. Size the pool above the number of distinct
+    credentials you expect to use concurrently.
+    """
+
+    def __init__(self, max_size: int = 32) -> None:
+        """
+        Initialize the pool.
+
+        Args:
+            max_size: Maximum number of clients kept alive at once.
+
+        Raises:
+            ValueError: If max_size is less than 1.
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self._clients: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        provider: str,
+        api_key: str,
+        factory: Callable[[], Any],
+        base_url: Optional[str] = None,
+    ) -> Any:
+        """
+        Return the pooled client for the given credentials, creating it if needed.
+
+        Args:
+            provider: Provider name (e.g., 'openai', 'claude').
+            api_key: API key the client is bound to.
+            factory: Zero-argument callable that builds a new client.
+            base_url: Optional base URL the client is bound to.
+
+        Returns:
+            The pooled SDK client.
+        """
+        key: PoolKey = (provider, api_key, base_url)
+        evicted = []
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                return client
+            client = factory()
+            self._clients[key] = client
+            while len(self._clients) > self.max_size:
+                _, old = self._clients.popitem(last=False)
+                evicted.append(old)
+        for old in evicted:
+            _close_client(old)
+        return client
+
+    def clear(self) -> None:
+        """Close and remove every pooled client."""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            _close_client(client)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._clients)
+
+
+def _close_client(client: Any) -> None:
+    """Close an SDK client, ignoring clients without a close method."""
+    close = getattr(client, "close", None)
+    if close is None:
+        # Google API clients expose close() on their transport instead
+        close = getattr(getattr(client, "transport", None), "close", None)
+    if close is None:
+        return
+    try:
+        result = close()
+        if asyncio.iscoroutine(result):
+            # Async clients close on their own event loop; without a running
+            # loop the coroutine is discarded and the sockets are left to GC
+            try:
+                asyncio.get_running_loop().create_task(result)
+            except RuntimeError:
+                result.close()
+    except Exception:
+        # Closing is best-effort; a failure here must not break the caller
+        pass
+
+
+# Process-wide pool used by the functions in oju.providers
+client_pool = ClientPool()
+
+_async_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ClientPool]" = (
+    weakref.WeakKeyDictionary()
+)
+_async_pools_lock = threading.Lock()
+
+
+def async_client_pool() -> ClientPool:
+    """
+    Return the client pool for the running event loop.
+
+    Async SDK clients hold connections bound to the event loop they were first
+    used on, so each loop gets its own pool. A loop's pool is dropped together
+    with the loop.
+
+    Returns:
+        The ClientPool for the current event loop.
+
+    Raises:
+        RuntimeError: If called outside a running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    with _async_pools_lock:
+        pool = _async_pools.get(loop)
+        if pool is None:
+            pool = ClientPool(max_size=client_pool.max_size)
+            _async_pools[loop] = pool
+        return pool
@@ -0,0 +1,216 @@
+"""
+Module for coalescing identical in-flight requests.
+
+A ``SingleFlight`` lets concurrent callers that ask for the same key share one
+execution: the first caller runs the function, callers that arrive while it is
+in flight wait for it and receive the same result or exception. Once the call
+finishes the key is forgotten, so later callers start a new one; caching
+finished results is the job of :class:`oju.cache.ResponseCache`.
+
+Threads and asyncio tasks are coalesced separately, since a coroutine can
+only be awaited from its own event loop. A caller given a deadline stops
+waiting for the shared call when its own deadline passes, even if the call
+it joined runs on.
+"""
+
+import asyncio
+import threading
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from .deadline import Deadline, DeadlineExceededError
+
+T = TypeVar("T")
+
+
+@dataclass
+class CoalesceStats:
+    """
+    Counters of a SingleFlight.
+
+    Attributes:
+        requests: Calls made through the SingleFlight.
+        executions: Calls that actually ran the function.
+        collapsed: Calls that joined an execution already in flight.
+    """
+
+    requests: int = 0
+    executions: int = 0
+    collapsed: int = 0
+
+    @property
+    def collapse_rate(self) -> float:
+        """Fraction of requests served by another caller's execution."""
+        return self.collapsed / self.requests if self.requests else 0.0
+
+
+class _Flight:
+    """One in-flight threaded execution and its outcome."""
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _AsyncFlight:
+    """One in-flight asyncio execution and the number of tasks awaiting it."""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task[Any]") -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Thread- and asyncio-safe coalescing of concurrent calls with equal keys.
+
+    Pass one to ``Agent``, ``AsyncAgent`` or the batch API with ``coalesce=``
+    to collapse identical concurrent requests into one provider call.
+    """
+
+    def __init__(self) -> None:
+        self._flights: Dict[str, _Flight] = {}
+        # Keyed by event loop as well, since tasks cannot be shared across loops
+        self._async_flights: Dict[Tuple[int, str], _AsyncFlight] = {}
+        self._lock = threading.Lock()
+        self._stats = CoalesceStats()
+
+    def do(
+        self,
+        key: str,
+        func: Callable[[], T],
+        deadline: Optional[Deadline] = None,
+    ) -> Tuple[T, bool]:
+        """
+        Run ``func`` unless a call with the same key is in flight, then share it.
+
+        Args:
+            key: Identifies equivalent calls.
+            func: The call to run.
+            deadline: Optional deadline of this caller. It bounds the wait for
+                a call made by another thread; ``func`` itself is expected to
+                honour it when this caller runs the call.
+
+        Returns:
+            Tuple[T, bool]: The result, and whether it came from a call made
+            by another thread.
+
+        Raises:
+            DeadlineExceededError: If ``deadline`` passed while waiting for a
+                call made by another thread.
+            Exception: Whatever ``func`` raised, in every caller that shared it.
+        """
+        with self._lock:
+            self._stats.requests += 1
+            flight = self._flights.get(key)
+            joined = flight is not None
+            if joined:
+                self._stats.collapsed += 1
+            else:
+                flight = self._flights[key] = _Flight()
+                self._stats.executions += 1
+
+        if joined:
+            timeout = None if deadline is None else deadline.remaining()
+            if not flight.done.wait(timeout):
+                raise DeadlineExceededError(deadline.timeout)
+        else:
+            try:
+                flight.result = func()
+            except BaseException as e:
+                flight.error = e
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, joined
+
+    async def ado(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[T]],
+        deadline: Optional[Deadline] = None,
+    ) -> Tuple[T, bool]:
+        """
+        The async counterpart of :meth:`do`.
+
+        The shared call runs as its own task, so cancelling one caller or
+        reaching its deadline does not affect the others; the call is cancelled
+        only when every caller has gone.
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        with self._lock:
+            self._stats.requests += 1
+            flight = self._async_flights.get(flight_key)
+            joined = flight is not None
+            if joined:
+                self._stats.collapsed += 1
+            else:
+                flight = _AsyncFlight(loop.create_task(func()))
+                self._async_flights[flight_key] = flight
+                self._stats.executions += 1
+                flight.task.add_done_callback(
+                    lambda task: self._forget(flight_key, task)
+                )
+            flight.waiters += 1
+
+        try:
+            if deadline is None:
+                result = await asyncio.shield(flight.task)
+            else:
+                result = await asyncio.wait_for(
+                    asyncio.shield(flight.task), deadline.remaining()
+                )
+        except asyncio.CancelledError:
+            self._leave(flight)
+            raise
+        except asyncio.TimeoutError:
+            if flight.task.done():
+                # Raised by the shared call itself
+                raise
+            self._leave(flight)
+            raise DeadlineExceededError(deadline.timeout) from None
+        return result, joined
+
+    @staticmethod
+    def _leave(flight: _AsyncFlight) -> None:
+        """Stop awaiting ``flight``, cancelling it once nobody awaits it."""
+        if not flight.task.done():
+            flight.waiters -= 1
+            if flight.waiters == 0:
+                flight.task.cancel()
+
+    def _forget(self, flight_key: Tuple[int, str], task: "asyncio.Task[Any]") -> None:
+        with self._lock:
+            flight = self._async_flights.get(flight_key)
+            if flight is not None and flight.task is task:
+                del self._async_flights[flight_key]
+        # Retrieve the outcome so an error nobody awaited is not logged as lost
+        if not task.cancelled():
+            task.exception()
+
+    @property
+    def in_flight(self) -> int:
+        """Number of calls currently running."""
+        with self._lock:
+            return len(self._flights) + len(self._async_flights)
+
+    @property
+    def stats(self) -> CoalesceStats:
+        """A snapshot of the counters."""
+        with self._lock:
+            return CoalesceStats(**vars(self._stats))
+
+    def reset_stats(self) -> None:
+        """Zero the counters."""
+        with self._lock:
+            self._stats = CoalesceStats()
@@ -0,0 +1,423 @@
+"""
+Module for per-call deadlines and cooperative cancellation.
+
+Without a timeout, a hung upstream connection holds a worker for as long as
+the provider SDK's default allows, often ten minutes. A :class:`Deadline` is
+the point in time by which a call has to finish. Each attempt of the call is
+given a share of the time left, which the provider functions pass to the SDK
+as its connect and read timeouts (for Gemini, the request deadline). The time
+left is split evenly over the attempts a RetryPolicy still allows, so a hung
+first attempt leaves time for the retries, and no retry is started once the
+deadline has passed. Streams stop with a :class:`DeadlineExceededError` once
+it passes, and a wait for rate limit budget or a pooled key that would end
+after it fails straight away.
+
+A :class:`CancelToken` lets another thread or task give up on calls:
+
+* asynchronous calls and reads of async streams are aborted at once, the
+  in-flight HTTP request included;
+* synchronous streams are closed, so their pending read fails;
+* synchronous calls wake up from retry backoff and from waits for rate limit
+  budget or a pooled key. Their requests run on a worker thread, see
+  :func:`call_cancellable`, so the caller is released at once while the
+  request, which the SDKs cannot interrupt, finishes in the background and
+  its answer is discarded.
+
+A cancelled call raises :class:`CallCancelledError`.
+"""
+
+import asyncio
+import contextvars
+import itertools
+import threading
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    Optional,
+    TypeVar,
+)
+
+from .streaming import AsyncTextStream, TextStream
+
+T = TypeVar("T")
+
+# Longest wait for a connection, however much of the deadline is left
+CONNECT_TIMEOUT = 10.0
+
+
+class DeadlineExceededError(Exception):
+    """Raised when a call's deadline passes before the call finished."""
+
+    def __init__(self, timeout: Optional[float] = None) -> None:
+        super().__init__(
+            "Deadline exceeded" if timeout is None
+            else f"Deadline of {timeout:g}s exceeded"
+        )
+        self.timeout = timeout
+
+
+class CallCancelledError(Exception):
+    """Raised by a call whose CancelToken was cancelled."""
+
+    def __init__(self, reason: Optional[str] = None) -> None:
+        super().__init__("Call cancelled" + (f": {reason}" if reason else ""))
+        self.reason = reason
+
+
+class Deadline:
+    """
+    The point in time by which a call has to finish.
+
+    Deadlines use the monotonic clock, so wall clock changes do not move them.
+    Pass one deadline to every call made on behalf of one incoming request to
+    bound them together.
+    """
+
+    __slots__ = ("expires_at", "timeout")
+
+    def __init__(self, expires_at: float, timeout: Optional[float] = None) -> None:
+        """
+        Initialize the deadline.
+
+        Args:
+            expires_at: The ``time.monotonic()`` value at which it passes.
+            timeout: The duration it was created with, for error messages.
+        """
+        self.expires_at = expires_at
+        self.timeout = timeout
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        """
+        Return a deadline ``seconds`` from now.
+
+        Raises:
+            ValueError: If seconds is not positive.
+        """
+        if seconds <= 0:
+            raise ValueError("timeout must be positive")
+        return cls(time.monotonic() + seconds, seconds)
+
+    def remaining(self) -> float:
+        """Seconds left, or 0.0 once the deadline has passed."""
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        """Whether the deadline has passed."""
+        return time.monotonic() >= self.expires_at
+
+    def check(self) -> None:
+        """
+        Raise if the deadline has passed.
+
+        Raises:
+            DeadlineExceededError: If the deadline has passed.
+        """
+        if self.expired:
+            raise DeadlineExceededError(self.timeout)
+
+    def attempt_timeout(self, attempts_left: int = 1) -> float:
+        """
+        Return the timeout of the next attempt, an even share of the time left.
+
+        Args:
+            attempts_left: Attempts the call may still make, the next one
+                included.
+
+        Raises:
+            DeadlineExceededError: If the deadline has passed.
+        """
+        remaining = self.expires_at - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceededError(self.timeout)
+        return remaining / max(attempts_left, 1)
+
+    def __repr__(self) -> str:
+        return f"Deadline(remaining={self.remaining():.3f})"
+
+
+def resolve_deadline(
+    timeout: Optional[float], deadline: Optional[Deadline]
+) -> Optional[Deadline]:
+    """
+    Combine a timeout in seconds and a deadline into the earlier of the two.
+
+    Raises:
+        ValueError: If timeout is not positive.
+    """
+    if timeout is None:
+        return deadline
+    own = Deadline.after(timeout)
+    if deadline is None or own.expires_at < deadline.expires_at:
+        return own
+    return deadline
+
+
+class CancelToken:
+    """
+    A thread-safe flag that aborts the calls it is passed to.
+
+    Share one token between all calls made for one incoming request to shed
+    them together. Cancelling is permanent; use a new token for new work.
+    """
+
+    def __init__(self) -> None:
+        """Initialize a token that is not cancelled."""
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: Dict[int, Callable[[], Any]] = {}
+        self._ids = itertools.count()
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the token has been cancelled."""
+        return self._event.is_set()
+
+    def cancel(self, reason: Optional[str] = None) -> None:
+        """
+        Cancel the token and abort the calls using it; safe from any thread.
+
+        Args:
+            reason: Optional explanation carried by the CallCancelledError.
+        """
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                # Aborting is best-effort; one failure must not spare the others
+                pass
+
+    def raise_if_cancelled(self) -> None:
+        """
+        Raise if the token has been cancelled.
+
+        Raises:
+            CallCancelledError: If the token has been cancelled.
+        """
+        if self._event.is_set():
+            raise CallCancelledError(self.reason)
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep up to ``timeout`` seconds, waking early; return whether cancelled."""
+        return self._event.wait(timeout)
+
+    def add_callback(self, callback: Callable[[], Any]) -> Callable[[], None]:
+        """
+        Run ``callback`` on cancellation, or at once if already cancelled.
+
+        Returns:
+            A function that removes the callback again.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                key = next(self._ids)
+                self._callbacks[key] = callback
+
+                def remove() -> None:
+                    with self._lock:
+                        self._callbacks.pop(key, None)
+
+                return remove
+        callback()
+        return lambda: None
+
+
+async def run_cancellable(awaitable: Awaitable[T], cancel: CancelToken) -> T:
+    """
+    Await ``awaitable`` in a task that cancelling the token cancels.
+
+    Cancelling the task aborts the request it is waiting for, so the token
+    frees the connection as well as the caller.
+
+    Raises:
+        CallCancelledError: If the token is cancelled first.
+    """
+    cancel.raise_if_cancelled()
+    loop = asyncio.get_running_loop()
+    task = asyncio.ensure_future(awaitable)
+    remove = cancel.add_callback(lambda: loop.call_soon_threadsafe(task.cancel))
+    try:
+        return await task
+    except asyncio.CancelledError:
+        if cancel.cancelled:
+            raise CallCancelledError(cancel.reason) from None
+        raise
+    finally:
+        remove()
+
+
+def call_cancellable(func: Callable[[], T], cancel: CancelToken) -> T:
+    """
+    Call ``func`` on a worker thread that cancelling the token abandons.
+
+    The synchronous SDKs cannot interrupt a request from another thread, so
+    the token releases the caller instead: it raises at once while the
+    request runs to its end, bounded by its timeout, on the worker. The late
+    result is discarded; a late stream is closed.
+
+    Raises:
+        CallCancelledError: If the token is cancelled first.
+    """
+    cancel.raise_if_cancelled()
+    wake = threading.Event()
+    lock = threading.Lock()
+    outcome: Dict[str, Any] = {}
+    abandoned = False
+
+    def run() -> None:
+        try:
+            outcome["result"] = func()
+        except BaseException as e:
+            outcome["error"] = e
+        with lock:
+            late = abandoned
+            wake.set()
+        close = getattr(outcome.get("result"), "close", None)
+        if late and close is not None:
+            try:
+                close()
+            except Exception:
+                pass
+
+    remove = cancel.add_callback(wake.set)
+    context = contextvars.copy_context()
+    worker = threading.Thread(
+        target=context.run, args=(run,), name="oju-call", daemon=True
+    )
+    try:
+        worker.start()
+        wake.wait()
+    finally:
+        remove()
+    with lock:
+        if not outcome:
+            abandoned = True
+            raise CallCancelledError(cancel.reason)
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def guard_stream(
+    stream: TextStream,
+    deadline: Optional[Deadline] = None,
+    cancel: Optional[CancelToken] = None,
+) -> TextStream:
+    """
+    Bound a stream by a deadline and a cancel token.
+
+    The stream stops with a DeadlineExceededError once the deadline passes.
+    Cancelling the token aborts the stream's connection from any thread, and
+    the read waiting on it fails with a CallCancelledError.
+    """
+    remove = cancel.add_callback(stream.abort) if cancel is not None else None
+
+    def deltas() -> Iterator[str]:
+        try:
+            for delta in stream:
+                if cancel is not None:
+                    cancel.raise_if_cancelled()
+                if deadline is not None:
+                    deadline.check()
+                yield delta
+            if cancel is not None:
+                # An aborted connection may end the stream without an error
+                cancel.raise_if_cancelled()
+        except Exception as e:
+            if cancel is not None and cancel.cancelled and not isinstance(
+                e, CallCancelledError
+            ):
+                raise CallCancelledError(cancel.reason) from e
+            raise
+        finally:
+            if remove is not None:
+                remove()
+            stream.close()
+
+    return TextStream(deltas(), stream.summary, on_close=stream.close)
+
+
+def sleep_within(
+    seconds: float,
+    deadline: Optional[Deadline] = None,
+    cancel: Optional[CancelToken] = None,
+) -> None:
+    """
+    Sleep for ``seconds`` unless the deadline or the token ends the wait.
+
+    A sleep that would outlast the deadline fails at once instead of
+    sleeping until the deadline only to fail then.
+
+    Raises:
+        DeadlineExceededError: If the sleep would end after the deadline.
+        CallCancelledError: As soon as the token is cancelled.
+    """
+    if cancel is not None:
+        cancel.raise_if_cancelled()
+    if deadline is not None and seconds > deadline.remaining():
+        raise DeadlineExceededError(deadline.timeout)
+    if cancel is None:
+        time.sleep(seconds)
+    elif cancel.wait(seconds):
+        raise CallCancelledError(cancel.reason)
+
+
+async def asleep_within(
+    seconds: float,
+    deadline: Optional[Deadline] = None,
+    cancel: Optional[CancelToken] = None,
+) -> None:
+    """The async counterpart of :func:`sleep_within`; the loop is not blocked."""
+    if cancel is not None:
+        cancel.raise_if_cancelled()
+    if deadline is not None and seconds > deadline.remaining():
+        raise DeadlineExceededError(deadline.timeout)
+    if cancel is None:
+        await asyncio.sleep(seconds)
+    else:
+        await run_cancellable(asyncio.sleep(seconds), cancel)
+
+
+def aguard_stream(
+    stream: AsyncTextStream,
+    deadline: Optional[Deadline] = None,
+    cancel: Optional[CancelToken] = None,
+) -> AsyncTextStream:
+    """
+    Bound an async stream by a deadline and a cancel token.
+
+    The async counterpart of :func:`guard_stream`. Each read runs through
+    :func:`run_cancellable`, so cancelling the token aborts a pending read.
+    """
+
+    async def deltas() -> AsyncIterator[str]:
+        try:
+            while True:
+                try:
+                    if cancel is None:
+                        delta = await stream.__anext__()
+                    else:
+                        delta = await run_cancellable(stream.__anext__(), cancel)
+                except StopAsyncIteration:
+                    return
+                if deadline is not None:
+                    deadline.check()
+                yield delta
+        finally:
+            await stream.aclose()
+
+    return AsyncTextStream(deltas(), stream.summary, on_close=stream.aclose)
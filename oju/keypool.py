@@ -0,0 +1,549 @@
+"""
+Module for spreading requests over several API keys of one provider.
+
+A ``KeyPool`` can be passed wherever ``Agent``, ``AsyncAgent``, the batch API
+or a routing ``Target`` take an ``api_key``. Every attempt draws the key with
+the most rate limit headroom left. A retried attempt draws again, so a
+request that hit a 429 on one key moves on to another.
+
+Headroom is learned from what the provider reports:
+
+* ``x-ratelimit-*`` (OpenAI) and ``anthropic-ratelimit-*`` (Anthropic)
+  headers, read from every response, successful or not, and from anything
+  passed to :meth:`KeyPool.observe`. A key with no requests or tokens left is
+  pulled until its window resets.
+* 429 responses pull the key for their ``Retry-After`` delay, or
+  ``cooldown`` seconds without one.
+* 401 and 403 responses mark the key as revoked and pull it for
+  ``revoked_for`` seconds.
+
+Successful responses carry their headers on ``Completion.headers`` and
+``TextStream.headers``. Between responses, for example while many requests
+are in flight, headroom is counted down locally from the last reported
+value. Optional ``requests_per_minute`` and ``tokens_per_minute`` give every
+key a known budget to count down from instead. Keys with nothing reported are
+balanced by the number of requests in flight.
+
+Per-key utilization is available from :meth:`KeyPool.stats`. Keys are never
+exposed in full: statistics and ``repr`` use the last four characters only.
+"""
+
+import asyncio
+import email.utils
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from .deadline import (
+    CallCancelledError,
+    CancelToken,
+    Deadline,
+    DeadlineExceededError,
+    asleep_within,
+    sleep_within,
+)
+from .retry import response_headers, retry_after, status_code
+
+T = TypeVar("T")
+
+# Header name prefixes carrying rate limit state, per provider
+_HEADER_PREFIXES = ("x-ratelimit-", "anthropic-ratelimit-")
+
+# Durations such as '1s', '6m0s' or '20ms' used by OpenAI reset headers
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _parse_reset(value: str) -> Optional[float]:
+    """Seconds until a reset header's time, from a duration or an RFC 3339 date."""
+    value = value.strip()
+    parts = _DURATION_PART.findall(value)
+    if parts and "".join(amount + unit for amount, unit in parts) == value:
+        return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        try:
+            reset_at = email.utils.parsedate_to_datetime(value).timestamp()
+        except (TypeError, ValueError):
+            return None
+    return max(reset_at - time.time(), 0.0)
+
+
+def _header(headers: Mapping[str, Any], name: str) -> Optional[str]:
+    """Read a rate limit header under either provider's prefix."""
+    for prefix in _HEADER_PREFIXES:
+        try:
+            value = headers.get(prefix + name)
+        except AttributeError:
+            return None
+        if value is not None:
+            return str(value)
+    return None
+
+
+def _header_int(headers: Mapping[str, Any], name: str) -> Optional[int]:
+    value = _header(headers, name)
+    if value is None:
+        return None
+    try:
+        return int(float(value))
+    except ValueError:
+        return None
+
+
+def mask_key(api_key: str) -> str:
+    """Return a label identifying an API key by its last four characters."""
+    return "..." + api_key[-4:]
+
+
+@dataclass
+class KeyStats:
+    """
+    Utilization of one key in a KeyPool.
+
+    Attributes:
+        key: The key's label, e.g. '...9f3a'.
+        requests: Attempts sent with the key.
+        failures: Attempts that raised, rate limits and revocations included.
+        rate_limited: Attempts rejected with a 429.
+        in_flight: Attempts currently running.
+        available: Whether the key is currently in rotation.
+        pulled_for: Seconds until a pulled key is used again.
+        revoked: Whether the key was last rejected as invalid or forbidden.
+        remaining_requests: Requests left in the current window, as last
+            reported or counted down locally; ``None`` if unknown.
+        remaining_tokens: Tokens left in the current window; ``None`` if unknown.
+        utilization: Share of the key's request budget used in the current
+            window, from 0 to 1; ``None`` if the budget is unknown.
+        share: The key's share of all attempts sent through the pool.
+    """
+
+    key: str
+    requests: int = 0
+    failures: int = 0
+    rate_limited: int = 0
+    in_flight: int = 0
+    available: bool = True
+    pulled_for: float = 0.0
+    revoked: bool = False
+    remaining_requests: Optional[int] = None
+    remaining_tokens: Optional[int] = None
+    utilization: Optional[float] = None
+    share: float = 0.0
+
+
+class _KeyState:
+    """Mutable bookkeeping of one key; guarded by the pool's lock."""
+
+    __slots__ = (
+        "requests", "failures", "rate_limited", "in_flight", "pulled_until",
+        "revoked", "limit_requests", "remaining_requests", "remaining_tokens",
+        "reset_at", "sent", "last_used",
+    )
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.pulled_until = 0.0
+        self.revoked = False
+        self.limit_requests: Optional[int] = None
+        self.remaining_requests: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        # When the reported remaining values stop being meaningful
+        self.reset_at = 0.0
+        # (sent at, estimated tokens) of the last minute, for local budgets
+        self.sent: Deque[Tuple[float, int]] = deque()
+        self.last_used = 0.0
+
+
+class KeyPool:
+    """
+    Thread- and asyncio-safe load balancing over several API keys.
+
+    All keys must belong to the same provider. Keys are handed out per
+    attempt with :meth:`acquire` and returned with :meth:`release`;
+    :meth:`wrap` and :meth:`awrap` do both around a call.
+    """
+
+    def __init__(
+        self,
+        api_keys: Iterable[str],
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        cooldown: float = 60.0,
+        revoked_for: float = 600.0,
+    ) -> None:
+        """
+        Initialize the pool.
+
+        Args:
+            api_keys: The keys to balance over. Duplicates are ignored.
+            requests_per_minute: Optional request budget of each key.
+            tokens_per_minute: Optional token budget of each key.
+            cooldown: Seconds a rate limited key is pulled for when the
+                provider gives no Retry-After or reset time.
+            revoked_for: Seconds a key rejected with 401 or 403 is pulled for.
+
+        Raises:
+            ValueError: If no key is given or an argument is out of range.
+        """
+        keys = list(dict.fromkeys(api_keys))
+        if not keys or not all(keys):
+            raise ValueError("A KeyPool needs at least one non-empty API key")
+        if cooldown < 0 or revoked_for < 0:
+            raise ValueError("cooldown and revoked_for cannot be negative")
+        for budget in (requests_per_minute, tokens_per_minute):
+            if budget is not None and budget <= 0:
+                raise ValueError("per-minute budgets must be positive")
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.cooldown = cooldown
+        self.revoked_for = revoked_for
+        self._keys: Tuple[str, ...] = tuple(keys)
+        self._states: Dict[str, _KeyState] = {key: _KeyState() for key in keys}
+        self._lock = threading.Lock()
+
+    @property
+    def keys(self) -> Tuple[str, ...]:
+        """The pooled keys, in the order they were given."""
+        return self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __repr__(self) -> str:
+        labels = ", ".join(mask_key(key) for key in self._keys)
+        return f"KeyPool([{labels}])"
+
+    def _expire(self, state: _KeyState, now: float) -> None:
+        while state.sent and state.sent[0][0] <= now - 60.0:
+            state.sent.popleft()
+        if state.reset_at and now >= state.reset_at:
+            state.remaining_requests = None
+            state.remaining_tokens = None
+            state.reset_at = 0.0
+
+    def _remaining(self, state: _KeyState) -> Tuple[Optional[float], Optional[float]]:
+        """Requests and tokens left for a key, or ``None`` where unknown."""
+        requests: Optional[float] = state.remaining_requests
+        tokens: Optional[float] = state.remaining_tokens
+        if self.requests_per_minute is not None:
+            local = self.requests_per_minute - len(state.sent)
+            requests = local if requests is None else min(requests, local)
+        if self.tokens_per_minute is not None:
+            local = self.tokens_per_minute - sum(amount for _, amount in state.sent)
+            tokens = local if tokens is None else min(tokens, local)
+        return requests, tokens
+
+    def _pick(self, tokens: int, now: float) -> Optional[str]:
+        """Choose the available key with the most headroom."""
+        best_key, best_score = None, None
+        for key in self._keys:
+            state = self._states[key]
+            self._expire(state, now)
+            if state.pulled_until > now:
+                continue
+            requests, budget = self._remaining(state)
+            score = (
+                # Keys with room for the request's tokens first
+                budget is None or budget >= tokens,
+                # Then the most requests left; unknown headroom counts as ample
+                float("inf") if requests is None else requests - state.in_flight,
+                -state.in_flight,
+                # Least recently used on ties, so equal keys take turns
+                -state.last_used,
+            )
+            if best_score is None or score > best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def _reserve(self, tokens: int) -> Tuple[Optional[str], float]:
+        """Take a key, or return the seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            key = self._pick(tokens, now)
+            if key is None:
+                wait = min(state.pulled_until for state in self._states.values()) - now
+                return None, max(wait, 0.001)
+            state = self._states[key]
+            state.requests += 1
+            state.in_flight += 1
+            state.last_used = now
+            state.sent.append((now, tokens))
+            if state.remaining_requests is not None:
+                state.remaining_requests -= 1
+            if state.remaining_tokens is not None:
+                state.remaining_tokens -= tokens
+            return key, 0.0
+
+    def acquire(
+        self,
+        tokens: int = 0,
+        on_wait: Optional[Callable[[float], Any]] = None,
+        deadline: Optional[Deadline] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> str:
+        """
+        Hand out the key with the most headroom, waiting while all are pulled.
+
+        Args:
+            tokens: Estimated tokens of the request.
+            on_wait: Optional callback receiving the seconds spent waiting.
+            deadline: Optional Deadline of the call. Waiting for a key that
+                is pulled until after it fails at once.
+            cancel: Optional CancelToken that ends the wait.
+
+        Returns:
+            str: The key to send the request with. Pass it back to
+            :meth:`release` once the request has finished.
+
+        Raises:
+            DeadlineExceededError: If no key is available before the deadline.
+            CallCancelledError: If the token is cancelled while waiting.
+        """
+        waited = 0.0
+        while True:
+            key, wait = self._reserve(tokens)
+            if key is not None:
+                break
+            sleep_within(wait, deadline, cancel)
+            waited += wait
+        if waited and on_wait is not None:
+            on_wait(waited)
+        return key
+
+    async def aacquire(
+        self,
+        tokens: int = 0,
+        on_wait: Optional[Callable[[float], Any]] = None,
+        deadline: Optional[Deadline] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> str:
+        """The async counterpart of :meth:`acquire`; waiting does not block the loop."""
+        waited = 0.0
+        while True:
+            key, wait = self._reserve(tokens)
+            if key is not None:
+                break
+            await asleep_within(wait, deadline, cancel)
+            waited += wait
+        if waited and on_wait is not None:
+            on_wait(waited)
+        return key
+
+    def _observe(
+        self, state: _KeyState, headers: Mapping[str, Any], now: float
+    ) -> None:
+        remaining_requests = _header_int(headers, "remaining-requests")
+        if remaining_requests is None:
+            remaining_requests = _header_int(headers, "requests-remaining")
+        remaining_tokens = _header_int(headers, "remaining-tokens")
+        if remaining_tokens is None:
+            remaining_tokens = _header_int(headers, "tokens-remaining")
+        limit = _header_int(headers, "limit-requests")
+        if limit is None:
+            limit = _header_int(headers, "requests-limit")
+        resets = [
+            _parse_reset(value)
+            for value in (
+                _header(headers, "reset-requests"),
+                _header(headers, "requests-reset"),
+                _header(headers, "reset-tokens"),
+                _header(headers, "tokens-reset"),
+            )
+            if value is not None
+        ]
+        resets = [reset for reset in resets if reset is not None]
+        if remaining_requests is None and remaining_tokens is None:
+            return
+        state.remaining_requests = remaining_requests
+        state.remaining_tokens = remaining_tokens
+        if limit is not None:
+            state.limit_requests = limit
+        # Reported values hold until the window resets, or a minute at most
+        state.reset_at = now + (max(resets) if resets else 60.0)
+        if remaining_requests == 0 or remaining_tokens == 0:
+            state.pulled_until = max(
+                state.pulled_until, now + min(resets or [self.cooldown])
+            )
+
+    def observe(self, api_key: str, headers: Mapping[str, Any]) -> None:
+        """
+        Update a key's headroom from the rate limit headers of a response.
+
+        Args:
+            api_key: The key the response was received for.
+            headers: The response headers.
+        """
+        with self._lock:
+            state = self._states.get(api_key)
+            if state is not None:
+                self._observe(state, headers, time.monotonic())
+
+    def release(
+        self,
+        api_key: str,
+        error: Optional[BaseException] = None,
+        headers: Optional[Mapping[str, Any]] = None,
+    ) -> None:
+        """
+        Return a key handed out by :meth:`acquire` with the attempt's outcome.
+
+        Args:
+            api_key: The key.
+            error: The error the attempt raised, if any. Rate limits and
+                revocations pull the key; headers on the error are observed.
+            headers: Headers of the successful response, if any, to observe.
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self._states.get(api_key)
+            if state is None:
+                return
+            state.in_flight = max(state.in_flight - 1, 0)
+            if error is None:
+                state.revoked = False
+                if headers:
+                    self._observe(state, headers, now)
+                return
+            state.failures += 1
+            for headers in response_headers(error):
+                self._observe(state, headers, now)
+                break
+            code = status_code(error)
+            if code == 429:
+                state.rate_limited += 1
+                delay = retry_after(error)
+                if delay is not None:
+                    state.pulled_until = max(state.pulled_until, now + delay)
+                elif state.pulled_until <= now:
+                    # No hint and no reset header pulled the key already
+                    state.pulled_until = now + self.cooldown
+            elif code in (401, 403):
+                state.revoked = True
+                state.pulled_until = max(state.pulled_until, now + self.revoked_for)
+
+    def restore(self, api_key: str) -> None:
+        """Put a pulled key back into rotation at once."""
+        with self._lock:
+            state = self._states.get(api_key)
+            if state is not None:
+                state.pulled_until = 0.0
+                state.revoked = False
+
+    def wrap(
+        self,
+        make_call: Callable[[str], Callable[[], T]],
+        tokens: int = 0,
+        on_wait: Optional[Callable[[float], Any]] = None,
+        deadline: Optional[Deadline] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> Callable[[], T]:
+        """
+        Return a callable that runs one attempt with a key from the pool.
+
+        Args:
+            make_call: Builds the zero-argument attempt for a given key.
+            tokens: Estimated tokens of the request.
+            on_wait: Optional callback receiving seconds spent waiting for a key.
+            deadline: Optional Deadline bounding the wait, as in :meth:`acquire`.
+            cancel: Optional CancelToken that ends the wait.
+
+        An attempt its caller cancelled or gave up on at its deadline releases
+        the key without counting a failure against it.
+        """
+
+        def balanced() -> T:
+            key = self.acquire(tokens, on_wait, deadline, cancel)
+            try:
+                result = make_call(key)()
+            except (CallCancelledError, DeadlineExceededError):
+                self.release(key)
+                raise
+            except BaseException as e:
+                self.release(key, e)
+                raise
+            self.release(key, headers=getattr(result, "headers", None))
+            return result
+
+        return balanced
+
+    def awrap(
+        self,
+        make_call: Callable[[str], Callable[[], Awaitable[T]]],
+        tokens: int = 0,
+        on_wait: Optional[Callable[[float], Any]] = None,
+        deadline: Optional[Deadline] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> Callable[[], Awaitable[T]]:
+        """The async counterpart of :meth:`wrap`."""
+
+        async def balanced() -> T:
+            key = await self.aacquire(tokens, on_wait, deadline, cancel)
+            try:
+                result = await make_call(key)()
+            except (
+                asyncio.CancelledError, CallCancelledError, DeadlineExceededError
+            ):
+                self.release(key)
+                raise
+            except BaseException as e:
+                self.release(key, e)
+                raise
+            self.release(key, headers=getattr(result, "headers", None))
+            return result
+
+        return balanced
+
+    def stats(self) -> List[KeyStats]:
+        """Return the utilization of every key, in the order the keys were given."""
+        now = time.monotonic()
+        with self._lock:
+            total = sum(state.requests for state in self._states.values())
+            report = []
+            for key in self._keys:
+                state = self._states[key]
+                self._expire(state, now)
+                requests, tokens = self._remaining(state)
+                budget = self.requests_per_minute or state.limit_requests
+                utilization = None
+                if budget and requests is not None:
+                    utilization = min(max(1.0 - requests / budget, 0.0), 1.0)
+                report.append(KeyStats(
+                    key=mask_key(key),
+                    requests=state.requests,
+                    failures=state.failures,
+                    rate_limited=state.rate_limited,
+                    in_flight=state.in_flight,
+                    available=state.pulled_until <= now,
+                    pulled_for=max(state.pulled_until - now, 0.0),
+                    revoked=state.revoked,
+                    remaining_requests=None if requests is None else int(requests),
+                    remaining_tokens=None if tokens is None else int(tokens),
+                    utilization=utilization,
+                    share=state.requests / total if total else 0.0,
+                ))
+            return report
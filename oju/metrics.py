@@ -0,0 +1,572 @@
+"""
+Module for instrumenting provider calls.
+
+Every :func:`oju.agent.Agent` and ``AsyncAgent`` call is reported to the hooks
+registered with :func:`add_hook` as a ``CallMetrics`` record: time spent
+queued for rate limit budget, time to first byte, total duration, token usage,
+retries, cache hits and the class of any error, tagged with the agent name,
+provider and model. While no hook is registered calls take the
+uninstrumented path and pay nothing.
+
+``MetricsAggregator`` is a ready-made hook that keeps counters and latency
+histograms per agent, provider and model. :func:`render_prometheus` formats an
+aggregator in the Prometheus text exposition format and
+:func:`serve_prometheus` exposes it over HTTP for scraping.
+"""
+
+import bisect
+import math
+import threading
+import time
+import warnings
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from .retry import RetryStats, root_cause
+from .streaming import AsyncTextStream, StreamSummary, TextStream
+
+T = TypeVar("T")
+
+
+@dataclass
+class CallMetrics:
+    """
+    Measurements of one agent call.
+
+    Attributes:
+        agent_name: Name of the agent.
+        provider: Provider name (e.g., 'openai').
+        model: Model name.
+        stream: Whether the response was streamed.
+        queue_wait: Seconds spent waiting for rate limit budget.
+        ttfb: Seconds from sending the final attempt to its first byte of
+            output: the first text delta when streaming, otherwise the full
+            response. ``None`` for cache hits and failed calls.
+        duration: Seconds for the whole call, including queueing, retries and,
+            when streaming, consuming the stream.
+        input_tokens: Prompt tokens reported by the provider, if any.
+        output_tokens: Completion tokens reported by the provider, if any.
+        cached_tokens: Prompt tokens read from the provider's prompt cache,
+            if any.
+        cache_write_tokens: Prompt tokens written to the provider's prompt
+            cache, if any.
+        retries: Attempts made after the first one.
+        cache_hit: Whether the response came from a ResponseCache.
+        coalesced: Whether the call shared another caller's in-flight
+            provider call instead of making its own.
+        error: Class name of the innermost error if the call failed.
+    """
+
+    agent_name: str
+    provider: str
+    model: str
+    stream: bool = False
+    queue_wait: float = 0.0
+    ttfb: Optional[float] = None
+    duration: float = 0.0
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    cache_write_tokens: Optional[int] = None
+    retries: int = 0
+    cache_hit: bool = False
+    coalesced: bool = False
+    error: Optional[str] = None
+
+
+Hook = Callable[[CallMetrics], Any]
+
+# Replaced wholesale under the lock so that readers never need it
+_hooks: Tuple[Hook, ...] = ()
+_hooks_lock = threading.Lock()
+
+
+def add_hook(hook: Hook) -> None:
+    """
+    Register a callable that receives the CallMetrics of every agent call.
+
+    Hooks run on the calling thread right after the call completes, so they
+    should be cheap; exceptions they raise are turned into warnings.
+    """
+    global _hooks
+    with _hooks_lock:
+        _hooks = _hooks + (hook,)
+
+
+def remove_hook(hook: Hook) -> None:
+    """Unregister a hook added with :func:`add_hook`. Unknown hooks are ignored."""
+    global _hooks
+    with _hooks_lock:
+        _hooks = tuple(h for h in _hooks if h is not hook)
+
+
+def clear_hooks() -> None:
+    """Unregister every hook."""
+    global _hooks
+    with _hooks_lock:
+        _hooks = ()
+
+
+def emit(metrics: CallMetrics) -> None:
+    """Send a record to every registered hook."""
+    for hook in _hooks:
+        try:
+            hook(metrics)
+        except Exception as e:
+            warnings.warn(f"Metrics hook {hook!r} failed: {e}", RuntimeWarning)
+
+
+def start_call(
+    agent_name: str, provider: str, model: str, stream: bool = False
+) -> Optional["CallRecorder"]:
+    """Return a recorder for a new call, or ``None`` if no hook is registered."""
+    if not _hooks:
+        return None
+    return CallRecorder(agent_name, provider, model, stream)
+
+
+class CallRecorder:
+    """Collects the measurements of one call and emits them exactly once."""
+
+    def __init__(
+        self, agent_name: str, provider: str, model: str, stream: bool
+    ) -> None:
+        self.metrics = CallMetrics(agent_name, provider, model, stream)
+        self._started = time.perf_counter()
+        self._attempt_started = self._started
+        self._done = False
+
+    def add_queue_wait(self, seconds: float) -> None:
+        """Account time spent waiting for rate limit budget."""
+        self.metrics.queue_wait += seconds
+
+    def attempt_started(self) -> None:
+        """Mark the moment an attempt is sent to the provider."""
+        self._attempt_started = time.perf_counter()
+
+    def first_byte(self) -> None:
+        """Record the time to first byte of the current attempt, once."""
+        if self.metrics.ttfb is None:
+            self.metrics.ttfb = time.perf_counter() - self._attempt_started
+
+    def finish(
+        self,
+        completion: Any = None,
+        summary: Optional[StreamSummary] = None,
+        retry_stats: Optional[RetryStats] = None,
+        error: Optional[BaseException] = None,
+        cache_hit: bool = False,
+    ) -> None:
+        """
+        Complete the record and emit it. Later calls are ignored.
+
+        Args:
+            completion: The provider's Completion, for token usage.
+            summary: The StreamSummary of a streamed response.
+            retry_stats: Retry counters of the call.
+            error: The error the call failed with.
+            cache_hit: Whether the response came from a cache.
+        """
+        if self._done:
+            return
+        self._done = True
+        metrics = self.metrics
+        metrics.duration = time.perf_counter() - self._started
+        metrics.cache_hit = cache_hit
+        usage = completion if completion is not None else summary
+        if usage is not None:
+            metrics.input_tokens = usage.input_tokens
+            metrics.output_tokens = usage.output_tokens
+            metrics.cached_tokens = usage.cached_tokens
+            metrics.cache_write_tokens = usage.cache_write_tokens
+        if retry_stats is not None:
+            metrics.retries = retry_stats.retries
+        if error is not None:
+            metrics.error = type(root_cause(error)).__name__
+        emit(metrics)
+
+    def wrap_attempt(self, func: Callable[[], T]) -> Callable[[], T]:
+        """Time each attempt of a provider call."""
+        def attempt() -> T:
+            self.attempt_started()
+            result = func()
+            if not self.metrics.stream:
+                self.first_byte()
+            return result
+        return attempt
+
+    def awrap_attempt(
+        self, func: Callable[[], Awaitable[T]]
+    ) -> Callable[[], Awaitable[T]]:
+        """The async counterpart of :meth:`wrap_attempt`."""
+        async def attempt() -> T:
+            self.attempt_started()
+            result = await func()
+            if not self.metrics.stream:
+                self.first_byte()
+            return result
+        return attempt
+
+    def wrap_stream(
+        self, stream: TextStream, retry_stats: Optional[RetryStats] = None
+    ) -> TextStream:
+        """Return a stream that records its first delta and emits when it ends."""
+        def deltas() -> Iterator[str]:
+            error = None
+            try:
+                for delta in stream:
+                    self.first_byte()
+                    yield delta
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                self.finish(
+                    summary=stream.summary, retry_stats=retry_stats, error=error
+                )
+
+        def close() -> None:
+            stream.close()
+            self.finish(summary=stream.summary, retry_stats=retry_stats)
+
+        return TextStream(deltas(), stream.summary, on_close=close)
+
+    def wrap_astream(
+        self, stream: AsyncTextStream, retry_stats: Optional[RetryStats] = None
+    ) -> AsyncTextStream:
+        """The async counterpart of :meth:`wrap_stream`."""
+        async def deltas() -> AsyncIterator[str]:
+            error = None
+            try:
+                async for delta in stream:
+                    self.first_byte()
+                    yield delta
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                self.finish(
+                    summary=stream.summary, retry_stats=retry_stats, error=error
+                )
+
+        async def close() -> None:
+            await stream.aclose()
+            self.finish(summary=stream.summary, retry_stats=retry_stats)
+
+        return AsyncTextStream(deltas(), stream.summary, on_close=close)
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile ``q`` (0-100) of ``values``, or ``None`` if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100.0 * len(ordered)), 1) - 1]
+
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+
+class Histogram:
+    """Fixed-bucket histogram of durations in seconds."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        # One extra slot for observations above the last bucket (+Inf)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """Add one observation."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """Return ``(upper bound, observations <= bound)`` pairs, ending with +Inf."""
+        pairs = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimate the ``q`` quantile (0-1) by interpolating within its bucket.
+
+        Observations above the last bucket are reported as the last bound.
+        Returns ``None`` without observations.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                return lower + (bound - lower) * max(rank - seen, 0) / count
+            seen += count
+            lower = bound
+        return lower
+
+    def copy(self) -> "Histogram":
+        clone = Histogram(self.buckets)
+        clone.counts = list(self.counts)
+        clone.sum = self.sum
+        clone.count = self.count
+        return clone
+
+
+@dataclass
+class SeriesStats:
+    """
+    Aggregated metrics of one agent, provider and model.
+
+    Attributes:
+        calls: Calls completed, including failed ones and cache hits.
+        errors: Failed calls by error class.
+        cache_hits: Calls answered from a cache.
+        coalesced: Calls that shared another caller's provider call.
+        retries: Retry attempts across all calls.
+        input_tokens: Prompt tokens reported by the provider, counted once
+            per provider call rather than per coalesced caller.
+        output_tokens: Completion tokens reported by the provider, counted
+            the same way.
+        cached_tokens: Prompt tokens read from provider prompt caches.
+        cache_write_tokens: Prompt tokens written to provider prompt caches.
+        queue_wait: Histogram of rate limit queueing time.
+        ttfb: Histogram of time to first byte.
+        duration: Histogram of total call duration.
+    """
+
+    calls: int = 0
+    errors: Dict[str, int] = field(default_factory=dict)
+    cache_hits: int = 0
+    coalesced: int = 0
+    retries: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    cache_write_tokens: int = 0
+    queue_wait: Histogram = field(default_factory=Histogram)
+    ttfb: Histogram = field(default_factory=Histogram)
+    duration: Histogram = field(default_factory=Histogram)
+
+
+SeriesKey = Tuple[str, str, str]
+
+
+class MetricsAggregator:
+    """
+    An in-process metrics hook keeping counters and histograms per series.
+
+    Register it with ``add_hook(aggregator)``. Recording a call costs a dict
+    lookup and a few additions under a lock.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        """
+        Initialize the aggregator.
+
+        Args:
+            buckets: Upper bounds in seconds of the latency histogram buckets.
+        """
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[SeriesKey, SeriesStats] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, metrics: CallMetrics) -> None:
+        self.record(metrics)
+
+    def _new_series(self) -> SeriesStats:
+        return SeriesStats(
+            queue_wait=Histogram(self.buckets),
+            ttfb=Histogram(self.buckets),
+            duration=Histogram(self.buckets),
+        )
+
+    def record(self, metrics: CallMetrics) -> None:
+        """Add one call to its series."""
+        key = (metrics.agent_name, metrics.provider, metrics.model)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = self._new_series()
+            series.calls += 1
+            series.retries += metrics.retries
+            if metrics.cache_hit:
+                series.cache_hits += 1
+            if metrics.coalesced:
+                series.coalesced += 1
+            if metrics.error is not None:
+                series.errors[metrics.error] = series.errors.get(metrics.error, 0) + 1
+            # Coalesced callers report the usage of the call they shared,
+            # which its leader has already counted
+            if not metrics.coalesced:
+                series.input_tokens += metrics.input_tokens or 0
+                series.output_tokens += metrics.output_tokens or 0
+                series.cached_tokens += metrics.cached_tokens or 0
+                series.cache_write_tokens += metrics.cache_write_tokens or 0
+            series.duration.observe(metrics.duration)
+            if not metrics.cache_hit:
+                series.queue_wait.observe(metrics.queue_wait)
+            if metrics.ttfb is not None:
+                series.ttfb.observe(metrics.ttfb)
+
+    def snapshot(self) -> Dict[SeriesKey, SeriesStats]:
+        """Return a copy of every series keyed by ``(agent, provider, model)``."""
+        with self._lock:
+            return {
+                key: SeriesStats(
+                    calls=s.calls,
+                    errors=dict(s.errors),
+                    cache_hits=s.cache_hits,
+                    coalesced=s.coalesced,
+                    retries=s.retries,
+                    input_tokens=s.input_tokens,
+                    output_tokens=s.output_tokens,
+                    cached_tokens=s.cached_tokens,
+                    cache_write_tokens=s.cache_write_tokens,
+                    queue_wait=s.queue_wait.copy(),
+                    ttfb=s.ttfb.copy(),
+                    duration=s.duration.copy(),
+                )
+                for key, s in self._series.items()
+            }
+
+    def reset(self) -> None:
+        """Drop every series."""
+        with self._lock:
+            self._series.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(key: SeriesKey, **extra: str) -> str:
+    pairs = [("agent", key[0]), ("provider", key[1]), ("model", key[2])]
+    pairs.extend(extra.items())
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+def render_prometheus(aggregator: MetricsAggregator, namespace: str = "oju") -> str:
+    """
+    Format an aggregator in the Prometheus text exposition format.
+
+    Args:
+        aggregator: The aggregator to export.
+        namespace: Prefix of every metric name.
+
+    Returns:
+        str: The exposition text, ending with a newline.
+    """
+    series = sorted(aggregator.snapshot().items())
+    lines: List[str] = []
+
+    counters = [
+        ("calls_total", "Agent calls completed.", lambda s: s.calls),
+        ("cache_hits_total", "Agent calls answered from a response cache.",
+         lambda s: s.cache_hits),
+        ("coalesced_total", "Agent calls that shared an identical in-flight call.",
+         lambda s: s.coalesced),
+        ("retries_total", "Provider call retries.", lambda s: s.retries),
+        ("input_tokens_total", "Prompt tokens reported by providers.",
+         lambda s: s.input_tokens),
+        ("output_tokens_total", "Completion tokens reported by providers.",
+         lambda s: s.output_tokens),
+        ("cached_tokens_total", "Prompt tokens read from provider prompt caches.",
+         lambda s: s.cached_tokens),
+        ("cache_write_tokens_total", "Prompt tokens written to provider prompt caches.",
+         lambda s: s.cache_write_tokens),
+    ]
+    for name, help_text, value in counters:
+        lines.append(f"# HELP {namespace}_{name} {help_text}")
+        lines.append(f"# TYPE {namespace}_{name} counter")
+        for key, stats in series:
+            lines.append(f"{namespace}_{name}{_labels(key)} {value(stats)}")
+
+    lines.append(f"# HELP {namespace}_errors_total Failed agent calls by error class.")
+    lines.append(f"# TYPE {namespace}_errors_total counter")
+    for key, stats in series:
+        for error, count in sorted(stats.errors.items()):
+            lines.append(f"{namespace}_errors_total{_labels(key, error=error)} {count}")
+
+    histograms = [
+        ("queue_wait_seconds", "Time spent waiting for rate limit budget.",
+         "queue_wait"),
+        ("time_to_first_byte_seconds", "Time from request to first output.", "ttfb"),
+        ("call_duration_seconds", "Total agent call duration.", "duration"),
+    ]
+    for name, help_text, attribute in histograms:
+        metric = f"{namespace}_{name}"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} histogram")
+        for key, stats in series:
+            histogram: Histogram = getattr(stats, attribute)
+            for bound, count in histogram.cumulative():
+                labels = _labels(key, le=_format_bound(bound))
+                lines.append(f"{metric}_bucket{labels} {count}")
+            lines.append(f"{metric}_sum{_labels(key)} {histogram.sum!r}")
+            lines.append(f"{metric}_count{_labels(key)} {histogram.count}")
+
+    return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(
+    aggregator: MetricsAggregator, port: int = 9464, host: str = "127.0.0.1"
+) -> ThreadingHTTPServer:
+    """
+    Serve ``/metrics`` for Prometheus from a daemon thread.
+
+    Args:
+        aggregator: The aggregator to export.
+        port: Port to listen on; 0 picks a free one.
+        host: Interface to bind.
+
+    Returns:
+        ThreadingHTTPServer: The running server; call ``shutdown()`` to stop it.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus(aggregator).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,344 @@
+"""
+Module for resumable bulk runs of one agent over a JSONL or CSV file.
+
+``run_pipeline`` reads the input file lazily, sends the records through one
+:class:`oju.agent.AgentSession` with bounded concurrency and appends one JSON
+line per record to the output file as soon as the record finishes. Alongside
+the output it keeps a small checkpoint file recording which records are done
+and how far the output file is complete. A rerun after a crash truncates the
+output to that point and skips the records already done, so every record
+appears in the output exactly once.
+
+The checkpoint stays compact however large the input is: records below a
+watermark are all done, and only the few finished out of order above it are
+listed. Together with the lazy reading this keeps memory flat.
+"""
+
+import csv
+import functools
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional, Set, Tuple, Union
+
+from . import agent
+from .batch import iter_batch, validate_concurrency
+from .keypool import KeyPool
+
+# Bumped when the checkpoint layout changes
+CHECKPOINT_VERSION = 1
+
+
+@dataclass
+class PipelineProgress:
+    """
+    Progress of a pipeline run.
+
+    Attributes:
+        total: Records in the input, or ``None`` if not counted.
+        completed: Records done, including those done by earlier runs.
+        succeeded: Records of this run that produced an output.
+        failed: Records of this run that failed; their error is in the output.
+        skipped: Records skipped because an earlier run completed them.
+        elapsed: Seconds since this run started.
+    """
+
+    total: Optional[int] = None
+    completed: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    skipped: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Records per second processed by this run."""
+        done = self.succeeded + self.failed
+        return done / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Estimated seconds until the input is done, if it can be estimated."""
+        if self.total is None or not self.throughput:
+            return None
+        return max(self.total - self.completed, 0) / self.throughput
+
+
+class _Checkpoint:
+    """Completed record indices, kept as a watermark plus out-of-order extras."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.done_through = 0
+        self.done: Set[int] = set()
+        self.output_offset = 0
+
+    def load(self) -> bool:
+        """Read the checkpoint file; returns False if there is none."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return False
+        except ValueError as e:
+            raise ValueError(
+                f"Corrupt pipeline checkpoint {self.path}: {str(e)}"
+            ) from e
+        if state.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported pipeline checkpoint version in {self.path}")
+        self.done_through = state["done_through"]
+        self.done = set(state["done"])
+        self.output_offset = state["output_offset"]
+        return True
+
+    def is_done(self, index: int) -> bool:
+        return index < self.done_through or index in self.done
+
+    def mark(self, index: int) -> None:
+        self.done.add(index)
+        while self.done_through in self.done:
+            self.done.remove(self.done_through)
+            self.done_through += 1
+
+    def save(self, output_offset: int) -> None:
+        """Atomically replace the checkpoint file."""
+        self.output_offset = output_offset
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "done_through": self.done_through,
+            "done": sorted(self.done),
+            "output_offset": output_offset,
+        }
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+
+
+def _input_format(path: str, input_format: Optional[str]) -> str:
+    fmt = input_format or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    if fmt not in ("jsonl", "csv"):
+        raise ValueError(f"Unsupported input format: {fmt}. Use 'jsonl' or 'csv'")
+    return fmt
+
+
+def _count_records(path: str, fmt: str) -> int:
+    """Count input records by scanning for line breaks in fixed-size chunks."""
+    count = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            count += chunk.count(b"\n")
+            last = chunk[-1:]
+    if last != b"\n":
+        count += 1
+    # The CSV header is not a record; blank JSONL lines are counted but rare
+    return max(count - 1, 0) if fmt == "csv" else count
+
+
+def _read_records(
+    path: str, fmt: str, checkpoint: _Checkpoint
+) -> Iterator[Tuple[int, Any]]:
+    """Yield ``(index, record)`` for the records not done yet."""
+    with open(path, newline="" if fmt == "csv" else None, encoding="utf-8") as f:
+        if fmt == "csv":
+            for index, row in enumerate(csv.DictReader(f)):
+                if not checkpoint.is_done(index):
+                    yield index, row
+            return
+        index = 0
+        for line in f:
+            if not line.strip():
+                continue
+            if not checkpoint.is_done(index):
+                # Records already done are skipped without parsing them
+                try:
+                    yield index, json.loads(line)
+                except ValueError as e:
+                    raise ValueError(
+                        f"Invalid JSON on record {index} of {path}: {str(e)}"
+                    ) from e
+            index += 1
+
+
+def _prompt(record: Any, input_field: str) -> str:
+    if isinstance(record, str):
+        return record
+    if isinstance(record, dict) and input_field in record:
+        return str(record[input_field])
+    raise ValueError(f"Record has no '{input_field}' field")
+
+
+def run_pipeline(
+    input_path: str,
+    output_path: str,
+    agent_name: str,
+    model: str,
+    provider: str,
+    api_key: Union[str, KeyPool],
+    input_field: str = "input",
+    id_field: Optional[str] = None,
+    input_format: Optional[str] = None,
+    checkpoint_path: Optional[str] = None,
+    max_concurrency: int = 8,
+    checkpoint_every: int = 100,
+    on_progress: Optional[Callable[[PipelineProgress], Any]] = None,
+    progress_interval: float = 5.0,
+    count_total: bool = True,
+    **agent_kwargs: Any,
+) -> PipelineProgress:
+    """
+    Run an agent over every record of a JSONL or CSV file, resuming if possible.
+
+    Each output line is a JSON object with the record's ``index``, its ``id``
+    when ``id_field`` is set, and either ``output`` or ``error``. Lines are
+    appended in completion order. Failed records are written with their error
+    and count as done, so a rerun does not repeat them.
+
+    Args:
+        input_path: JSONL file of objects (or JSON strings), or a CSV file
+            with a header row.
+        output_path: JSONL file the results are appended to.
+        agent_name: Name of the agent (used to locate prompt file).
+        model: Name of the model to use (e.g., 'gpt-4', 'claude-3-opus').
+        provider: One of 'openai', 'claude', or 'gemini'.
+        api_key: API key for the provider, or a KeyPool.
+        input_field: Field of each record holding the prompt input.
+        id_field: Optional field copied to the output as ``id``.
+        input_format: 'jsonl' or 'csv'; guessed from the file extension if
+            not given.
+        checkpoint_path: Checkpoint file; defaults to ``output_path`` with a
+            ``.checkpoint`` suffix.
+        max_concurrency: Maximum number of requests in flight at once.
+        checkpoint_every: Records finished between checkpoint writes.
+        on_progress: Optional callback receiving a PipelineProgress every
+            ``progress_interval`` seconds and once at the end.
+        progress_interval: Seconds between progress reports.
+        count_total: Count the input records up front so that progress
+            reports carry an ETA. Costs one fast scan of the file.
+        **agent_kwargs: Further :func:`oju.agent.Agent` arguments such as
+            ``cache``, ``retry``, ``rate_limiter`` or ``custom_system_prompt``.
+
+    Returns:
+        PipelineProgress: The final progress of the run.
+
+    Raises:
+        ValueError: If an argument is invalid, a record is malformed or the
+            checkpoint cannot be read.
+        FileNotFoundError: If the input file or the prompt file does not exist.
+    """
+    validate_concurrency(max_concurrency)
+    if checkpoint_every < 1:
+        raise ValueError("checkpoint_every must be at least 1")
+    if agent_kwargs.get("stream"):
+        raise ValueError("Pipelines do not support stream=True")
+    fmt = _input_format(input_path, input_format)
+    checkpoint = _Checkpoint(checkpoint_path or f"{output_path}.checkpoint")
+    resumed = checkpoint.load()
+    if resumed and not _has_bytes(output_path, checkpoint.output_offset):
+        raise ValueError(
+            f"{output_path} is shorter than its checkpoint {checkpoint.path} records; "
+            "delete the checkpoint to start over"
+        )
+
+    total = _count_records(input_path, fmt) if count_total else None
+    progress = PipelineProgress(total=total)
+    progress.skipped = checkpoint.done_through + len(checkpoint.done)
+    progress.completed = progress.skipped
+    session_kwargs, call_kwargs = agent.split_agent_kwargs(agent_kwargs)
+    # One session for the whole run: the prompt is loaded once, not per record
+    session = agent.AgentSession(
+        agent_name=agent_name, model=model, provider=provider, api_key=api_key,
+        **session_kwargs,
+    )
+
+    # Records submitted but not finished, by their position in the batch
+    in_flight: Dict[int, Tuple[int, Any]] = {}
+
+    def prompts() -> Iterator[str]:
+        for position, (index, record) in enumerate(
+            _read_records(input_path, fmt, checkpoint)
+        ):
+            in_flight[position] = (index, record)
+            yield _prompt(record, input_field)
+
+    started = time.monotonic()
+    last_report = started
+    with open(output_path, "a+b" if resumed else "wb") as output:
+        if resumed:
+            # Drop lines written after the last checkpoint; those records rerun
+            output.truncate(checkpoint.output_offset)
+        output.seek(0, os.SEEK_END)
+        unsaved = 0
+        results = iter_batch(
+            prompts(),
+            functools.partial(session, **call_kwargs),
+            max_concurrency,
+            ordered=False,
+        )
+        try:
+            for result in results:
+                index, record = in_flight.pop(result.index)
+                line: Dict[str, Any] = {"index": index}
+                if id_field is not None and isinstance(record, dict):
+                    line["id"] = record.get(id_field)
+                if result.ok:
+                    line["output"] = str(result.output)
+                    progress.succeeded += 1
+                else:
+                    line["error"] = str(result.error)
+                    progress.failed += 1
+                output.write(json.dumps(line, ensure_ascii=False).encode("utf-8"))
+                output.write(b"\n")
+                checkpoint.mark(index)
+                progress.completed += 1
+                unsaved += 1
+                if unsaved >= checkpoint_every:
+                    _flush(output)
+                    checkpoint.save(output.tell())
+                    unsaved = 0
+                now = time.monotonic()
+                if on_progress is not None and now - last_report >= progress_interval:
+                    progress.elapsed = now - started
+                    on_progress(_snapshot(progress))
+                    last_report = now
+        finally:
+            # Stop queued requests and keep what finished, also on errors
+            results.close()
+            _flush(output)
+            checkpoint.save(output.tell())
+
+    progress.elapsed = time.monotonic() - started
+    if on_progress is not None:
+        on_progress(_snapshot(progress))
+    return progress
+
+
+def _has_bytes(path: str, size: int) -> bool:
+    try:
+        return os.path.getsize(path) >= size
+    except FileNotFoundError:
+        return size == 0
+
+
+def _flush(output: Any) -> None:
+    output.flush()
+    os.fsync(output.fileno())
+
+
+def _snapshot(progress: PipelineProgress) -> PipelineProgress:
+    return PipelineProgress(**vars(progress))
+
+
+def format_progress(progress: PipelineProgress) -> str:
+    """Render a progress report as one human-readable line."""
+    total = "?" if progress.total is None else str(progress.total)
+    eta = progress.eta
+    remaining = "unknown" if eta is None else f"{eta:.0f}s"
+    return (
+        f"{progress.completed}/{total} records, {progress.failed} failed, "
+        f"{progress.throughput:.1f} records/s, ETA {remaining}"
+    )
@@ -0,0 +1,151 @@
+"""
+Module for caching file-based agent prompts in memory.
+
+Prompts live in ``prompts/<agent_name>/prompt.txt`` and almost never change
+while a process is running, so each prompt is read once and served from
+memory afterwards. Cached prompts are revalidated against the file's
+modification time at most once per ``check_interval`` seconds, which keeps hot
+requests free of filesystem I/O.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+
+class _Entry(NamedTuple):
+    text: str
+    mtime_ns: int
+    checked_at: float
+
+
+class PromptCache:
+    """
+    A thread-safe, process-wide cache of agent system prompts.
+    """
+
+    def __init__(
+        self,
+        root_dir: str = os.path.dirname(__file__),
+        check_interval: Optional[float] = 5.0,
+    ) -> None:
+        """
+        Initialize the cache.
+
+        Args:
+            root_dir: Directory whose ``prompts`` sub-directory contains one
+                directory per agent.
+            check_interval: Minimum number of seconds between mtime checks of a
+                cached prompt. ``None`` disables revalidation entirely, so
+                prompts only change after an explicit ``invalidate()``.
+        """
+        self.root_dir = root_dir
+        self.check_interval = check_interval
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def prompt_path(self, agent_name: str) -> str:
+        """Return the prompt file path for the given agent."""
+        return os.path.join(self.root_dir, "prompts", agent_name, "prompt.txt")
+
+    def get(self, agent_name: str) -> str:
+        """
+        Return the system prompt for an agent, loading it on first use.
+
+        Args:
+            agent_name: Name of the agent (used to locate prompt file).
+
+        Returns:
+            str: The stripped prompt text.
+
+        Raises:
+            FileNotFoundError: If the prompt file is not found.
+            ValueError: If the prompt file is empty.
+        """
+        now = time.monotonic()
+        entry = self._entries.get(agent_name)
+        if entry is not None and (
+            self.check_interval is None
+            or now - entry.checked_at < self.check_interval
+        ):
+            return entry.text
+
+        prompt_path = self.prompt_path(agent_name)
+        if entry is not None:
+            try:
+                mtime_ns = os.stat(prompt_path).st_mtime_ns
+            except FileNotFoundError:
+                mtime_ns = None
+            if mtime_ns == entry.mtime_ns:
+                with self._lock:
+                    self._entries[agent_name] = entry._replace(checked_at=now)
+                return entry.text
+
+        return self._load(agent_name, prompt_path, now)
+
+    def _load(self, agent_name: str, prompt_path: str, now: float) -> str:
+        """Read a prompt file from disk and store it in the cache."""
+        try:
+            with open(prompt_path, "r", encoding='utf-8') as f:
+                mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+                system_prompt = f.read().strip()
+        except FileNotFoundError as e:
+            self.invalidate(agent_name)
+            raise FileNotFoundError(
+                f"Prompt file not found: {prompt_path}. "
+                "Please ensure the agent_name corresponds to an existing prompt "
+                "directory."
+            ) from e
+        if not system_prompt:
+            self.invalidate(agent_name)
+            raise ValueError(f"Prompt file {prompt_path} is empty")
+
+        with self._lock:
+            self._entries[agent_name] = _Entry(system_prompt, mtime_ns, now)
+        return system_prompt
+
+    def preload(self, agent_names: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Load prompts into the cache ahead of the first request.
+
+        Args:
+            agent_names: Agents to load. Defaults to every agent directory
+                under ``<root_dir>/prompts`` that contains a ``prompt.txt``.
+
+        Returns:
+            List[str]: The names of the agents that were loaded.
+
+        Raises:
+            FileNotFoundError: If an explicitly named prompt file is not found.
+            ValueError: If a prompt file is empty.
+        """
+        if agent_names is None:
+            agent_names = sorted(
+                name
+                for name in os.listdir(os.path.join(self.root_dir, "prompts"))
+                if os.path.isfile(self.prompt_path(name))
+            )
+        loaded = []
+        now = time.monotonic()
+        for agent_name in agent_names:
+            self._load(agent_name, self.prompt_path(agent_name), now)
+            loaded.append(agent_name)
+        return loaded
+
+    def invalidate(self, agent_name: Optional[str] = None) -> None:
+        """
+        Drop cached prompts so they are re-read on next use.
+
+        Args:
+            agent_name: Agent to drop. Drops every cached prompt if omitted.
+        """
+        with self._lock:
+            if agent_name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(agent_name, None)
+
+
+# Process-wide cache used by oju.agent.Agent
+prompt_cache = PromptCache()
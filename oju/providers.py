@@ -3,142 +3,1719 @@ Module for handling different LLM provider APIs.
 
 This module provides functions to interact with various language model providers
 like OpenAI, Anthropic, and Google's Gemini.
+
+Each provider has the same six functions: ``complete_<provider>`` returns a
+normalized :class:`Completion`, ``call_<provider>`` only its text and
+``stream_<provider>`` a :class:`~oju.streaming.TextStream`; the ``a``-prefixed
+variants are their async counterparts, which use a pooled async client for the
+running event loop and abort the request when the awaiting task is cancelled.
+All of them take the same arguments:
+
+* ``model``: The model to use (e.g., 'gpt-4', 'claude-3-opus-20240229',
+  'gemini-pro').
+* ``system_prompt``: The system prompt to guide the model's behavior.
+* ``prompt``: The user's input prompt.
+* ``api_key``: The provider's API key.
+* ``base_url``: Optional override for the provider's API endpoint. Gemini
+  serves it over REST, from the synchronous functions only.
+* ``sdk_retries``: Let the SDK retry failed requests itself. Disabled when
+  the caller applies its own RetryPolicy.
+* ``max_tokens``: Optional limit of the response length, replacing the
+  provider's default.
+* ``timeout``: Optional timeout in seconds, bounding the connection and each
+  read; for Gemini, the whole request, of which the context cache lookup may
+  use at most half. Without it the SDK's default applies.
+
+They raise ``ValueError`` if the API key is invalid or missing, ``ImportError``
+if the provider's SDK is not installed and ``Exception`` for other errors during
+the API call. Streaming functions send the request before they return, so
+authentication errors are raised there; errors later in the stream are raised
+while iterating.
 """
 
-from typing import Dict, Any, Optional
+import asyncio
+import datetime
+import functools
+import hashlib
+import importlib
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Any,
+    FrozenSet,
+    Mapping,
+    Optional,
+    Tuple,
+)
+
+if TYPE_CHECKING:  # pragma: no cover
+    from openai import AsyncOpenAI, OpenAI, OpenAIError
+    from openai import Timeout as OpenAITimeout
+    import anthropic
+    from anthropic import AnthropicError, RateLimitError, APIConnectionError
+    import google.generativeai as genai
+    from google.ai import generativelanguage as glm
+    from google.api_core import exceptions as google_exceptions
+
+from . import tokens
+from .clients import ClientPool, async_client_pool, client_pool
+from .deadline import CONNECT_TIMEOUT, Deadline, DeadlineExceededError
+from .streaming import (
+    AsyncTextStream,
+    StreamSummary,
+    TextStream,
+    aiter_deltas,
+    iter_deltas,
+)
 
-from openai import OpenAI, OpenAIError
-import anthropic
-from anthropic import AnthropicError, RateLimitError, APIConnectionError
-import google.generativeai as genai
-from google.api_core import exceptions as google_exceptions
 
+# Provider SDKs are imported on first use so that importing oju only pays for
+# the providers actually called. Each entry maps a module-level name to the
+# module it comes from and, optionally, the attribute to take from it.
+_LAZY_IMPORTS: Dict[str, Dict[str, Tuple[str, Optional[str]]]] = {
+    "openai": {
+        "OpenAI": ("openai", "OpenAI"),
+        "AsyncOpenAI": ("openai", "AsyncOpenAI"),
+        "OpenAIError": ("openai", "OpenAIError"),
+        "OpenAITimeout": ("openai", "Timeout"),
+    },
+    "claude": {
+        "anthropic": ("anthropic", None),
+        "AnthropicError": ("anthropic", "AnthropicError"),
+        "RateLimitError": ("anthropic", "RateLimitError"),
+        "APIConnectionError": ("anthropic", "APIConnectionError"),
+    },
+    "gemini": {
+        "genai": ("google.generativeai", None),
+        "glm": ("google.ai.generativelanguage", None),
+        "google_exceptions": ("google.api_core.exceptions", None),
+    },
+}
 
-def call_openai(model: str, system_prompt: str, prompt: str, api_key: str) -> str:
+# Package to install for each provider when its SDK is missing
+_SDK_PACKAGES = {
+    "openai": "openai",
+    "claude": "anthropic",
+    "gemini": "google-generativeai",
+}
+
+# google-generativeai releases whose GenerativeModel internals GeminiBackend
+# sets directly; keep in step with setup.py and pyproject.toml
+_GEMINI_SDK_REQUIREMENT = "google-generativeai>=0.8.5,<0.9"
+
+_import_lock = threading.Lock()
+
+
+def _import_sdk(provider: str) -> None:
     """
-    Call the OpenAI API with the given parameters.
+    Import a provider's SDK into the module namespace if not already loaded.
+
+    Names that are already set (for example by ``unittest.mock.patch``) are
+    left untouched.
+
+    Raises:
+        ImportError: If the provider's SDK is not installed.
+    """
+    names = _LAZY_IMPORTS[provider]
+    namespace = globals()
+    if all(name in namespace for name in names):
+        return
+    with _import_lock:
+        for name, (module_name, attribute) in names.items():
+            if name in namespace:
+                continue
+            try:
+                module = importlib.import_module(module_name)
+            except ImportError as e:
+                package = _SDK_PACKAGES[provider]
+                raise ImportError(
+                    f"The '{provider}' provider requires the '{package}' package. "
+                    f"Install it with: pip install {package}"
+                ) from e
+            namespace[name] = (
+                module if attribute is None else getattr(module, attribute)
+            )
+
+
+def __getattr__(name: str) -> Any:
+    """Resolve lazily imported SDK names on attribute access."""
+    for provider, names in _LAZY_IMPORTS.items():
+        if name in names:
+            _import_sdk(provider)
+            return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Generation parameters sent with every request, per provider
+GENERATION_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "openai": {"temperature": 0.7, "max_tokens": 2000},
+    "claude": {"temperature": 0.7, "max_tokens": 4000},
+    "gemini": {},
+}
+
+
+@dataclass
+class Completion:
+    """
+    A provider response normalized across providers.
+
+    Attributes:
+        text: The generated text.
+        finish_reason: Why the model stopped, as reported by the provider
+            (e.g. 'stop', 'end_turn', 'STOP').
+        input_tokens: Prompt tokens, including cached ones, if reported.
+        output_tokens: Completion tokens, if reported.
+        cached_tokens: Prompt tokens served from the provider's prompt cache,
+            if reported.
+        cache_write_tokens: Prompt tokens written to the provider's prompt
+            cache, if reported. Only Claude bills cache writes per request.
+        request_id: The provider's ID for the request, if it returns one.
+        headers: HTTP headers of the response, if the SDK exposes them. A
+            KeyPool reads its rate limit headers.
+    """
+
+    text: str
+    finish_reason: Optional[str] = None
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    cache_write_tokens: Optional[int] = None
+    request_id: Optional[str] = None
+    headers: Optional[Mapping[str, str]] = field(
+        default=None, repr=False, compare=False
+    )
+
+
+# Smallest system prompts, in estimated tokens, cached on the provider side.
+# Shorter prompts are not cached by the providers; ``None`` disables caching.
+PROMPT_CACHE_MIN_TOKENS: Dict[str, Optional[int]] = {
+    "openai": 1024,
+    "claude": 1024,
+    "gemini": 4096,
+}
+
+
+def _cacheable(provider: str, model: str, system_prompt: str) -> bool:
+    """Whether a system prompt is large enough to use provider-side caching."""
+    threshold = PROMPT_CACHE_MIN_TOKENS.get(provider)
+    return (
+        threshold is not None
+        and tokens.count_system_prompt_tokens(system_prompt, provider, model)
+        >= threshold
+    )
+
+
+def _prompt_digest(*parts: str) -> str:
+    """Short stable hash identifying a cached prompt prefix."""
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:32]
+
+
+# Provider finish reasons mapped onto OpenAI's vocabulary
+_FINISH_REASONS = {
+    "end_turn": "stop",
+    "stop_sequence": "stop",
+    "pause_turn": "stop",
+    "STOP": "stop",
+    "max_tokens": "length",
+    "model_context_window_exceeded": "length",
+    "MAX_TOKENS": "length",
+    "tool_use": "tool_calls",
+    "function_call": "tool_calls",
+    "refusal": "content_filter",
+    "SAFETY": "content_filter",
+    "RECITATION": "content_filter",
+    "BLOCKLIST": "content_filter",
+    "PROHIBITED_CONTENT": "content_filter",
+    "SPII": "content_filter",
+}
+
+
+def normalize_finish_reason(reason: Optional[str]) -> Optional[str]:
+    """
+    Map a provider's finish reason onto a common vocabulary.
 
     Args:
-        model: The model to use (e.g., 'gpt-4', 'gpt-3.5-turbo').
-        system_prompt: The system prompt to guide the model's behavior.
-        prompt: The user's input prompt.
-        api_key: The OpenAI API key.
+        reason: The finish reason as reported by OpenAI, Claude or Gemini.
 
     Returns:
-        The generated text response from the model.
+        Optional[str]: 'stop', 'length', 'tool_calls' or 'content_filter' for
+        known reasons, the lowercased reason otherwise, or ``None``.
+    """
+    if reason is None:
+        return None
+    return _FINISH_REASONS.get(reason, reason.lower())
 
-    Raises:
-        ValueError: If the API key is invalid or missing.
-        Exception: For errors during the API call.
+
+def _client_kwargs(api_key: str, base_url: Optional[str]) -> Dict[str, Any]:
+    """Build SDK client constructor arguments, omitting unset options."""
+    kwargs: Dict[str, Any] = {"api_key": api_key}
+    if base_url is not None:
+        kwargs["base_url"] = base_url
+    return kwargs
+
+
+async def _aparse(raw: Any) -> Any:
+    """Parse an async raw response; some SDK versions parse asynchronously."""
+    parsed = raw.parse()
+    return await parsed if inspect.isawaitable(parsed) else parsed
+
+
+def _with_sdk_retries(client: Any, sdk_retries: bool) -> Any:
+    """Return the client, or a copy sharing its connection pool that never retries."""
+    return client if sdk_retries else client.with_options(max_retries=0)
+
+
+def _openai_request(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Build the chat completion request shared by the sync and async paths."""
+    # The system prompt leads so that calls of one agent share a cacheable prefix
+    request = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt},
+        ],
+        **GENERATION_DEFAULTS["openai"],
+    }
+    if max_tokens is not None:
+        request["max_tokens"] = max_tokens
+    if timeout is not None:
+        request["timeout"] = OpenAITimeout(
+            timeout, connect=min(timeout, CONNECT_TIMEOUT)
+        )
+    if _cacheable("openai", model, system_prompt):
+        # Routes requests with the same prefix to the same prompt cache
+        completions = importlib.import_module("openai.resources.chat.completions")
+        request.update(_supported_params(
+            completions.Completions.create,
+            {"prompt_cache_key": "oju-" + _prompt_digest(model, system_prompt)},
+        ))
+    return request
+
+
+def _openai_error(e: Exception) -> Exception:
+    """Translate an OpenAI SDK error into the exception raised to callers."""
+    if "Incorrect API key" in str(e):
+        return ValueError("Invalid OpenAI API key")
+    return Exception(f"OpenAI API error: {str(e)}")
+
+
+def _openai_completion(response: Any, headers: Any = None) -> Completion:
+    """Normalize a chat completion response."""
+    choice = response.choices[0]
+    usage = getattr(response, "usage", None)
+    return Completion(
+        text=choice.message.content or "",
+        finish_reason=getattr(choice, "finish_reason", None),
+        input_tokens=getattr(usage, "prompt_tokens", None),
+        output_tokens=getattr(usage, "completion_tokens", None),
+        cached_tokens=getattr(
+            getattr(usage, "prompt_tokens_details", None), "cached_tokens", None
+        ),
+        request_id=getattr(response, "_request_id", None),
+        headers=headers,
+    )
+
+
+def complete_openai(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    api_key: str,
+    base_url: Optional[str] = None,
+    sdk_retries: bool = True,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Completion:
+    """
+    Call the OpenAI API and return the normalized completion.
+
+    See the module docstring for the arguments and errors.
     """
     if not api_key:
         raise ValueError("OpenAI API key is required")
 
+    _import_sdk("openai")
+
     try:
-        client = OpenAI(api_key=api_key)
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.7,
-            max_tokens=2000,
-        )
-        return response.choices[0].message.content or ""
+        client = client_pool.get(
+            "openai",
+            api_key,
+            lambda: OpenAI(**_client_kwargs(api_key, base_url)),
+            base_url=base_url,
+        )
+        client = _with_sdk_retries(client, sdk_retries)
+        raw = client.chat.completions.with_raw_response.create(
+            **_openai_request(model, system_prompt, prompt, max_tokens, timeout)
+        )
+        return _openai_completion(raw.parse(), raw.headers)
     except OpenAIError as e:
-        error_msg = f"OpenAI API error: {str(e)}"
-        if "Incorrect API key" in str(e):
-            raise ValueError("Invalid OpenAI API key") from e
-        raise Exception(error_msg) from e
+        raise _openai_error(e) from e
+
+
+def call_openai(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    api_key: str,
+    base_url: Optional[str] = None,
+    sdk_retries: bool = True,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> str:
+    """
+    Call the OpenAI API with the given parameters.
+
+    See the module docstring for the arguments and errors.
+    """
+    return complete_openai(
+        model, system_prompt, prompt, api_key, base_url, sdk_retries, max_tokens,
+        timeout,
+    ).text
+
+
+async def acomplete_openai(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    api_key: str,
+    base_url: Optional[str] = None,
+    sdk_retries: bool = True,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Completion:
+    """
+    Asynchronously call the OpenAI API and return the normalized completion.
+
+    See the module docstring for the arguments and errors.
+    """
+    if not api_key:
+        raise ValueError("OpenAI API key is required")
+
+    _import_sdk("openai")
+
+    try:
+        client = async_client_pool().get(
+            "openai",
+            api_key,
+            lambda: AsyncOpenAI(**_client_kwargs(api_key, base_url)),
+            base_url=base_url,
+        )
+        client = _with_sdk_retries(client, sdk_retries)
+        raw = await client.chat.completions.with_raw_response.create(
+            **_openai_request(model, system_prompt, prompt, max_tokens, timeout)
+        )
+        return _openai_completion(await _aparse(raw), raw.headers)
+    except OpenAIError as e:
+        raise _openai_error(e) from e
+
+
+async def acall_openai(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    api_key: str,
+    base_url: Optional[str] = None,
+    sdk_retries: bool = True,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> str:
+    """
+    Asynchronously call the OpenAI API with the given parameters.
+
+    See the module docstring for the arguments and errors.
+    """
+    completion = await acomplete_openai(
+        model, system_prompt, prompt, api_key, base_url, sdk_retries, max_tokens,
+        timeout,
+    )
+    return completion.text
+
+
+@functools.lru_cache(maxsize=None)
+def _keyword_names(func: Callable[..., Any]) -> Optional[FrozenSet[str]]:
+    """Return the keyword arguments a function accepts, or None if it takes **kwargs."""
+    try:
+        parameters = inspect.signature(func).parameters.values()
+    except (TypeError, ValueError):
+        return None
+    if any(p.kind is inspect.Parameter.VAR_KEYWORD for p in parameters):
+        return None
+    return frozenset(p.name for p in parameters)
+
+
+def _supported_params(
+    func: Callable[..., Any], params: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Drop generation parameters that the installed SDK no longer accepts."""
+    names = _keyword_names(func)
+    if names is None:
+        return dict(params)
+    return {name: value for name, value in params.items() if name in names}
+
+
+def _claude_request(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Build the messages request shared by the sync and async paths."""
+    system: Any = system_prompt
+    if _cacheable("claude", model, system_prompt):
+        system = [
+            {
+                "type": "text",
+                "text": system_prompt,
+                "cache_control": {"type": "ephemeral"},
+            }
+        ]
+    request = {
+        "model": model,
+        "system": system,
+        "messages": [
+            {"role": "user", "content": prompt}
+        ],
+        # Recent SDK releases removed sampling parameters such as temperature
+        **_supported_params(
+            anthropic.resources.Messages.create, GENERATION_DEFAULTS["claude"]
+        ),
+    }
+    if max_tokens is not None:
+        request["max_tokens"] = max_tokens
+    if timeout is not None:
+        request["timeout"] = anthropic.Timeout(
+            timeout, connect=min(timeout, CONNECT_TIMEOUT)
+        )
+    return request
+
+
+def _claude_error(e: Exception) -> Exception:
+    """Translate an Anthropic SDK error into the exception raised to callers."""
+    error_str = str(e).lower()
+    if "invalid" in error_str and "api key" in error_str:
+        return ValueError("Invalid Anthropic API key")
+    return Exception(f"Anthropic API error: {str(e)}")
+
+
+def _claude_input_tokens(usage: Any) -> Optional[int]:
+    """Total prompt tokens; Claude reports cache reads and writes separately."""
+    counts = [
+        getattr(usage, name, None)
+        for name in (
+            "input_tokens", "cache_read_input_tokens", "cache_creation_input_tokens"
+        )
+    ]
+    if not isinstance(counts[0], int):
+        return counts[0]
+    return sum(count for count in counts if isinstance(count, int))
+
+
+def _claude_completion(response: Any, headers: Any = None) -> Completion:
+    """Normalize a Messages API response."""
+    usage = getattr(response, "usage", None)
+    return Completion(
+        text=response.content[0].text,
+        finish_reason=getattr(response, "stop_reason", None),
+        input_tokens=_claude_input_tokens(usage),
+        output_tokens=getattr(usage, "output_tokens", None),
+        cached_tokens=getattr(usage, "cache_read_input_tokens", None),
+        cache_write_tokens=getattr(usage, "cache_creation_input_tokens", None),
+        request_id=getattr(response, "_request_id", None),
+        headers=headers,
+    )
+
+
+def complete_claude(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    api_key: str,
+    base_url: Optional[str] = None,
+    sdk_retries: bool = True,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Completion:
+    """
+    Call the Anthropic Claude API and return the normalized completion.
+
+    See the module docstring for the arguments and errors.
+    """
+    if not api_key:
+        raise ValueError("Anthropic API key is required")
+
+    _import_sdk("claude")
+
+    try:
+        client = client_pool.get(
+            "claude",
+            api_key,
+            lambda: anthropic.Anthropic(**_client_kwargs(api_key, base_url)),
+            base_url=base_url,
+        )
+        client = _with_sdk_retries(client, sdk_retries)
+        raw = client.messages.with_raw_response.create(
+            **_claude_request(model, system_prompt, prompt, max_tokens, timeout)
+        )
+        return _claude_completion(raw.parse(), raw.headers)
+    except (AnthropicError, RateLimitError, APIConnectionError) as e:
+        raise _claude_error(e) from e
 
 
-def call_claude(model: str, system_prompt: str, prompt: str, api_key: str) -> str:
+def call_claude(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    api_key: str,
+    base_url: Optional[str] = None,
+    sdk_retries: bool = True,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> str:
     """
     Call the Anthropic Claude API with the given parameters.
 
-    Args:
-        model: The model to use (e.g., 'claude-3-opus-20240229', 'claude-3-sonnet-20240229').
-        system_prompt: The system prompt to guide the model's behavior.
-        prompt: The user's input prompt.
-        api_key: The Anthropic API key.
+    See the module docstring for the arguments and errors.
+    """
+    return complete_claude(
+        model, system_prompt, prompt, api_key, base_url, sdk_retries, max_tokens,
+        timeout,
+    ).text
 
-    Returns:
-        The generated text response from the model.
 
-    Raises:
-        ValueError: If the API key is invalid or missing.
-        Exception: For errors during the API call.
+async def acomplete_claude(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    api_key: str,
+    base_url: Optional[str] = None,
+    sdk_retries: bool = True,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Completion:
+    """
+    Asynchronously call the Claude API and return the normalized completion.
+
+    See the module docstring for the arguments and errors.
     """
     if not api_key:
         raise ValueError("Anthropic API key is required")
 
+    _import_sdk("claude")
+
     try:
-        client = anthropic.Anthropic(api_key=api_key)
-        response = client.messages.create(
-            model=model,
-            system=system_prompt,
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=4000,
-            temperature=0.7,
-        )
-        return response.content[0].text
+        client = async_client_pool().get(
+            "claude",
+            api_key,
+            lambda: anthropic.AsyncAnthropic(**_client_kwargs(api_key, base_url)),
+            base_url=base_url,
+        )
+        client = _with_sdk_retries(client, sdk_retries)
+        raw = await client.messages.with_raw_response.create(
+            **_claude_request(model, system_prompt, prompt, max_tokens, timeout)
+        )
+        return _claude_completion(await _aparse(raw), raw.headers)
     except (AnthropicError, RateLimitError, APIConnectionError) as e:
-        error_msg = f"Anthropic API error: {str(e)}"
-        error_str = str(e).lower()
-        if "invalid" in error_str and "api key" in error_str:
-            raise ValueError("Invalid Anthropic API key") from e
-        raise Exception(error_msg) from e
+        raise _claude_error(e) from e
+
+
+async def acall_claude(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    api_key: str,
+    base_url: Optional[str] = None,
+    sdk_retries: bool = True,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> str:
+    """
+    Asynchronously call the Anthropic Claude API with the given parameters.
+
+    See the module docstring for the arguments and errors.
+    """
+    completion = await acomplete_claude(
+        model, system_prompt, prompt, api_key, base_url, sdk_retries, max_tokens,
+        timeout,
+    )
+    return completion.text
+
+
+def _gemini_client_kwargs(api_key: str, base_url: Optional[str]) -> Dict[str, Any]:
+    """Build GenerativeServiceClient arguments; custom endpoints use REST."""
+    if base_url is None:
+        return {"client_options": {"api_key": api_key}}
+    return {
+        "client_options": {"api_key": api_key, "api_endpoint": base_url},
+        "transport": "rest",
+    }
+
+
+class GeminiBackend:
+    """
+    Per-key Gemini client and model state, safe to share between threads.
+
+    ``google.generativeai`` normally routes every request through a process-global
+    client set by ``genai.configure``, so concurrent calls with different keys
+    race on it. This backend gives each API key its own pooled
+    ``GenerativeServiceClient`` and caches one ``GenerativeModel`` per
+    ``(api_key, model, system_prompt)`` bound to that client.
+
+    The binding sets private ``GenerativeModel`` attributes, which is why the
+    SDK version is pinned; a release without them fails with an ImportError
+    rather than silently falling back to the global client.
+    """
+
+    def __init__(self, pool: ClientPool = client_pool, max_models: int = 128) -> None:
+        """
+        Initialize the backend.
+
+        Args:
+            pool: Client pool holding the per-key service clients.
+            max_models: Maximum number of cached GenerativeModel instances.
+
+        Raises:
+            ValueError: If max_models is less than 1.
+        """
+        if max_models < 1:
+            raise ValueError("max_models must be at least 1")
+        self.max_models = max_models
+        self._pool = pool
+        self._models: "OrderedDict[Tuple[Any, ...], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_model(
+        self,
+        api_key: str,
+        model: str,
+        system_prompt: str,
+        asynchronous: bool = False,
+        base_url: Optional[str] = None,
+        cached_content: Optional[str] = None,
+    ) -> Any:
+        """
+        Return a GenerativeModel bound to the client for the given API key.
+
+        Args:
+            api_key: The Google AI API key.
+            model: The model to use (e.g., 'gemini-pro').
+            system_prompt: The system instruction for the model.
+            asynchronous: Bind the model to an async client from the running
+                event loop's pool instead of the shared sync client.
+            base_url: Optional API endpoint (e.g. 'http://localhost:8080').
+                Served over the REST transport, so only sync clients support it.
+            cached_content: Optional name of a cached content holding the
+                system prompt, sent instead of the system instruction.
+
+        Returns:
+            A cached or newly created GenerativeModel.
+
+        Raises:
+            ValueError: If base_url is combined with an async client.
+            ImportError: If the installed SDK lacks the client attributes.
+        """
+        _import_sdk("gemini")
+        if asynchronous:
+            if base_url is not None:
+                raise ValueError(
+                    "A custom Gemini base_url requires the synchronous client"
+                )
+            pool = async_client_pool()
+            client_attr = "_async_client"
+            client = pool.get(
+                "gemini",
+                api_key,
+                lambda: glm.GenerativeServiceAsyncClient(
+                    client_options={"api_key": api_key}
+                ),
+            )
+        else:
+            pool = self._pool
+            client_attr = "_client"
+            client = pool.get(
+                "gemini",
+                api_key,
+                lambda: glm.GenerativeServiceClient(
+                    **_gemini_client_kwargs(api_key, base_url)
+                ),
+                base_url=base_url,
+            )
+        # Async models are kept per event loop pool so that loops never share one
+        key = (id(pool), api_key, base_url, model, system_prompt, cached_content)
+        with self._lock:
+            instance = self._models.get(key)
+            # A model whose client was evicted from the pool is rebuilt
+            if instance is not None and getattr(instance, client_attr) is client:
+                self._models.move_to_end(key)
+                return instance
+            if cached_content is None or not _gemini_reads_cached_content():
+                # Without the cached_content property the SDK would ignore the
+                # name, so the prompt is sent inline instead
+                instance = genai.GenerativeModel(
+                    model_name=model, system_instruction=system_prompt
+                )
+            else:
+                # What GenerativeModel.from_cached_content does, minus its lookup
+                # through the SDK's process-global client
+                instance = genai.GenerativeModel(model_name=model)
+                instance._cached_content = cached_content
+            if not hasattr(instance, client_attr):
+                raise ImportError(
+                    f"GenerativeModel no longer has the {client_attr} attribute "
+                    "that oju binds per-key clients to. Install a supported "
+                    f"version with: pip install '{_GEMINI_SDK_REQUIREMENT}'"
+                )
+            setattr(instance, client_attr, client)
+            self._models[key] = instance
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+            return instance
+
+    def clear(self) -> None:
+        """Drop every cached model."""
+        with self._lock:
+            self._models.clear()
+
+
+# Process-wide Gemini backend used by call_gemini
+gemini_backend = GeminiBackend()
+
+
+def _gemini_reads_cached_content() -> bool:
+    """Whether GenerativeModel still reads the private ``_cached_content``."""
+    return getattr(genai.GenerativeModel, "cached_content", None) is not None
+
+
+def _gemini_model_path(model: str) -> str:
+    return model if "/" in model else f"models/{model}"
+
+
+# GeminiContextCache key: (api_key, base_url, model, system prompt digest)
+_ContextKey = Tuple[str, Optional[str], str, str]
+
+
+class GeminiContextCache:
+    """
+    Gemini cached contents holding large system prompts, safe to share between threads.
+
+    The first call with a system prompt of at least
+    ``PROMPT_CACHE_MIN_TOKENS["gemini"]`` estimated tokens stores it as a
+    ``CachedContent`` with a lifetime of ``ttl`` seconds; later calls of the
+    same key, model and prompt reference it instead of resending the prompt.
+    Entries are extended when they get within ``refresh_margin`` of expiring
+    and recreated if the service dropped them. Prompts that cannot be cached
+    (for example because the model does not support caching) are sent as
+    plain system instructions and not retried for ``retry_failed_after``
+    seconds. At most ``max_entries`` prompts are tracked; expired ones are
+    dropped on every write and the least recently used go first beyond that.
+
+    A lookup given a timeout bounds its RPCs by it. With less than
+    ``min_lookup_time`` seconds it makes no RPC and only uses an entry that
+    needs no work; one that runs out of time falls back to the plain system
+    instruction without marking the prompt as failed.
+    """
+
+    def __init__(
+        self,
+        pool: ClientPool = client_pool,
+        ttl: float = 3600.0,
+        refresh_margin: float = 300.0,
+        retry_failed_after: float = 600.0,
+        max_entries: int = 1024,
+        min_lookup_time: float = 1.0,
+    ) -> None:
+        """
+        Initialize the cache.
+
+        Args:
+            pool: Client pool holding the per-key cache service clients.
+            ttl: Lifetime in seconds given to cached contents.
+            refresh_margin: Extend an entry when it expires in fewer seconds.
+            retry_failed_after: Seconds before retrying a prompt that could
+                not be cached.
+            max_entries: Maximum number of prompts tracked, cached and failed
+                ones each.
+            min_lookup_time: Shortest timeout, in seconds, with which a
+                lookup creates or extends an entry.
+
+        Raises:
+            ValueError: If ttl is not greater than refresh_margin or
+                max_entries is less than 1.
+        """
+        if ttl <= refresh_margin or refresh_margin < 0:
+            raise ValueError("ttl must be greater than refresh_margin")
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.retry_failed_after = retry_failed_after
+        self.max_entries = max_entries
+        self.min_lookup_time = min_lookup_time
+        self._pool = pool
+        # key -> (cached content name, monotonic expiry time), oldest use first
+        self._entries: "OrderedDict[_ContextKey, Tuple[str, float]]" = OrderedDict()
+        # key -> monotonic time after which caching is attempted again
+        self._failed: "OrderedDict[_ContextKey, float]" = OrderedDict()
+        self._key_locks: Dict[_ContextKey, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _key(
+        self, api_key: str, model: str, system_prompt: str, base_url: Optional[str]
+    ) -> _ContextKey:
+        return (api_key, base_url, model, _prompt_digest(system_prompt))
+
+    def _cached(
+        self, key: _ContextKey
+    ) -> Tuple[bool, Optional[str]]:
+        """Return ``(final, name)``; ``final`` is False when the entry needs work."""
+        now = time.monotonic()
+        with self._lock:
+            if self._failed.get(key, 0.0) > now:
+                return True, None
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None and entry[1] - now > self.refresh_margin:
+            return True, entry[0]
+        return False, entry[0] if entry is not None else None
 
+    def _store(
+        self, key: _ContextKey, name: Optional[str]
+    ) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if name is None:
+                self._entries.pop(key, None)
+                self._failed[key] = now + self.retry_failed_after
+                self._failed.move_to_end(key)
+            else:
+                self._entries[key] = (name, now + self.ttl)
+                self._entries.move_to_end(key)
+                self._failed.pop(key, None)
+            self._prune(now)
 
-def call_gemini(model: str, system_prompt: str, prompt: str, api_key: str) -> str:
+    def _prune(self, now: float) -> None:
+        """Drop expired and least recently used entries; call with the lock held."""
+        for stale in [k for k, (_, expires) in self._entries.items() if expires <= now]:
+            del self._entries[stale]
+        for stale in [k for k, retry_at in self._failed.items() if retry_at <= now]:
+            del self._failed[stale]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        while len(self._failed) > self.max_entries:
+            self._failed.popitem(last=False)
+        for stale in [
+            k for k in self._key_locks
+            if k not in self._entries and k not in self._failed
+            and not self._key_locks[k].locked()
+        ]:
+            del self._key_locks[stale]
+
+    def _create_request(self, model: str, system_prompt: str) -> Any:
+        return glm.CachedContent(
+            model=_gemini_model_path(model),
+            system_instruction=glm.Content(parts=[glm.Part(text=system_prompt)]),
+            ttl=datetime.timedelta(seconds=self.ttl),
+        )
+
+    def _update_request(self, name: str) -> Dict[str, Any]:
+        return {
+            "cached_content": glm.CachedContent(
+                name=name, ttl=datetime.timedelta(seconds=self.ttl)
+            ),
+            "update_mask": {"paths": ["ttl"]},
+        }
+
+    @staticmethod
+    def _rpc_options(
+        deadline: Optional[Deadline], sdk_retries: bool
+    ) -> Dict[str, Any]:
+        """Keyword arguments bounding one cache RPC by the time left."""
+        if deadline is None:
+            return _gemini_rpc_options(sdk_retries)
+        deadline.check()
+        return _gemini_rpc_options(False, deadline.remaining())
+
+    def lookup(
+        self,
+        api_key: str,
+        model: str,
+        system_prompt: str,
+        base_url: Optional[str] = None,
+        timeout: Optional[float] = None,
+        sdk_retries: bool = True,
+    ) -> Optional[str]:
+        """
+        Return the cached content name for a system prompt, creating it if needed.
+
+        Args:
+            api_key: The Google AI API key.
+            model: The model the prompt is used with.
+            system_prompt: The system instruction to cache.
+            base_url: Optional API endpoint, as for :meth:`GeminiBackend.get_model`.
+            timeout: Optional limit in seconds of the whole lookup, including
+                the wait for another thread's lookup of the same prompt.
+            sdk_retries: Let the SDK retry failed RPCs; off with a timeout.
+
+        Returns:
+            Optional[str]: The cached content name, or ``None`` if the prompt
+            is too small, cannot be cached or the time ran out.
+        """
+        if not _cacheable("gemini", model, system_prompt):
+            return None
+        key = self._key(api_key, model, system_prompt, base_url)
+        final, name = self._cached(key)
+        if final:
+            return name
+        if timeout is not None and timeout < self.min_lookup_time:
+            return None
+        deadline = None if timeout is None else Deadline.after(timeout)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # One thread creates or extends an entry while the others wait for it
+        if not key_lock.acquire(timeout=-1 if deadline is None else timeout):
+            return None
+        try:
+            final, name = self._cached(key)
+            if final:
+                return name
+            _import_sdk("gemini")
+            client = self._pool.get(
+                "gemini-cache",
+                api_key,
+                lambda: glm.CacheServiceClient(
+                    **_gemini_client_kwargs(api_key, base_url)
+                ),
+                base_url=base_url,
+            )
+            try:
+                name = self._refresh(
+                    client, name, model, system_prompt, deadline, sdk_retries
+                )
+            except DeadlineExceededError:
+                return None  # Out of time, not a failure; try again later
+            self._store(key, name)
+            return name
+        finally:
+            key_lock.release()
+
+    def _refresh(
+        self,
+        client: Any,
+        name: Optional[str],
+        model: str,
+        system_prompt: str,
+        deadline: Optional[Deadline] = None,
+        sdk_retries: bool = True,
+    ) -> Optional[str]:
+        """
+        Extend an entry, or create it if it is new or gone; ``None`` on failure.
+
+        Raises:
+            DeadlineExceededError: If ``deadline`` passed first.
+        """
+        if name is not None:
+            try:
+                updated = client.update_cached_content(
+                    **self._update_request(name),
+                    **self._rpc_options(deadline, sdk_retries),
+                )
+                return updated.name or name
+            except DeadlineExceededError:
+                raise
+            except google_exceptions.DeadlineExceeded as e:
+                raise DeadlineExceededError() from e
+            except Exception:
+                pass  # Expired or deleted: create it again below
+        try:
+            return client.create_cached_content(
+                cached_content=self._create_request(model, system_prompt),
+                **self._rpc_options(deadline, sdk_retries),
+            ).name
+        except DeadlineExceededError:
+            raise
+        except google_exceptions.DeadlineExceeded as e:
+            raise DeadlineExceededError() from e
+        except Exception:
+            return None
+
+    async def _arefresh(
+        self,
+        client: Any,
+        name: Optional[str],
+        model: str,
+        system_prompt: str,
+        deadline: Optional[Deadline] = None,
+        sdk_retries: bool = True,
+    ) -> Optional[str]:
+        """The async counterpart of :meth:`_refresh`."""
+        if name is not None:
+            try:
+                updated = await client.update_cached_content(
+                    **self._update_request(name),
+                    **self._rpc_options(deadline, sdk_retries),
+                )
+                return updated.name or name
+            except DeadlineExceededError:
+                raise
+            except google_exceptions.DeadlineExceeded as e:
+                raise DeadlineExceededError() from e
+            except Exception:
+                pass  # Expired or deleted: create it again below
+        try:
+            created = await client.create_cached_content(
+                cached_content=self._create_request(model, system_prompt),
+                **self._rpc_options(deadline, sdk_retries),
+            )
+            return created.name
+        except DeadlineExceededError:
+            raise
+        except google_exceptions.DeadlineExceeded as e:
+            raise DeadlineExceededError() from e
+        except Exception:
+            return None
+
+    async def alookup(
+        self,
+        api_key: str,
+        model: str,
+        system_prompt: str,
+        base_url: Optional[str] = None,
+        timeout: Optional[float] = None,
+        sdk_retries: bool = True,
+    ) -> Optional[str]:
+        """
+        Asynchronously return the cached content name for a system prompt.
+
+        The async counterpart of :meth:`lookup`. Concurrent tasks may each
+        create an entry the first time; the extra ones simply expire. A custom
+        ``base_url`` is served over REST, which the async GAPIC client does not
+        speak, so such lookups run :meth:`lookup` on a worker thread.
+        """
+        if not _cacheable("gemini", model, system_prompt):
+            return None
+        if base_url is not None:
+            return await asyncio.get_running_loop().run_in_executor(
+                None,
+                functools.partial(
+                    self.lookup, api_key, model, system_prompt, base_url,
+                    timeout, sdk_retries,
+                ),
+            )
+        key = self._key(api_key, model, system_prompt, base_url)
+        final, name = self._cached(key)
+        if final:
+            return name
+        if timeout is not None and timeout < self.min_lookup_time:
+            return None
+        deadline = None if timeout is None else Deadline.after(timeout)
+        _import_sdk("gemini")
+        client = async_client_pool().get(
+            "gemini-cache",
+            api_key,
+            lambda: glm.CacheServiceAsyncClient(
+                **_gemini_client_kwargs(api_key, base_url)
+            ),
+        )
+        try:
+            name = await self._arefresh(
+                client, name, model, system_prompt, deadline, sdk_retries
+            )
+        except DeadlineExceededError:
+            return None  # Out of time, not a failure; try again later
+        self._store(key, name)
+        return name
+
+    def clear(self) -> None:
+        """Forget every entry. Cached contents on the service expire on their own."""
+        with self._lock:
+            self._entries.clear()
+            self._failed.clear()
+            self._key_locks.clear()
+
+
+# Process-wide Gemini context cache used by the Gemini provider functions
+gemini_context_cache = GeminiContextCache()
+
+
+def _gemini_lookup_timeout(deadline: Optional[Deadline]) -> Optional[float]:
+    """The share of an attempt a context cache lookup may use, leaving the rest."""
+    return None if deadline is None else deadline.remaining() / 2
+
+
+def _gemini_model(
+    api_key: str,
+    model: str,
+    system_prompt: str,
+    base_url: Optional[str],
+    sdk_retries: bool = True,
+    deadline: Optional[Deadline] = None,
+) -> Any:
+    """Return the sync GenerativeModel, using a cached content for large prompts."""
+    cached_content = gemini_context_cache.lookup(
+        api_key, model, system_prompt, base_url,
+        timeout=_gemini_lookup_timeout(deadline), sdk_retries=sdk_retries,
+    )
+    return gemini_backend.get_model(
+        api_key, model, system_prompt, base_url=base_url, cached_content=cached_content
+    )
+
+
+async def _agemini_model(
+    api_key: str,
+    model: str,
+    system_prompt: str,
+    base_url: Optional[str],
+    sdk_retries: bool = True,
+    deadline: Optional[Deadline] = None,
+) -> Any:
+    """Return the async GenerativeModel, using a cached content for large prompts."""
+    cached_content = await gemini_context_cache.alookup(
+        api_key, model, system_prompt, base_url,
+        timeout=_gemini_lookup_timeout(deadline), sdk_retries=sdk_retries,
+    )
+    return gemini_backend.get_model(
+        api_key, model, system_prompt, asynchronous=True, base_url=base_url,
+        cached_content=cached_content,
+    )
+
+
+# Full category names; the SDK rejects the short "DANGEROUS_CONTENT" alias
+_GEMINI_SAFETY_SETTINGS = {
+    "HARM_CATEGORY_HARASSMENT": "BLOCK_NONE",
+    "HARM_CATEGORY_HATE_SPEECH": "BLOCK_NONE",
+    "HARM_CATEGORY_SEXUALLY_EXPLICIT": "BLOCK_NONE",
+    "HARM_CATEGORY_DANGEROUS_CONTENT": "BLOCK_NONE",
+}
+
+
+def _gemini_text(response: Any) -> str:
+    """Extract the response text, rejecting empty responses."""
+    if not response.text:
+        raise ValueError("No response text was returned from Gemini API")
+    return response.text
+
+
+def _gemini_error(e: Exception) -> Exception:
+    """Translate a Gemini error into the exception raised to callers."""
+    if isinstance(
+        e, (google_exceptions.InvalidArgument, google_exceptions.PermissionDenied)
+    ):
+        # Check for "api key" in the error message (case insensitive)
+        if "api key" in str(e).lower():
+            return ValueError("Invalid Google AI API key")
+        return Exception(f"Google API error: {str(e)}")
+    return Exception(f"Error calling Gemini API: {str(e)}")
+
+
+def _gemini_rpc_options(
+    sdk_retries: bool, timeout: Optional[float] = None
+) -> Dict[str, Any]:
+    """GAPIC call options; ``retry=None`` disables the GAPIC retry."""
+    options: Dict[str, Any] = {}
+    if not sdk_retries:
+        options["retry"] = None
+    if timeout is not None:
+        # The RPC deadline, covering the whole request rather than each read
+        options["timeout"] = timeout
+    return options
+
+
+def _gemini_deadline(timeout: Optional[float]) -> Optional[Deadline]:
+    """The deadline of an attempt, shared by its cache lookup and its request."""
+    return None if timeout is None else Deadline.after(timeout)
+
+
+def _gemini_time_left(deadline: Optional[Deadline]) -> Optional[float]:
+    return None if deadline is None else deadline.remaining()
+
+
+def _gemini_request_options(
+    sdk_retries: bool, max_tokens: Optional[int] = None, timeout: Optional[float] = None
+) -> Dict[str, Any]:
+    """Extra generate_content arguments; ``retry=None`` disables the GAPIC retry."""
+    options: Dict[str, Any] = {}
+    request_options = _gemini_rpc_options(sdk_retries, timeout)
+    if request_options:
+        options["request_options"] = request_options
+    if max_tokens is not None:
+        options["generation_config"] = {"max_output_tokens": max_tokens}
+    return options
+
+
+def _gemini_completion(response: Any) -> Completion:
+    """Normalize a GenerateContentResponse."""
+    text = _gemini_text(response)
+    candidates = getattr(response, "candidates", None)
+    finish_reason = (
+        getattr(candidates[0], "finish_reason", None) if candidates else None
+    )
+    usage = getattr(response, "usage_metadata", None)
+    return Completion(
+        text=text,
+        finish_reason=getattr(finish_reason, "name", finish_reason),
+        input_tokens=getattr(usage, "prompt_token_count", None),
+        output_tokens=getattr(usage, "candidates_token_count", None),
+        # The Gemini API does not return a request ID
+        cached_tokens=getattr(usage, "cached_content_token_count", None),
+    )
+
+
+def complete_gemini(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    api_key: str,
+    base_url: Optional[str] = None,
+    sdk_retries: bool = True,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Completion:
+    """
+    Call the Google Gemini API and return the normalized completion.
+
+    See the module docstring for the arguments and errors.
+    """
+    if not api_key:
+        raise ValueError("Google AI API key is required")
+
+    _import_sdk("gemini")
+
+    try:
+        deadline = _gemini_deadline(timeout)
+        model_instance = _gemini_model(
+            api_key, model, system_prompt, base_url, sdk_retries, deadline
+        )
+        response = model_instance.generate_content(
+            prompt,
+            safety_settings=_GEMINI_SAFETY_SETTINGS,
+            **_gemini_request_options(
+                sdk_retries, max_tokens, _gemini_time_left(deadline)
+            ),
+        )
+        return _gemini_completion(response)
+    except Exception as e:
+        raise _gemini_error(e) from e
+
+
+def call_gemini(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    api_key: str,
+    base_url: Optional[str] = None,
+    sdk_retries: bool = True,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> str:
     """
     Call the Google Gemini API with the given parameters.
 
-    Args:
-        model: The model to use (e.g., 'gemini-pro').
-        system_prompt: The system prompt to guide the model's behavior.
-        prompt: The user's input prompt.
-        api_key: The Google AI API key.
+    See the module docstring for the arguments and errors.
+    """
+    return complete_gemini(
+        model, system_prompt, prompt, api_key, base_url, sdk_retries, max_tokens,
+        timeout,
+    ).text
 
-    Returns:
-        The generated text response from the model.
 
-    Raises:
-        ValueError: If the API key is invalid or missing.
-        Exception: For errors during the API call.
+async def acomplete_gemini(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    api_key: str,
+    base_url: Optional[str] = None,
+    sdk_retries: bool = True,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Completion:
+    """
+    Asynchronously call the Gemini API and return the normalized completion.
+
+    See the module docstring for the arguments and errors.
+    """
+    if not api_key:
+        raise ValueError("Google AI API key is required")
+
+    _import_sdk("gemini")
+
+    try:
+        deadline = _gemini_deadline(timeout)
+        model_instance = await _agemini_model(
+            api_key, model, system_prompt, base_url, sdk_retries, deadline
+        )
+        response = await model_instance.generate_content_async(
+            prompt,
+            safety_settings=_GEMINI_SAFETY_SETTINGS,
+            **_gemini_request_options(
+                sdk_retries, max_tokens, _gemini_time_left(deadline)
+            ),
+        )
+        return _gemini_completion(response)
+    except Exception as e:
+        raise _gemini_error(e) from e
+
+
+async def acall_gemini(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    api_key: str,
+    base_url: Optional[str] = None,
+    sdk_retries: bool = True,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> str:
+    """
+    Asynchronously call the Google Gemini API with the given parameters.
+
+    See the module docstring for the arguments and errors.
+    """
+    completion = await acomplete_gemini(
+        model, system_prompt, prompt, api_key, base_url, sdk_retries, max_tokens,
+        timeout,
+    )
+    return completion.text
+
+
+def _openai_chunk(chunk: Any, summary: StreamSummary) -> Optional[str]:
+    """Parse one chat completion chunk."""
+    if getattr(chunk, "usage", None) is not None:
+        summary.input_tokens = chunk.usage.prompt_tokens
+        summary.output_tokens = chunk.usage.completion_tokens
+        summary.cached_tokens = getattr(
+            getattr(chunk.usage, "prompt_tokens_details", None), "cached_tokens", None
+        )
+    if not chunk.choices:
+        return None
+    choice = chunk.choices[0]
+    if choice.finish_reason:
+        summary.finish_reason = choice.finish_reason
+    return choice.delta.content
+
+
+def stream_openai(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    api_key: str,
+    base_url: Optional[str] = None,
+    sdk_retries: bool = True,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> TextStream:
+    """
+    Stream a completion from the OpenAI API.
+
+    See the module docstring for the arguments and errors.
+    """
+    if not api_key:
+        raise ValueError("OpenAI API key is required")
+
+    _import_sdk("openai")
+
+    try:
+        client = client_pool.get(
+            "openai",
+            api_key,
+            lambda: OpenAI(**_client_kwargs(api_key, base_url)),
+            base_url=base_url,
+        )
+        client = _with_sdk_retries(client, sdk_retries)
+        raw = client.chat.completions.with_raw_response.create(
+            **_openai_request(model, system_prompt, prompt, max_tokens, timeout),
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        stream = raw.parse()
+    except OpenAIError as e:
+        raise _openai_error(e) from e
+    summary = StreamSummary()
+    deltas = iter_deltas(
+        stream, _openai_chunk, summary, stream.close, (OpenAIError,), _openai_error
+    )
+    return TextStream(deltas, summary, on_close=stream.close, headers=raw.headers)
+
+
+async def astream_openai(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    api_key: str,
+    base_url: Optional[str] = None,
+    sdk_retries: bool = True,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> AsyncTextStream:
+    """
+    Asynchronously stream a completion from the OpenAI API.
+
+    See the module docstring for the arguments and errors.
+    """
+    if not api_key:
+        raise ValueError("OpenAI API key is required")
+
+    _import_sdk("openai")
+
+    try:
+        client = async_client_pool().get(
+            "openai",
+            api_key,
+            lambda: AsyncOpenAI(**_client_kwargs(api_key, base_url)),
+            base_url=base_url,
+        )
+        client = _with_sdk_retries(client, sdk_retries)
+        raw = await client.chat.completions.with_raw_response.create(
+            **_openai_request(model, system_prompt, prompt, max_tokens, timeout),
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        stream = await _aparse(raw)
+    except OpenAIError as e:
+        raise _openai_error(e) from e
+    summary = StreamSummary()
+    deltas = aiter_deltas(
+        stream, _openai_chunk, summary, stream.close, (OpenAIError,), _openai_error
+    )
+    return AsyncTextStream(
+        deltas, summary, on_close=stream.close, headers=raw.headers
+    )
+
+
+def _claude_event(event: Any, summary: StreamSummary) -> Optional[str]:
+    """Parse one Messages API stream event."""
+    if event.type == "message_start":
+        usage = event.message.usage
+        summary.input_tokens = _claude_input_tokens(usage)
+        summary.cached_tokens = getattr(usage, "cache_read_input_tokens", None)
+        summary.cache_write_tokens = getattr(usage, "cache_creation_input_tokens", None)
+    elif event.type == "message_delta":
+        summary.finish_reason = event.delta.stop_reason
+        summary.output_tokens = event.usage.output_tokens
+    elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+        return event.delta.text
+    return None
+
+
+def stream_claude(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    api_key: str,
+    base_url: Optional[str] = None,
+    sdk_retries: bool = True,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> TextStream:
+    """
+    Stream a completion from the Anthropic Claude API.
+
+    See the module docstring for the arguments and errors.
+    """
+    if not api_key:
+        raise ValueError("Anthropic API key is required")
+
+    _import_sdk("claude")
+
+    errors = (AnthropicError, RateLimitError, APIConnectionError)
+    try:
+        client = client_pool.get(
+            "claude",
+            api_key,
+            lambda: anthropic.Anthropic(**_client_kwargs(api_key, base_url)),
+            base_url=base_url,
+        )
+        client = _with_sdk_retries(client, sdk_retries)
+        raw = client.messages.with_raw_response.create(
+            **_claude_request(model, system_prompt, prompt, max_tokens, timeout),
+            stream=True,
+        )
+        stream = raw.parse()
+    except errors as e:
+        raise _claude_error(e) from e
+    summary = StreamSummary()
+    deltas = iter_deltas(
+        stream, _claude_event, summary, stream.close, errors, _claude_error
+    )
+    return TextStream(deltas, summary, on_close=stream.close, headers=raw.headers)
+
+
+async def astream_claude(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    api_key: str,
+    base_url: Optional[str] = None,
+    sdk_retries: bool = True,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> AsyncTextStream:
+    """
+    Asynchronously stream a completion from the Anthropic Claude API.
+
+    See the module docstring for the arguments and errors.
+    """
+    if not api_key:
+        raise ValueError("Anthropic API key is required")
+
+    _import_sdk("claude")
+
+    errors = (AnthropicError, RateLimitError, APIConnectionError)
+    try:
+        client = async_client_pool().get(
+            "claude",
+            api_key,
+            lambda: anthropic.AsyncAnthropic(**_client_kwargs(api_key, base_url)),
+            base_url=base_url,
+        )
+        client = _with_sdk_retries(client, sdk_retries)
+        raw = await client.messages.with_raw_response.create(
+            **_claude_request(model, system_prompt, prompt, max_tokens, timeout),
+            stream=True,
+        )
+        stream = await _aparse(raw)
+    except errors as e:
+        raise _claude_error(e) from e
+    summary = StreamSummary()
+    deltas = aiter_deltas(
+        stream, _claude_event, summary, stream.close, errors, _claude_error
+    )
+    return AsyncTextStream(
+        deltas, summary, on_close=stream.close, headers=raw.headers
+    )
+
+
+def _gemini_chunk(chunk: Any, summary: StreamSummary) -> Optional[str]:
+    """Parse one streamed GenerateContentResponse."""
+    usage = getattr(chunk, "usage_metadata", None)
+    if usage is not None and usage.prompt_token_count:
+        summary.input_tokens = usage.prompt_token_count
+        summary.output_tokens = usage.candidates_token_count
+        summary.cached_tokens = getattr(usage, "cached_content_token_count", None)
+    if chunk.candidates:
+        finish_reason = chunk.candidates[0].finish_reason
+        if finish_reason:
+            summary.finish_reason = getattr(finish_reason, "name", str(finish_reason))
+    try:
+        return chunk.text
+    except ValueError:
+        # Chunks that only carry a finish reason or usage have no text parts
+        return None
+
+
+def _gemini_stream_closer(response: Any) -> Any:
+    """Return a callable that cancels a streaming Gemini response."""
+    # The SDK keeps the gRPC call on a private attribute; cancelling it is the
+    # only way to stop the server from generating the rest of the response
+    iterator = getattr(response, "_iterator", None)
+    cancel = getattr(iterator, "cancel", None)
+
+    def close() -> None:
+        if cancel is not None:
+            cancel()
+
+    return close
+
+
+def stream_gemini(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    api_key: str,
+    base_url: Optional[str] = None,
+    sdk_retries: bool = True,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> TextStream:
+    """
+    Stream a completion from the Google Gemini API.
+
+    See the module docstring for the arguments and errors.
     """
     if not api_key:
         raise ValueError("Google AI API key is required")
 
+    _import_sdk("gemini")
+
     try:
-        genai.configure(api_key=api_key)
-        model_instance = genai.GenerativeModel(model_name=model)
-        
-        # Combine system prompt and user prompt
-        full_prompt = f"{system_prompt}\n\nUser: {prompt}\n\nAssistant:"
-        
+        deadline = _gemini_deadline(timeout)
+        model_instance = _gemini_model(
+            api_key, model, system_prompt, base_url, sdk_retries, deadline
+        )
         response = model_instance.generate_content(
-            full_prompt,
-            safety_settings={
-                "HARASSMENT": "BLOCK_NONE",
-                "HATE_SPEECH": "BLOCK_NONE",
-                "SEXUALLY_EXPLICIT": "BLOCK_NONE",
-                "DANGEROUS_CONTENT": "BLOCK_NONE",
-            }
+            prompt,
+            safety_settings=_GEMINI_SAFETY_SETTINGS,
+            stream=True,
+            **_gemini_request_options(
+                sdk_retries, max_tokens, _gemini_time_left(deadline)
+            ),
         )
-        
-        if not response.text:
-            raise ValueError("No response text was returned from Gemini API")
-            
-        return response.text
-    except (google_exceptions.InvalidArgument, google_exceptions.PermissionDenied) as e:
-        # Fixed: Check for "api key" in the error message (case insensitive)
-        error_str = str(e).lower()
-        if "api key" in error_str:
-            raise ValueError("Invalid Google AI API key") from e
-        raise Exception(f"Google API error: {str(e)}") from e
     except Exception as e:
-        raise Exception(f"Error calling Gemini API: {str(e)}") from e
\ No newline at end of file
+        raise _gemini_error(e) from e
+    summary = StreamSummary()
+    close = _gemini_stream_closer(response)
+    deltas = iter_deltas(
+        response, _gemini_chunk, summary, close, (Exception,), _gemini_error
+    )
+    return TextStream(deltas, summary, on_close=close)
+
+
+async def astream_gemini(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    api_key: str,
+    base_url: Optional[str] = None,
+    sdk_retries: bool = True,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> AsyncTextStream:
+    """
+    Asynchronously stream a completion from the Google Gemini API.
+
+    See the module docstring for the arguments and errors.
+    """
+    if not api_key:
+        raise ValueError("Google AI API key is required")
+
+    _import_sdk("gemini")
+
+    try:
+        deadline = _gemini_deadline(timeout)
+        model_instance = await _agemini_model(
+            api_key, model, system_prompt, base_url, sdk_retries, deadline
+        )
+        response = await model_instance.generate_content_async(
+            prompt,
+            safety_settings=_GEMINI_SAFETY_SETTINGS,
+            stream=True,
+            **_gemini_request_options(
+                sdk_retries, max_tokens, _gemini_time_left(deadline)
+            ),
+        )
+    except Exception as e:
+        raise _gemini_error(e) from e
+    summary = StreamSummary()
+    iterator = getattr(response, "_iterator", None)
+
+    async def close() -> None:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+    deltas = aiter_deltas(
+        response, _gemini_chunk, summary, close, (Exception,), _gemini_error
+    )
+    return AsyncTextStream(deltas, summary, on_close=close)
@@ -0,0 +1,390 @@
+"""
+Module for pacing provider calls with client-side token buckets.
+
+A ``RateLimiter`` keeps one requests-per-minute and one tokens-per-minute
+bucket per provider, model and API key. Callers never get rejected: each call
+reserves its share of both buckets and, if a bucket is overdrawn, sleeps until
+the reservation is covered. Reservations are granted in arrival order, so a
+burst of workers is spread evenly over time instead of all of them hitting the
+provider at once and backing off on 429s. A wait that would outlast the call's
+deadline, or whose call is cancelled, ends at once and gives its reservation
+back.
+
+Bucket state lives in memory by default. Give the limiter a ``path`` and the
+buckets are kept in a SQLite file instead, so every process on the host that
+points at the same file draws from one budget.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from .deadline import CancelToken, Deadline, asleep_within, sleep_within
+from .tokens import estimate_text_tokens
+
+T = TypeVar("T")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Roughly estimate the number of tokens in a text.
+
+    Kept for existing callers; use :func:`oju.tokens.count_tokens`, which
+    knows the provider and model, in new code.
+
+    Args:
+        text: The text to measure.
+
+    Returns:
+        int: The estimate of :func:`oju.tokens.estimate_text_tokens`.
+    """
+    return estimate_text_tokens(text)
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """
+    Per-minute budgets for one provider and model.
+
+    Attributes:
+        requests_per_minute: Maximum requests per minute. ``None`` means unlimited.
+        tokens_per_minute: Maximum estimated tokens per minute. ``None`` means
+            unlimited.
+    """
+
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+
+
+class MemoryBuckets:
+    """Thread-safe token buckets held in process memory."""
+
+    def __init__(self) -> None:
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, key: str, per_minute: float, amount: float) -> float:
+        """
+        Take ``amount`` from a bucket, letting it go negative.
+
+        The bucket holds at most one minute of budget and refills
+        continuously at ``per_minute / 60`` per second. A negative amount
+        gives budget back.
+
+        Returns:
+            float: Seconds until the reservation is covered.
+        """
+        with self._lock:
+            now = time.monotonic()
+            level, updated = self._buckets.get(key, (per_minute, now))
+            level = min(per_minute, level + (now - updated) * per_minute / 60.0)
+            level -= amount
+            self._buckets[key] = (level, now)
+        return max(-level, 0.0) * 60.0 / per_minute
+
+    def clear(self) -> None:
+        """Reset every bucket to full."""
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBuckets:
+    """
+    Token buckets stored in a SQLite file shared by several processes.
+
+    Each reservation is a short ``BEGIN IMMEDIATE`` transaction, so concurrent
+    processes serialize on the file lock and never overspend a bucket. It opens
+    and closes its own connection, so short-lived worker threads leave no file
+    handles behind; that costs little next to the API call being paced.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initialize the store, creating the database file if needed.
+
+        Args:
+            path: Path of the SQLite database file.
+        """
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            # WAL mode is a property of the file, kept by later connections
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, level REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def reserve(self, key: str, per_minute: float, amount: float) -> float:
+        """Take ``amount`` from a bucket; see :meth:`MemoryBuckets.reserve`."""
+        with closing(self._connect()) as conn:
+            return self._reserve(conn, key, per_minute, amount)
+
+    @staticmethod
+    def _reserve(
+        conn: sqlite3.Connection, key: str, per_minute: float, amount: float
+    ) -> float:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Wall-clock time, since monotonic clocks are not shared between processes
+            now = time.time()
+            row = conn.execute(
+                "SELECT level, updated_at FROM buckets WHERE key = ?", (key,)
+            ).fetchone()
+            level, updated = row if row is not None else (per_minute, now)
+            elapsed = max(now - updated, 0.0)
+            level = min(per_minute, level + elapsed * per_minute / 60.0)
+            level -= amount
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, level, updated_at) "
+                "VALUES (?, ?, ?)",
+                (key, level, now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return max(-level, 0.0) * 60.0 / per_minute
+
+    def clear(self) -> None:
+        """Reset every bucket to full."""
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM buckets")
+
+
+class RateLimiter:
+    """
+    Client-side RPM/TPM pacing keyed by provider, model and API key.
+
+    Safe to share between threads and event loops. Limits are looked up most
+    specific first: ``(provider, model)``, then ``provider``, then the
+    defaults given to the constructor.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        path: Optional[str] = None,
+    ) -> None:
+        """
+        Initialize the limiter.
+
+        Args:
+            requests_per_minute: Default request budget per minute.
+            tokens_per_minute: Default estimated token budget per minute.
+            path: Optional SQLite file holding the buckets, shared by every
+                process that uses the same path.
+
+        Raises:
+            ValueError: If a budget is not positive.
+        """
+        self.default = self._validate(RateLimit(requests_per_minute, tokens_per_minute))
+        self.path = path
+        self._limits: Dict[Tuple[str, Optional[str]], RateLimit] = {}
+        self._buckets: Any = SQLiteBuckets(path) if path else MemoryBuckets()
+
+    @staticmethod
+    def _validate(limit: RateLimit) -> RateLimit:
+        for value in (limit.requests_per_minute, limit.tokens_per_minute):
+            if value is not None and value <= 0:
+                raise ValueError("Rate limits must be positive")
+        return limit
+
+    def set_limit(
+        self,
+        provider: str,
+        model: Optional[str] = None,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+    ) -> None:
+        """
+        Override the budgets for a provider, or for one model of a provider.
+
+        Args:
+            provider: Provider name (e.g., 'openai').
+            model: Model name. Applies to every model of the provider if omitted.
+            requests_per_minute: Request budget per minute, ``None`` for unlimited.
+            tokens_per_minute: Token budget per minute, ``None`` for unlimited.
+
+        Raises:
+            ValueError: If a budget is not positive.
+        """
+        self._limits[(provider, model)] = self._validate(
+            RateLimit(requests_per_minute, tokens_per_minute)
+        )
+
+    def limit_for(self, provider: str, model: str) -> RateLimit:
+        """Return the budgets that apply to a provider and model."""
+        limit = self._limits.get((provider, model))
+        if limit is None:
+            limit = self._limits.get((provider, None), self.default)
+        return limit
+
+    @staticmethod
+    def _bucket(provider: str, model: str, api_key: str) -> str:
+        key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        return f"{provider}:{model}:{key_hash}"
+
+    def reserve(
+        self, provider: str, model: str, api_key: str, tokens: int = 0
+    ) -> float:
+        """
+        Reserve one request and ``tokens`` tokens without waiting.
+
+        Args:
+            provider: Provider name.
+            model: Model name.
+            api_key: API key the request is sent with. Only a hash of it is
+                stored.
+            tokens: Estimated tokens the request consumes.
+
+        Returns:
+            float: Seconds the caller must wait before sending the request.
+        """
+        limit = self.limit_for(provider, model)
+        bucket = self._bucket(provider, model, api_key)
+        wait = 0.0
+        if limit.requests_per_minute is not None:
+            wait = self._buckets.reserve(bucket + ":rpm", limit.requests_per_minute, 1)
+        if limit.tokens_per_minute is not None and tokens > 0:
+            wait = max(
+                wait,
+                self._buckets.reserve(
+                    bucket + ":tpm", limit.tokens_per_minute, tokens
+                ),
+            )
+        return wait
+
+    def refund(
+        self, provider: str, model: str, api_key: str, tokens: int = 0
+    ) -> None:
+        """
+        Give back a reservation whose request was never sent.
+
+        Takes the arguments of the :meth:`reserve` call it undoes.
+        """
+        limit = self.limit_for(provider, model)
+        bucket = self._bucket(provider, model, api_key)
+        if limit.requests_per_minute is not None:
+            self._buckets.reserve(bucket + ":rpm", limit.requests_per_minute, -1)
+        if limit.tokens_per_minute is not None and tokens > 0:
+            self._buckets.reserve(bucket + ":tpm", limit.tokens_per_minute, -tokens)
+
+    def acquire(
+        self,
+        provider: str,
+        model: str,
+        api_key: str,
+        tokens: int = 0,
+        deadline: Optional[Deadline] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> float:
+        """
+        Block until the request fits the budgets.
+
+        Takes the same arguments as :meth:`reserve`, and optionally the
+        Deadline and CancelToken of the call. A wait that would outlast the
+        deadline fails at once, and cancelling the token ends the wait; either
+        way the reservation is given back.
+
+        Returns:
+            float: Seconds spent waiting.
+
+        Raises:
+            DeadlineExceededError: If the wait would end after the deadline.
+            CallCancelledError: If the token is cancelled while waiting.
+        """
+        wait = self.reserve(provider, model, api_key, tokens)
+        if wait > 0:
+            try:
+                sleep_within(wait, deadline, cancel)
+            except BaseException:
+                # The request is not sent, so its share goes to later callers
+                self.refund(provider, model, api_key, tokens)
+                raise
+        return wait
+
+    async def aacquire(
+        self,
+        provider: str,
+        model: str,
+        api_key: str,
+        tokens: int = 0,
+        deadline: Optional[Deadline] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> float:
+        """
+        Wait without blocking the event loop until the request fits the budgets.
+
+        The async counterpart of :meth:`acquire`. Cancelling the awaiting task
+        also gives the reservation back.
+        """
+        wait = self.reserve(provider, model, api_key, tokens)
+        if wait > 0:
+            try:
+                await asleep_within(wait, deadline, cancel)
+            except BaseException:
+                self.refund(provider, model, api_key, tokens)
+                raise
+        return wait
+
+    def wrap(
+        self,
+        func: Callable[[], T],
+        provider: str,
+        model: str,
+        api_key: str,
+        tokens: int = 0,
+        on_wait: Optional[Callable[[float], Any]] = None,
+        deadline: Optional[Deadline] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> Callable[[], T]:
+        """
+        Return a callable that acquires the budgets before each call of ``func``.
+
+        ``on_wait``, if given, receives the seconds waited before each call;
+        ``deadline`` and ``cancel`` bound the waits as in :meth:`acquire`.
+        """
+        def paced() -> T:
+            waited = self.acquire(provider, model, api_key, tokens, deadline, cancel)
+            if on_wait is not None:
+                on_wait(waited)
+            return func()
+        return paced
+
+    def awrap(
+        self,
+        func: Callable[[], Awaitable[T]],
+        provider: str,
+        model: str,
+        api_key: str,
+        tokens: int = 0,
+        on_wait: Optional[Callable[[float], Any]] = None,
+        deadline: Optional[Deadline] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> Callable[[], Awaitable[T]]:
+        """The async counterpart of :meth:`wrap`."""
+        async def paced() -> T:
+            waited = await self.aacquire(
+                provider, model, api_key, tokens, deadline, cancel
+            )
+            if on_wait is not None:
+                on_wait(waited)
+            return await func()
+        return paced
+
+    def clear(self) -> None:
+        """Reset every bucket to full."""
+        self._buckets.clear()
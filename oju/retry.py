@@ -0,0 +1,283 @@
+"""
+Module for retrying provider calls on transient failures.
+
+A ``RetryPolicy`` retries rate limits (429), server errors (5xx) and connection
+failures with capped exponential backoff and full jitter, honours
+``Retry-After`` hints from the provider and stops once an overall deadline
+would be exceeded. Authentication failures, bad requests and other
+non-retryable errors are raised immediately.
+
+Errors are classified by walking the exception's ``__cause__`` chain, so the
+plain ``Exception``/``ValueError`` wrappers raised by :mod:`oju.providers` are
+classified by the SDK error they were raised from.
+"""
+
+import asyncio
+import email.utils
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterator, List, Optional, TypeVar
+
+from .deadline import CallCancelledError, CancelToken, Deadline
+
+T = TypeVar("T")
+
+# HTTP statuses worth retrying besides 5xx: timeouts, conflicts and rate limits
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429})
+
+# SDK and transport exception class names that indicate a connection failure.
+# Matched by name so that classifying an error never imports a provider SDK.
+CONNECTION_ERROR_NAMES = frozenset({
+    "APIConnectionError",
+    "APITimeoutError",
+    "TransportError",
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+})
+
+
+@dataclass
+class RetryStats:
+    """
+    Per-call record of the work a RetryPolicy did.
+
+    Attributes:
+        attempts: Number of attempts made, including the first one.
+        total_delay: Seconds spent sleeping between attempts.
+        errors: Class names of the errors that triggered a retry, taken from
+            the innermost error of each chain (e.g. 'RateLimitError').
+    """
+
+    attempts: int = 0
+    total_delay: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def retries(self) -> int:
+        """Number of attempts after the first one."""
+        return max(self.attempts - 1, 0)
+
+
+def _exception_chain(error: BaseException) -> Iterator[BaseException]:
+    seen = set()
+    current: Optional[BaseException] = error
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        yield current
+        current = current.__cause__ or current.__context__
+
+
+def root_cause(error: BaseException) -> BaseException:
+    """Return the innermost error an exception was raised from."""
+    *_, root = _exception_chain(error)
+    return root
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    """
+    Return the HTTP status code behind an error, if any.
+
+    Understands OpenAI/Anthropic ``APIStatusError.status_code`` and Google
+    ``GoogleAPICallError.code``.
+    """
+    for exc in _exception_chain(error):
+        for attribute in ("status_code", "code"):
+            value = getattr(exc, attribute, None)
+            if isinstance(value, int) and 100 <= value < 600:
+                return value
+    return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Decide whether an error is transient and worth retrying.
+
+    Args:
+        error: The raised exception.
+
+    Returns:
+        bool: True for rate limits, 5xx responses and connection errors.
+    """
+    for exc in _exception_chain(error):
+        if isinstance(exc, (ConnectionError, TimeoutError)):
+            return True
+        if any(cls.__name__ in CONNECTION_ERROR_NAMES for cls in type(exc).__mro__):
+            return True
+    code = status_code(error)
+    if code is None:
+        return False
+    return code in RETRYABLE_STATUS_CODES or code >= 500
+
+
+def response_headers(error: BaseException) -> Iterator[Any]:
+    """Yield the HTTP response headers of an error and the errors it was raised from."""
+    for exc in _exception_chain(error):
+        headers = getattr(getattr(exc, "response", None), "headers", None)
+        if headers:
+            yield headers
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """
+    Return the server-requested delay in seconds, if the error carries one.
+
+    Reads ``retry-after-ms`` and ``retry-after`` (seconds or an HTTP date)
+    from the response headers of the error or any error it was raised from.
+    """
+    for headers in response_headers(error):
+        try:
+            value = headers.get("retry-after-ms")
+            if value is not None:
+                return max(float(value) / 1000.0, 0.0)
+            value = headers.get("retry-after")
+        except AttributeError:
+            continue
+        if value is None:
+            continue
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            continue
+        return max(retry_at.timestamp() - time.time(), 0.0)
+    return None
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter, Retry-After support and a deadline.
+
+    Attributes:
+        max_attempts: Maximum number of attempts, including the first one.
+        initial_delay: Backoff ceiling in seconds before the first retry.
+        max_delay: Upper bound for any single backoff.
+        multiplier: Growth factor of the backoff ceiling per retry.
+        jitter: Whether to draw each delay uniformly from ``[0, ceiling]``.
+        deadline: Seconds after the first attempt beyond which no retry is
+            started. ``None`` disables the deadline.
+        max_retry_after: Cap applied to server-provided Retry-After delays.
+    """
+
+    max_attempts: int = 4
+    initial_delay: float = 0.5
+    max_delay: float = 20.0
+    multiplier: float = 2.0
+    jitter: bool = True
+    deadline: Optional[float] = 60.0
+    max_retry_after: float = 60.0
+
+    def __post_init__(self) -> None:
+        if self.max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        if self.initial_delay < 0 or self.max_delay < 0:
+            raise ValueError("delays cannot be negative")
+
+    def delay(self, retry: int, error: Optional[BaseException] = None) -> float:
+        """
+        Return the delay before the given retry.
+
+        Args:
+            retry: 1 for the first retry, 2 for the second and so on.
+            error: The error being retried; its Retry-After hint, if any,
+                takes precedence over the computed backoff.
+
+        Returns:
+            float: Seconds to wait.
+        """
+        if error is not None:
+            hint = retry_after(error)
+            if hint is not None:
+                return min(hint, self.max_retry_after)
+        ceiling = min(
+            self.max_delay, self.initial_delay * self.multiplier ** (retry - 1)
+        )
+        return random.uniform(0, ceiling) if self.jitter else ceiling
+
+    def _next_delay(
+        self,
+        error: Exception,
+        stats: RetryStats,
+        started: float,
+        call_deadline: Optional[Deadline] = None,
+    ) -> Optional[float]:
+        """Return the delay before the next attempt, or None to give up."""
+        if stats.attempts >= self.max_attempts or not is_retryable(error):
+            return None
+        delay = self.delay(stats.attempts, error)
+        if self.deadline is not None:
+            if time.monotonic() - started + delay > self.deadline:
+                return None
+        if call_deadline is not None and delay >= call_deadline.remaining():
+            return None
+        stats.errors.append(type(root_cause(error)).__name__)
+        stats.total_delay += delay
+        return delay
+
+    def call(
+        self,
+        func: Callable[[], T],
+        stats: Optional[RetryStats] = None,
+        call_deadline: Optional[Deadline] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> T:
+        """
+        Call ``func`` until it succeeds or the policy gives up.
+
+        Args:
+            func: Zero-argument callable performing one attempt.
+            stats: Optional RetryStats updated with this call's attempts.
+            call_deadline: Optional Deadline of the whole call; no retry is
+                started whose backoff would run past it.
+            cancel: Optional CancelToken that interrupts the backoff sleep.
+
+        Returns:
+            The result of the first successful attempt.
+
+        Raises:
+            CallCancelledError: If the token is cancelled during a backoff.
+            Exception: The last error once retries are exhausted, or the first
+                non-retryable error.
+        """
+        stats = stats if stats is not None else RetryStats()
+        started = time.monotonic()
+        while True:
+            stats.attempts += 1
+            try:
+                return func()
+            except Exception as e:
+                delay = self._next_delay(e, stats, started, call_deadline)
+                if delay is None:
+                    raise
+            if cancel is None:
+                time.sleep(delay)
+            elif cancel.wait(delay):
+                raise CallCancelledError(cancel.reason)
+
+    async def acall(
+        self,
+        func: Callable[[], Awaitable[T]],
+        stats: Optional[RetryStats] = None,
+        call_deadline: Optional[Deadline] = None,
+    ) -> T:
+        """
+        Await ``func()`` until it succeeds or the policy gives up.
+
+        The async counterpart of :meth:`call`; backoff sleeps do not block the
+        event loop and cancelling the task stops the retries.
+        """
+        stats = stats if stats is not None else RetryStats()
+        started = time.monotonic()
+        while True:
+            stats.attempts += 1
+            try:
+                return await func()
+            except Exception as e:
+                delay = self._next_delay(e, stats, started, call_deadline)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
@@ -0,0 +1,412 @@
+"""
+Module for hedged and fallback requests across providers and models.
+
+A ``Router`` runs an agent against an ordered list of ``Target`` entries,
+each a provider and model with its own API key. The first target is tried
+first. If it has not answered within ``hedge_after`` seconds, a hedge request
+goes to the next target while the first keeps running, and so on down the
+list. The first successful answer wins and the other requests are cancelled.
+A target that fails hands over to the next one straight away, so an outage of
+one provider only costs the time it takes to fail.
+
+Every target keeps win, failure and latency statistics, available from
+:meth:`Router.stats`. With a :class:`oju.circuit.CircuitBreaker`, targets
+whose circuit is open are moved to the back of the list, so requests go to
+healthy targets first. Each request is an ordinary agent call, so caching,
+retries, rate limiting and the instrumentation hooks apply per target. The
+router keeps one :class:`oju.agent.AgentSession` per target and agent, so an
+agent's setup is resolved on its first request rather than on every one.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from . import agent, metrics
+from .circuit import CircuitBreaker
+from .deadline import CancelToken
+from .keypool import KeyPool
+
+# Successful latencies kept per target for the percentiles
+LATENCY_WINDOW = 1000
+
+
+@dataclass(frozen=True)
+class Target:
+    """
+    One provider and model a Router can send requests to.
+
+    Attributes:
+        provider: One of 'openai', 'claude', or 'gemini'.
+        model: Name of the model to use.
+        api_key: API key for the provider, or a KeyPool of several keys.
+        base_url: Optional override for the provider's API endpoint.
+    """
+
+    provider: str
+    model: str
+    api_key: Union[str, KeyPool] = field(repr=False)
+    base_url: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        """The ``provider:model`` label used in statistics."""
+        return f"{self.provider}:{self.model}"
+
+
+@dataclass
+class TargetStats:
+    """
+    Routing statistics of one target.
+
+    Attributes:
+        requests: Requests sent to the target, hedges included.
+        hedges: Requests sent because an earlier target was slow.
+        wins: Requests whose answer was used.
+        failures: Requests that raised.
+        cancelled: Requests abandoned because another target won first.
+        latencies: Seconds taken by the most recent successful requests.
+    """
+
+    requests: int = 0
+    hedges: int = 0
+    wins: int = 0
+    failures: int = 0
+    cancelled: int = 0
+    latencies: Deque[float] = field(
+        default_factory=lambda: deque(maxlen=LATENCY_WINDOW)
+    )
+
+    @property
+    def win_rate(self) -> float:
+        """Fraction of requests to this target whose answer was used."""
+        return self.wins / self.requests if self.requests else 0.0
+
+    @property
+    def p50(self) -> Optional[float]:
+        """Median latency of recent successful requests."""
+        return metrics.percentile(self.latencies, 50)
+
+    @property
+    def p99(self) -> Optional[float]:
+        """99th percentile latency of recent successful requests."""
+        return metrics.percentile(self.latencies, 99)
+
+
+class Router:
+    """
+    Hedged and fallback routing of agent calls over an ordered list of targets.
+
+    Safe to share between threads and event loops. Synchronous calls run their
+    requests on the router's thread pool, each with its own
+    :class:`oju.deadline.CancelToken`. Cancelling a loser's token frees its
+    pool thread at once; the request it already sent cannot be interrupted, so
+    it finishes in the background and its answer is discarded. Losing async
+    requests are cancelled outright.
+    """
+
+    def __init__(
+        self,
+        targets: Sequence[Target],
+        hedge_after: Optional[float] = None,
+        max_workers: int = 32,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        """
+        Initialize the router.
+
+        Args:
+            targets: Targets in order of preference.
+            hedge_after: Seconds to wait for a target before also sending the
+                request to the next one. ``None`` disables hedging, so targets
+                are only tried one after another as they fail.
+            max_workers: Threads available to synchronous calls.
+            circuit_breaker: Optional CircuitBreaker passed to every call.
+                Targets it would reject are tried only after the healthy ones.
+
+        Raises:
+            ValueError: If there are no targets or hedge_after is negative.
+        """
+        if not targets:
+            raise ValueError("A Router needs at least one target")
+        if hedge_after is not None and hedge_after < 0:
+            raise ValueError("hedge_after must not be negative")
+        self.targets: Tuple[Target, ...] = tuple(targets)
+        self.hedge_after = hedge_after
+        self.circuit_breaker = circuit_breaker
+        self._max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats: Dict[Target, TargetStats] = {
+            t: TargetStats() for t in self.targets
+        }
+        self._lock = threading.Lock()
+        # One session per target and agent setup, reused by later calls
+        self._sessions = agent.SessionCache()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_workers, thread_name_prefix="oju-router"
+                )
+            return self._executor
+
+    def _record(self, target: Target, **changes: Any) -> None:
+        with self._lock:
+            stats = self._stats[target]
+            latency = changes.pop("latency", None)
+            if latency is not None:
+                stats.latencies.append(latency)
+            for name, amount in changes.items():
+                setattr(stats, name, getattr(stats, name) + amount)
+
+    def _split_kwargs(
+        self, agent_kwargs: Dict[str, Any]
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        if agent_kwargs.get("stream"):
+            raise ValueError("Routed calls do not support stream=True")
+        return agent.split_agent_kwargs(agent_kwargs)
+
+    def _session(
+        self,
+        target: Target,
+        agent_name: str,
+        custom_system_prompt: Optional[str],
+        session_kwargs: Dict[str, Any],
+    ) -> agent.AgentSession:
+        """Return the target's session for this agent, created on first use."""
+        kwargs = dict(
+            agent_name=agent_name,
+            model=target.model,
+            provider=target.provider,
+            api_key=target.api_key,
+            custom_system_prompt=custom_system_prompt,
+            **session_kwargs,
+        )
+        if target.base_url is not None:
+            kwargs["base_url"] = target.base_url
+        if self.circuit_breaker is not None:
+            kwargs.setdefault("circuit_breaker", self.circuit_breaker)
+        return self._sessions.get(**kwargs)
+
+    def _ordered_targets(self) -> List[Target]:
+        """Targets in order of preference, those with an open circuit last."""
+        if self.circuit_breaker is None:
+            return list(self.targets)
+        healthy, unhealthy = [], []
+        for target in self.targets:
+            if isinstance(target.api_key, KeyPool):
+                keys = target.api_key.keys
+            else:
+                keys = (target.api_key,)
+            breaker = self.circuit_breaker
+            if any(breaker.allows(target.provider, target.model, key) for key in keys):
+                healthy.append(target)
+            else:
+                unhealthy.append(target)
+        return healthy + unhealthy
+
+    def _hedge_timeout(self, launched: int) -> Optional[float]:
+        """Seconds to wait before hedging, or ``None`` to wait for a result."""
+        return self.hedge_after if launched < len(self.targets) else None
+
+    @staticmethod
+    def _all_failed(errors: List[Tuple[Target, BaseException]]) -> Exception:
+        summary = "; ".join(f"{t.name}: {e}" for t, e in errors)
+        return Exception(f"All routing targets failed: {summary}")
+
+    def run(
+        self,
+        agent_name: str,
+        prompt_input: str,
+        custom_system_prompt: Optional[str] = None,
+        **agent_kwargs: Any,
+    ) -> Any:
+        """
+        Run an agent through the targets and return the first successful answer.
+
+        Args:
+            agent_name: Name of the agent (used to locate prompt file).
+            prompt_input: User input to be processed by the agent.
+            custom_system_prompt: Optional custom system prompt that overrides
+                the file-based one.
+            **agent_kwargs: Further :func:`oju.agent.Agent` arguments such as
+                ``cache``, ``retry`` or ``return_result``, used for every target.
+                A ``cancel`` token cancels every request of the call.
+
+        Returns:
+            The winning target's response, as :func:`oju.agent.Agent` returns it.
+
+        Raises:
+            ValueError: If ``stream=True`` is requested.
+            CallCancelledError: If the caller's ``cancel`` token was cancelled.
+            Exception: If every target failed; chained to the last error.
+        """
+        session_kwargs, call_kwargs = self._split_kwargs(agent_kwargs)
+        caller_cancel: Optional[CancelToken] = call_kwargs.pop("cancel", None)
+        pending: Dict["Future[Any]", Tuple[Target, float, CancelToken]] = {}
+        errors: List[Tuple[Target, BaseException]] = []
+        unlink: List[Callable[[], None]] = []
+        targets = self._ordered_targets()
+        launched = 0
+
+        def call(target: Target, cancel: CancelToken) -> Any:
+            session = self._session(
+                target, agent_name, custom_system_prompt, session_kwargs
+            )
+            return session(prompt_input, cancel=cancel, **call_kwargs)
+
+        def launch() -> None:
+            nonlocal launched
+            target = targets[launched]
+            self._record(target, requests=1, hedges=int(bool(pending)))
+            cancel = CancelToken()
+            if caller_cancel is not None:
+                unlink.append(caller_cancel.add_callback(
+                    lambda: cancel.cancel(caller_cancel.reason)
+                ))
+            future = self._pool().submit(call, target, cancel)
+            pending[future] = (target, time.perf_counter(), cancel)
+            launched += 1
+
+        launch()
+        try:
+            while pending:
+                timeout = self._hedge_timeout(launched)
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    launch()
+                    continue
+                for future in done:
+                    target, started, _ = pending.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        self._record(
+                            target, wins=1, latency=time.perf_counter() - started
+                        )
+                        return future.result()
+                    self._record(target, failures=1)
+                    errors.append((target, error))
+                if caller_cancel is not None:
+                    caller_cancel.raise_if_cancelled()
+                # Fall through to the next target as soon as one fails
+                if launched < len(self.targets):
+                    launch()
+        finally:
+            # Winner found, every target failed, or the caller gave up
+            for future, (target, _, cancel) in pending.items():
+                future.cancel()
+                cancel.cancel("No longer needed by the router")
+                self._record(target, cancelled=1)
+            for remove in unlink:
+                remove()
+        raise self._all_failed(errors) from errors[-1][1]
+
+    async def arun(
+        self,
+        agent_name: str,
+        prompt_input: str,
+        custom_system_prompt: Optional[str] = None,
+        **agent_kwargs: Any,
+    ) -> Any:
+        """
+        Asynchronously run an agent through the targets.
+
+        The async counterpart of :meth:`run`, awaiting
+        :meth:`oju.agent.AgentSession.acall`. Losing requests are cancelled.
+        """
+        session_kwargs, call_kwargs = self._split_kwargs(agent_kwargs)
+        pending: Dict["asyncio.Task[Any]", Tuple[Target, float]] = {}
+        errors: List[Tuple[Target, BaseException]] = []
+        targets = self._ordered_targets()
+        launched = 0
+
+        async def call(target: Target) -> Any:
+            session = self._session(
+                target, agent_name, custom_system_prompt, session_kwargs
+            )
+            return await session.acall(prompt_input, **call_kwargs)
+
+        def launch() -> None:
+            nonlocal launched
+            target = targets[launched]
+            self._record(target, requests=1, hedges=int(bool(pending)))
+            task = asyncio.ensure_future(call(target))
+            pending[task] = (target, time.perf_counter())
+            launched += 1
+
+        launch()
+        try:
+            while pending:
+                timeout = self._hedge_timeout(launched)
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    launch()
+                    continue
+                for task in done:
+                    target, started = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        self._record(
+                            target, wins=1, latency=time.perf_counter() - started
+                        )
+                        return task.result()
+                    self._record(target, failures=1)
+                    errors.append((target, error))
+                if launched < len(self.targets):
+                    launch()
+        finally:
+            # Winner found, every target failed, or the caller was cancelled
+            for task, (target, _) in pending.items():
+                task.cancel()
+                self._record(target, cancelled=1)
+        raise self._all_failed(errors) from errors[-1][1]
+
+    def stats(self) -> Dict[Target, TargetStats]:
+        """Return a copy of the statistics of every target, in target order."""
+        with self._lock:
+            return {
+                target: TargetStats(
+                    requests=s.requests,
+                    hedges=s.hedges,
+                    wins=s.wins,
+                    failures=s.failures,
+                    cancelled=s.cancelled,
+                    latencies=deque(s.latencies, maxlen=LATENCY_WINDOW),
+                )
+                for target, s in self._stats.items()
+            }
+
+    def reset_stats(self) -> None:
+        """Zero the statistics of every target."""
+        with self._lock:
+            self._stats = {t: TargetStats() for t in self.targets}
+
+    def close(self) -> None:
+        """Shut down the thread pool; running requests finish in the background."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def __enter__(self) -> "Router":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
@@ -0,0 +1,497 @@
+"""
+Module for caching responses of near-duplicate prompts.
+
+A ``SemanticCache`` sits in front of the provider dispatch in
+:func:`oju.agent.Agent`, after the exact-match :class:`oju.cache.ResponseCache`.
+Prompts are embedded into unit vectors and kept in one NumPy matrix, so a
+lookup is a single matrix-vector product: the stored prompt with the highest
+cosine similarity answers the request if the similarity reaches the agent's
+threshold. Only entries of the same scope, that is the same provider, model,
+system prompt and generation parameters, can match.
+
+The default ``HashingEmbedder`` needs no model download or network access. It
+hashes word n-grams into a fixed number of dimensions and weights them by
+sublinear term frequency and, once fitted on a corpus, inverse document
+frequency. Any callable turning a list of texts into a 2-D array of vectors,
+such as a sentence-transformers model's ``encode``, can be used instead.
+
+With a ``path``, the cache is saved to a directory holding the vectors as a
+``.npy`` file and the entries as JSON. On startup the vectors are
+memory-mapped rather than read, so a large cache is available at once and
+pages are loaded as lookups touch them.
+
+NumPy is an optional dependency: ``pip install oju[semantic]``.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .cache import ResponseCache
+
+# Bumped when the layout of the saved index changes
+INDEX_VERSION = 1
+
+_WORD = re.compile(r"\w+")
+
+
+def _numpy() -> Any:
+    """Import NumPy, explaining how to install it if it is missing."""
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError(
+            "The semantic cache requires the 'numpy' package. "
+            "Install it with: pip install oju[semantic]"
+        ) from e
+    return numpy
+
+
+class HashingEmbedder:
+    """
+    An offline TF-IDF vectorizer using the hashing trick.
+
+    Word n-grams are hashed into ``dimensions`` buckets with a stable hash and
+    a random sign, so no vocabulary is stored and vectors are the same in every
+    process. Without :meth:`fit` every n-gram has the same weight.
+    """
+
+    def __init__(self, dimensions: int = 1024, ngrams: int = 2) -> None:
+        """
+        Initialize the embedder.
+
+        Args:
+            dimensions: Length of the vectors.
+            ngrams: Longest word n-gram used as a feature; 1 uses single
+                words only.
+
+        Raises:
+            ValueError: If dimensions or ngrams is less than 1.
+        """
+        if dimensions < 1 or ngrams < 1:
+            raise ValueError("dimensions and ngrams must be at least 1")
+        self.dimensions = dimensions
+        self.ngrams = ngrams
+        self.idf: Optional[Any] = None
+
+    def _features(self, text: str) -> Counter:
+        words = _WORD.findall(text.lower())
+        features: Counter = Counter()
+        for n in range(1, self.ngrams + 1):
+            for i in range(len(words) - n + 1):
+                features[" ".join(words[i:i + n])] += 1
+        return features
+
+    def _bucket(self, feature: str) -> Tuple[int, float]:
+        digest = zlib.crc32(feature.encode("utf-8"))
+        return digest % self.dimensions, 1.0 if digest & 0x80000000 else -1.0
+
+    def fit(self, texts: Iterable[str]) -> "HashingEmbedder":
+        """
+        Learn inverse document frequencies from a corpus of typical prompts.
+
+        Words common to most prompts then count for less than distinctive
+        ones. Refitting changes the vectors, so fit before filling a cache.
+
+        Returns:
+            HashingEmbedder: The embedder itself.
+        """
+        np = _numpy()
+        documents = np.zeros(self.dimensions, dtype=np.float64)
+        count = 0
+        for text in texts:
+            buckets = {self._bucket(f)[0] for f in self._features(text)}
+            documents[list(buckets)] += 1
+            count += 1
+        self.idf = (np.log((1 + count) / (1 + documents)) + 1).astype(np.float32)
+        return self
+
+    def __call__(self, texts: Sequence[str]) -> Any:
+        """
+        Embed texts into L2-normalized vectors.
+
+        Returns:
+            numpy.ndarray: A float32 array of shape ``(len(texts), dimensions)``.
+        """
+        np = _numpy()
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, frequency in self._features(text).items():
+                bucket, sign = self._bucket(feature)
+                vectors[row, bucket] += sign * (1 + math.log(frequency))
+        if self.idf is not None:
+            vectors *= self.idf
+        return _normalize(np, vectors)
+
+
+def _normalize(np: Any, vectors: Any) -> Any:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+@dataclass
+class SemanticMatch:
+    """
+    A cached response found for a similar prompt.
+
+    Attributes:
+        response: The cached response.
+        prompt: The stored prompt the response was generated for.
+        similarity: Cosine similarity of the stored and the looked up prompt.
+    """
+
+    response: str
+    prompt: str
+    similarity: float
+
+
+@dataclass
+class SemanticCacheStats:
+    """
+    Counters of a SemanticCache.
+
+    Attributes:
+        hits: Lookups answered by a similar prompt.
+        misses: Lookups with no prompt similar enough.
+        writes: Responses stored.
+        evictions: Entries dropped to make room for new ones.
+    """
+
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups that were hits."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class SemanticCache:
+    """
+    A response cache matching prompts by embedding similarity.
+
+    Safe to share between threads. When full, the least recently used entry
+    is replaced. Unlike :class:`oju.cache.ResponseCache`, one instance is not
+    shared between processes; each loads the saved index and :meth:`save`
+    replaces it.
+    """
+
+    def __init__(
+        self,
+        embedder: Optional[Callable[[Sequence[str]], Any]] = None,
+        threshold: float = 0.85,
+        thresholds: Optional[Dict[str, float]] = None,
+        max_entries: int = 10_000,
+        path: Optional[str] = None,
+    ) -> None:
+        """
+        Initialize the cache, memory-mapping a saved index if there is one.
+
+        Args:
+            embedder: Callable embedding a list of texts into a 2-D array;
+                defaults to a :class:`HashingEmbedder`. Vectors are normalized
+                by the cache.
+            threshold: Least cosine similarity, between -1 and 1, for a stored
+                prompt to answer a lookup.
+            thresholds: Thresholds of particular agents by agent name,
+                overriding ``threshold``.
+            max_entries: Maximum number of entries kept.
+            path: Optional directory the index is saved to and loaded from.
+
+        Raises:
+            ImportError: If NumPy is not installed.
+            ValueError: If max_entries is less than 1, a threshold is out of
+                range, or the saved index cannot be read.
+        """
+        self._np = _numpy()
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        for value in [threshold, *(thresholds or {}).values()]:
+            if not -1.0 <= value <= 1.0:
+                raise ValueError("Similarity thresholds must be between -1 and 1")
+        self.embedder = embedder or HashingEmbedder()
+        self.threshold = threshold
+        self.thresholds: Dict[str, float] = dict(thresholds or {})
+        self.max_entries = max_entries
+        self.path = path
+        self._lock = threading.Lock()
+        self._stats = SemanticCacheStats()
+        self._clear()
+        if path is not None:
+            self._load(path)
+
+    def _clear(self) -> None:
+        np = self._np
+        # Rows [0, _size) of these arrays and lists describe the entries
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._scope_ids = np.zeros(0, dtype=np.int32)
+        self._last_used = np.zeros(0, dtype=np.float64)
+        self._prompts: List[str] = []
+        self._responses: List[str] = []
+        self._scopes: Dict[str, int] = {}
+        self._size = 0
+
+    @staticmethod
+    def make_scope(
+        provider: str,
+        model: str,
+        system_prompt: str,
+        params: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        Build the scope of a request; only entries of the same scope can match.
+
+        Args:
+            provider: Provider name (e.g., 'openai').
+            model: Model name.
+            system_prompt: The system prompt; only its hash is part of the scope.
+            params: Generation parameters such as temperature and max_tokens.
+
+        Returns:
+            str: A hex digest identifying the scope.
+        """
+        return ResponseCache.make_key(provider, model, system_prompt, "", params)
+
+    def threshold_for(self, agent_name: Optional[str]) -> float:
+        """The similarity threshold applying to an agent."""
+        if agent_name is None:
+            return self.threshold
+        return self.thresholds.get(agent_name, self.threshold)
+
+    def embed(self, texts: Sequence[str]) -> Any:
+        """Embed texts into a float32 array of unit vectors, one row per text."""
+        np = self._np
+        vectors = np.asarray(self.embedder(list(texts)), dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(texts):
+            raise ValueError("The embedder must return one vector per text")
+        return _normalize(np, vectors)
+
+    def get_many(
+        self,
+        scope: str,
+        prompts: Sequence[str],
+        agent_name: Optional[str] = None,
+        vectors: Optional[Any] = None,
+    ) -> List[Optional[SemanticMatch]]:
+        """
+        Look up several prompts with one matrix product.
+
+        Args:
+            scope: The scope from :meth:`make_scope`.
+            prompts: The prompts to look up.
+            agent_name: Agent whose threshold applies.
+            vectors: Embeddings of the prompts, if already computed.
+
+        Returns:
+            A match or ``None`` for every prompt, in order.
+        """
+        np = self._np
+        if vectors is None:
+            vectors = self.embed(prompts)
+        threshold = self.threshold_for(agent_name)
+        matches: List[Optional[SemanticMatch]] = [None] * len(prompts)
+        with self._lock:
+            scope_id = self._scopes.get(scope)
+            if scope_id is not None and self._size:
+                # Score every entry at once and rule out other scopes afterwards;
+                # cheaper than gathering the rows of one scope first
+                similarities = self._vectors[:self._size] @ vectors.T
+                similarities[self._scope_ids[:self._size] != scope_id] = -np.inf
+                now = time.time()
+                for column, index in enumerate(similarities.argmax(axis=0)):
+                    similarity = float(similarities[index, column])
+                    if similarity < threshold:
+                        continue
+                    self._last_used[index] = now
+                    matches[column] = SemanticMatch(
+                        response=self._responses[index],
+                        prompt=self._prompts[index],
+                        similarity=similarity,
+                    )
+            hits = sum(match is not None for match in matches)
+            self._stats.hits += hits
+            self._stats.misses += len(prompts) - hits
+        return matches
+
+    def get(
+        self,
+        scope: str,
+        prompt: str,
+        agent_name: Optional[str] = None,
+        vector: Optional[Any] = None,
+    ) -> Optional[SemanticMatch]:
+        """
+        Look up the stored prompt most similar to ``prompt``.
+
+        Args:
+            scope: The scope from :meth:`make_scope`.
+            prompt: The prompt to look up.
+            agent_name: Agent whose threshold applies.
+            vector: Embedding of the prompt, if already computed.
+
+        Returns:
+            The best match if it reaches the threshold, else ``None``.
+        """
+        vectors = None if vector is None else vector.reshape(1, -1)
+        return self.get_many(scope, [prompt], agent_name, vectors)[0]
+
+    def set(
+        self, scope: str, prompt: str, response: str, vector: Optional[Any] = None
+    ) -> None:
+        """
+        Store a response, replacing the least recently used entry if full.
+
+        Args:
+            scope: The scope from :meth:`make_scope`.
+            prompt: The prompt the response was generated for.
+            response: The response to store.
+            vector: Embedding of the prompt, if already computed.
+        """
+        if vector is None:
+            vector = self.embed([prompt])[0]
+        with self._lock:
+            if self._size and len(vector) != self._vectors.shape[1]:
+                raise ValueError("The embedder's vector length changed")
+            self._reserve(min(self._size + 1, self.max_entries), len(vector))
+            if self._size < self.max_entries:
+                index = self._size
+                self._size += 1
+                self._prompts.append(prompt)
+                self._responses.append(response)
+            else:
+                index = int(self._last_used[:self._size].argmin())
+                self._prompts[index] = prompt
+                self._responses[index] = response
+                self._stats.evictions += 1
+            self._vectors[index] = vector
+            self._scope_ids[index] = self._scopes.setdefault(scope, len(self._scopes))
+            self._last_used[index] = time.time()
+            self._stats.writes += 1
+
+    def _reserve(self, rows: int, dimensions: int) -> None:
+        """Grow the arrays geometrically to hold at least ``rows`` entries."""
+        np = self._np
+        if self._size == 0 and self._vectors.shape[1] != dimensions:
+            self._vectors = np.zeros((0, dimensions), dtype=np.float32)
+        capacity = len(self._vectors)
+        if rows <= capacity and self._vectors.flags.writeable:
+            return
+        # Also reached on the first write after loading a read-only mapping
+        capacity = min(max(rows, 2 * capacity, 64), self.max_entries)
+        vectors = np.zeros((capacity, dimensions), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        self._vectors = vectors
+        scope_ids = np.zeros(capacity, dtype=np.int32)
+        scope_ids[:self._size] = self._scope_ids[:self._size]
+        self._scope_ids = scope_ids
+        last_used = np.zeros(capacity, dtype=np.float64)
+        last_used[:self._size] = self._last_used[:self._size]
+        self._last_used = last_used
+
+    def save(self, path: Optional[str] = None) -> None:
+        """
+        Write the index to a directory, replacing an earlier save.
+
+        A new vectors file is written first and the entries file naming it
+        is then replaced atomically, so a crash leaves the previous save
+        intact.
+
+        Args:
+            path: Directory to save to; defaults to the cache's ``path``.
+
+        Raises:
+            ValueError: If no path is given or configured.
+        """
+        np = self._np
+        path = path or self.path
+        if path is None:
+            raise ValueError("No path to save the semantic cache to")
+        os.makedirs(path, exist_ok=True)
+        entries_path = os.path.join(path, "entries.json")
+        previous = _read_entries(entries_path)
+        vectors_file = f"vectors-{uuid.uuid4().hex}.npy"
+        with self._lock:
+            with open(os.path.join(path, vectors_file), "wb") as f:
+                np.save(f, np.ascontiguousarray(self._vectors[:self._size]))
+                f.flush()
+                os.fsync(f.fileno())
+            scopes = sorted(self._scopes, key=self._scopes.__getitem__)
+            state = {
+                "version": INDEX_VERSION,
+                "vectors": vectors_file,
+                "scopes": scopes,
+                "entries": [
+                    [int(scope_id), prompt, response, float(last_used)]
+                    for scope_id, prompt, response, last_used in zip(
+                        self._scope_ids[:self._size], self._prompts,
+                        self._responses, self._last_used[:self._size],
+                    )
+                ],
+            }
+        temporary = f"{entries_path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, entries_path)
+        if previous is not None and previous["vectors"] != vectors_file:
+            try:
+                os.remove(os.path.join(path, previous["vectors"]))
+            except OSError:
+                # Still mapped on platforms that forbid removing open files
+                pass
+
+    def _load(self, path: str) -> None:
+        np = self._np
+        state = _read_entries(os.path.join(path, "entries.json"))
+        if state is None:
+            return
+        vectors = np.load(os.path.join(path, state["vectors"]), mmap_mode="r")
+        entries = state["entries"][-self.max_entries:]
+        first = len(state["entries"]) - len(entries)
+        self._vectors = vectors[first:]
+        self._scopes = {scope: i for i, scope in enumerate(state["scopes"])}
+        self._scope_ids = np.array([e[0] for e in entries], dtype=np.int32)
+        self._prompts = [e[1] for e in entries]
+        self._responses = [e[2] for e in entries]
+        self._last_used = np.array([e[3] for e in entries], dtype=np.float64)
+        self._size = len(entries)
+
+    def clear(self) -> None:
+        """Remove every entry from memory; a saved index is kept until :meth:`save`."""
+        with self._lock:
+            self._clear()
+
+    @property
+    def stats(self) -> SemanticCacheStats:
+        """A snapshot of the counters."""
+        with self._lock:
+            return SemanticCacheStats(**vars(self._stats))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._size
+
+
+def _read_entries(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        raise ValueError(f"Corrupt semantic cache index {path}: {str(e)}") from e
+    if state.get("version") != INDEX_VERSION:
+        raise ValueError(f"Unsupported semantic cache index version in {path}")
+    return state
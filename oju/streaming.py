@@ -0,0 +1,250 @@
+"""
+Module for streaming text deltas from provider responses.
+
+A stream yields text fragments as soon as the provider sends them, so callers
+can render the first token without waiting for the full completion and never
+have to hold the whole output in memory. Once the stream is exhausted its
+``summary`` carries the finish reason and token usage reported by the provider.
+Closing a stream early closes the underlying HTTP (or gRPC) stream.
+"""
+
+from dataclasses import dataclass
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    Tuple,
+    Type,
+)
+
+ErrorTypes = Tuple[Type[BaseException], ...]
+
+
+@dataclass
+class StreamSummary:
+    """
+    Final metadata of a streamed completion.
+
+    Attributes:
+        finish_reason: Why the model stopped (e.g. 'stop', 'end_turn', 'length').
+        input_tokens: Prompt tokens reported by the provider, if any.
+        output_tokens: Completion tokens reported by the provider, if any.
+        cached_tokens: Prompt tokens read from the provider's prompt cache,
+            if reported.
+        cache_write_tokens: Prompt tokens written to the provider's prompt
+            cache, if reported.
+    """
+
+    finish_reason: Optional[str] = None
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    cache_write_tokens: Optional[int] = None
+
+
+class TextStream:
+    """
+    An iterator of text deltas from a streaming completion.
+
+    Use it as a context manager or call ``close()`` to stop early; the
+    underlying connection is released either way.
+    """
+
+    def __init__(
+        self,
+        deltas: Iterator[str],
+        summary: StreamSummary,
+        on_close: Optional[Callable[[], Any]] = None,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> None:
+        """
+        Initialize the stream.
+
+        Args:
+            deltas: Iterator of text deltas, usually from :func:`iter_deltas`.
+            summary: Summary filled in while the deltas are consumed.
+            on_close: Closes the SDK stream. Needed because closing a
+                generator that never started does not run its cleanup.
+            headers: HTTP headers of the response, if the SDK exposes them.
+        """
+        self._deltas = deltas
+        self._summary = summary
+        self._on_close = on_close
+        self.headers = headers
+        self.done = False
+
+    def __iter__(self) -> "TextStream":
+        return self
+
+    def __next__(self) -> str:
+        try:
+            return next(self._deltas)
+        except StopIteration:
+            self.done = True
+            raise
+
+    def __enter__(self) -> "TextStream":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    @property
+    def summary(self) -> StreamSummary:
+        """Finish reason and usage; complete only once ``done`` is True."""
+        return self._summary
+
+    def read(self) -> str:
+        """Consume the rest of the stream and return it as one string."""
+        return "".join(self)
+
+    def close(self) -> None:
+        """Stop the stream and close the underlying connection."""
+        close = getattr(self._deltas, "close", None)
+        if close is not None:
+            close()
+        if self._on_close is not None:
+            self._on_close()
+
+    def abort(self) -> None:
+        """
+        Close the underlying connection without touching the iterator.
+
+        Unlike ``close()``, this is safe to call from another thread while the
+        stream is being read; the pending read fails instead.
+        """
+        if self._on_close is not None:
+            self._on_close()
+
+
+class AsyncTextStream:
+    """
+    An async iterator of text deltas from a streaming completion.
+
+    Use it as an async context manager or await ``aclose()`` to stop early; the
+    underlying connection is released either way.
+    """
+
+    def __init__(
+        self,
+        deltas: AsyncIterator[str],
+        summary: StreamSummary,
+        on_close: Optional[Callable[[], Awaitable[Any]]] = None,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> None:
+        """
+        Initialize the stream.
+
+        Args:
+            deltas: Async iterator of text deltas, usually from :func:`aiter_deltas`.
+            summary: Summary filled in while the deltas are consumed.
+            on_close: Closes the SDK stream. Needed because closing an async
+                generator that never started does not run its cleanup.
+            headers: HTTP headers of the response, if the SDK exposes them.
+        """
+        self._deltas = deltas
+        self._summary = summary
+        self._on_close = on_close
+        self.headers = headers
+        self.done = False
+
+    def __aiter__(self) -> "AsyncTextStream":
+        return self
+
+    async def __anext__(self) -> str:
+        try:
+            return await self._deltas.__anext__()
+        except StopAsyncIteration:
+            self.done = True
+            raise
+
+    async def __aenter__(self) -> "AsyncTextStream":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    @property
+    def summary(self) -> StreamSummary:
+        """Finish reason and usage; complete only once ``done`` is True."""
+        return self._summary
+
+    async def read(self) -> str:
+        """Consume the rest of the stream and return it as one string."""
+        return "".join([delta async for delta in self])
+
+    async def aclose(self) -> None:
+        """Stop the stream and close the underlying connection."""
+        aclose = getattr(self._deltas, "aclose", None)
+        if aclose is not None:
+            await aclose()
+        if self._on_close is not None:
+            await self._on_close()
+
+
+def iter_deltas(
+    chunks: Iterable[Any],
+    parse: Callable[[Any, StreamSummary], Optional[str]],
+    summary: StreamSummary,
+    close: Callable[[], Any],
+    errors: ErrorTypes = (),
+    translate_error: Optional[Callable[[Exception], Exception]] = None,
+) -> Iterator[str]:
+    """
+    Turn a provider's chunk stream into text deltas.
+
+    Args:
+        chunks: The SDK's stream of chunks or events.
+        parse: Extracts the text delta from one chunk and records any finish
+            reason or usage it carries on the summary.
+        summary: The summary to fill in.
+        close: Closes the SDK stream; always called when iteration ends.
+        errors: SDK exception types to translate.
+        translate_error: Maps an SDK exception to the one raised to callers.
+
+    Yields:
+        str: Non-empty text deltas.
+    """
+    try:
+        for chunk in chunks:
+            delta = parse(chunk, summary)
+            if delta:
+                yield delta
+    except errors as e:
+        if translate_error is None:
+            raise
+        raise translate_error(e) from e
+    finally:
+        close()
+
+
+async def aiter_deltas(
+    chunks: AsyncIterable[Any],
+    parse: Callable[[Any, StreamSummary], Optional[str]],
+    summary: StreamSummary,
+    close: Callable[[], Awaitable[Any]],
+    errors: ErrorTypes = (),
+    translate_error: Optional[Callable[[Exception], Exception]] = None,
+) -> AsyncIterator[str]:
+    """
+    Turn a provider's async chunk stream into text deltas.
+
+    The async counterpart of :func:`iter_deltas`; ``close`` is awaited.
+    """
+    try:
+        async for chunk in chunks:
+            delta = parse(chunk, summary)
+            if delta:
+                yield delta
+    except errors as e:
+        if translate_error is None:
+            raise
+        raise translate_error(e) from e
+    finally:
+        await close()
@@ -0,0 +1,356 @@
+"""
+Module for estimating token counts and budgeting requests before sending them.
+
+:func:`count_tokens` estimates how many tokens a text takes for a provider and
+model. For OpenAI models it uses the model's ``tiktoken`` encoding when that
+package is installed; encodings are loaded once and kept. Otherwise a fast
+heuristic over characters and word pieces is used, which tends to slightly
+overestimate so that budgets stay on the safe side.
+
+:func:`preflight` runs in :func:`oju.agent.Agent` before every request, and a
+:class:`TokenBudget` resolved once in every :class:`oju.agent.AgentSession`. It
+checks that the system prompt and input fit the model's context window,
+rejecting or trimming inputs that do not, and lowers ``max_tokens`` to the
+room left for the response. Its estimate is also what a
+:class:`oju.ratelimit.RateLimiter` charges against the tokens-per-minute
+budget, and :func:`count_tokens` decides which system prompts are large
+enough for provider-side prompt caching.
+"""
+
+import functools
+import math
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+# Imported as a module: providers uses count_tokens in turn
+from . import providers
+
+# Tokens a chat request adds around its messages (roles, separators)
+REQUEST_OVERHEAD_TOKENS = 16
+
+# Least room left for the response before a request counts as over the limit
+MIN_OUTPUT_TOKENS = 16
+
+# Ways to handle inputs that do not fit the context window
+OVERFLOW_MODES = ("error", "truncate", "ignore")
+
+_PIECE = re.compile(r"\w+|[^\w\s]")
+
+
+@dataclass(frozen=True)
+class ModelLimits:
+    """
+    Token limits of a model.
+
+    Attributes:
+        context_window: Tokens of input and output the model accepts together.
+        max_output_tokens: Most tokens the model generates in one response.
+    """
+
+    context_window: int
+    max_output_tokens: int
+
+
+# Known limits by model name prefix; the longest matching prefix wins.
+# Extend or override entries for new or fine-tuned models.
+MODEL_LIMITS: Dict[str, Dict[str, ModelLimits]] = {
+    "openai": {
+        "gpt-3.5-turbo": ModelLimits(16_385, 4_096),
+        "gpt-4": ModelLimits(8_192, 8_192),
+        "gpt-4-32k": ModelLimits(32_768, 32_768),
+        "gpt-4-turbo": ModelLimits(128_000, 4_096),
+        "gpt-4o": ModelLimits(128_000, 16_384),
+        "gpt-4.1": ModelLimits(1_047_576, 32_768),
+        "o1": ModelLimits(200_000, 100_000),
+        "o3": ModelLimits(200_000, 100_000),
+        "o4-mini": ModelLimits(200_000, 100_000),
+    },
+    "claude": {
+        "claude-2": ModelLimits(100_000, 4_096),
+        "claude-3": ModelLimits(200_000, 4_096),
+        "claude-3-5": ModelLimits(200_000, 8_192),
+        "claude-3-7": ModelLimits(200_000, 64_000),
+        "claude-sonnet-4": ModelLimits(200_000, 64_000),
+        "claude-opus-4": ModelLimits(200_000, 32_000),
+    },
+    "gemini": {
+        "gemini-pro": ModelLimits(32_760, 8_192),
+        "gemini-1.0-pro": ModelLimits(32_760, 8_192),
+        "gemini-1.5-flash": ModelLimits(1_048_576, 8_192),
+        "gemini-1.5-pro": ModelLimits(2_097_152, 8_192),
+        "gemini-2.0-flash": ModelLimits(1_048_576, 8_192),
+        "gemini-2.5": ModelLimits(1_048_576, 65_536),
+    },
+}
+
+
+class ContextLengthError(ValueError):
+    """Raised before sending a request that cannot fit the model's context window."""
+
+    def __init__(
+        self, provider: str, model: str, input_tokens: int, context_window: int
+    ) -> None:
+        super().__init__(
+            f"Request to {provider} ({model}) needs about {input_tokens} input tokens, "
+            f"leaving no room for a response in the {context_window}-token context "
+            "window"
+        )
+        self.provider = provider
+        self.model = model
+        self.input_tokens = input_tokens
+        self.context_window = context_window
+
+
+@dataclass(frozen=True)
+class Preflight:
+    """
+    The outcome of checking a request against its token budget.
+
+    Attributes:
+        prompt_input: The input to send; shorter than the original if trimmed.
+        input_tokens: Estimated tokens of the system prompt, input and
+            request overhead.
+        max_tokens: Response limit to send, or ``None`` to keep the
+            provider's default.
+        output_tokens: Most tokens the response can take, as far as known.
+        truncated: Whether the input was trimmed to fit.
+    """
+
+    prompt_input: str
+    input_tokens: int
+    max_tokens: Optional[int]
+    output_tokens: int
+    truncated: bool = False
+
+    @property
+    def total_tokens(self) -> int:
+        """Tokens the request can use at most, input and response together."""
+        return self.input_tokens + self.output_tokens
+
+
+def model_limits(provider: str, model: str) -> Optional[ModelLimits]:
+    """Return the limits of a model, or ``None`` if the model is not known."""
+    best: Optional[Tuple[str, ModelLimits]] = None
+    for prefix, limits in MODEL_LIMITS.get(provider, {}).items():
+        if model.startswith(prefix) and (best is None or len(prefix) > len(best[0])):
+            best = (prefix, limits)
+    return best[1] if best else None
+
+
+@functools.lru_cache(maxsize=32)
+def _openai_encoding(model: str) -> Any:
+    """The tiktoken encoding of a model, or ``None`` without tiktoken."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Models newer than the installed tiktoken use the latest encoding
+        return tiktoken.get_encoding("o200k_base")
+
+
+def estimate_text_tokens(text: str) -> int:
+    """
+    Estimate tokens from characters and word pieces, without a tokenizer.
+
+    ASCII text costs about a token per four characters, or three tokens per
+    four words and punctuation marks if that is more, as in code. Other
+    characters, such as CJK text, cost about a token each.
+    """
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    pieces = len(_PIECE.findall(text))
+    return max(math.ceil(ascii_chars / 4), math.ceil(pieces * 0.75)) + (
+        len(text) - ascii_chars
+    )
+
+
+def count_tokens(text: str, provider: str, model: str) -> int:
+    """
+    Estimate the tokens a text takes for a provider and model.
+
+    Args:
+        text: The text to measure.
+        provider: One of 'openai', 'claude', or 'gemini'.
+        model: Name of the model.
+
+    Returns:
+        int: The exact count for OpenAI models when ``tiktoken`` is installed,
+        otherwise an estimate.
+    """
+    if provider == "openai":
+        encoding = _openai_encoding(model)
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+    return estimate_text_tokens(text)
+
+
+@functools.lru_cache(maxsize=256)
+def count_system_prompt_tokens(system_prompt: str, provider: str, model: str) -> int:
+    """
+    :func:`count_tokens` for a system prompt, remembering recent counts.
+
+    System prompts repeat on every call of an agent, so the Preflight check
+    and provider-side prompt caching share these counts.
+    """
+    return count_tokens(system_prompt, provider, model)
+
+
+def _trim(prompt_input: str, budget: int, provider: str, model: str) -> str:
+    """Cut the end of an input until it fits ``budget`` tokens."""
+    text = prompt_input
+    tokens = count_tokens(text, provider, model)
+    while tokens > budget and text:
+        # Shrink in proportion to the excess, at least a little each round
+        keep = min(int(len(text) * budget / tokens * 0.98), len(text) - 1)
+        text = text[:max(keep, 0)]
+        tokens = count_tokens(text, provider, model)
+    return text
+
+
+class TokenBudget:
+    """
+    The token budget of an agent's requests, resolved once for many inputs.
+
+    Holds everything :func:`preflight` needs except the input: the model's
+    limits, the system prompt's token count and the response limit, so
+    checking an input only costs counting its own tokens.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        model: str,
+        system_prompt: str,
+        max_tokens: Optional[int] = None,
+        on_overflow: str = "error",
+    ) -> None:
+        """
+        Resolve the budget of a request setup.
+
+        Args:
+            provider: One of 'openai', 'claude', or 'gemini'.
+            model: Name of the model.
+            system_prompt: The system prompt to send.
+            max_tokens: Response limit the caller asked for; defaults to the
+                provider's default, or the model's maximum if it has none.
+            on_overflow: What to do when the input leaves no room for a
+                response: 'error' raises a ContextLengthError, 'truncate'
+                cuts the end of the input, 'ignore' sends the request
+                unchanged.
+
+        Raises:
+            ValueError: If on_overflow or max_tokens is invalid.
+        """
+        if on_overflow not in OVERFLOW_MODES:
+            raise ValueError(
+                f"Unsupported on_overflow: {on_overflow}. "
+                f"Use one of: {', '.join(OVERFLOW_MODES)}"
+            )
+        if max_tokens is not None and max_tokens < 1:
+            raise ValueError("max_tokens must be at least 1")
+        self.provider = provider
+        self.model = model
+        self.max_tokens = max_tokens
+        self.on_overflow = on_overflow
+        self.limits = model_limits(provider, model)
+        self.fixed_tokens = (
+            count_system_prompt_tokens(system_prompt, provider, model)
+            + REQUEST_OVERHEAD_TOKENS
+        )
+        self._default = providers.GENERATION_DEFAULTS.get(provider, {}).get(
+            "max_tokens"
+        )
+        # The response limit to send when the input leaves enough room
+        self._requested = None if max_tokens == self._default else max_tokens
+        self._wanted = max_tokens or self._default
+
+    def check(self, prompt_input: str) -> Preflight:
+        """
+        Check an input against the budget and size the response.
+
+        Args:
+            prompt_input: The user input to send.
+
+        Returns:
+            Preflight: The input to send, the estimates and the
+            ``max_tokens`` to send. ``max_tokens`` is only set if it differs
+            from the provider's default, so unconstrained requests are sent
+            as before.
+
+        Raises:
+            ContextLengthError: If the input does not fit and on_overflow is
+                'error'.
+        """
+        provider, model, limits = self.provider, self.model, self.limits
+        fixed_tokens, wanted = self.fixed_tokens, self._wanted
+        input_tokens = fixed_tokens + count_tokens(prompt_input, provider, model)
+        if limits is None:
+            # Unknown model: nothing to check against
+            return Preflight(prompt_input, input_tokens, self._requested, wanted or 0)
+        # What the provider generates at most if no max_tokens is sent
+        implicit = self._default or limits.max_output_tokens
+
+        truncated = False
+        room = limits.context_window - input_tokens
+        if room < MIN_OUTPUT_TOKENS:
+            if self.on_overflow == "error":
+                raise ContextLengthError(
+                    provider, model, input_tokens, limits.context_window
+                )
+            if self.on_overflow == "ignore":
+                return Preflight(
+                    prompt_input, input_tokens, self._requested, wanted or implicit
+                )
+            # Keep room for the requested response if possible, else the minimum
+            reserve = max(
+                min(wanted or MIN_OUTPUT_TOKENS, limits.context_window // 2),
+                MIN_OUTPUT_TOKENS,
+            )
+            budget = limits.context_window - fixed_tokens - reserve
+            if budget < 1:
+                raise ContextLengthError(
+                    provider, model, input_tokens, limits.context_window
+                )
+            prompt_input = _trim(prompt_input, budget, provider, model)
+            input_tokens = fixed_tokens + count_tokens(prompt_input, provider, model)
+            room = limits.context_window - input_tokens
+            truncated = True
+
+        output = max(min(wanted or implicit, limits.max_output_tokens, room), 1)
+        return Preflight(
+            prompt_input=prompt_input,
+            input_tokens=input_tokens,
+            max_tokens=None if output == implicit else output,
+            output_tokens=output,
+            truncated=truncated,
+        )
+
+
+def preflight(
+    provider: str,
+    model: str,
+    system_prompt: str,
+    prompt_input: str,
+    max_tokens: Optional[int] = None,
+    on_overflow: str = "error",
+) -> Preflight:
+    """
+    Check a request against its model's context window and size its response.
+
+    A one-off :class:`TokenBudget` check; see there for the arguments.
+
+    Returns:
+        Preflight: The input to send, the estimates and the ``max_tokens``
+        to send.
+
+    Raises:
+        ValueError: If on_overflow or max_tokens is invalid.
+        ContextLengthError: If the input does not fit and on_overflow is
+            'error'.
+    """
+    return TokenBudget(
+        provider, model, system_prompt, max_tokens, on_overflow
+    ).check(prompt_input)
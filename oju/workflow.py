@@ -0,0 +1,560 @@
+"""
+Module for multi-agent workflows declared as a dependency graph.
+
+A ``Workflow`` is a set of ``Node`` entries, each one agent call whose prompt
+is a template over the workflow input and the outputs of the nodes it depends
+on. Running the workflow starts every node as soon as its dependencies have
+finished, so independent branches run concurrently instead of one after
+another::
+
+    research  ──►  summary  ──►  report
+        └──────►  critique  ───────┘
+
+Node outputs are memoized on the node, its prompt, its system prompt and its
+parameters, so a rerun only calls the nodes whose prompt or prompt file
+changed or that failed before. Every
+node reports when it started, how long it took and the length of the longest
+dependency chain ending in it, and the result names the workflow's critical
+path: the chain of nodes that determined the total run time.
+"""
+
+import asyncio
+import hashlib
+import json
+import string
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple, Union
+
+from . import agent
+from .keypool import KeyPool
+
+# Template field holding the workflow input
+INPUT_FIELD = "input"
+
+PromptTemplate = Union[str, Callable[[Dict[str, str]], str]]
+
+# Start and finish times, output and error of one agent call
+Outcome = Tuple[float, float, Any, Optional[Exception]]
+
+# A node's session, prompt input and per-call arguments
+Call = Tuple[agent.AgentSession, str, Dict[str, Any]]
+
+
+@dataclass
+class Node:
+    """
+    One agent call in a workflow.
+
+    Attributes:
+        name: Unique name of the node; downstream prompts refer to its output
+            by this name.
+        agent_name: Name of the agent (used to locate prompt file).
+        prompt: Template of the prompt input, formatted with ``{input}`` for
+            the workflow input and ``{<name>}`` for the output of each
+            dependency. May also be a callable receiving those values as a
+            dict and returning the prompt input.
+        depends_on: Names of the nodes whose outputs this node needs.
+        model: Model to use; defaults to the workflow's model.
+        provider: One of 'openai', 'claude', or 'gemini'; defaults to the
+            workflow's provider.
+        api_key: API key or KeyPool; defaults to the workflow's key.
+        custom_system_prompt: Optional custom system prompt that overrides
+            the file-based one.
+        agent_kwargs: Further :func:`oju.agent.Agent` arguments for this node,
+            taking precedence over those given to the run.
+    """
+
+    name: str
+    agent_name: str
+    prompt: PromptTemplate = "{input}"
+    depends_on: Sequence[str] = ()
+    model: Optional[str] = None
+    provider: Optional[str] = None
+    api_key: Union[None, str, KeyPool] = field(default=None, repr=False)
+    custom_system_prompt: Optional[str] = None
+    agent_kwargs: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class NodeResult:
+    """
+    The outcome of one node of a workflow run.
+
+    Attributes:
+        name: Name of the node.
+        output: The agent's response, or ``None`` if the node failed.
+        error: The exception raised for this node, or ``None`` on success.
+        started: Seconds after the start of the run at which the call began.
+        duration: Seconds the call took; zero for memoized and skipped nodes.
+        critical_path: Seconds along the slowest chain of dependencies ending
+            in this node, this node's own duration included.
+        memoized: Whether the output came from an earlier run.
+        skipped: Whether the node was not run because a dependency failed.
+    """
+
+    name: str
+    output: Any = None
+    error: Optional[Exception] = None
+    started: float = 0.0
+    duration: float = 0.0
+    critical_path: float = 0.0
+    memoized: bool = False
+    skipped: bool = False
+
+    @property
+    def ok(self) -> bool:
+        """Whether the node completed successfully."""
+        return self.error is None
+
+
+@dataclass
+class WorkflowResult:
+    """
+    The outcome of a workflow run.
+
+    Attributes:
+        nodes: Result of every node, in topological order.
+        elapsed: Wall-clock seconds the run took.
+        critical_path: Names of the nodes on the slowest dependency chain,
+            from the first to the last.
+    """
+
+    nodes: Dict[str, NodeResult]
+    elapsed: float = 0.0
+    critical_path: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        """Whether every node completed successfully."""
+        return all(result.ok for result in self.nodes.values())
+
+    @property
+    def outputs(self) -> Dict[str, Any]:
+        """Outputs of the nodes that completed successfully."""
+        return {name: r.output for name, r in self.nodes.items() if r.ok}
+
+    @property
+    def critical_path_time(self) -> float:
+        """Seconds along the critical path; the least time the run could take."""
+        if not self.critical_path:
+            return 0.0
+        return self.nodes[self.critical_path[-1]].critical_path
+
+    def __getitem__(self, name: str) -> Any:
+        """Return a node's output, raising its error if it failed."""
+        result = self.nodes[name]
+        if result.error is not None:
+            raise result.error
+        return result.output
+
+
+def _template_fields(template: str) -> List[str]:
+    """Names referenced by a format string, without attribute or index parts."""
+    names = []
+    for _, field_name, _, _ in string.Formatter().parse(template):
+        if field_name is not None:
+            names.append(field_name.split(".")[0].split("[")[0])
+    return names
+
+
+def _parameters_key(kwargs: Dict[str, Any]) -> Optional[Tuple[Tuple[str, Any], ...]]:
+    """
+    The plain-valued call parameters; API keys and helper objects do not count.
+
+    Lists and dicts, such as ``stop`` sequences, count in their JSON form.
+    Returns ``None``, so the call is not memoized, if one cannot be encoded.
+    """
+    parameters = []
+    for name, value in kwargs.items():
+        if name == "api_key":
+            continue
+        if isinstance(value, (str, int, float, bool, type(None))):
+            parameters.append((name, value))
+        elif isinstance(value, (list, tuple, dict)):
+            try:
+                parameters.append((name, json.dumps(value, sort_keys=True)))
+            except (TypeError, ValueError):
+                return None
+    return tuple(sorted(parameters))
+
+
+class Workflow:
+    """
+    A dependency graph of agent calls run with parallel branches.
+
+    The graph is validated once, when the workflow is created, and can then
+    be run any number of times, also from several threads or event loops at
+    once. Memoized outputs are shared by all runs of the workflow; editing an
+    agent's prompt file makes its nodes run again.
+    """
+
+    def __init__(
+        self,
+        nodes: Sequence[Node],
+        model: Optional[str] = None,
+        provider: Optional[str] = None,
+        api_key: Union[None, str, KeyPool] = None,
+        max_concurrency: int = 8,
+        memoize: bool = True,
+        max_memo_entries: int = 1024,
+    ) -> None:
+        """
+        Initialize the workflow.
+
+        Args:
+            nodes: The nodes of the workflow, in any order.
+            model: Default model of nodes that do not name one.
+            provider: Default provider of nodes that do not name one.
+            api_key: Default API key or KeyPool of nodes without their own.
+            max_concurrency: Maximum number of agent calls in flight at once.
+            memoize: Reuse outputs of earlier runs for identical node calls.
+            max_memo_entries: Memoized outputs kept, least recently used
+                dropped first.
+
+        Raises:
+            ValueError: If a node name repeats, a dependency or template field
+                is unknown, the dependencies form a cycle, or a node has no
+                model, provider or API key.
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.model = model
+        self.provider = provider
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.memoize = memoize
+        self.max_memo_entries = max_memo_entries
+        self._nodes: Dict[str, Node] = {}
+        for node in nodes:
+            if node.name in self._nodes:
+                raise ValueError(f"Duplicate workflow node: {node.name}")
+            if node.name == INPUT_FIELD:
+                raise ValueError(f"'{INPUT_FIELD}' is reserved for the workflow input")
+            self._nodes[node.name] = node
+        for node in self._nodes.values():
+            self._validate(node)
+        self.order: Tuple[str, ...] = self._topological_order()
+        self._memo: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        # One session per node setup, reused by later runs
+        self._sessions = agent.SessionCache()
+
+    def _validate(self, node: Node) -> None:
+        for dependency in node.depends_on:
+            if dependency not in self._nodes:
+                raise ValueError(
+                    f"Node '{node.name}' depends on unknown node '{dependency}'"
+                )
+        if isinstance(node.prompt, str):
+            known = {INPUT_FIELD, *node.depends_on}
+            for name in _template_fields(node.prompt):
+                if name not in known:
+                    raise ValueError(
+                        f"Prompt of node '{node.name}' refers to '{{{name}}}', "
+                        "which is neither the input nor one of its dependencies"
+                    )
+        for setting in ("model", "provider", "api_key"):
+            if getattr(node, setting) is None and getattr(self, setting) is None:
+                raise ValueError(f"Node '{node.name}' has no {setting}")
+        if node.agent_kwargs.get("stream"):
+            raise ValueError("Workflow nodes do not support stream=True")
+
+    def _topological_order(self) -> Tuple[str, ...]:
+        """Order the nodes so that each follows its dependencies (Kahn's algorithm)."""
+        remaining = {name: len(set(n.depends_on)) for name, n in self._nodes.items()}
+        dependents: Dict[str, List[str]] = {name: [] for name in self._nodes}
+        for name, node in self._nodes.items():
+            for dependency in set(node.depends_on):
+                dependents[dependency].append(name)
+        ready = [name for name, count in remaining.items() if count == 0]
+        order: List[str] = []
+        while ready:
+            name = ready.pop(0)
+            order.append(name)
+            for dependent in dependents[name]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+        if len(order) < len(self._nodes):
+            cycle = sorted(name for name in self._nodes if name not in order)
+            raise ValueError(f"Workflow dependencies form a cycle: {', '.join(cycle)}")
+        return tuple(order)
+
+    def _prepare(
+        self,
+        node: Node,
+        prompt_input: str,
+        results: Dict[str, NodeResult],
+        run_kwargs: Dict[str, Any],
+    ) -> Tuple[Call, Optional[Hashable]]:
+        """
+        Build a node's call and memo key from its dependencies.
+
+        The key is ``None`` if the call cannot be memoized.
+        """
+        values = {INPUT_FIELD: prompt_input}
+        for dependency in node.depends_on:
+            values[dependency] = str(results[dependency].output)
+        if isinstance(node.prompt, str):
+            text = node.prompt.format_map(values)
+        else:
+            text = node.prompt(values)
+        kwargs = dict(run_kwargs)
+        kwargs.update(node.agent_kwargs)
+        kwargs.update(
+            agent_name=node.agent_name,
+            model=node.model or self.model,
+            provider=node.provider or self.provider,
+            api_key=node.api_key if node.api_key is not None else self.api_key,
+            custom_system_prompt=node.custom_system_prompt,
+        )
+        session_kwargs, call_kwargs = agent.split_agent_kwargs(kwargs)
+        session = self._sessions.get(**session_kwargs)
+        call = (session, text, call_kwargs)
+        parameters = _parameters_key(kwargs)
+        if parameters is None:
+            return call, None
+        # The prompt file is reloaded when edited, and so is the session
+        system_prompt = hashlib.sha256(
+            session.system_prompt.encode("utf-8")
+        ).hexdigest()
+        return call, (node.name, text, system_prompt, parameters)
+
+    def _recall(self, key: Optional[Hashable]) -> Tuple[bool, Any]:
+        if not self.memoize or key is None:
+            return False, None
+        with self._lock:
+            if key not in self._memo:
+                return False, None
+            self._memo.move_to_end(key)
+            return True, self._memo[key]
+
+    def _remember(self, key: Optional[Hashable], output: Any) -> None:
+        if not self.memoize or key is None:
+            return
+        with self._lock:
+            self._memo[key] = output
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.max_memo_entries:
+                self._memo.popitem(last=False)
+
+    def clear_memo(self) -> None:
+        """Forget the outputs of earlier runs."""
+        with self._lock:
+            self._memo.clear()
+
+    def _upstream_time(self, node: Node, results: Dict[str, NodeResult]) -> float:
+        return max((results[d].critical_path for d in node.depends_on), default=0.0)
+
+    def _blocked(
+        self, node: Node, results: Dict[str, NodeResult]
+    ) -> Optional[NodeResult]:
+        """A skipped result if a dependency failed, else ``None``."""
+        for dependency in node.depends_on:
+            if not results[dependency].ok:
+                return NodeResult(
+                    name=node.name,
+                    error=Exception(
+                        f"Skipped because node '{dependency}' failed: "
+                        f"{results[dependency].error}"
+                    ),
+                    critical_path=self._upstream_time(node, results),
+                    skipped=True,
+                )
+        return None
+
+    def _start(
+        self,
+        node: Node,
+        prompt_input: str,
+        results: Dict[str, NodeResult],
+        run_kwargs: Dict[str, Any],
+        run_started: float,
+    ) -> Optional[Tuple[Call, Optional[Hashable]]]:
+        """
+        Resolve a node that needs no call, or return its call and memo key.
+
+        Skipped, memoized and unformattable nodes get their result right away.
+        """
+        blocked = self._blocked(node, results)
+        if blocked is not None:
+            results[node.name] = blocked
+            return None
+        try:
+            call, key = self._prepare(node, prompt_input, results, run_kwargs)
+        except Exception as e:
+            upstream = self._upstream_time(node, results)
+            results[node.name] = NodeResult(
+                name=node.name, error=e, critical_path=upstream
+            )
+            return None
+        found, output = self._recall(key)
+        if found:
+            results[node.name] = NodeResult(
+                name=node.name,
+                output=output,
+                started=time.perf_counter() - run_started,
+                critical_path=self._upstream_time(node, results),
+                memoized=True,
+            )
+            return None
+        return call, key
+
+    def _finish(
+        self,
+        node: Node,
+        key: Optional[Hashable],
+        outcome: Outcome,
+        results: Dict[str, NodeResult],
+        run_started: float,
+    ) -> None:
+        call_started, call_finished, output, error = outcome
+        duration = call_finished - call_started
+        if error is None:
+            self._remember(key, output)
+        results[node.name] = NodeResult(
+            name=node.name,
+            output=output,
+            error=error,
+            started=call_started - run_started,
+            duration=duration,
+            critical_path=self._upstream_time(node, results) + duration,
+        )
+
+    def _result(
+        self, results: Dict[str, NodeResult], run_started: float
+    ) -> WorkflowResult:
+        ordered = {name: results[name] for name in self.order}
+        path: List[str] = []
+        if ordered:
+            name: Optional[str] = max(ordered, key=lambda n: ordered[n].critical_path)
+            while name is not None:
+                path.append(name)
+                dependencies = self._nodes[name].depends_on
+                name = max(
+                    dependencies, key=lambda d: ordered[d].critical_path, default=None
+                )
+            path.reverse()
+        return WorkflowResult(
+            nodes=ordered, elapsed=time.perf_counter() - run_started, critical_path=path
+        )
+
+    @staticmethod
+    def _check_run_kwargs(run_kwargs: Dict[str, Any]) -> None:
+        if run_kwargs.get("stream"):
+            raise ValueError("Workflows do not support stream=True")
+
+    def run(self, prompt_input: str, **agent_kwargs: Any) -> WorkflowResult:
+        """
+        Run the workflow, starting each node as soon as its dependencies finish.
+
+        A failing node does not stop the run: nodes depending on it are
+        skipped with an error naming it, and independent branches complete.
+
+        Args:
+            prompt_input: The workflow input, available to prompts as ``{input}``.
+            **agent_kwargs: Further :func:`oju.agent.Agent` arguments such as
+                ``cache``, ``retry`` or ``rate_limiter``, used for every node.
+
+        Returns:
+            WorkflowResult: The result of every node and the critical path.
+
+        Raises:
+            ValueError: If ``stream=True`` is requested.
+        """
+        self._check_run_kwargs(agent_kwargs)
+        run_started = time.perf_counter()
+        results: Dict[str, NodeResult] = {}
+        waiting = list(self.order)
+        running: Dict["Future[Any]", Tuple[Node, Optional[Hashable]]] = {}
+        executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="oju-workflow"
+        )
+        try:
+            while waiting or running:
+                # Topological order lets one pass resolve chains of memoized nodes
+                for name in list(waiting):
+                    node = self._nodes[name]
+                    if any(d not in results for d in node.depends_on):
+                        continue
+                    waiting.remove(name)
+                    started = self._start(
+                        node, prompt_input, results, agent_kwargs, run_started
+                    )
+                    if started is not None:
+                        call, key = started
+                        future = executor.submit(_timed_call, call)
+                        running[future] = (node, key)
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node, key = running.pop(future)
+                    self._finish(node, key, future.result(), results, run_started)
+        finally:
+            # Reached early only if the caller is interrupted; drop queued calls
+            for future in running:
+                future.cancel()
+            executor.shutdown(wait=False)
+        return self._result(results, run_started)
+
+    async def arun(self, prompt_input: str, **agent_kwargs: Any) -> WorkflowResult:
+        """
+        Asynchronously run the workflow.
+
+        The async counterpart of :meth:`run`, awaiting
+        :meth:`oju.agent.AgentSession.acall`.
+        Cancelling the run cancels the calls in flight.
+        """
+        self._check_run_kwargs(agent_kwargs)
+        run_started = time.perf_counter()
+        results: Dict[str, NodeResult] = {}
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks: Dict[str, "asyncio.Task[None]"] = {}
+
+        async def run_node(node: Node) -> None:
+            dependencies = [tasks[d] for d in node.depends_on]
+            if dependencies:
+                await asyncio.wait(dependencies)
+            started = self._start(
+                node, prompt_input, results, agent_kwargs, run_started
+            )
+            if started is None:
+                return
+            call, key = started
+            async with semaphore:
+                outcome = await _atimed_call(call)
+            self._finish(node, key, outcome, results, run_started)
+
+        for name in self.order:
+            tasks[name] = asyncio.ensure_future(run_node(self._nodes[name]))
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+        return self._result(results, run_started)
+
+
+def _timed_call(call: Call) -> Outcome:
+    session, prompt_input, call_kwargs = call
+    started = time.perf_counter()
+    try:
+        output = session(prompt_input, **call_kwargs)
+    except Exception as e:
+        return started, time.perf_counter(), None, e
+    return started, time.perf_counter(), output, None
+
+
+async def _atimed_call(call: Call) -> Outcome:
+    session, prompt_input, call_kwargs = call
+    started = time.perf_counter()
+    try:
+        output = await session.acall(prompt_input, **call_kwargs)
+    except Exception as e:
+        return started, time.perf_counter(), None, e
+    return started, time.perf_counter(), output, None
@@ -33,10 +33,19 @@ setup(
     install_requires=[
         'openai>=1.0.0',
         'anthropic>=0.3.0',
-        'google-generativeai>=0.3.0',
+        'google-generativeai>=0.8.5,<0.9',
         'python-dotenv>=0.19.0',
     ],
+    extras_require={
+        'semantic': ['numpy>=1.20'],
+        'tokens': ['tiktoken>=0.5.0'],
+    },
     python_requires='>=3.8',
+    entry_points={
+        'console_scripts': [
+            'oju=oju.cli:main',
+        ],
+    },
     keywords='llm ai agent framework openai anthropic gemini',
     project_urls={
         'Bug Reports': 'https://github.com/ojasaklechat41/oju/issues',
@@ -1,5 +1,4 @@
 """Test configuration and fixtures for the oju package."""
-import os
 import pytest
 from unittest.mock import Mock, patch
 
@@ -39,6 +38,7 @@ SAMPLE_GEMINI_RESPONSE = {
     "text": "Test response from Gemini"
 }
 
+
 @pytest.fixture
 def mock_openai_response():
     """Mock OpenAI response."""
@@ -46,6 +46,7 @@ def mock_openai_response():
     mock_response.choices = [Mock(message=Mock(content="Test response from OpenAI"))]
     return mock_response
 
+
 @pytest.fixture
 def mock_anthropic_response():
     """Mock Anthropic response."""
@@ -53,6 +54,7 @@ def mock_anthropic_response():
     mock_response.content = [Mock(text="Test response from Claude")]
     return mock_response
 
+
 @pytest.fixture
 def mock_gemini_response():
     """Mock Gemini response."""
@@ -60,6 +62,7 @@ def mock_gemini_response():
     mock_response.text = "Test response from Gemini"
     return mock_response
 
+
 @pytest.fixture
 def create_test_prompt_file(tmp_path):
     """Create a temporary prompt file for testing."""
@@ -70,3 +73,72 @@ def create_test_prompt_file(tmp_path):
         prompt_file.write_text(content)
         return str(prompt_file)
     return _create_file
+
+
+@pytest.fixture(autouse=True)
+def reset_shared_caches():
+    """Start every test with empty process-wide client and prompt caches."""
+    from oju.clients import client_pool
+    from oju.prompt_cache import prompt_cache
+    from oju.providers import gemini_backend, gemini_context_cache
+    client_pool.clear()
+    gemini_backend.clear()
+    gemini_context_cache.clear()
+    prompt_cache.invalidate()
+    yield
+    client_pool.clear()
+    gemini_backend.clear()
+    gemini_context_cache.clear()
+    prompt_cache.invalidate()
+
+
+class FakeSession:
+    """An AgentSession stand-in that hands each call to a fake Agent function."""
+
+    def __init__(
+        self, answer, agent_name, model, provider, api_key,
+        custom_system_prompt=None, **kwargs
+    ):
+        self.answer = answer
+        self.kwargs = dict(
+            kwargs,
+            agent_name=agent_name,
+            model=model,
+            provider=provider,
+            api_key=api_key,
+            custom_system_prompt=custom_system_prompt,
+        )
+        if custom_system_prompt is not None:
+            self.system_prompt = custom_system_prompt
+        else:
+            from oju import agent
+            try:
+                self.system_prompt = agent.prompt_cache.get(agent_name)
+            except (OSError, ValueError):
+                # Test agents mostly have no prompt file
+                self.system_prompt = ""
+
+    def __call__(self, prompt_input, **call_kwargs):
+        return self.answer(prompt_input=prompt_input, **self.kwargs, **call_kwargs)
+
+    async def acall(self, prompt_input, **call_kwargs):
+        return await self.answer(
+            prompt_input=prompt_input, **self.kwargs, **call_kwargs
+        )
+
+
+@pytest.fixture
+def fake_sessions():
+    """
+    Patch AgentSession with sessions answering through a fake Agent function.
+
+    ``fake_sessions(answer)`` returns the patch; ``answer`` receives the
+    arguments Agent (or, awaited, AsyncAgent) would have been called with,
+    and the patched class counts the sessions created.
+    """
+    def install(answer):
+        return patch(
+            "oju.agent.AgentSession",
+            side_effect=lambda *args, **kwargs: FakeSession(answer, *args, **kwargs),
+        )
+    return install
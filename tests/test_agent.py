@@ -1,7 +1,8 @@
 """Tests for the agent module."""
+import asyncio
 import os
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 from oju import agent
 
 
@@ -9,7 +10,7 @@ def test_agent_with_custom_system_prompt(create_test_prompt_file):
     """Test agent with a custom system prompt."""
     with patch('oju.providers.call_openai') as mock_call:
         mock_call.return_value = "Test response"
-        
+
         response = agent.Agent(
             agent_name="test_agent",
             model="gpt-4",
@@ -18,7 +19,7 @@ def test_agent_with_custom_system_prompt(create_test_prompt_file):
             prompt_input="Test input",
             custom_system_prompt="Custom system prompt"
         )
-        
+
         assert response == "Test response"
         mock_call.assert_called_once_with(
             model="gpt-4",
@@ -36,18 +37,18 @@ def test_agent_with_prompt_file(tmp_path, monkeypatch):
     prompt_file = prompt_dir / "prompt.txt"
     prompt_content = "Test system prompt from file"
     prompt_file.write_text(prompt_content)
-    
+
     # Mock the file path resolution to use our temp directory
     def mock_join(*args):
         if 'prompts' in args and 'test_agent' in args:
             return str(prompt_file)
         return os.path.join(*args)
-    
+
     monkeypatch.setattr(os.path, 'join', mock_join)
-    
+
     with patch('oju.providers.call_openai') as mock_call:
         mock_call.return_value = "Test response"
-        
+
         response = agent.Agent(
             agent_name="test_agent",
             model="gpt-4",
@@ -55,7 +56,7 @@ def test_agent_with_prompt_file(tmp_path, monkeypatch):
             api_key="test_key",
             prompt_input="Test input"
         )
-        
+
         assert response == "Test response"
         mock_call.assert_called_once_with(
             model="gpt-4",
@@ -75,7 +76,7 @@ def test_agent_missing_prompt_file():
             api_key="test_key",
             prompt_input="Test input"
         )
-    
+
     assert "Prompt file not found" in str(excinfo.value)
 
 
@@ -86,15 +87,15 @@ def test_agent_empty_prompt_file(tmp_path, monkeypatch):
     prompt_dir.mkdir(parents=True, exist_ok=True)
     prompt_file = prompt_dir / "prompt.txt"
     prompt_file.write_text("")
-    
+
     # Mock the file path resolution to use our temp directory
     def mock_join(*args):
         if 'prompts' in args and 'test_agent' in args:
             return str(prompt_file)
         return os.path.join(*args)
-    
+
     monkeypatch.setattr(os.path, 'join', mock_join)
-    
+
     with pytest.raises(ValueError) as excinfo:
         agent.Agent(
             agent_name="test_agent",
@@ -103,7 +104,7 @@ def test_agent_empty_prompt_file(tmp_path, monkeypatch):
             api_key="test_key",
             prompt_input="Test input"
         )
-    
+
     assert "is empty" in str(excinfo.value)
 
 
@@ -118,7 +119,7 @@ def test_agent_missing_api_key():
             prompt_input="Test input",
             custom_system_prompt="Test prompt"
         )
-    
+
     assert "API key" in str(excinfo.value)
 
 
@@ -133,7 +134,7 @@ def test_agent_empty_prompt_input():
             prompt_input=" ",
             custom_system_prompt="Test prompt"
         )
-    
+
     assert "Prompt input cannot be empty" in str(excinfo.value)
 
 
@@ -148,9 +149,10 @@ def test_unsupported_provider():
             prompt_input="Test input",
             custom_system_prompt="Test prompt"
         )
-    
+
     assert "Unsupported provider" in str(excinfo.value)
 
+
 def test_agent_api_error_handling(tmp_path, monkeypatch):
     """Test agent's error handling when API call fails."""
     # Create test prompt directory and file
@@ -159,18 +161,18 @@ def test_agent_api_error_handling(tmp_path, monkeypatch):
     prompt_file = prompt_dir / "prompt.txt"
     prompt_content = "Test system prompt from file"
     prompt_file.write_text(prompt_content)
-    
+
     # Mock the file path resolution to use our temp directory
     def mock_join(*args):
         if 'prompts' in args and 'test_agent' in args:
             return str(prompt_file)
         return os.path.join(*args)
-    
+
     monkeypatch.setattr(os.path, 'join', mock_join)
-    
+
     with patch('oju.providers.call_openai') as mock_call:
         mock_call.side_effect = Exception("API Error")
-        
+
         with pytest.raises(Exception) as exc_info:
             agent.Agent(
                 agent_name="test_agent",
@@ -179,6 +181,247 @@ def test_agent_api_error_handling(tmp_path, monkeypatch):
                 api_key="test_key",
                 prompt_input="Test input"
             )
-        
-        assert "Error getting completion from openai (gpt-4): API Error" in str(exc_info.value)
-        mock_call.assert_called_once()
\ No newline at end of file
+
+        assert "Error getting completion from openai (gpt-4): API Error" in str(
+            exc_info.value
+        )
+        mock_call.assert_called_once()
+
+
+def test_async_agent_with_custom_system_prompt():
+    """Test async agent dispatches to the async provider function."""
+    import asyncio
+    from unittest.mock import AsyncMock
+
+    with patch('oju.providers.acall_claude', new_callable=AsyncMock) as mock_call:
+        mock_call.return_value = "Test response"
+
+        response = asyncio.run(agent.AsyncAgent(
+            agent_name="test_agent",
+            model="claude-3-opus-20240229",
+            provider="claude",
+            api_key="test_key",
+            prompt_input="Test input",
+            custom_system_prompt="Custom system prompt"
+        ))
+
+        assert response == "Test response"
+        mock_call.assert_awaited_once_with(
+            model="claude-3-opus-20240229",
+            system_prompt="Custom system prompt",
+            prompt="Test input",
+            api_key="test_key"
+        )
+
+
+def test_async_agent_validation_and_errors():
+    """Test async agent raises the same errors as the sync agent."""
+    import asyncio
+    from unittest.mock import AsyncMock
+
+    with pytest.raises(ValueError) as excinfo:
+        asyncio.run(agent.AsyncAgent(
+            agent_name="test_agent",
+            model="unknown-model",
+            provider="unsupported_provider",
+            api_key="test_key",
+            prompt_input="Test input",
+            custom_system_prompt="Test prompt"
+        ))
+    assert "Unsupported provider" in str(excinfo.value)
+
+    with patch('oju.providers.acall_openai', new_callable=AsyncMock) as mock_call:
+        mock_call.side_effect = Exception("API Error")
+
+        with pytest.raises(Exception) as exc_info:
+            asyncio.run(agent.AsyncAgent(
+                agent_name="test_agent",
+                model="gpt-4",
+                provider="openai",
+                api_key="test_key",
+                prompt_input="Test input",
+                custom_system_prompt="Test prompt"
+            ))
+
+        assert "Error getting completion from openai (gpt-4): API Error" in str(
+            exc_info.value
+        )
+
+
+def test_agent_stream_dispatches_to_stream_function():
+    """Test that stream=True returns the provider's text stream."""
+    with patch('oju.providers.stream_openai') as mock_stream, \
+         patch('oju.providers.call_openai') as mock_call:
+        mock_stream.return_value = iter(["Test", " response"])
+
+        response = agent.Agent(
+            agent_name="test_agent",
+            model="gpt-4",
+            provider="openai",
+            api_key="test_key",
+            prompt_input="Test input",
+            custom_system_prompt="Custom system prompt",
+            stream=True
+        )
+
+        assert list(response) == ["Test", " response"]
+        mock_call.assert_not_called()
+        mock_stream.assert_called_once_with(
+            model="gpt-4",
+            system_prompt="Custom system prompt",
+            prompt="Test input",
+            api_key="test_key"
+        )
+
+
+def test_agent_return_result():
+    """Test that return_result wraps the completion in a normalized AgentResult."""
+    from oju.cache import ResponseCache
+    from oju.providers import Completion
+
+    completion = Completion(
+        "Truncated", "max_tokens", input_tokens=30, output_tokens=1024,
+        cached_tokens=20, request_id="req_1"
+    )
+    cache = ResponseCache(max_entries=10)
+    kwargs = dict(agent_name="test_agent", model="claude-3", provider="claude",
+                  api_key="test_key", prompt_input="Test input",
+                  custom_system_prompt="Custom system prompt", cache=cache)
+    complete = patch('oju.providers.complete_claude', return_value=completion)
+    with complete as mock_complete, patch('oju.providers.call_claude') as mock_call:
+        result = agent.Agent(return_result=True, **kwargs)
+        cached = agent.Agent(return_result=True, **kwargs)
+        plain = agent.Agent(**kwargs)
+
+    mock_complete.assert_called_once()
+    mock_call.assert_not_called()
+    assert str(result) == result.text == "Truncated"
+    assert (result.finish_reason, result.stop_reason) == ("length", "max_tokens")
+    assert result.truncated
+    usage = (result.input_tokens, result.output_tokens, result.cached_tokens)
+    assert usage == (30, 1024, 20)
+    assert result.request_id == "req_1" and not result.cache_hit
+    assert 0 <= result.time_to_first_byte <= result.duration
+    assert cached.cache_hit and cached.text == "Truncated"
+    assert cached.input_tokens is None
+    assert plain == "Truncated"
+
+
+def test_agent_return_result_rejects_stream():
+    """Test that return_result cannot be combined with streaming."""
+    with pytest.raises(ValueError, match="return_result"):
+        agent.Agent(
+            agent_name="test_agent", model="gpt-4", provider="openai",
+            api_key="test_key", prompt_input="Test input", stream=True,
+            return_result=True,
+        )
+
+
+def test_async_agent_return_result():
+    """Test that AsyncAgent returns an AgentResult on request."""
+    from oju.providers import Completion
+
+    async def acomplete_gemini(**kwargs):
+        return Completion("Hi", "STOP", input_tokens=4, output_tokens=1)
+
+    with patch('oju.providers.acomplete_gemini', acomplete_gemini):
+        result = asyncio.run(agent.AsyncAgent(
+            agent_name="test_agent", model="gemini-pro", provider="gemini",
+            api_key="test_key", prompt_input="Test input",
+            custom_system_prompt="System", return_result=True
+        ))
+
+    assert isinstance(result, agent.AgentResult)
+    assert (result.text, result.finish_reason, result.retries) == ("Hi", "stop", 0)
+
+
+def test_agent_session_resolves_configuration_once():
+    """Test that a session loads its prompt once and reuses it for every call."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    with patch('oju.agent.prompt_cache') as mock_prompts, \
+         patch(
+             'oju.providers.call_openai', side_effect=lambda **kw: kw["prompt"]
+         ) as mock_call:
+        mock_prompts.get.return_value = "Prompt from file"
+        session = agent.AgentSession(
+            "test_agent", "gpt-4", "openai", "test_key", max_tokens=100
+        )
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(executor.map(session, [f"Input {i}" for i in range(32)]))
+
+    assert responses == [f"Input {i}" for i in range(32)]
+    mock_prompts.get.assert_called_once_with("test_agent")
+    assert session.system_prompt == "Prompt from file"
+    assert mock_call.call_count == 32
+    assert mock_call.call_args.kwargs == {
+        "model": "gpt-4", "system_prompt": "Prompt from file", "prompt": "Input 31",
+        "api_key": "test_key", "max_tokens": 100,
+    }
+
+
+def test_agent_session_validation():
+    """Test that settings are checked on creation and inputs on every call."""
+    with pytest.raises(ValueError, match="Unsupported provider"):
+        agent.AgentSession("test_agent", "gpt-4", "unknown", "test_key", "System")
+    with pytest.raises(ValueError, match="API key"):
+        agent.AgentSession("test_agent", "gpt-4", "openai", "", "System")
+    with pytest.raises(ValueError, match="on_overflow"):
+        agent.AgentSession(
+            "test_agent", "gpt-4", "openai", "test_key", "System", on_overflow="drop"
+        )
+
+    session = agent.AgentSession("test_agent", "gpt-4", "openai", "test_key", "System")
+    with pytest.raises(ValueError, match="Prompt input cannot be empty"):
+        session("  ")
+    with pytest.raises(ValueError, match="return_result"):
+        session("Test input", stream=True, return_result=True)
+
+
+def test_session_cache_reuses_sessions_until_the_prompt_changes():
+    """Test session reuse by arguments, prompt file changes and the LRU bound."""
+    session_kwargs, call_kwargs = agent.split_agent_kwargs(
+        {"model": "gpt-4", "max_tokens": 100, "return_result": True, "cancel": None}
+    )
+    assert session_kwargs == {"model": "gpt-4", "max_tokens": 100}
+    assert call_kwargs == {"return_result": True, "cancel": None}
+
+    sessions = agent.SessionCache(max_sessions=2)
+    kwargs = dict(agent_name="test_agent", model="gpt-4", provider="openai",
+                  api_key="test_key")
+    with patch('oju.agent.prompt_cache') as mock_prompts:
+        mock_prompts.get.return_value = "Prompt from file"
+        first = sessions.get(**kwargs)
+        assert sessions.get(**kwargs) is first
+        assert sessions.get(**kwargs, max_tokens=100) is not first
+
+        mock_prompts.get.return_value = "Edited prompt"
+        edited = sessions.get(**kwargs)
+        assert edited is not first and edited.system_prompt == "Edited prompt"
+
+    custom = sessions.get(**kwargs, custom_system_prompt="System")
+    assert sessions.get(**kwargs, custom_system_prompt="System") is custom
+    assert len(sessions) == 2
+    with pytest.raises(ValueError):
+        agent.SessionCache(max_sessions=0)
+
+
+def test_agent_session_async_call_and_cache():
+    """Test acall and that a session's cache is shared by sync and async calls."""
+    from oju.cache import ResponseCache
+
+    async def acall_claude(**kwargs):
+        return "Async response"
+
+    with patch('oju.providers.acall_claude', side_effect=acall_claude) as mock_acall, \
+         patch('oju.providers.call_claude') as mock_call:
+        session = agent.AgentSession(
+            "test_agent", "claude-3", "claude", "test_key", "System",
+            cache=ResponseCache(max_entries=10),
+        )
+        assert asyncio.run(session.acall("Test input")) == "Async response"
+        result = session("Test input", return_result=True)
+
+    assert mock_acall.call_count == 1
+    mock_call.assert_not_called()
+    assert result.cache_hit and result.text == "Async response"
@@ -0,0 +1,155 @@
+"""Tests for the batch module."""
+import asyncio
+import threading
+import time
+import pytest
+from unittest.mock import Mock
+
+from oju.batch import BatchResult, arun_batch, iter_batch, run_batch
+
+AGENT_KWARGS = {
+    "agent_name": "test_agent",
+    "model": "gpt-4",
+    "provider": "openai",
+    "api_key": "test_key",
+    "custom_system_prompt": "Test prompt",
+}
+
+
+def fake_agent(prompt_input, **kwargs):
+    """Echo the input, failing for inputs that start with 'bad'."""
+    if prompt_input.startswith("bad"):
+        raise ValueError(f"failed on {prompt_input}")
+    return prompt_input.upper()
+
+
+def test_run_batch_ordered_with_per_item_errors(fake_sessions):
+    """Test that failures are reported per item without aborting the batch."""
+    with fake_sessions(fake_agent):
+        results = list(run_batch(["a", "bad1", "c"], max_concurrency=2, **AGENT_KWARGS))
+
+    assert [r.index for r in results] == [0, 1, 2]
+    assert [r.output for r in results] == ["A", None, "C"]
+    assert [r.ok for r in results] == [True, False, True]
+    assert isinstance(results[1].error, ValueError)
+    assert results[1].input == "bad1"
+
+
+def test_run_batch_unordered_yields_as_completed(fake_sessions):
+    """Test that unordered batches yield fast items before slow ones."""
+    def slow_first(prompt_input, **kwargs):
+        if prompt_input == "slow":
+            time.sleep(0.2)
+        return prompt_input
+
+    with fake_sessions(slow_first):
+        results = list(run_batch(
+            ["slow", "fast1", "fast2"], max_concurrency=3, ordered=False, **AGENT_KWARGS
+        ))
+
+    assert results[-1].output == "slow"
+    assert sorted(r.index for r in results) == [0, 1, 2]
+
+
+def test_run_batch_bounds_concurrency_and_reads_lazily(fake_sessions):
+    """Test the in-flight limit and lazy consumption of a generator input."""
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+    produced = []
+
+    def tracking_agent(prompt_input, **kwargs):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.01)
+        with lock:
+            active -= 1
+        return prompt_input
+
+    def inputs():
+        for i in range(50):
+            produced.append(i)
+            yield str(i)
+
+    with fake_sessions(tracking_agent):
+        batch = run_batch(inputs(), max_concurrency=4, **AGENT_KWARGS)
+        first = next(batch)
+        # Only the in-flight window has been pulled from the generator
+        assert len(produced) <= 5
+        rest = list(batch)
+
+    assert first.output == "0"
+    assert [r.output for r in rest] == [str(i) for i in range(1, 50)]
+    assert peak <= 4
+
+
+def test_run_batch_passes_agent_arguments(fake_sessions):
+    """Test that one session with the batch's agent arguments runs every item."""
+    answer = Mock(return_value="ok")
+    with fake_sessions(answer) as session_class:
+        list(run_batch(["x", "y", "z"], **AGENT_KWARGS))
+
+    assert session_class.call_count == 1
+    answer.assert_any_call(
+        prompt_input="x", rate_limiter=None, coalesce=None, circuit_breaker=None,
+        **AGENT_KWARGS
+    )
+    assert answer.call_count == 3
+
+
+def test_run_batch_invalid_concurrency():
+    """Test that a non-positive concurrency limit is rejected eagerly."""
+    with pytest.raises(ValueError) as excinfo:
+        run_batch(["x"], max_concurrency=0, **AGENT_KWARGS)
+
+    assert "max_concurrency" in str(excinfo.value)
+
+
+def test_iter_batch_runs_any_callable():
+    """Test the engine with a plain callable, in and out of input order."""
+    results = list(iter_batch(["a", "bad1", "c"], fake_agent, max_concurrency=2))
+
+    assert [r.output for r in results] == ["A", None, "C"]
+    assert isinstance(results[1].error, ValueError)
+    unordered = iter_batch(["a", "b"], str.upper, ordered=False)
+    assert sorted(r.output for r in unordered) == ["A", "B"]
+    with pytest.raises(ValueError):
+        iter_batch(["x"], str.upper, max_concurrency=0)
+
+
+def test_arun_batch_ordered_and_unordered(fake_sessions):
+    """Test the async batch with sync and async inputs."""
+    async def fake_async_agent(prompt_input, **kwargs):
+        await asyncio.sleep(0.05 if prompt_input == "a" else 0)
+        return fake_agent(prompt_input)
+
+    async def async_inputs():
+        for item in ("a", "bad", "c"):
+            yield item
+
+    async def collect(inputs, ordered):
+        return [
+            result
+            async for result in arun_batch(
+                inputs, max_concurrency=3, ordered=ordered, **AGENT_KWARGS
+            )
+        ]
+
+    with fake_sessions(fake_async_agent) as session_class:
+        ordered = asyncio.run(collect(["a", "bad", "c"], True))
+        unordered = asyncio.run(collect(async_inputs(), False))
+
+    assert session_class.call_count == 2
+
+    assert [r.output for r in ordered] == ["A", None, "C"]
+    assert not ordered[1].ok
+    assert unordered[-1].index == 0
+    assert {r.index for r in unordered} == {0, 1, 2}
+
+
+def test_batch_result_ok():
+    """Test the ok property of batch results."""
+    assert BatchResult(index=0, input="x", output="y").ok
+    assert not BatchResult(index=0, input="x", error=Exception("boom")).ok
@@ -0,0 +1,136 @@
+"""Tests for the fake provider server and benchmark runner."""
+import json
+import pytest
+
+from benchmarks import run
+from benchmarks.fake_server import FakeProviderServer, FakeServerConfig
+from oju import agent
+from oju.retry import RetryPolicy, RetryStats
+
+pytestmark = pytest.mark.filterwarnings("ignore::FutureWarning")
+
+PROVIDERS = ["openai", "claude", "gemini"]
+
+
+@pytest.fixture
+def server():
+    with FakeProviderServer(FakeServerConfig(response_words=3)) as fake:
+        yield fake
+
+
+def _call(server, provider, **kwargs):
+    kwargs.setdefault("custom_system_prompt", "System")
+    return agent.Agent(
+        agent_name="benchmark",
+        model="test-model",
+        provider=provider,
+        api_key="test_key",
+        prompt_input="Hello",
+        base_url=run._base_url(server, provider),
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize("provider", PROVIDERS)
+def test_agent_round_trip_through_real_sdk(server, provider):
+    """Test that each SDK parses the fake server's completion response."""
+    assert _call(server, provider) == "word0 word1 word2 "
+    assert server.requests == 1
+
+
+@pytest.mark.parametrize("provider", PROVIDERS)
+def test_agent_stream_through_real_sdk(server, provider):
+    """Test that each SDK parses the fake server's streaming format."""
+    with _call(server, provider, stream=True) as stream:
+        assert stream.read() == "word0 word1 word2 "
+    assert stream.summary.output_tokens == 3
+    assert stream.summary.finish_reason in ("stop", "end_turn", "STOP")
+
+
+@pytest.mark.parametrize("provider", PROVIDERS)
+def test_injected_errors_are_retried(server, provider):
+    """Test that injected 503s surface as retryable SDK errors."""
+    server.config.error_rate = 1.0
+    server.config.error_status = 503
+    stats = RetryStats()
+
+    with pytest.raises(Exception, match=f"Error getting completion from {provider}"):
+        _call(server, provider, retry=RetryPolicy(max_attempts=2, initial_delay=0.001),
+              retry_stats=stats)
+
+    assert stats.attempts == 2
+    # The SDK's own retries are disabled while a policy is in effect
+    assert server.requests == 2
+
+
+def test_benchmark_runner_reports_levels(tmp_path, capsys):
+    """Test a tiny benchmark run end to end, including the JSON report."""
+    output = tmp_path / "results.json"
+    status = run.main([
+        "--providers", "openai", "claude",
+        "--concurrency", "1", "2",
+        "--requests", "4",
+        "--latency", "0",
+        "--json", str(output),
+    ])
+
+    assert status == 0
+    results = json.loads(output.read_text())
+    assert [(r["provider"], r["concurrency"]) for r in results] == [
+        ("openai", 1), ("openai", 2), ("claude", 1), ("claude", 2)
+    ]
+    assert all(r["errors"] == 0 and r["p99"] >= r["p50"] > 0 for r in results)
+    assert "overhead ms" in capsys.readouterr().out
+
+    assert run.main(["--providers", "openai", "--concurrency", "1", "--requests", "2",
+                     "--latency", "0", "--max-overhead-ms", "0"]) == 1
+
+
+def test_benchmark_runner_session_mode(server):
+    """Test that sessions are benchmarked on both the thread and asyncio paths."""
+    sync = run.run_sync_level(server, "openai", 2, 4, session=True)
+    async_ = run.run_async_level(server, "claude", 2, 4, stream=True, session=True)
+
+    assert (sync.mode, sync.errors) == ("sync+session", 0)
+    assert (async_.mode, async_.errors) == ("async+session+stream", 0)
+    assert server.requests == 4
+
+
+def test_percentile():
+    """Test the nearest-rank percentile."""
+    values = list(range(1, 101))
+    assert run.percentile(values, 50) == 50
+    assert run.percentile(values, 99) == 99
+    assert run.percentile([], 50) == 0.0
+
+
+@pytest.mark.parametrize("provider", PROVIDERS)
+def test_agent_result_through_real_sdk(server, provider):
+    """Test that usage, finish reason and request IDs are normalized per SDK."""
+    result = _call(server, provider, return_result=True)
+
+    assert result.text == "word0 word1 word2 "
+    assert result.finish_reason == "stop"
+    assert result.output_tokens == 3 and result.input_tokens > 0
+    assert result.request_id == (None if provider == "gemini" else "req_0")
+    assert 0 < result.time_to_first_byte <= result.duration
+
+
+@pytest.mark.parametrize("provider", PROVIDERS)
+def test_large_system_prompts_use_provider_caching(server, provider):
+    """Test that repeated large system prompts are served from the provider cache."""
+    system_prompt = "You are a meticulous reviewer. " * 800
+
+    first, second = (
+        _call(server, provider, return_result=True, custom_system_prompt=system_prompt)
+        for _ in range(2)
+    )
+
+    assert second.cached_tokens > 0
+    assert second.input_tokens >= second.cached_tokens
+    if provider == "claude":
+        assert first.cache_write_tokens > 0 and not first.cached_tokens
+    if provider == "gemini":
+        # The prompt lives in a cached content created once and referenced by both calls
+        assert first.cached_tokens == second.cached_tokens
+        assert len(server.cached_contents) == 1
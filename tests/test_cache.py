@@ -0,0 +1,206 @@
+"""Tests for the cache module."""
+import multiprocessing
+import threading
+import time
+import pytest
+from unittest.mock import patch
+
+from oju import agent
+from oju.cache import MemoryTier, ResponseCache, SQLiteTier
+
+
+def test_make_key_covers_every_request_field():
+    """Test that each part of the request changes the key."""
+    base = ("openai", "gpt-4", "System", "Input", {"temperature": 0.7})
+    key = ResponseCache.make_key(*base)
+
+    assert key == ResponseCache.make_key(*base)
+    for index, value in enumerate(
+        ["claude", "gpt-3.5-turbo", "Other system", "Other input", {"temperature": 0.2}]
+    ):
+        changed = list(base)
+        changed[index] = value
+        assert ResponseCache.make_key(*changed) != key
+
+
+def test_memory_tier_lru_eviction():
+    """Test that the memory tier evicts the least recently used entry."""
+    tier = MemoryTier(max_entries=2)
+    tier.set("a", "A")
+    tier.set("b", "B")
+    assert tier.get("a") == "A"
+    tier.set("c", "C")
+
+    assert tier.get("b") is None
+    assert tier.get("a") == "A"
+    assert len(tier) == 2
+
+
+def test_memory_tier_ttl():
+    """Test that memory entries expire after the TTL."""
+    tier = MemoryTier(ttl=10)
+    tier.set("a", "A")
+
+    with patch("oju.cache.time.monotonic", return_value=time.monotonic() + 11):
+        assert tier.get("a") is None
+
+
+def test_sqlite_tier_ttl_and_size_eviction(tmp_path):
+    """Test TTL expiry and size-based eviction on disk."""
+    tier = SQLiteTier(str(tmp_path / "cache.db"), ttl=10, max_entries=3)
+    for i in range(5):
+        tier.set(f"k{i}", f"v{i}")
+    tier.evict()
+
+    assert len(tier) == 3
+    assert tier.get("k0") is None
+    assert tier.get("k4") == "v4"
+
+    with patch("oju.cache.time.time", return_value=time.time() + 11):
+        assert tier.get("k4") is None
+        tier.evict()
+    assert len(tier) == 0
+
+
+def test_disk_hits_keep_their_expiry(tmp_path):
+    """Test that promoted entries expire with the disk row and expired rows go."""
+    path = str(tmp_path / "cache.db")
+    ResponseCache(path=path, ttl=10).set("key", "value")
+
+    cache = ResponseCache(path=path, ttl=10)
+    with patch("oju.cache.time.time", return_value=time.time() + 8):
+        assert cache.get("key") == "value"
+    with patch("oju.cache.time.monotonic", return_value=time.monotonic() + 3):
+        assert cache.memory.get("key") is None
+
+    with patch("oju.cache.time.time", return_value=time.time() + 11):
+        assert cache.disk.get("key") is None
+    assert len(cache.disk) == 0
+
+
+def test_sqlite_tier_invalid_arguments(tmp_path):
+    """Test argument validation of the disk tier."""
+    with pytest.raises(ValueError):
+        SQLiteTier(str(tmp_path / "cache.db"), max_entries=0)
+    with pytest.raises(ValueError):
+        SQLiteTier(str(tmp_path / "cache.db"), ttl=0)
+
+
+def test_response_cache_tiers_and_stats(tmp_path):
+    """Test lookups across tiers and the hit/miss statistics."""
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(path=path)
+
+    assert cache.get("key") is None
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+
+    # A fresh cache on the same file finds the entry on disk, then in memory
+    other = ResponseCache(path=path)
+    assert other.get("key") == "value"
+    assert other.get("key") == "value"
+
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 1
+    assert cache.stats.writes == 1
+    assert other.stats.disk_hits == 1
+    assert other.stats.memory_hits == 1
+    assert other.stats.hit_rate == 1.0
+
+    cache.clear()
+    assert ResponseCache(path=path).get("key") is None
+
+
+def test_response_cache_thread_safety(tmp_path):
+    """Test concurrent use of one cache from many threads."""
+    cache = ResponseCache(max_entries=16, path=str(tmp_path / "cache.db"))
+    errors = []
+
+    def worker(n):
+        try:
+            for i in range(50):
+                key = f"{n}-{i}"
+                cache.set(key, key)
+                assert cache.get(key) == key
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert cache.stats.writes == 400
+
+
+def _write_entries(path, start):
+    cache = ResponseCache(path=path)
+    for i in range(start, start + 50):
+        cache.set(f"k{i}", f"v{i}")
+
+
+def test_response_cache_shared_between_processes(tmp_path):
+    """Test that several processes can write to one disk tier."""
+    path = str(tmp_path / "cache.db")
+    ResponseCache(path=path)
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+    processes = [
+        ctx.Process(target=_write_entries, args=(path, n * 50)) for n in range(3)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert all(process.exitcode == 0 for process in processes)
+    assert len(SQLiteTier(path)) == 150
+
+
+def test_agent_uses_response_cache():
+    """Test that Agent serves repeated requests from the cache."""
+    cache = ResponseCache()
+    kwargs = dict(
+        agent_name="test_agent",
+        model="gpt-4",
+        provider="openai",
+        api_key="test_key",
+        custom_system_prompt="Test prompt",
+        cache=cache
+    )
+
+    with patch('oju.providers.call_openai') as mock_call:
+        mock_call.return_value = "Test response"
+
+        assert agent.Agent(prompt_input="Test input", **kwargs) == "Test response"
+        assert agent.Agent(prompt_input="Test input", **kwargs) == "Test response"
+        agent.Agent(prompt_input="Other input", **kwargs)
+
+    assert mock_call.call_count == 2
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 2
+
+
+def test_agent_does_not_cache_errors():
+    """Test that failed calls are not stored in the cache."""
+    cache = ResponseCache()
+
+    with patch('oju.providers.call_claude') as mock_call:
+        mock_call.side_effect = [Exception("API Error"), "Recovered"]
+        kwargs = dict(
+            agent_name="test_agent",
+            model="claude-3-opus-20240229",
+            provider="claude",
+            api_key="test_key",
+            prompt_input="Test input",
+            custom_system_prompt="Test prompt",
+            cache=cache
+        )
+
+        with pytest.raises(Exception):
+            agent.Agent(**kwargs)
+        assert agent.Agent(**kwargs) == "Recovered"
+
+    assert cache.stats.writes == 1
@@ -0,0 +1,196 @@
+"""Tests for the circuit module."""
+import asyncio
+import time
+import pytest
+from unittest.mock import Mock, patch
+
+from oju import agent
+from oju.circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from oju.routing import Router, Target
+
+
+class StatusError(Exception):
+    """An SDK-style error carrying an HTTP status code."""
+
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _fail(error):
+    def call():
+        raise error
+    return call
+
+
+def _trip(breaker, calls=4, provider="openai", model="gpt-4", api_key="key"):
+    guarded = breaker.wrap(_fail(StatusError(503)), provider, model, api_key)
+    for _ in range(calls):
+        with pytest.raises(StatusError):
+            guarded()
+
+
+def test_circuit_opens_on_error_rate_and_fails_fast():
+    """Test that transient failures open the circuit and further calls are rejected."""
+    breaker = CircuitBreaker(failure_rate=0.5, minimum_calls=4, open_for=60)
+    ok = breaker.wrap(lambda: "ok", "openai", "gpt-4", "key")
+    assert ok() == "ok"
+    _trip(breaker, calls=3)
+
+    assert breaker.state("openai", "gpt-4", "key") == OPEN
+    assert not breaker.allows("openai", "gpt-4", "key")
+    with pytest.raises(CircuitOpenError) as exc_info:
+        ok()
+    assert exc_info.value.retry_in > 59
+    health = breaker.health("openai", "gpt-4", "key")
+    assert (health.calls, health.failures, health.rejected) == (4, 3, 1)
+    assert health.error_rate == 0.75 and health.p50 is not None
+
+    # Other models and keys have their own circuits
+    assert breaker.state("openai", "gpt-4", "other_key") == CLOSED
+    assert breaker.wrap(lambda: "ok", "openai", "gpt-4o", "key")() == "ok"
+
+
+def test_client_errors_and_minimum_calls_do_not_open():
+    """Test that deliberate client errors count as healthy and few calls are not."""
+    breaker = CircuitBreaker(minimum_calls=3)
+    bad_request = breaker.wrap(_fail(StatusError(400)), "claude", "claude-3", "key")
+    for _ in range(5):
+        with pytest.raises(StatusError):
+            bad_request()
+    assert breaker.state("claude", "claude-3", "key") == CLOSED
+
+    _trip(breaker, calls=2, provider="gemini", model="gemini-pro")
+    assert breaker.state("gemini", "gemini-pro", "key") == CLOSED
+
+
+def test_half_open_probe_closes_or_reopens():
+    """Test the half-open trial request in both directions."""
+    breaker = CircuitBreaker(minimum_calls=2, open_for=0.02)
+    _trip(breaker, calls=2)
+    time.sleep(0.03)
+    assert breaker.state("openai", "gpt-4", "key") == HALF_OPEN
+
+    # A failed trial opens the circuit again
+    _trip(breaker, calls=1)
+    assert breaker.state("openai", "gpt-4", "key") == OPEN
+
+    time.sleep(0.03)
+    probe = breaker.before_call("openai", "gpt-4", "key")
+    assert probe is True
+    # Only one trial request at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call("openai", "gpt-4", "key")
+    breaker.after_call("openai", "gpt-4", "key", 0.01, probe=probe)
+
+    assert breaker.state("openai", "gpt-4", "key") == CLOSED
+    assert breaker.health("openai", "gpt-4", "key").calls == 0
+
+
+def test_cancelled_probe_frees_its_slot():
+    """Test that a cancelled trial request lets another one through."""
+    breaker = CircuitBreaker(minimum_calls=2, open_for=0)
+    _trip(breaker, calls=2)
+
+    async def hang():
+        await asyncio.sleep(5)
+
+    async def main():
+        task = asyncio.ensure_future(breaker.awrap(hang, "openai", "gpt-4", "key")())
+        await asyncio.sleep(0.01)
+        assert not breaker.allows("openai", "gpt-4", "key")
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert breaker.state("openai", "gpt-4", "key") == HALF_OPEN
+    assert breaker.allows("openai", "gpt-4", "key")
+
+
+def test_slow_calls_count_as_failures():
+    """Test that calls over slow_call_duration can open the circuit."""
+    breaker = CircuitBreaker(minimum_calls=2, slow_call_duration=0.01)
+    slow = breaker.wrap(lambda: time.sleep(0.02), "openai", "gpt-4", "key")
+    slow()
+    slow()
+
+    health = breaker.health("openai", "gpt-4", "key")
+    assert health.state == OPEN
+    assert health.slow_calls == 2 and health.p99 >= 0.02
+
+
+def test_snapshot_reset_and_validation():
+    """Test programmatic access to all circuits."""
+    breaker = CircuitBreaker(minimum_calls=1)
+    _trip(breaker, calls=1)
+
+    snapshot = breaker.snapshot()
+    assert snapshot[CircuitBreaker.key("openai", "gpt-4", "key")].state == OPEN
+    assert all("key" != part for key in snapshot for part in key[2:])
+
+    breaker.reset("openai", "gpt-4", "key")
+    assert breaker.state("openai", "gpt-4", "key") == CLOSED
+    _trip(breaker, calls=1)
+    breaker.clear()
+    assert breaker.snapshot() == {}
+
+    with pytest.raises(ValueError):
+        CircuitBreaker(failure_rate=0)
+    with pytest.raises(ValueError):
+        CircuitBreaker(half_open_probes=0)
+
+
+def test_agent_fails_fast_while_open():
+    """Test that Agent rejects calls without reaching the provider."""
+    breaker = CircuitBreaker(minimum_calls=2, open_for=60)
+    kwargs = dict(
+        agent_name="test_agent", model="gpt-4", provider="openai", api_key="test_key",
+        prompt_input="Hello", custom_system_prompt="System", circuit_breaker=breaker,
+    )
+    with patch("oju.providers.call_openai", side_effect=StatusError(500)) as mock_call:
+        for _ in range(2):
+            with pytest.raises(Exception, match="HTTP 500"):
+                agent.Agent(**kwargs)
+        with pytest.raises(Exception, match="Circuit open") as exc_info:
+            agent.Agent(**kwargs)
+
+    assert mock_call.call_count == 2
+    assert isinstance(exc_info.value.__cause__, CircuitOpenError)
+
+
+def test_async_agent_records_outcomes():
+    """Test that AsyncAgent feeds the breaker."""
+    breaker = CircuitBreaker()
+
+    async def acall_claude(**kwargs):
+        return "Hi"
+
+    with patch("oju.providers.acall_claude", acall_claude):
+        response = asyncio.run(agent.AsyncAgent(
+            agent_name="test_agent", model="claude-3", provider="claude",
+            api_key="test_key", prompt_input="Hello", custom_system_prompt="System",
+            circuit_breaker=breaker,
+        ))
+
+    assert response == "Hi"
+    assert breaker.health("claude", "claude-3", "test_key").calls == 1
+
+
+def test_router_steers_around_open_circuits(fake_sessions):
+    """Test that a Router tries targets with an open circuit last."""
+    breaker = CircuitBreaker(minimum_calls=1, open_for=60)
+    _trip(breaker, calls=1, api_key="openai_key")
+    targets = [
+        Target("openai", "gpt-4", "openai_key"),
+        Target("claude", "claude-3", "claude_key"),
+    ]
+
+    mock_agent = Mock(return_value="from claude")
+    with Router(targets, circuit_breaker=breaker) as router, \
+         fake_sessions(mock_agent):
+        assert router.run("test_agent", "Hello") == "from claude"
+
+    assert mock_agent.call_count == 1
+    assert mock_agent.call_args.kwargs["provider"] == "claude"
+    assert mock_agent.call_args.kwargs["circuit_breaker"] is breaker
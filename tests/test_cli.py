@@ -0,0 +1,177 @@
+"""Tests for the cli module."""
+import io
+import json
+import subprocess
+import sys
+import pytest
+from unittest.mock import MagicMock, Mock, patch
+
+from oju import cli, metrics
+from oju.keypool import KeyPool
+from oju.metrics import CallMetrics, MetricsAggregator
+from oju.retry import RetryPolicy
+
+BASE_ARGS = ["test_agent", "-p", "openai", "-m", "gpt-4", "--api-key", "test_key"]
+
+
+def _echo(prompt_input, **kwargs):
+    if prompt_input == "fail":
+        raise Exception("upstream error")
+    return f"out:{prompt_input}"
+
+
+def _main(args, stdin=""):
+    with patch("sys.stdin", io.StringIO(stdin)):
+        return cli.main(BASE_ARGS + args)
+
+
+def test_single_prompt(capsys, fake_sessions):
+    """Test a single prompt given on the command line."""
+    answer = Mock(side_effect=_echo)
+    with fake_sessions(answer):
+        assert _main(["--system-prompt", "System", "Hello"]) == 0
+
+    assert capsys.readouterr().out == "out:Hello\n"
+    kwargs = answer.call_args.kwargs
+    assert (kwargs["agent_name"], kwargs["provider"], kwargs["model"]) == (
+        "test_agent", "openai", "gpt-4"
+    )
+    assert kwargs["custom_system_prompt"] == "System"
+    assert isinstance(kwargs["retry"], RetryPolicy)
+    assert "rate_limiter" not in kwargs and "cache" not in kwargs
+
+
+def test_stdin_lines_run_in_order_with_failures(capsys, fake_sessions):
+    """Test that every stdin line is a prompt and failures set the exit status."""
+    with fake_sessions(_echo) as session_class:
+        status = _main(["-c", "2", "--retries", "0"], stdin="a\n\nfail\nb\n")
+
+    assert session_class.call_count == 1
+
+    captured = capsys.readouterr()
+    assert status == 1
+    assert captured.out == "out:a\nout:b\n"
+    assert "oju: input 2: upstream error" in captured.err
+
+
+def test_jsonl_stream(capsys, fake_sessions):
+    """Test JSONL records in and JSON lines out."""
+    stdin = '{"id": "x", "question": "a"}\n"b"\n'
+    with fake_sessions(_echo):
+        status = _main(["--jsonl", "--input-field", "question", "--id-field", "id"],
+                       stdin=stdin)
+
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert status == 0
+    assert lines == [
+        {"index": 0, "id": "x", "output": "out:a"},
+        {"index": 1, "output": "out:b"},
+    ]
+
+
+def test_output_file_uses_the_resumable_pipeline(tmp_path, fake_sessions):
+    """Test that --output writes a checkpointed JSONL file."""
+    source = tmp_path / "in.jsonl"
+    source.write_text('{"input": "a"}\n{"input": "b"}\n')
+    output = tmp_path / "out.jsonl"
+
+    with fake_sessions(_echo):
+        assert _main(["-i", str(source), "-o", str(output)]) == 0
+
+    lines = output.read_text().splitlines()
+    assert sorted(json.loads(line)["output"] for line in lines) == ["out:a", "out:b"]
+    assert (tmp_path / "out.jsonl.checkpoint").exists()
+
+
+def test_streaming_output(capsys, fake_sessions):
+    """Test that --stream prints deltas as they arrive."""
+    stream = MagicMock()
+    stream.return_value.__enter__.return_value = iter(["Hel", "lo"])
+    with fake_sessions(stream):
+        assert _main(["--stream", "Hi"]) == 0
+
+    assert capsys.readouterr().out == "Hello\n"
+    assert stream.call_args.kwargs["stream"] is True
+
+
+def test_throughput_options_and_key_pools(tmp_path, monkeypatch, fake_sessions):
+    """Test rate limit, cache and key options."""
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "key_one, key_two")
+    answer = Mock(side_effect=_echo)
+    with fake_sessions(answer):
+        status = cli.main([
+            "test_agent", "-p", "claude", "-m", "claude-3",
+            "--rpm", "60", "--tpm", "1000",
+            "--cache", str(tmp_path / "cache.db"), "--base-url", "http://localhost:1",
+            "--timeout", "30", "Hello",
+        ])
+
+    assert status == 0
+    kwargs = answer.call_args.kwargs
+    assert isinstance(kwargs["api_key"], KeyPool) and len(kwargs["api_key"]) == 2
+    limit = kwargs["rate_limiter"].limit_for("claude", "claude-3")
+    assert limit.requests_per_minute == 60
+    assert kwargs["cache"] is not None
+    assert kwargs["base_url"] == "http://localhost:1"
+    assert kwargs["timeout"] == 30
+
+
+def test_usage_errors(capsys, monkeypatch):
+    """Test argument validation."""
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    with patch.dict("sys.modules", {"dotenv": None}):
+        with pytest.raises(SystemExit) as exc_info:
+            cli.main(["test_agent", "-p", "openai", "-m", "gpt-4", "Hi"])
+    assert exc_info.value.code == 2
+    assert "OPENAI_API_KEY" in capsys.readouterr().err
+
+    for args in (
+        ["--stream"], ["-o", "out.jsonl"], ["-c", "0", "Hi"], ["--timeout", "0", "Hi"]
+    ):
+        with pytest.raises(SystemExit):
+            _main(args)
+
+
+def test_errors_are_reported_not_raised(capsys, fake_sessions):
+    """Test that a failing single call prints the error and exits with 1."""
+    with fake_sessions(Mock(side_effect=Exception("boom"))):
+        assert _main(["Hello"]) == 1
+    assert capsys.readouterr().err == "oju: error: boom\n"
+
+
+def test_stats_summary(capsys, fake_sessions):
+    """Test the --stats report and that its hook is removed afterwards."""
+    def instrumented(prompt_input, **kwargs):
+        metrics.emit(CallMetrics(
+            agent_name="test_agent", provider="openai", model="gpt-4",
+            duration=0.2, ttfb=0.1, input_tokens=10, output_tokens=5,
+        ))
+        return "ok"
+
+    with fake_sessions(instrumented):
+        assert _main(["--stats"], stdin="a\nb\n") == 0
+
+    err = capsys.readouterr().err
+    assert "calls: 2 (0 failed, 0 cached, 0 retries)" in err
+    assert "latency: p50 0.175s" in err
+    assert "tokens: 20 input (0 cached), 10 output" in err
+    assert not metrics._hooks
+
+
+def test_format_stats_without_calls():
+    """Test the summary of a run that made no calls."""
+    summary = cli.format_stats(MetricsAggregator(), 0.0)
+    assert "calls: 0" in summary and "p99 -" in summary
+
+
+def test_help_starts_without_provider_sdks():
+    """Test that the command starts without importing oju's core or any SDK."""
+    code = (
+        "import sys; from oju import cli; cli.build_parser(); "
+        "print(sorted(m for m in sys.modules if m.split('.')[0] in "
+        "('openai', 'anthropic', 'oju') or m.startswith('google.generativeai')))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip() == "['oju', 'oju.cli']"
@@ -0,0 +1,119 @@
+"""Tests for the clients module."""
+import threading
+import pytest
+from unittest.mock import MagicMock
+
+from oju.clients import ClientPool
+
+
+def test_pool_reuses_client_for_same_key():
+    """Test that the same credentials return the same client."""
+    pool = ClientPool()
+    factory = MagicMock(side_effect=lambda: MagicMock())
+
+    first = pool.get("openai", "key", factory)
+    second = pool.get("openai", "key", factory)
+
+    assert first is second
+    factory.assert_called_once()
+
+
+def test_pool_keys_on_provider_key_and_base_url():
+    """Test that provider, API key and base URL each select a distinct client."""
+    pool = ClientPool()
+    factory = MagicMock(side_effect=lambda: MagicMock())
+
+    clients = {
+        id(pool.get("openai", "key", factory)),
+        id(pool.get("claude", "key", factory)),
+        id(pool.get("openai", "other_key", factory)),
+        id(pool.get("openai", "key", factory, base_url="http://localhost:8000")),
+    }
+
+    assert len(clients) == 4
+    assert len(pool) == 4
+
+
+def test_pool_evicts_and_closes_least_recently_used():
+    """Test LRU eviction closes the evicted client."""
+    pool = ClientPool(max_size=2)
+    a = pool.get("openai", "a", MagicMock)
+    b = pool.get("openai", "b", MagicMock)
+
+    # Touch "a" so that "b" becomes the least recently used entry
+    assert pool.get("openai", "a", MagicMock) is a
+    pool.get("openai", "c", MagicMock)
+
+    assert len(pool) == 2
+    b.close.assert_called_once()
+    a.close.assert_not_called()
+
+
+def test_pool_clear_closes_clients():
+    """Test that clearing the pool closes every client."""
+    pool = ClientPool()
+    client = pool.get("openai", "key", MagicMock)
+
+    pool.clear()
+
+    assert len(pool) == 0
+    client.close.assert_called_once()
+
+
+def test_pool_invalid_size():
+    """Test that a non-positive pool size is rejected."""
+    with pytest.raises(ValueError) as excinfo:
+        ClientPool(max_size=0)
+
+    assert "max_size" in str(excinfo.value)
+
+
+def test_pool_concurrent_access_creates_one_client():
+    """Test that concurrent lookups for one key build a single client."""
+    pool = ClientPool()
+    factory = MagicMock(side_effect=lambda: MagicMock())
+    results = []
+
+    def worker():
+        results.append(pool.get("openai", "key", factory))
+
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(client) for client in results}) == 1
+    factory.assert_called_once()
+
+
+def test_async_client_pool_is_per_event_loop():
+    """Test that each event loop gets its own client pool."""
+    import asyncio
+    from oju.clients import async_client_pool
+
+    async def get_pool():
+        first = async_client_pool()
+        assert async_client_pool() is first
+        return first
+
+    assert asyncio.run(get_pool()) is not asyncio.run(get_pool())
+
+    with pytest.raises(RuntimeError):
+        async_client_pool()
+
+
+def test_pool_closes_async_clients_on_event_loop():
+    """Test that evicted async clients are closed on the running loop."""
+    import asyncio
+    from unittest.mock import AsyncMock
+
+    async def run():
+        pool = ClientPool(max_size=1)
+        first = MagicMock(close=AsyncMock())
+        pool.get("openai", "a", lambda: first)
+        pool.get("openai", "b", MagicMock)
+        await asyncio.sleep(0)
+        first.close.assert_awaited_once()
+
+    asyncio.run(run())
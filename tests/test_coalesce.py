@@ -0,0 +1,251 @@
+"""Tests for the coalesce module."""
+import asyncio
+import threading
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
+
+from oju import agent, metrics
+from oju.batch import run_batch
+from oju.coalesce import SingleFlight
+from oju.deadline import Deadline, DeadlineExceededError
+from oju.providers import Completion
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.001)
+
+
+def _run_concurrently(flight, callers, func, key="key"):
+    """Start ``callers`` threads on one key while ``func`` is held, then release it."""
+    release = threading.Event()
+
+    def held():
+        release.wait()
+        return func()
+
+    with ThreadPoolExecutor(max_workers=callers) as executor:
+        futures = [executor.submit(flight.do, key, held) for _ in range(callers)]
+        _wait_for(lambda: flight.stats.requests == callers)
+        release.set()
+        return [f.exception() or f.result() for f in futures]
+
+
+def test_concurrent_calls_share_one_execution():
+    """Test that overlapping calls with one key run the function once."""
+    flight = SingleFlight()
+    calls = []
+
+    results = _run_concurrently(flight, 8, lambda: calls.append(1) or "done")
+
+    assert len(calls) == 1
+    assert sorted(joined for _, joined in results) == [False] + [True] * 7
+    assert all(result == "done" for result, _ in results)
+    stats = flight.stats
+    assert (stats.requests, stats.executions, stats.collapsed) == (8, 1, 7)
+    assert stats.collapse_rate == 7 / 8
+    assert flight.in_flight == 0
+
+
+def test_errors_are_shared_and_keys_are_forgotten():
+    """Test that every waiter gets the error and later calls run again."""
+    flight = SingleFlight()
+    error = ValueError("upstream failed")
+
+    def fail():
+        raise error
+
+    results = _run_concurrently(flight, 3, fail)
+
+    assert results == [error, error, error]
+    assert flight.do("key", lambda: "again") == ("again", False)
+    assert flight.do("other", lambda: "other") == ("other", False)
+
+
+def test_async_calls_share_one_execution():
+    """Test coalescing of tasks on one event loop."""
+    flight = SingleFlight()
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "done"
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("key", upstream) for _ in range(5)))
+
+    results = asyncio.run(main())
+
+    assert len(calls) == 1
+    assert [joined for _, joined in results] == [False] + [True] * 4
+    assert flight.stats.collapsed == 4
+    assert flight.in_flight == 0
+
+
+def test_async_cancellation_only_stops_the_call_without_waiters():
+    """Test that one cancelled waiter leaves the shared call running for others."""
+    flight = SingleFlight()
+    started = []
+
+    async def upstream():
+        started.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        first = asyncio.ensure_future(flight.ado("key", upstream))
+        second = asyncio.ensure_future(flight.ado("key", upstream))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        result = await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+        lone = asyncio.ensure_future(flight.ado("lone", upstream))
+        await asyncio.sleep(0.01)
+        lone.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await lone
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(main()) == ("done", True)
+    assert flight.in_flight == 0
+
+
+def test_followers_stop_waiting_at_their_own_deadline():
+    """Test that a short-deadline caller joining a slow call gives up in time."""
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def slow():
+        release.wait()
+        return "done"
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        leader = executor.submit(flight.do, "key", slow)
+        _wait_for(lambda: flight.in_flight == 1)
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceededError):
+            flight.do("key", slow, Deadline.after(0.05))
+        assert time.monotonic() - started < 1.0
+        release.set()
+        assert leader.result() == ("done", False)
+
+    async def upstream():
+        await asyncio.sleep(0.3)
+        return "done"
+
+    async def main():
+        first = asyncio.ensure_future(flight.ado("key", upstream))
+        await asyncio.sleep(0)
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceededError):
+            await flight.ado("key", upstream, Deadline.after(0.05))
+        elapsed = time.monotonic() - started
+        return elapsed, await first
+
+    elapsed, result = asyncio.run(main())
+    assert elapsed < 0.25
+    assert result == ("done", False)
+    assert flight.in_flight == 0
+
+
+def test_agent_coalesces_identical_requests():
+    """Test that concurrent identical Agent calls make one provider call."""
+    flight = SingleFlight()
+    release = threading.Event()
+    records = []
+    metrics.add_hook(records.append)
+
+    def complete_openai(**kwargs):
+        release.wait()
+        return Completion("Shared answer", "stop", input_tokens=5, output_tokens=2)
+
+    def call(prompt_input):
+        return agent.Agent(
+            agent_name="test_agent", model="gpt-4", provider="openai",
+            api_key="test_key", prompt_input=prompt_input,
+            custom_system_prompt="System", coalesce=flight, return_result=True,
+        )
+
+    try:
+        with patch(
+            "oju.providers.complete_openai", side_effect=complete_openai
+        ) as mock_call, \
+             ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [
+                executor.submit(call, text) for text in ("Hi", "Hi", "Hi", "Other")
+            ]
+            _wait_for(lambda: flight.stats.requests == 4)
+            release.set()
+            results = [f.result() for f in futures]
+    finally:
+        metrics.clear_hooks()
+
+    assert mock_call.call_count == 2
+    assert [r.text for r in results] == ["Shared answer"] * 4
+    assert all(r.output_tokens == 2 for r in results)
+    assert sum(r.coalesced for r in records) == 2
+    assert flight.stats.collapsed == 2
+    aggregator = metrics.MetricsAggregator()
+    for record in records:
+        aggregator(record)
+    stats = aggregator.snapshot()[("test_agent", "openai", "gpt-4")]
+    assert (stats.input_tokens, stats.output_tokens) == (10, 4)
+
+
+def test_agent_without_instrumentation_still_returns_text():
+    """Test that coalesced calls return plain strings by default."""
+    flight = SingleFlight()
+    with patch("oju.providers.complete_claude", return_value=Completion("Hi")):
+        response = agent.Agent(
+            agent_name="test_agent", model="claude-3", provider="claude",
+            api_key="test_key", prompt_input="Hello", custom_system_prompt="System",
+            coalesce=flight,
+        )
+    assert response == "Hi"
+
+
+def test_async_agent_coalesces_identical_requests():
+    """Test that concurrent identical AsyncAgent calls make one provider call."""
+    flight = SingleFlight()
+    calls = []
+
+    async def acomplete_claude(**kwargs):
+        calls.append(kwargs)
+        await asyncio.sleep(0.01)
+        return Completion("Shared answer")
+
+    async def main():
+        return await asyncio.gather(*(
+            agent.AsyncAgent(
+                agent_name="test_agent", model="claude-3", provider="claude",
+                api_key="test_key", prompt_input="Hi", custom_system_prompt="System",
+                coalesce=flight,
+            )
+            for _ in range(3)
+        ))
+
+    with patch("oju.providers.acomplete_claude", acomplete_claude):
+        results = asyncio.run(main())
+
+    assert results == ["Shared answer"] * 3
+    assert len(calls) == 1
+
+
+def test_batch_passes_coalesce_to_agent(fake_sessions):
+    """Test that run_batch forwards the SingleFlight to every call."""
+    flight = SingleFlight()
+    mock_agent = Mock(return_value="ok")
+    with fake_sessions(mock_agent):
+        results = list(run_batch(
+            ["a", "a"], "test_agent", "gpt-4", "openai", "test_key", coalesce=flight
+        ))
+    assert [r.output for r in results] == ["ok", "ok"]
+    assert all(c.kwargs["coalesce"] is flight for c in mock_agent.call_args_list)
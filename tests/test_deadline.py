@@ -0,0 +1,257 @@
+"""Tests for the deadline module."""
+import asyncio
+import threading
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+
+from oju import agent
+from oju.circuit import CircuitBreaker
+from oju.deadline import (
+    CallCancelledError,
+    CancelToken,
+    Deadline,
+    DeadlineExceededError,
+    aguard_stream,
+    call_cancellable,
+    guard_stream,
+    resolve_deadline,
+)
+from oju.providers import call_claude, call_gemini, call_openai
+from oju.retry import RetryPolicy
+from oju.streaming import AsyncTextStream, StreamSummary, TextStream
+
+AGENT_KWARGS = dict(
+    agent_name="test_agent",
+    model="gpt-4",
+    provider="openai",
+    api_key="test_key",
+    prompt_input="Test input",
+    custom_system_prompt="System",
+)
+
+
+def test_deadline_shares_and_expiry():
+    """Test attempt shares, expiry and combining a timeout with a deadline."""
+    deadline = Deadline.after(10)
+    assert deadline.attempt_timeout(4) == pytest.approx(2.5, abs=0.01)
+    assert deadline.attempt_timeout() == pytest.approx(10, abs=0.01)
+    assert not deadline.expired
+
+    passed = Deadline(time.monotonic() - 1, timeout=5)
+    assert passed.expired and passed.remaining() == 0.0
+    with pytest.raises(DeadlineExceededError, match="5s"):
+        passed.attempt_timeout(2)
+
+    assert resolve_deadline(None, deadline) is deadline
+    assert resolve_deadline(1, deadline).remaining() <= 1
+    assert resolve_deadline(60, deadline) is deadline
+    with pytest.raises(ValueError):
+        resolve_deadline(0, None)
+
+
+def test_cancel_token_runs_callbacks_once():
+    """Test cancelling from another thread, removing and late callbacks."""
+    token = CancelToken()
+    aborted, removed = MagicMock(), MagicMock()
+    token.add_callback(aborted)
+    token.add_callback(removed)()
+    token.raise_if_cancelled()
+
+    worker = threading.Thread(target=token.cancel, args=("shutting down",))
+    worker.start()
+    assert token.wait(5)
+    worker.join()
+    token.cancel("again")
+
+    aborted.assert_called_once_with()
+    removed.assert_not_called()
+    assert token.reason == "shutting down"
+    with pytest.raises(CallCancelledError, match="shutting down"):
+        token.raise_if_cancelled()
+    late = MagicMock()
+    token.add_callback(late)
+    late.assert_called_once_with()
+
+
+def test_agent_splits_the_timeout_across_attempts():
+    """Test that each attempt gets a share of the time left and no SDK retries."""
+    retry = RetryPolicy(max_attempts=4, initial_delay=0, jitter=False)
+    with patch(
+        "oju.providers.call_openai", side_effect=[ConnectionError("reset"), "ok"]
+    ) as mock_call:
+        result = agent.Agent(timeout=8, retry=retry, **AGENT_KWARGS)
+
+    assert result == "ok"
+    first, second = (call.kwargs for call in mock_call.call_args_list)
+    assert first["timeout"] == pytest.approx(2.0, abs=0.05)
+    assert second["timeout"] == pytest.approx(8 / 3, abs=0.05)
+    assert first["sdk_retries"] is False and second["sdk_retries"] is False
+
+    with patch("oju.providers.call_openai", return_value="ok") as mock_call:
+        agent.Agent(**AGENT_KWARGS)
+    assert "timeout" not in mock_call.call_args.kwargs
+
+
+def test_agent_raises_when_the_deadline_passes():
+    """Test giving up once the deadline has run out."""
+    def slow_failure(**kwargs):
+        time.sleep(0.1)
+        raise TimeoutError("read timed out")
+
+    retry = RetryPolicy(initial_delay=0, jitter=False)
+    breaker = CircuitBreaker(minimum_calls=1)
+    with patch("oju.providers.call_openai", side_effect=slow_failure) as mock_call:
+        with pytest.raises(DeadlineExceededError):
+            agent.Agent(timeout=0.05, retry=retry, **AGENT_KWARGS)
+        assert mock_call.call_count == 1
+
+        with pytest.raises(DeadlineExceededError):
+            agent.Agent(
+                deadline=Deadline(time.monotonic() - 1),
+                circuit_breaker=breaker,
+                **AGENT_KWARGS,
+            )
+        assert mock_call.call_count == 1
+    # A call given up before it was sent says nothing about the provider
+    assert breaker.health("openai", "gpt-4", "test_key").calls == 0
+
+
+def test_cancel_interrupts_retry_backoff():
+    """Test that a token cancelled from another thread ends the backoff early."""
+    token = CancelToken()
+    retry = RetryPolicy(initial_delay=30, jitter=False, deadline=None)
+    timer = threading.Timer(0.1, token.cancel, args=("overloaded",))
+    with patch(
+        "oju.providers.call_openai", side_effect=ConnectionError("reset")
+    ) as mock_call:
+        timer.start()
+        started = time.monotonic()
+        with pytest.raises(CallCancelledError, match="overloaded"):
+            agent.Agent(retry=retry, cancel=token, **AGENT_KWARGS)
+        assert time.monotonic() - started < 5
+        assert mock_call.call_count == 1
+
+        with pytest.raises(CallCancelledError):
+            agent.Agent(cancel=token, **AGENT_KWARGS)
+        assert mock_call.call_count == 1
+
+
+def test_sync_cancel_releases_the_in_flight_call():
+    """Test that cancelling frees a caller blocked in a provider call."""
+    release = threading.Event()
+    late_stream = MagicMock()
+
+    def hung_call(**kwargs):
+        release.wait(5)
+        return late_stream
+
+    token = CancelToken()
+    timer = threading.Timer(0.05, token.cancel, args=("client went away",))
+    with patch("oju.providers.call_openai", side_effect=hung_call) as mock_call:
+        timer.start()
+        started = time.monotonic()
+        with pytest.raises(CallCancelledError, match="client went away"):
+            agent.Agent(cancel=token, **AGENT_KWARGS)
+        assert time.monotonic() - started < 1
+        assert mock_call.call_count == 1
+
+    # The abandoned request ends in the background and its stream is closed
+    release.set()
+    for _ in range(100):
+        if late_stream.close.called:
+            break
+        time.sleep(0.01)
+    late_stream.close.assert_called_once_with()
+
+    assert call_cancellable(lambda: "ok", CancelToken()) == "ok"
+    with pytest.raises(ConnectionError):
+        call_cancellable(MagicMock(side_effect=ConnectionError("reset")), CancelToken())
+
+
+def test_async_cancel_aborts_the_in_flight_call():
+    """Test that cancelling the token cancels the awaited provider call."""
+    finished = []
+
+    async def hung_call(**kwargs):
+        await asyncio.sleep(30)
+        finished.append(True)
+
+    async def run():
+        token = CancelToken()
+        asyncio.get_running_loop().call_later(0.05, token.cancel)
+        with pytest.raises(CallCancelledError):
+            await agent.AsyncAgent(cancel=token, **AGENT_KWARGS)
+
+    with patch("oju.providers.acall_openai", hung_call):
+        started = time.monotonic()
+        asyncio.run(run())
+    assert time.monotonic() - started < 5
+    assert not finished
+
+
+def test_stream_guards():
+    """Test that guarded streams stop on cancellation and at the deadline."""
+    token = CancelToken()
+    abort = MagicMock()
+    stream = guard_stream(
+        TextStream(iter(["a", "b", "c"]), StreamSummary(), on_close=abort), cancel=token
+    )
+    assert next(stream) == "a"
+    token.cancel()
+    abort.assert_called()
+    with pytest.raises(CallCancelledError):
+        next(stream)
+
+    passed = Deadline(time.monotonic() - 1)
+    stream = guard_stream(TextStream(iter(["a"]), StreamSummary()), deadline=passed)
+    with pytest.raises(DeadlineExceededError):
+        stream.read()
+
+    async def hung_deltas():
+        yield "a"
+        await asyncio.sleep(30)
+        yield "b"
+
+    async def run():
+        token = CancelToken()
+        stream = aguard_stream(
+            AsyncTextStream(hung_deltas(), StreamSummary()), cancel=token
+        )
+        assert await stream.__anext__() == "a"
+        asyncio.get_running_loop().call_later(0.05, token.cancel)
+        with pytest.raises(CallCancelledError):
+            await stream.__anext__()
+
+    asyncio.run(asyncio.wait_for(run(), 5))
+
+
+def test_providers_pass_timeouts_to_the_sdks():
+    """Test the SDK timeout arguments built from a provider timeout."""
+    with patch("oju.providers.OpenAI") as mock_openai:
+        create = mock_openai.return_value.chat.completions.with_raw_response.create
+        create.return_value.choices = [MagicMock()]
+        call_openai("gpt-4", "System", "Hi", "test_key", timeout=60)
+        sent = create.call_args.kwargs["timeout"]
+        assert (sent.connect, sent.read) == (10, 60)
+
+        call_openai("gpt-4", "System", "Hi", "test_key")
+        assert "timeout" not in create.call_args.kwargs
+
+    with patch("oju.providers.anthropic.Anthropic") as mock_anthropic:
+        create = mock_anthropic.return_value.messages.with_raw_response.create
+        create.return_value.content = [MagicMock(text="ok")]
+        call_claude("claude-3", "System", "Hi", "test_key", timeout=2.5)
+        sent = create.call_args.kwargs["timeout"]
+        assert (sent.connect, sent.read) == (2.5, 2.5)
+
+    with patch("oju.providers.genai") as mock_genai, patch("oju.providers.glm"):
+        model = mock_genai.GenerativeModel.return_value
+        model.generate_content.return_value.text = "ok"
+        call_gemini(
+            "gemini-pro", "System", "Hi", "test_key", sdk_retries=False, timeout=5
+        )
+        options = model.generate_content.call_args.kwargs["request_options"]
+        # The time left after the context cache lookup
+        assert options["retry"] is None
+        assert 4.9 < options["timeout"] <= 5
@@ -0,0 +1,259 @@
+"""Tests for the keypool module."""
+import asyncio
+import time
+import pytest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock, patch
+
+from oju import agent
+from oju.deadline import (
+    CallCancelledError,
+    CancelToken,
+    Deadline,
+    DeadlineExceededError,
+)
+from oju.keypool import KeyPool, _parse_reset, mask_key
+from oju.providers import Completion
+from oju.retry import RetryPolicy
+
+
+class StatusError(Exception):
+    """An SDK-style error with an HTTP status code and response headers."""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = Mock(headers=headers or {})
+
+
+def test_keys_take_turns_without_rate_limit_information():
+    """Test that equal keys are used evenly."""
+    pool = KeyPool(["key_a", "key_b", "key_c"])
+    used = []
+    for _ in range(6):
+        key = pool.acquire()
+        used.append(key)
+        pool.release(key)
+
+    assert sorted(used) == ["key_a", "key_a", "key_b", "key_b", "key_c", "key_c"]
+    assert [s.share for s in pool.stats()] == [pytest.approx(1 / 3)] * 3
+
+
+def test_requests_in_flight_spread_over_keys():
+    """Test that a key busy with a request is not picked while others are idle."""
+    pool = KeyPool(["key_a", "key_b"])
+    first = pool.acquire()
+    second = pool.acquire()
+
+    assert {first, second} == {"key_a", "key_b"}
+    assert [s.in_flight for s in pool.stats()] == [1, 1]
+
+
+def test_reported_headroom_steers_requests():
+    """Test that keys with more reported requests left are preferred."""
+    pool = KeyPool(["key_a", "key_b"])
+    pool.observe("key_a", {"x-ratelimit-remaining-requests": "2",
+                           "x-ratelimit-limit-requests": "100",
+                           "x-ratelimit-reset-requests": "30s"})
+    pool.observe("key_b", {"anthropic-ratelimit-requests-remaining": "50",
+                           "anthropic-ratelimit-requests-limit": "100"})
+
+    assert pool.acquire() == "key_b"
+    stats = {s.key: s for s in pool.stats()}
+    assert stats[mask_key("key_b")].remaining_requests == 49
+    assert stats[mask_key("key_a")].utilization == pytest.approx(0.98)
+
+
+def test_exhausted_key_is_pulled_until_reset():
+    """Test that a key reporting no requests left is skipped."""
+    pool = KeyPool(["key_a", "key_b"])
+    pool.observe("key_a", {"x-ratelimit-remaining-requests": "0",
+                           "x-ratelimit-reset-requests": "6m0s"})
+
+    assert all(pool.acquire() == "key_b" for _ in range(3))
+    stats = pool.stats()[0]
+    assert not stats.available and 350 < stats.pulled_for <= 360
+
+
+def test_rate_limited_key_is_pulled_for_retry_after():
+    """Test that a 429 pulls the key and requests move to the others."""
+    pool = KeyPool(["key_a", "key_b"])
+    key = pool.acquire()
+    pool.release(key, StatusError(429, {"retry-after": "30"}))
+
+    other = "key_b" if key == "key_a" else "key_a"
+    assert pool.acquire() == other
+    stats = {s.key: s for s in pool.stats()}[mask_key(key)]
+    assert (stats.rate_limited, stats.failures, stats.available) == (1, 1, False)
+    assert 29 < stats.pulled_for <= 30
+
+
+def test_revoked_key_is_pulled_and_can_be_restored():
+    """Test that 401s pull a key until restore()."""
+    pool = KeyPool(["key_a", "key_b"], revoked_for=600)
+    pool.release(pool.acquire(), ValueError("Invalid OpenAI API key"))
+    key = pool.acquire()
+    error = ValueError("Invalid OpenAI API key")
+    error.__cause__ = StatusError(401)
+    pool.release(key, error)
+
+    stats = {s.key: s for s in pool.stats()}[mask_key(key)]
+    assert stats.revoked and not stats.available
+
+    pool.restore(key)
+    stats = {s.key: s for s in pool.stats()}[mask_key(key)]
+    assert stats.available and not stats.revoked
+
+
+def test_acquire_waits_while_every_key_is_pulled():
+    """Test that requests wait for the first key to come back."""
+    pool = KeyPool(["key_a"])
+    pool.release(pool.acquire(), StatusError(429, {"retry-after-ms": "30"}))
+    waits = []
+
+    started = time.monotonic()
+    assert pool.acquire(on_wait=waits.append) == "key_a"
+    assert time.monotonic() - started >= 0.02
+    assert waits and waits[0] > 0
+
+
+def test_key_waits_respect_the_deadline_and_cancellation():
+    """Test that waiting for a pulled key fails at once past the deadline."""
+    pool = KeyPool(["key_a"])
+    pool.release(pool.acquire(), StatusError(429, {"retry-after": "30"}))
+    token = CancelToken()
+    token.cancel("shutting down")
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        pool.acquire(deadline=Deadline.after(5))
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(pool.aacquire(deadline=Deadline.after(5)))
+    with pytest.raises(CallCancelledError, match="shutting down"):
+        pool.acquire(cancel=token)
+    with pytest.raises(CallCancelledError):
+        asyncio.run(pool.aacquire(cancel=token))
+    assert time.monotonic() - started < 1
+
+
+def test_given_up_attempts_do_not_count_as_key_failures():
+    """Test that cancelled and timed-out attempts release their key cleanly."""
+    pool = KeyPool(["key_a"])
+
+    def given_up(error):
+        def make_call(key):
+            def attempt():
+                raise error
+            return attempt
+        return make_call
+
+    async def agiven_up(error):
+        async def attempt():
+            raise error
+        return await pool.awrap(lambda key: attempt)()
+
+    for error in (CallCancelledError("shed"), DeadlineExceededError(2)):
+        with pytest.raises(type(error)):
+            pool.wrap(given_up(error))()
+        with pytest.raises(type(error)):
+            asyncio.run(agiven_up(error))
+    with pytest.raises(ValueError):
+        pool.wrap(given_up(ValueError("bad request")))()
+
+    [stats] = pool.stats()
+    assert (stats.requests, stats.failures, stats.in_flight) == (5, 1, 0)
+
+
+def test_local_budgets_and_token_headroom():
+    """Test per-minute budgets counted down locally."""
+    pool = KeyPool(["key_a", "key_b"], requests_per_minute=10, tokens_per_minute=1000)
+    pool.release(pool.acquire(tokens=900))
+
+    # key_a has 100 tokens left, so a large request goes to key_b
+    assert pool.acquire(tokens=500) == "key_b"
+    stats = pool.stats()
+    assert [s.remaining_tokens for s in stats] == [100, 500]
+    assert [s.utilization for s in stats] == [pytest.approx(0.1)] * 2
+
+
+def test_parse_reset_formats():
+    """Test the reset header formats of both providers."""
+    assert _parse_reset("1s") == 1.0
+    assert _parse_reset("6m0s") == 360.0
+    assert _parse_reset("20ms") == pytest.approx(0.02)
+    assert _parse_reset("12") == 12.0
+    soon = (datetime.now(timezone.utc) + timedelta(seconds=30)).isoformat()
+    assert 28 < _parse_reset(soon.replace("+00:00", "Z")) <= 30
+    assert _parse_reset("soon") is None
+
+
+def test_invalid_pools_and_masked_keys():
+    """Test validation and that keys never show in full."""
+    with pytest.raises(ValueError):
+        KeyPool([])
+    with pytest.raises(ValueError):
+        KeyPool(["key_a", ""])
+    with pytest.raises(ValueError):
+        KeyPool(["key_a"], requests_per_minute=0)
+
+    pool = KeyPool(["sk-secret-1234", "sk-secret-1234", "sk-secret-5678"])
+    assert len(pool) == 2
+    assert repr(pool) == "KeyPool([...1234, ...5678])"
+    assert [s.key for s in pool.stats()] == ["...1234", "...5678"]
+
+
+def test_agent_retries_on_another_key():
+    """Test that a rate limited attempt is retried with a different key."""
+    pool = KeyPool(["key_a", "key_b"])
+    seen = []
+
+    def complete_openai(**kwargs):
+        seen.append(kwargs["api_key"])
+        if len(seen) == 1:
+            raise StatusError(429)
+        headers = {
+            "x-ratelimit-limit-requests": "10",
+            "x-ratelimit-remaining-requests": "7",
+        }
+        return Completion("Hi", headers=headers)
+
+    with patch("oju.providers.complete_openai", side_effect=complete_openai), \
+         patch("oju.retry.time.sleep"):
+        response = agent.Agent(
+            agent_name="test_agent", model="gpt-4", provider="openai", api_key=pool,
+            prompt_input="Hello", custom_system_prompt="System",
+            retry=RetryPolicy(jitter=False),
+        )
+
+    assert response == "Hi"
+    assert len(set(seen)) == 2
+    stats = {s.key: s for s in pool.stats()}
+    assert sum(s.rate_limited for s in stats.values()) == 1
+    assert all(s.in_flight == 0 for s in stats.values())
+    # The headers of the successful response were observed for its key
+    assert stats[mask_key(seen[1])].remaining_requests == 7
+    assert stats[mask_key(seen[1])].utilization == pytest.approx(0.3)
+
+
+def test_async_agent_uses_the_pool():
+    """Test that AsyncAgent draws keys from the pool."""
+    pool = KeyPool(["key_a", "key_b"])
+    seen = []
+
+    async def acomplete_claude(**kwargs):
+        seen.append(kwargs["api_key"])
+        return Completion("Hi")
+
+    async def main():
+        return await asyncio.gather(*(
+            agent.AsyncAgent(
+                agent_name="test_agent", model="claude-3", provider="claude",
+                api_key=pool, prompt_input="Hello", custom_system_prompt="System",
+            )
+            for _ in range(4)
+        ))
+
+    with patch("oju.providers.acomplete_claude", acomplete_claude):
+        assert asyncio.run(main()) == ["Hi"] * 4
+
+    assert sorted(seen) == ["key_a", "key_a", "key_b", "key_b"]
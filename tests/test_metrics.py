@@ -0,0 +1,245 @@
+"""Tests for the metrics module."""
+import asyncio
+import urllib.request
+import pytest
+from unittest.mock import patch
+
+from oju import agent, metrics
+from oju.cache import ResponseCache
+from oju.metrics import CallMetrics, MetricsAggregator, render_prometheus
+from oju.providers import Completion
+from oju.ratelimit import RateLimiter
+from oju.retry import RetryPolicy
+from oju.streaming import AsyncTextStream, StreamSummary, TextStream
+
+
+@pytest.fixture
+def records():
+    """Collect the CallMetrics emitted during a test."""
+    collected = []
+    metrics.add_hook(collected.append)
+    yield collected
+    metrics.clear_hooks()
+
+
+def _call(**kwargs):
+    return agent.Agent(
+        agent_name="test_agent",
+        model="gpt-4",
+        provider="openai",
+        api_key="test_key",
+        prompt_input="Hello",
+        custom_system_prompt="System",
+        **kwargs,
+    )
+
+
+def test_no_hooks_uses_the_plain_call_path():
+    """Test that uninstrumented calls skip the metrics machinery entirely."""
+    assert metrics.start_call("a", "openai", "gpt-4") is None
+    with patch("oju.providers.call_openai", return_value="Hi") as mock_call, \
+         patch("oju.providers.complete_openai") as mock_complete:
+        assert _call() == "Hi"
+    mock_call.assert_called_once()
+    mock_complete.assert_not_called()
+
+
+def test_agent_reports_tokens_and_timings(records):
+    """Test that a completed call reports usage, ttfb and duration."""
+    completion = Completion("Hi", "stop", input_tokens=12, output_tokens=3)
+    with patch("oju.providers.complete_openai", return_value=completion):
+        assert _call() == "Hi"
+
+    [record] = records
+    identity = (record.agent_name, record.provider, record.model)
+    assert identity == ("test_agent", "openai", "gpt-4")
+    assert (record.input_tokens, record.output_tokens) == (12, 3)
+    assert record.error is None and not record.cache_hit and not record.stream
+    assert 0 <= record.ttfb <= record.duration
+
+
+def test_agent_reports_cache_hits(records):
+    """Test that cache hits are reported without calling the provider."""
+    cache = ResponseCache(max_entries=10)
+    complete = patch("oju.providers.complete_openai", return_value=Completion("Hi"))
+    with complete as mock_call:
+        _call(cache=cache)
+        assert _call(cache=cache) == "Hi"
+
+    mock_call.assert_called_once()
+    assert [r.cache_hit for r in records] == [False, True]
+    assert records[1].ttfb is None
+
+
+def test_agent_reports_retries_and_errors(records):
+    """Test that retries and the innermost error class are reported."""
+    error = ConnectionResetError("reset")
+    complete = patch(
+        "oju.providers.complete_openai", side_effect=[error, Completion("Hi")]
+    )
+    with complete, patch("oju.retry.time.sleep"):
+        assert _call(retry=RetryPolicy(max_attempts=2)) == "Hi"
+    with patch("oju.providers.complete_openai", side_effect=ValueError("bad key")):
+        with pytest.raises(Exception, match="Error getting completion"):
+            _call()
+
+    assert records[0].retries == 1 and records[0].error is None
+    assert records[1].error == "ValueError"
+
+
+def test_agent_reports_queue_wait(records):
+    """Test that time spent waiting on the rate limiter is reported."""
+    limiter = RateLimiter(requests_per_minute=1)
+    limiter.reserve("openai", "gpt-4", "test_key")
+    with patch("oju.providers.complete_openai", return_value=Completion("Hi")), \
+         patch("oju.ratelimit.time.sleep") as mock_sleep:
+        _call(rate_limiter=limiter)
+
+    mock_sleep.assert_called_once()
+    assert records[0].queue_wait > 0
+
+
+def test_agent_stream_reports_when_consumed(records):
+    """Test that streams report their first delta and usage once consumed."""
+    summary = StreamSummary()
+
+    def deltas():
+        yield "Hel"
+        yield "lo"
+        summary.output_tokens = 2
+
+    stream = TextStream(deltas(), summary)
+    with patch("oju.providers.stream_openai", return_value=stream):
+        stream = _call(stream=True)
+        assert records == []
+        assert stream.read() == "Hello"
+
+    [record] = records
+    assert record.stream and record.output_tokens == 2
+    assert 0 <= record.ttfb <= record.duration
+
+
+def test_agent_stream_closed_early_reports_once(records):
+    """Test that closing a stream before the end still emits one record."""
+    with patch("oju.providers.stream_openai",
+               return_value=TextStream(iter(["a", "b"]), StreamSummary())):
+        with _call(stream=True) as stream:
+            next(stream)
+
+    assert len(records) == 1
+
+
+def test_async_agent_reports(records):
+    """Test that AsyncAgent reports calls and streams."""
+    async def acomplete(**kwargs):
+        return Completion("Hi", input_tokens=5)
+
+    async def astream(**kwargs):
+        async def deltas():
+            yield "Hi"
+        return AsyncTextStream(deltas(), StreamSummary())
+
+    async def run():
+        kwargs = dict(agent_name="test_agent", model="claude-3", provider="claude",
+                      api_key="test_key", prompt_input="Hello",
+                      custom_system_prompt="S")
+        assert await agent.AsyncAgent(**kwargs) == "Hi"
+        stream = await agent.AsyncAgent(stream=True, **kwargs)
+        assert await stream.read() == "Hi"
+
+    with patch("oju.providers.acomplete_claude", acomplete), \
+         patch("oju.providers.astream_claude", astream):
+        asyncio.run(run())
+
+    assert [(r.input_tokens, r.stream) for r in records] == [(5, False), (None, True)]
+    assert records[1].ttfb is not None
+
+
+def test_failing_hook_warns():
+    """Test that a broken hook does not break the call."""
+    def broken(record):
+        raise RuntimeError("boom")
+
+    metrics.add_hook(broken)
+    try:
+        with pytest.warns(RuntimeWarning, match="boom"):
+            metrics.emit(CallMetrics("a", "openai", "gpt-4"))
+    finally:
+        metrics.remove_hook(broken)
+
+
+def test_aggregator_and_prometheus_output():
+    """Test counters, histograms and the exposition format."""
+    aggregator = MetricsAggregator(buckets=(0.1, 1.0))
+    aggregator(CallMetrics("a", "openai", "gpt-4", ttfb=0.05, duration=0.5,
+                           input_tokens=10, output_tokens=4, cached_tokens=8,
+                           retries=1))
+    aggregator(CallMetrics("a", "openai", "gpt-4", duration=2.0,
+                           error="RateLimitError"))
+    aggregator(CallMetrics("a", "openai", "gpt-4", duration=0.01, cache_hit=True))
+
+    stats = aggregator.snapshot()[("a", "openai", "gpt-4")]
+    assert (stats.calls, stats.cache_hits, stats.retries) == (3, 1, 1)
+    assert stats.errors == {"RateLimitError": 1}
+    assert stats.duration.cumulative() == [(0.1, 1), (1.0, 2), (float("inf"), 3)]
+    assert stats.queue_wait.count == 2
+
+    text = render_prometheus(aggregator)
+    labels = 'agent="a",provider="openai",model="gpt-4"'
+    assert f"oju_calls_total{{{labels}}} 3" in text
+    assert f"oju_input_tokens_total{{{labels}}} 10" in text
+    assert f"oju_cached_tokens_total{{{labels}}} 8" in text
+    assert f'oju_errors_total{{{labels},error="RateLimitError"}} 1' in text
+    assert f'oju_call_duration_seconds_bucket{{{labels},le="+Inf"}} 3' in text
+    assert f"oju_time_to_first_byte_seconds_count{{{labels}}} 1" in text
+    assert "# TYPE oju_queue_wait_seconds histogram" in text
+
+    aggregator.reset()
+    assert aggregator.snapshot() == {}
+
+
+def test_aggregator_counts_coalesced_usage_once():
+    """Test that callers sharing one provider call do not add its tokens again."""
+    aggregator = MetricsAggregator()
+    for coalesced in (False, True, True, True, True):
+        aggregator(CallMetrics("a", "openai", "gpt-4", input_tokens=100,
+                               output_tokens=50, cached_tokens=20,
+                               coalesced=coalesced))
+
+    stats = aggregator.snapshot()[("a", "openai", "gpt-4")]
+    assert (stats.calls, stats.coalesced) == (5, 4)
+    assert (stats.input_tokens, stats.output_tokens) == (100, 50)
+    assert stats.cached_tokens == 20
+
+
+def test_histogram_quantiles_interpolate_within_buckets():
+    """Test quantile estimates from bucket counts."""
+    histogram = metrics.Histogram(buckets=(0.1, 1.0))
+    assert histogram.quantile(0.5) is None
+
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value)
+    assert histogram.quantile(0.25) == pytest.approx(0.1)
+    assert histogram.quantile(0.5) == pytest.approx(0.55)
+    assert histogram.quantile(0.99) == 1.0
+
+
+def test_label_values_are_escaped():
+    """Test that quotes and backslashes in labels are escaped."""
+    aggregator = MetricsAggregator()
+    aggregator(CallMetrics('say "hi"\\', "openai", "gpt-4"))
+    assert 'agent="say \\"hi\\"\\\\"' in render_prometheus(aggregator)
+
+
+def test_serve_prometheus():
+    """Test that the exporter serves the exposition text on /metrics."""
+    aggregator = MetricsAggregator()
+    aggregator(CallMetrics("a", "openai", "gpt-4"))
+    server = metrics.serve_prometheus(aggregator, port=0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert b"oju_calls_total" in response.read()
+    finally:
+        server.shutdown()
+        server.server_close()
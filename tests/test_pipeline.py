@@ -0,0 +1,160 @@
+"""Tests for the pipeline module."""
+import json
+import pytest
+from unittest.mock import Mock
+
+from oju.pipeline import PipelineProgress, format_progress, run_pipeline
+
+
+class Crash(BaseException):
+    """Stands in for the process dying mid-run."""
+
+
+def _write_jsonl(path, records):
+    path.write_text("".join(json.dumps(r) + "\n" for r in records))
+    return str(path)
+
+
+def _read_jsonl(path):
+    return [json.loads(line) for line in open(path)]
+
+
+def _echo(prompt_input, **kwargs):
+    return f"out:{prompt_input}"
+
+
+def _run(input_path, output_path, **kwargs):
+    return run_pipeline(
+        input_path, output_path, "test_agent", "gpt-4", "openai", "test_key", **kwargs
+    )
+
+
+def test_jsonl_records_are_processed_and_written(tmp_path, fake_sessions):
+    """Test a complete run over a JSONL file."""
+    source = _write_jsonl(tmp_path / "in.jsonl", [{"input": f"q{i}"} for i in range(5)])
+    output = str(tmp_path / "out.jsonl")
+
+    mock_agent = Mock(side_effect=_echo)
+    with fake_sessions(mock_agent) as session_class:
+        progress = _run(
+            source, output, max_concurrency=3, custom_system_prompt="System"
+        )
+
+    lines = sorted(_read_jsonl(output), key=lambda line: line["index"])
+    assert lines == [{"index": i, "output": f"out:q{i}"} for i in range(5)]
+    assert (progress.total, progress.completed, progress.succeeded) == (5, 5, 5)
+    assert mock_agent.call_args.kwargs["custom_system_prompt"] == "System"
+    assert session_class.call_count == 1
+    checkpoint = json.load(open(output + ".checkpoint"))
+    assert (checkpoint["done_through"], checkpoint["done"]) == (5, [])
+
+
+def test_rerun_after_crash_skips_completed_records(tmp_path, fake_sessions):
+    """Test that a crashed run resumes where its checkpoint left off."""
+    source = _write_jsonl(tmp_path / "in.jsonl", [f"q{i}" for i in range(6)])
+    output = str(tmp_path / "out.jsonl")
+
+    def crash_on_q3(prompt_input, **kwargs):
+        if prompt_input == "q3":
+            raise Crash()
+        return _echo(prompt_input)
+
+    with fake_sessions(crash_on_q3):
+        with pytest.raises(Crash):
+            _run(source, output, max_concurrency=1, checkpoint_every=1)
+    assert [line["index"] for line in _read_jsonl(output)] == [0, 1, 2]
+
+    mock_agent = Mock(side_effect=_echo)
+    with fake_sessions(mock_agent):
+        progress = _run(source, output, max_concurrency=2)
+
+    prompts = [c.kwargs["prompt_input"] for c in mock_agent.call_args_list]
+    assert prompts == ["q3", "q4", "q5"]
+    assert sorted(line["index"] for line in _read_jsonl(output)) == list(range(6))
+    assert (progress.skipped, progress.succeeded, progress.completed) == (3, 3, 6)
+
+
+def test_output_past_the_checkpoint_is_dropped(tmp_path, fake_sessions):
+    """Test that lines written after the last checkpoint do not end up twice."""
+    source = _write_jsonl(tmp_path / "in.jsonl", [f"q{i}" for i in range(3)])
+    output = tmp_path / "out.jsonl"
+    with fake_sessions(_echo):
+        _run(source, str(output))
+
+    checkpoint = tmp_path / "out.jsonl.checkpoint"
+    state = json.loads(checkpoint.read_text())
+    first_line = len(output.read_bytes().splitlines(keepends=True)[0])
+    state.update(done_through=1, output_offset=first_line)
+    checkpoint.write_text(json.dumps(state))
+
+    mock_agent = Mock(side_effect=_echo)
+    with fake_sessions(mock_agent):
+        _run(source, str(output))
+
+    assert mock_agent.call_count == 2
+    assert sorted(line["index"] for line in _read_jsonl(output)) == [0, 1, 2]
+
+
+def test_csv_input_with_ids_and_failures(tmp_path, fake_sessions):
+    """Test CSV input, id passthrough and recorded errors."""
+    source = tmp_path / "in.csv"
+    source.write_text('id,question\nA,"Hello, world"\nB,fail\n')
+    output = str(tmp_path / "out.jsonl")
+
+    def answer(prompt_input, **kwargs):
+        if prompt_input == "fail":
+            raise Exception("upstream error")
+        return "ok"
+
+    mock_agent = Mock(side_effect=answer)
+    with fake_sessions(mock_agent):
+        progress = _run(str(source), output, input_field="question", id_field="id")
+
+    lines = sorted(_read_jsonl(output), key=lambda line: line["index"])
+    assert lines == [
+        {"index": 0, "id": "A", "output": "ok"},
+        {"index": 1, "id": "B", "error": "upstream error"},
+    ]
+    assert {c.kwargs["prompt_input"] for c in mock_agent.call_args_list} == {
+        "Hello, world", "fail"
+    }
+    assert (progress.total, progress.succeeded, progress.failed) == (2, 1, 1)
+
+
+def test_progress_reports_throughput_and_eta(tmp_path, fake_sessions):
+    """Test the progress callback."""
+    source = _write_jsonl(tmp_path / "in.jsonl", [f"q{i}" for i in range(4)])
+    reports = []
+
+    with fake_sessions(_echo):
+        _run(source, str(tmp_path / "out.jsonl"), on_progress=reports.append,
+             progress_interval=0)
+
+    assert [r.completed for r in reports] == [1, 2, 3, 4, 4]
+    assert reports[0].total == 4 and reports[0].eta is not None
+    assert reports[-1].eta == 0 and reports[-1].throughput > 0
+
+    line = format_progress(
+        PipelineProgress(total=10, completed=5, succeeded=5, elapsed=2.5)
+    )
+    assert line == "5/10 records, 0 failed, 2.0 records/s, ETA 2s"
+
+
+def test_invalid_inputs(tmp_path, fake_sessions):
+    """Test errors for malformed records and inconsistent checkpoints."""
+    output = tmp_path / "out.jsonl"
+    source = _write_jsonl(tmp_path / "in.jsonl", [{"question": "q"}])
+    with fake_sessions(_echo):
+        with pytest.raises(ValueError, match="no 'input' field"):
+            _run(source, str(output))
+
+    (tmp_path / "out.jsonl.checkpoint").write_text(json.dumps(
+        {"version": 1, "done_through": 1, "done": [], "output_offset": 100}
+    ))
+    with pytest.raises(ValueError, match="shorter than its checkpoint"):
+        _run(source, str(output))
+
+    with pytest.raises(ValueError, match="Unsupported input format"):
+        _run(source, str(output), input_format="xml")
+    with pytest.raises(ValueError, match="stream"):
+        _run(source, str(output), stream=True)
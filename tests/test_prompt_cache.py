@@ -0,0 +1,119 @@
+"""Tests for the prompt_cache module."""
+import os
+import pytest
+from unittest.mock import patch
+
+from oju.prompt_cache import PromptCache
+
+
+@pytest.fixture
+def prompt_root(tmp_path):
+    """Create a prompts directory with two agents."""
+    for name, content in (("alpha", "Alpha prompt\n"), ("beta", "Beta prompt")):
+        prompt_dir = tmp_path / "prompts" / name
+        prompt_dir.mkdir(parents=True)
+        (prompt_dir / "prompt.txt").write_text(content)
+    return tmp_path
+
+
+def _bump_mtime(path):
+    """Move a file's modification time forward so a rewrite is detectable."""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_get_loads_prompt_once(prompt_root):
+    """Test that a cached prompt is served without further file reads."""
+    cache = PromptCache(root_dir=str(prompt_root), check_interval=None)
+
+    assert cache.get("alpha") == "Alpha prompt"
+    with patch("builtins.open") as mock_open, patch("os.stat") as mock_stat:
+        assert cache.get("alpha") == "Alpha prompt"
+        mock_open.assert_not_called()
+        mock_stat.assert_not_called()
+
+
+def test_get_revalidates_by_mtime(prompt_root):
+    """Test that a changed prompt file is reloaded after the check interval."""
+    cache = PromptCache(root_dir=str(prompt_root), check_interval=0)
+    prompt_file = prompt_root / "prompts" / "alpha" / "prompt.txt"
+
+    assert cache.get("alpha") == "Alpha prompt"
+    prompt_file.write_text("Updated prompt")
+    _bump_mtime(prompt_file)
+
+    assert cache.get("alpha") == "Updated prompt"
+
+
+def test_get_skips_revalidation_within_interval(prompt_root):
+    """Test that mtime checks are rate limited by the check interval."""
+    cache = PromptCache(root_dir=str(prompt_root), check_interval=3600)
+    prompt_file = prompt_root / "prompts" / "alpha" / "prompt.txt"
+
+    assert cache.get("alpha") == "Alpha prompt"
+    prompt_file.write_text("Updated prompt")
+    _bump_mtime(prompt_file)
+
+    assert cache.get("alpha") == "Alpha prompt"
+    cache.invalidate("alpha")
+    assert cache.get("alpha") == "Updated prompt"
+
+
+def test_get_missing_and_empty_prompt(prompt_root):
+    """Test errors for missing and empty prompt files."""
+    cache = PromptCache(root_dir=str(prompt_root))
+    empty_dir = prompt_root / "prompts" / "empty"
+    empty_dir.mkdir()
+    (empty_dir / "prompt.txt").write_text("  \n")
+
+    with pytest.raises(FileNotFoundError) as excinfo:
+        cache.get("missing")
+    assert "Prompt file not found" in str(excinfo.value)
+
+    with pytest.raises(ValueError) as excinfo:
+        cache.get("empty")
+    assert "is empty" in str(excinfo.value)
+
+
+def test_get_deleted_prompt_file(prompt_root):
+    """Test that a deleted prompt file is reported on revalidation."""
+    cache = PromptCache(root_dir=str(prompt_root), check_interval=0)
+    assert cache.get("beta") == "Beta prompt"
+
+    os.remove(prompt_root / "prompts" / "beta" / "prompt.txt")
+
+    with pytest.raises(FileNotFoundError):
+        cache.get("beta")
+
+
+def test_preload_all_and_selected(prompt_root):
+    """Test preloading every agent or a chosen subset."""
+    cache = PromptCache(root_dir=str(prompt_root), check_interval=None)
+
+    assert cache.preload(["beta"]) == ["beta"]
+    assert cache.preload() == ["alpha", "beta"]
+
+    with patch("builtins.open") as mock_open:
+        assert cache.get("alpha") == "Alpha prompt"
+        assert cache.get("beta") == "Beta prompt"
+        mock_open.assert_not_called()
+
+
+def test_invalidate_all(prompt_root):
+    """Test that invalidating without a name drops every prompt."""
+    cache = PromptCache(root_dir=str(prompt_root), check_interval=None)
+    cache.preload()
+    for name in ("alpha", "beta"):
+        (prompt_root / "prompts" / name / "prompt.txt").write_text("New")
+
+    cache.invalidate()
+
+    assert cache.get("alpha") == "New"
+    assert cache.get("beta") == "New"
+
+
+def test_packaged_prompts_preload():
+    """Test that the prompts shipped with the package preload cleanly."""
+    cache = PromptCache()
+
+    assert "backend_coding_agent" in cache.preload()
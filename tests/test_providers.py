@@ -1,18 +1,33 @@
 """Tests for the providers module."""
+import asyncio
+import datetime
+import threading
+import time
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 from openai import OpenAIError
-import anthropic
+import anthropic  # noqa: F401
 import google.generativeai as genai
 from google.api_core import exceptions as google_exceptions
 
+from oju.clients import ClientPool
 from oju.providers import (
+    GeminiBackend,
+    GeminiContextCache,
     call_openai,
     call_claude,
-    call_gemini
+    call_gemini,
+    complete_claude,
+    normalize_finish_reason
 )
 
 
+def _raw(response, headers=None, async_parse=False):
+    """Build an SDK raw response that parses to ``response``."""
+    parse = AsyncMock if async_parse else MagicMock
+    return MagicMock(parse=parse(return_value=response), headers=headers or {})
+
+
 def test_call_openai_success():
     """Test successful OpenAI API call."""
     with patch('oju.providers.OpenAI') as mock_openai:
@@ -21,13 +36,15 @@ def test_call_openai_success():
         mock_response = MagicMock()
         mock_choice = MagicMock()
         mock_message = MagicMock()
-        
+
         mock_message.content = "Test response from OpenAI"
         mock_choice.message = mock_message
         mock_response.choices = [mock_choice]
-        mock_client.chat.completions.create.return_value = mock_response
+        mock_client.chat.completions.with_raw_response.create.return_value = _raw(
+            mock_response
+        )
         mock_openai.return_value = mock_client
-        
+
         # Call the function
         response = call_openai(
             model="gpt-4",
@@ -35,22 +52,22 @@ def test_call_openai_success():
             prompt="Test input",
             api_key="test_key"
         )
-        
+
         # Assertions
         assert response == "Test response from OpenAI"
         mock_openai.assert_called_once_with(api_key="test_key")
-        mock_client.chat.completions.create.assert_called_once()
+        mock_client.chat.completions.with_raw_response.create.assert_called_once()
 
 
 def test_call_openai_invalid_key():
     """Test OpenAI API call with invalid API key."""
     with patch('oju.providers.OpenAI') as mock_openai:
         mock_client = MagicMock()
-        mock_client.chat.completions.create.side_effect = OpenAIError(
+        mock_client.chat.completions.with_raw_response.create.side_effect = OpenAIError(
             "Incorrect API key provided"
         )
         mock_openai.return_value = mock_client
-        
+
         with pytest.raises(ValueError) as excinfo:
             call_openai(
                 model="gpt-4",
@@ -58,7 +75,7 @@ def test_call_openai_invalid_key():
                 prompt="Test input",
                 api_key="invalid_key"
             )
-        
+
         assert "Invalid OpenAI API key" in str(excinfo.value)
 
 
@@ -69,12 +86,12 @@ def test_call_claude_success():
         mock_client = MagicMock()
         mock_response = MagicMock()
         mock_content = MagicMock()
-        
+
         mock_content.text = "Test response from Claude"
         mock_response.content = [mock_content]
-        mock_client.messages.create.return_value = mock_response
+        mock_client.messages.with_raw_response.create.return_value = _raw(mock_response)
         mock_anthropic.return_value = mock_client
-        
+
         # Call the function
         response = call_claude(
             model="claude-3-opus-20240229",
@@ -82,11 +99,11 @@ def test_call_claude_success():
             prompt="Test input",
             api_key="test_key"
         )
-        
+
         # Assertions
         assert response == "Test response from Claude"
         mock_anthropic.assert_called_once_with(api_key="test_key")
-        mock_client.messages.create.assert_called_once()
+        mock_client.messages.with_raw_response.create.assert_called_once()
 
 
 def test_call_claude_invalid_key():
@@ -94,7 +111,7 @@ def test_call_claude_invalid_key():
     with patch('oju.providers.anthropic.Anthropic') as mock_anthropic:
         # Create a mock client
         mock_client = MagicMock()
-        
+
         # Create a mock exception that will be raised by the API call
         class MockAPIStatusError(Exception):
             def __init__(self, message, response=None, body=None):
@@ -102,24 +119,26 @@ def test_call_claude_invalid_key():
                 self.response = response
                 self.body = body
                 super().__init__(message)
-        
+
         # Set up the side effect to raise our custom exception
-        mock_client.messages.create.side_effect = MockAPIStatusError(
+        mock_client.messages.with_raw_response.create.side_effect = MockAPIStatusError(
             "Invalid API key",
             response=MagicMock(status_code=401),
             body={"error": {"type": "authentication_error"}}
         )
-        
+
         mock_anthropic.return_value = mock_client
-        
+
         # Import the actual exceptions to patch them
-        from oju.providers import AnthropicError, RateLimitError, APIConnectionError
-        
+        from oju.providers import (  # noqa: F401
+            AnthropicError, RateLimitError, APIConnectionError
+        )
+
         # Patch the exception classes to use our mock
         with patch('oju.providers.AnthropicError', MockAPIStatusError), \
              patch('oju.providers.RateLimitError', MockAPIStatusError), \
              patch('oju.providers.APIConnectionError', MockAPIStatusError):
-            
+
             with pytest.raises(ValueError) as excinfo:
                 call_claude(
                     model="claude-3-opus-20240229",
@@ -127,21 +146,64 @@ def test_call_claude_invalid_key():
                     prompt="Test input",
                     api_key="invalid_key"
                 )
-            
+
             # Verify the error message contains the expected text
             assert "Invalid Anthropic API key" in str(excinfo.value)
 
 
+def test_complete_claude_normalizes_usage():
+    """Test that Claude's cache token counts are folded into input_tokens."""
+    with patch('oju.providers.anthropic.Anthropic') as mock_anthropic:
+        mock_response = MagicMock()
+        mock_response.content = [MagicMock(text="Hi")]
+        mock_response.stop_reason = "end_turn"
+        mock_response.usage.input_tokens = 10
+        mock_response.usage.cache_read_input_tokens = 100
+        mock_response.usage.cache_creation_input_tokens = None
+        mock_response.usage.output_tokens = 2
+        mock_response._request_id = "req_123"
+        headers = {"anthropic-ratelimit-requests-remaining": "49"}
+        messages = mock_anthropic.return_value.messages
+        messages.with_raw_response.create.return_value = _raw(mock_response, headers)
+
+        completion = complete_claude(
+            model="claude-3-opus-20240229",
+            system_prompt="Test system prompt",
+            prompt="Test input",
+            api_key="test_key"
+        )
+
+    assert completion.text == "Hi"
+    assert (completion.input_tokens, completion.cached_tokens) == (110, 100)
+    assert completion.request_id == "req_123"
+    assert completion.headers == headers
+
+
+def test_normalize_finish_reason():
+    """Test that finish reasons share one vocabulary across providers."""
+    assert normalize_finish_reason("stop") == "stop"
+    assert normalize_finish_reason("end_turn") == "stop"
+    assert normalize_finish_reason("STOP") == "stop"
+    assert normalize_finish_reason("length") == "length"
+    assert normalize_finish_reason("max_tokens") == "length"
+    assert normalize_finish_reason("MAX_TOKENS") == "length"
+    assert normalize_finish_reason("SAFETY") == "content_filter"
+    assert normalize_finish_reason("tool_use") == "tool_calls"
+    assert normalize_finish_reason("OTHER") == "other"
+    assert normalize_finish_reason(None) is None
+
+
 def test_call_gemini_success():
     """Test successful Google Gemini API call."""
-    with patch('oju.providers.genai') as mock_genai:
+    with patch('oju.providers.genai') as mock_genai, \
+         patch('oju.providers.glm'):
         # Setup mock response
         mock_model = MagicMock()
         mock_response = MagicMock()
         mock_response.text = "Test response from Gemini"
         mock_model.generate_content.return_value = mock_response
         mock_genai.GenerativeModel.return_value = mock_model
-        
+
         # Call the function
         response = call_gemini(
             model="gemini-pro",
@@ -149,30 +211,39 @@ def test_call_gemini_success():
             prompt="Test input",
             api_key="test_key"
         )
-        
+
         # Assertions
         assert response == "Test response from Gemini"
-        mock_genai.configure.assert_called_once_with(api_key="test_key")
-        mock_genai.GenerativeModel.assert_called_once_with(model_name="gemini-pro")
+        mock_genai.configure.assert_not_called()
+        mock_genai.GenerativeModel.assert_called_once_with(
+            model_name="gemini-pro", system_instruction="Test system prompt"
+        )
         mock_model.generate_content.assert_called_once()
+        assert mock_model.generate_content.call_args[0][0] == "Test input"
 
 
 def test_call_gemini_invalid_key():
     """Test Gemini API call with invalid API key."""
     # Import the actual exception to patch it
-    from oju.providers import google_exceptions
-    
+    from oju.providers import google_exceptions  # noqa: F401
+
     # Create a mock for the exception
     class MockInvalidArgument(Exception):
         pass
-    
+
     # Patch the genai module
-    with patch('oju.providers.genai') as mock_genai:
+    with patch('oju.providers.genai') as mock_genai, \
+         patch('oju.providers.glm'):
         # Set up the side effect to raise our custom exception
-        mock_genai.configure.side_effect = MockInvalidArgument("API key not valid")
-        
+        mock_model = mock_genai.GenerativeModel.return_value
+        mock_model.generate_content.side_effect = MockInvalidArgument(
+            "API key not valid"
+        )
+
         # Patch the exception class to use our mock
-        with patch('oju.providers.google_exceptions.InvalidArgument', MockInvalidArgument):
+        with patch(
+            'oju.providers.google_exceptions.InvalidArgument', MockInvalidArgument
+        ):
             with pytest.raises(ValueError) as excinfo:
                 call_gemini(
                     model="gemini-pro",
@@ -180,7 +251,7 @@ def test_call_gemini_invalid_key():
                     prompt="Test input",
                     api_key="invalid_key"
                 )
-            
+
             # Verify the error message contains the expected text
             assert "Invalid Google AI API key" in str(excinfo.value)
 
@@ -191,20 +262,21 @@ def test_call_gemini_empty_response():
     class MockResponse:
         def __init__(self, text=None):
             self.text = text
-    
+
     # Patch the genai module
-    with patch('oju.providers.genai') as mock_genai:
+    with patch('oju.providers.genai') as mock_genai, \
+         patch('oju.providers.glm'):
         # Setup mock response with empty text
         mock_response = MockResponse(text=None)
-        
+
         # Setup the model mock to return our mock response
         mock_model = MagicMock()
         mock_model.generate_content.return_value = mock_response
-        
+
         # Setup the genai mock
         mock_genai.GenerativeModel.return_value = mock_model
         mock_genai.configure.return_value = None
-        
+
         # Test that the function raises the expected exception
         with pytest.raises(Exception) as excinfo:
             call_gemini(
@@ -213,22 +285,27 @@ def test_call_gemini_empty_response():
                 prompt="Test input",
                 api_key="test_key"
             )
-        
+
         # Verify the exception message contains the expected text
         assert "No response text was returned from Gemini API" in str(excinfo.value)
-        
+
         # Verify the mocks were called as expected
-        mock_genai.configure.assert_called_once_with(api_key="test_key")
-        mock_genai.GenerativeModel.assert_called_once_with(model_name="gemini-pro")
+        mock_genai.configure.assert_not_called()
+        mock_genai.GenerativeModel.assert_called_once_with(
+            model_name="gemini-pro", system_instruction="Test system prompt"
+        )
         mock_model.generate_content.assert_called_once()
 
 
 def test_call_gemini_api_error():
     """Test Gemini API call with API error."""
-    with patch('oju.providers.genai') as mock_genai:
+    with patch('oju.providers.genai') as mock_genai, \
+         patch('oju.providers.glm'):
         # Test PermissionDenied error
-        mock_genai.GenerativeModel.side_effect = google_exceptions.PermissionDenied("Invalid API key")
-        
+        mock_genai.GenerativeModel.side_effect = google_exceptions.PermissionDenied(
+            "Invalid API key"
+        )
+
         with pytest.raises(ValueError) as exc_info:
             call_gemini(
                 model="gemini-pro",
@@ -237,9 +314,11 @@ def test_call_gemini_api_error():
                 api_key="invalid_key"
             )
         assert "Invalid Google AI API key" in str(exc_info.value)
-        
+
         # Test other API error
-        mock_genai.GenerativeModel.side_effect = google_exceptions.InvalidArgument("Invalid argument")
+        mock_genai.GenerativeModel.side_effect = google_exceptions.InvalidArgument(
+            "Invalid argument"
+        )
         with pytest.raises(Exception) as exc_info:
             call_gemini(
                 model="gemini-pro",
@@ -254,9 +333,11 @@ def test_call_openai_general_error():
     """Test OpenAI API call with general error."""
     with patch('oju.providers.OpenAI') as mock_openai:
         mock_client = MagicMock()
-        mock_client.chat.completions.create.side_effect = Exception("General error")
+        mock_client.chat.completions.with_raw_response.create.side_effect = Exception(
+            "General error"
+        )
         mock_openai.return_value = mock_client
-        
+
         with pytest.raises(Exception) as exc_info:
             call_openai(
                 model="gpt-4",
@@ -271,9 +352,11 @@ def test_call_claude_general_error():
     """Test Claude API call with general error."""
     with patch('oju.providers.anthropic.Anthropic') as mock_anthropic:
         mock_client = MagicMock()
-        mock_client.messages.create.side_effect = Exception("General error")
+        mock_client.messages.with_raw_response.create.side_effect = Exception(
+            "General error"
+        )
         mock_anthropic.return_value = mock_client
-        
+
         with pytest.raises(Exception) as exc_info:
             call_claude(
                 model="claude-3-opus-20240229",
@@ -292,13 +375,15 @@ def test_call_openai_successful_response():
         mock_response = MagicMock()
         mock_choice = MagicMock()
         mock_message = MagicMock()
-        
+
         mock_message.content = "Test response"
         mock_choice.message = mock_message
         mock_response.choices = [mock_choice]
-        mock_client.chat.completions.create.return_value = mock_response
+        mock_client.chat.completions.with_raw_response.create.return_value = _raw(
+            mock_response
+        )
         mock_openai.return_value = mock_client
-        
+
         # Call the function
         response = call_openai(
             model="gpt-4",
@@ -306,11 +391,11 @@ def test_call_openai_successful_response():
             prompt="Test input",
             api_key="test_key"
         )
-        
+
         # Verify the response
         assert response == "Test response"
         mock_openai.assert_called_once_with(api_key="test_key")
-        mock_client.chat.completions.create.assert_called_once()
+        mock_client.chat.completions.with_raw_response.create.assert_called_once()
 
 
 def test_call_claude_successful_response():
@@ -320,12 +405,12 @@ def test_call_claude_successful_response():
         mock_client = MagicMock()
         mock_response = MagicMock()
         mock_content = MagicMock()
-        
+
         mock_content.text = "Test response"
         mock_response.content = [mock_content]
-        mock_client.messages.create.return_value = mock_response
+        mock_client.messages.with_raw_response.create.return_value = _raw(mock_response)
         mock_anthropic.return_value = mock_client
-        
+
         # Call the function
         response = call_claude(
             model="claude-3-opus-20240229",
@@ -333,23 +418,24 @@ def test_call_claude_successful_response():
             prompt="Test input",
             api_key="test_key"
         )
-        
+
         # Verify the response
         assert response == "Test response"
         mock_anthropic.assert_called_once_with(api_key="test_key")
-        mock_client.messages.create.assert_called_once()
+        mock_client.messages.with_raw_response.create.assert_called_once()
 
 
 def test_call_gemini_successful_response():
     """Test successful Gemini API call to cover the try block."""
-    with patch('oju.providers.genai') as mock_genai:
+    with patch('oju.providers.genai') as mock_genai, \
+         patch('oju.providers.glm'):
         # Setup mock response
         mock_model = MagicMock()
         mock_response = MagicMock()
         mock_response.text = "Test response"
         mock_model.generate_content.return_value = mock_response
         mock_genai.GenerativeModel.return_value = mock_model
-        
+
         # Call the function
         response = call_gemini(
             model="gemini-pro",
@@ -357,11 +443,13 @@ def test_call_gemini_successful_response():
             prompt="Test input",
             api_key="test_key"
         )
-        
+
         # Verify the response
         assert response == "Test response"
-        mock_genai.configure.assert_called_once_with(api_key="test_key")
-        mock_genai.GenerativeModel.assert_called_once_with(model_name="gemini-pro")
+        mock_genai.configure.assert_not_called()
+        mock_genai.GenerativeModel.assert_called_once_with(
+            model_name="gemini-pro", system_instruction="Test system"
+        )
         mock_model.generate_content.assert_called_once()
 
 
@@ -373,13 +461,15 @@ def test_call_openai_empty_response():
         mock_response = MagicMock()
         mock_choice = MagicMock()
         mock_message = MagicMock()
-        
+
         mock_message.content = None
         mock_choice.message = mock_message
         mock_response.choices = [mock_choice]
-        mock_client.chat.completions.create.return_value = mock_response
+        mock_client.chat.completions.with_raw_response.create.return_value = _raw(
+            mock_response
+        )
         mock_openai.return_value = mock_client
-        
+
         # Call the function
         response = call_openai(
             model="gpt-4",
@@ -387,7 +477,7 @@ def test_call_openai_empty_response():
             prompt="Test input",
             api_key="test_key"
         )
-        
+
         # Verify empty string is returned for empty content
         assert response == ""
 
@@ -397,9 +487,11 @@ def test_call_openai_with_openai_error():
     with patch('oju.providers.OpenAI') as mock_openai:
         # Setup mock to raise OpenAIError
         mock_client = MagicMock()
-        mock_client.chat.completions.create.side_effect = OpenAIError("Test error")
+        mock_client.chat.completions.with_raw_response.create.side_effect = OpenAIError(
+            "Test error"
+        )
         mock_openai.return_value = mock_client
-        
+
         # Test with non-API key related error
         with pytest.raises(Exception) as exc_info:
             call_openai(
@@ -409,9 +501,11 @@ def test_call_openai_with_openai_error():
                 api_key="test_key"
             )
         assert "OpenAI API error: Test error" in str(exc_info.value)
-        
+
         # Test with API key related error
-        mock_client.chat.completions.create.side_effect = OpenAIError("Incorrect API key")
+        mock_client.chat.completions.with_raw_response.create.side_effect = OpenAIError(
+            "Incorrect API key"
+        )
         with pytest.raises(ValueError) as exc_info:
             call_openai(
                 model="gpt-4",
@@ -424,10 +518,13 @@ def test_call_openai_with_openai_error():
 
 def test_call_gemini_permission_denied():
     """Test Gemini API call with PermissionDenied error."""
-    with patch('oju.providers.genai') as mock_genai:
+    with patch('oju.providers.genai') as mock_genai, \
+         patch('oju.providers.glm'):
         # Setup mock to raise PermissionDenied with API key in message
-        mock_genai.GenerativeModel.side_effect = google_exceptions.PermissionDenied("API key not valid")
-        
+        mock_genai.GenerativeModel.side_effect = google_exceptions.PermissionDenied(
+            "API key not valid"
+        )
+
         with pytest.raises(ValueError) as exc_info:
             call_gemini(
                 model="gemini-pro",
@@ -440,10 +537,13 @@ def test_call_gemini_permission_denied():
 
 def test_call_gemini_invalid_argument():
     """Test Gemini API call with InvalidArgument error."""
-    with patch('oju.providers.genai') as mock_genai:
+    with patch('oju.providers.genai') as mock_genai, \
+         patch('oju.providers.glm'):
         # Setup mock to raise InvalidArgument
-        mock_genai.GenerativeModel.side_effect = google_exceptions.InvalidArgument("Invalid argument")
-        
+        mock_genai.GenerativeModel.side_effect = google_exceptions.InvalidArgument(
+            "Invalid argument"
+        )
+
         with pytest.raises(Exception) as exc_info:
             call_gemini(
                 model="gemini-pro",
@@ -452,3 +552,823 @@ def test_call_gemini_invalid_argument():
                 api_key="test_key"
             )
         assert "Google API error: 400 Invalid argument" in str(exc_info.value)
+
+
+def test_call_openai_reuses_pooled_client():
+    """Test that repeated OpenAI calls share one SDK client."""
+    with patch('oju.providers.OpenAI') as mock_openai:
+        mock_client = MagicMock()
+        mock_client.chat.completions.with_raw_response.create.return_value = _raw(
+            MagicMock(choices=[MagicMock(message=MagicMock(content="Test response"))])
+        )
+        mock_openai.return_value = mock_client
+
+        for _ in range(3):
+            call_openai(
+                model="gpt-4",
+                system_prompt="Test system",
+                prompt="Test input",
+                api_key="test_key"
+            )
+
+        mock_openai.assert_called_once_with(api_key="test_key")
+        assert mock_client.chat.completions.with_raw_response.create.call_count == 3
+
+
+def test_call_claude_pools_clients_per_base_url():
+    """Test that Claude clients are pooled per base URL."""
+    with patch('oju.providers.anthropic.Anthropic') as mock_anthropic:
+        messages = mock_anthropic.return_value.messages
+        messages.with_raw_response.create.return_value = _raw(
+            MagicMock(content=[MagicMock(text="Test response")])
+        )
+
+        for base_url in (None, "http://localhost:8000", "http://localhost:8000"):
+            call_claude(
+                model="claude-3-opus-20240229",
+                system_prompt="Test system",
+                prompt="Test input",
+                api_key="test_key",
+                base_url=base_url
+            )
+
+        assert mock_anthropic.call_count == 2
+        mock_anthropic.assert_any_call(api_key="test_key")
+        mock_anthropic.assert_any_call(
+            api_key="test_key", base_url="http://localhost:8000"
+        )
+
+
+def test_call_gemini_uses_per_key_clients():
+    """Test that Gemini calls with different keys use separate clients."""
+    with patch('oju.providers.genai') as mock_genai, \
+         patch('oju.providers.glm') as mock_glm:
+        mock_glm.GenerativeServiceClient.side_effect = lambda **kwargs: MagicMock()
+        mock_genai.GenerativeModel.side_effect = lambda **kwargs: MagicMock(
+            generate_content=MagicMock(return_value=MagicMock(text="Test response"))
+        )
+
+        for api_key in ("key_a", "key_b", "key_a"):
+            call_gemini(
+                model="gemini-pro",
+                system_prompt="Test system",
+                prompt="Test input",
+                api_key=api_key
+            )
+
+        mock_genai.configure.assert_not_called()
+        assert mock_glm.GenerativeServiceClient.call_count == 2
+        mock_glm.GenerativeServiceClient.assert_any_call(
+            client_options={"api_key": "key_a"}
+        )
+        mock_glm.GenerativeServiceClient.assert_any_call(
+            client_options={"api_key": "key_b"}
+        )
+        assert mock_genai.GenerativeModel.call_count == 2
+
+
+def test_gemini_backend_caches_models_per_system_prompt():
+    """Test that models are cached per key, model and system prompt."""
+    with patch('oju.providers.genai') as mock_genai, \
+         patch('oju.providers.glm'):
+        mock_genai.GenerativeModel.side_effect = lambda **kwargs: MagicMock()
+        backend = GeminiBackend(max_models=2)
+
+        first = backend.get_model("key", "gemini-pro", "Prompt A")
+        assert backend.get_model("key", "gemini-pro", "Prompt A") is first
+        second = backend.get_model("key", "gemini-pro", "Prompt B")
+        backend.get_model("key", "gemini-1.5-pro", "Prompt A")
+
+        assert second is not first
+        # "Prompt A" on gemini-pro was evicted by the size bound
+        assert backend.get_model("key", "gemini-pro", "Prompt A") is not first
+        assert mock_genai.GenerativeModel.call_count == 4
+
+
+LARGE_PROMPT = "Review the code carefully. " * 800
+
+
+def test_prompt_caching_threshold_uses_the_token_counter():
+    """Test that cacheability is judged by oju.tokens, like the preflight."""
+    from oju.providers import _cacheable
+    from oju.tokens import count_tokens
+
+    # Short pieces: under the threshold at four characters per token, over it
+    # by the token counter
+    prompt = "a, " * 1000
+    assert count_tokens(prompt, "claude", "claude-3") >= 1024
+    assert _cacheable("claude", "claude-3", prompt)
+    assert not _cacheable("claude", "claude-3", "Short prompt")
+
+
+def test_large_system_prompts_request_prompt_caching():
+    """Test that large system prompts are marked cacheable for Claude and OpenAI."""
+    with patch('oju.providers.anthropic.Anthropic') as mock_anthropic, \
+         patch('oju.providers.OpenAI') as mock_openai:
+        claude_create = mock_anthropic.return_value.messages.with_raw_response.create
+        claude_create.return_value = _raw(MagicMock(content=[MagicMock(text="Hi")]))
+        openai_create = (
+            mock_openai.return_value.chat.completions.with_raw_response.create
+        )
+        openai_create.return_value = _raw(
+            MagicMock(choices=[MagicMock(message=MagicMock(content="Hi"))])
+        )
+        call_claude("claude-3", "Short prompt", "Input", "test_key")
+        call_claude("claude-3", LARGE_PROMPT, "Input", "test_key")
+        call_openai("gpt-4", "Short prompt", "Input", "test_key")
+        call_openai("gpt-4", LARGE_PROMPT, "Input", "test_key")
+
+    small, large = [c.kwargs for c in claude_create.call_args_list]
+    assert small["system"] == "Short prompt"
+    assert large["system"] == [
+        {"type": "text", "text": LARGE_PROMPT, "cache_control": {"type": "ephemeral"}}
+    ]
+    small, large = [
+        c.kwargs for c in openai_create.call_args_list
+    ]
+    assert "prompt_cache_key" not in small
+    assert large["prompt_cache_key"].startswith("oju-")
+    assert large["messages"][0] == {"role": "system", "content": LARGE_PROMPT}
+
+
+def test_gemini_context_cache_lifetime():
+    """Test that cached contents are created once, extended and recreated."""
+    with patch('oju.providers.glm') as mock_glm, \
+         patch('oju.providers.time.monotonic') as mock_time:
+        client = mock_glm.CacheServiceClient.return_value
+        client.create_cached_content.return_value.name = "cachedContents/a"
+        client.update_cached_content.return_value.name = "cachedContents/a"
+        mock_time.return_value = 0.0
+        cache = GeminiContextCache(pool=ClientPool(), ttl=3600, refresh_margin=300)
+
+        assert cache.lookup("key", "gemini-pro", "Short prompt") is None
+        assert cache.lookup("key", "gemini-pro", LARGE_PROMPT) == "cachedContents/a"
+        mock_time.return_value = 3000.0
+        assert cache.lookup("key", "gemini-pro", LARGE_PROMPT) == "cachedContents/a"
+        client.update_cached_content.assert_not_called()
+
+        # Close to expiry the entry is extended
+        mock_time.return_value = 3400.0
+        assert cache.lookup("key", "gemini-pro", LARGE_PROMPT) == "cachedContents/a"
+        assert client.update_cached_content.call_count == 1
+
+        # An entry the service dropped is created again
+        client.update_cached_content.side_effect = Exception("Not found")
+        client.create_cached_content.return_value.name = "cachedContents/b"
+        mock_time.return_value = 7000.0
+        assert cache.lookup("key", "gemini-pro", LARGE_PROMPT) == "cachedContents/b"
+        assert client.create_cached_content.call_count == 2
+        request = client.create_cached_content.call_args.kwargs["cached_content"]
+        mock_glm.CachedContent.assert_called_with(
+            model="models/gemini-pro",
+            system_instruction=mock_glm.Content.return_value,
+            ttl=datetime.timedelta(seconds=3600),
+        )
+        assert request is mock_glm.CachedContent.return_value
+
+
+def test_gemini_context_cache_falls_back_when_caching_fails():
+    """Test that uncacheable prompts are sent inline and not retried at once."""
+    with patch('oju.providers.glm') as mock_glm, \
+         patch('oju.providers.time.monotonic') as mock_time:
+        client = mock_glm.CacheServiceClient.return_value
+        client.create_cached_content.side_effect = Exception(
+            "Model does not support caching"
+        )
+        mock_time.return_value = 0.0
+        cache = GeminiContextCache(pool=ClientPool(), retry_failed_after=600)
+
+        assert cache.lookup("key", "gemini-pro", LARGE_PROMPT) is None
+        assert cache.lookup("key", "gemini-pro", LARGE_PROMPT) is None
+        assert client.create_cached_content.call_count == 1
+        mock_time.return_value = 601.0
+        assert cache.lookup("key", "gemini-pro", LARGE_PROMPT) is None
+        assert client.create_cached_content.call_count == 2
+
+
+def test_gemini_context_cache_lookups_are_bounded_by_the_timeout():
+    """Test that cache RPCs get the timeout and short lookups make none."""
+    with patch('oju.providers.glm') as mock_glm:
+        client = mock_glm.CacheServiceClient.return_value
+        client.create_cached_content.return_value.name = "cachedContents/a"
+        cache = GeminiContextCache(pool=ClientPool(), min_lookup_time=1.0)
+
+        assert cache.lookup("key", "gemini-pro", LARGE_PROMPT, timeout=0.5) is None
+        client.create_cached_content.assert_not_called()
+        assert not cache._failed
+
+        client.create_cached_content.side_effect = google_exceptions.DeadlineExceeded(
+            "timed out"
+        )
+        assert cache.lookup("key", "gemini-pro", LARGE_PROMPT, timeout=5) is None
+        options = client.create_cached_content.call_args.kwargs
+        assert options["retry"] is None
+        assert 0 < options["timeout"] <= 5
+        # Running out of time does not mark the prompt as uncacheable
+        assert not cache._failed
+
+        client.create_cached_content.side_effect = None
+        assert cache.lookup("key", "gemini-pro", LARGE_PROMPT, timeout=5) == (
+            "cachedContents/a"
+        )
+        # A thread that cannot get the lookup lock in time sends the prompt inline
+        cache.clear()
+        key = cache._key("key", "gemini-pro", LARGE_PROMPT, None)
+        with cache._lock:
+            key_lock = cache._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            started = time.monotonic()
+            assert cache.lookup("key", "gemini-pro", LARGE_PROMPT, timeout=1) is None
+            assert time.monotonic() - started < 2
+
+
+def test_gemini_context_cache_async_lookups_honour_base_url():
+    """Test that async lookups on a custom endpoint use the REST cache client."""
+    with patch('oju.providers.glm') as mock_glm:
+        client = mock_glm.CacheServiceClient.return_value
+        client.create_cached_content.return_value.name = "cachedContents/rest"
+        async_client = mock_glm.CacheServiceAsyncClient.return_value
+        async_client.create_cached_content = AsyncMock(
+            return_value=MagicMock(name="created")
+        )
+        async_client.create_cached_content.return_value.name = "cachedContents/grpc"
+        cache = GeminiContextCache(pool=ClientPool())
+
+        async def main():
+            return (
+                await cache.alookup(
+                    "key", "gemini-pro", LARGE_PROMPT, base_url="http://localhost:1"
+                ),
+                await cache.alookup("key", "gemini-pro", LARGE_PROMPT),
+            )
+
+        assert asyncio.run(main()) == ("cachedContents/rest", "cachedContents/grpc")
+        mock_glm.CacheServiceClient.assert_called_once_with(
+            client_options={"api_key": "key", "api_endpoint": "http://localhost:1"},
+            transport="rest",
+        )
+        mock_glm.CacheServiceAsyncClient.assert_called_once_with(
+            client_options={"api_key": "key"}
+        )
+
+
+def test_gemini_context_cache_prunes_entries():
+    """Test that expired entries are dropped and the cache stays bounded."""
+    with patch('oju.providers.glm') as mock_glm, \
+         patch('oju.providers.time.monotonic') as mock_time:
+        client = mock_glm.CacheServiceClient.return_value
+        client.create_cached_content.return_value.name = "cachedContents/a"
+        mock_time.return_value = 0.0
+        cache = GeminiContextCache(pool=ClientPool(), ttl=3600, max_entries=2)
+
+        for model in ("m1", "m2"):
+            cache.lookup("key", model, LARGE_PROMPT)
+        cache.lookup("key", "m1", LARGE_PROMPT)
+        cache.lookup("key", "m3", LARGE_PROMPT)
+        assert [key[2] for key in cache._entries] == ["m1", "m3"]
+        assert len(cache._key_locks) == 2
+
+        mock_time.return_value = 4000.0
+        client.create_cached_content.side_effect = Exception("quota")
+        cache.lookup("key", "m4", LARGE_PROMPT)
+        assert not cache._entries
+        assert list(cache._failed) == list(cache._key_locks)
+
+    with pytest.raises(ValueError):
+        GeminiContextCache(max_entries=0)
+
+
+def test_gemini_backend_binds_the_installed_sdk():
+    """Test the GenerativeModel internals GeminiBackend relies on.
+
+    Fails when a google-generativeai release drops them; update
+    _GEMINI_SDK_REQUIREMENT and the binding together.
+    """
+    pool = ClientPool()
+    model = GeminiBackend(pool=pool).get_model(
+        "key", "gemini-pro", LARGE_PROMPT, cached_content="cachedContents/a"
+    )
+    assert isinstance(model, genai.GenerativeModel)
+    assert model._client is pool.get("gemini", "key", MagicMock)
+    assert model.cached_content == "cachedContents/a"
+    assert model._system_instruction is None
+
+    class OldModel:
+        cached_content = None
+
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+
+    with patch('oju.providers.genai.GenerativeModel', OldModel):
+        with pytest.raises(ImportError, match="google-generativeai>="):
+            GeminiBackend().get_model("key", "gemini-pro", "System")
+
+
+def test_gemini_backend_uses_cached_content():
+    """Test that a model bound to a cached content sends no system instruction."""
+    with patch('oju.providers.genai') as mock_genai, \
+         patch('oju.providers.glm'):
+        mock_genai.GenerativeModel.side_effect = lambda **kwargs: MagicMock()
+        backend = GeminiBackend()
+
+        model = backend.get_model(
+            "key", "gemini-pro", LARGE_PROMPT, cached_content="cachedContents/a"
+        )
+
+        mock_genai.GenerativeModel.assert_called_once_with(model_name="gemini-pro")
+        assert model._cached_content == "cachedContents/a"
+        assert backend.get_model("key", "gemini-pro", LARGE_PROMPT) is not model
+
+
+def test_gemini_backend_concurrent_calls():
+    """Test that concurrent Gemini calls with mixed keys stay isolated."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    with patch('oju.providers.genai') as mock_genai, \
+         patch('oju.providers.glm') as mock_glm:
+        mock_glm.GenerativeServiceClient.side_effect = (
+            lambda client_options: MagicMock(api_key=client_options["api_key"])
+        )
+
+        def make_model(**kwargs):
+            model = MagicMock()
+            model.generate_content.side_effect = lambda prompt, **_: MagicMock(
+                text=model._client.api_key
+            )
+            return model
+
+        mock_genai.GenerativeModel.side_effect = make_model
+        keys = [f"key_{i % 4}" for i in range(64)]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(
+                lambda key: call_gemini(
+                    model="gemini-pro",
+                    system_prompt="Test system",
+                    prompt="Test input",
+                    api_key=key
+                ),
+                keys
+            ))
+
+        assert results == keys
+
+
+def test_acall_openai_success():
+    """Test successful async OpenAI API call."""
+    import asyncio
+    from unittest.mock import AsyncMock
+    from oju.providers import acall_openai
+
+    with patch('oju.providers.AsyncOpenAI') as mock_openai:
+        mock_client = MagicMock()
+        mock_client.chat.completions.with_raw_response.create = AsyncMock(
+            return_value=_raw(MagicMock(
+                choices=[MagicMock(message=MagicMock(content="Test response"))]
+            ))
+        )
+        mock_openai.return_value = mock_client
+
+        async def run():
+            return [
+                await acall_openai(
+                    model="gpt-4",
+                    system_prompt="Test system",
+                    prompt="Test input",
+                    api_key="test_key"
+                )
+                for _ in range(2)
+            ]
+
+        assert asyncio.run(run()) == ["Test response", "Test response"]
+        mock_openai.assert_called_once_with(api_key="test_key")
+        assert mock_client.chat.completions.with_raw_response.create.await_count == 2
+
+
+def test_acall_openai_invalid_key():
+    """Test async OpenAI API call maps errors like the sync path."""
+    import asyncio
+    from unittest.mock import AsyncMock
+    from oju.providers import acall_openai
+
+    with patch('oju.providers.AsyncOpenAI') as mock_openai:
+        mock_openai.return_value.chat.completions.with_raw_response.create = AsyncMock(
+            side_effect=OpenAIError("Incorrect API key provided")
+        )
+
+        with pytest.raises(ValueError) as excinfo:
+            asyncio.run(acall_openai(
+                model="gpt-4",
+                system_prompt="Test system",
+                prompt="Test input",
+                api_key="invalid_key"
+            ))
+
+        assert "Invalid OpenAI API key" in str(excinfo.value)
+
+
+def test_acall_claude_success():
+    """Test successful async Claude API call."""
+    import asyncio
+    from unittest.mock import AsyncMock
+    from oju.providers import acall_claude
+
+    with patch('oju.providers.anthropic.AsyncAnthropic') as mock_anthropic:
+        # Recent Anthropic SDKs parse async raw responses asynchronously
+        mock_anthropic.return_value.messages.with_raw_response.create = AsyncMock(
+            return_value=_raw(
+                MagicMock(content=[MagicMock(text="Test response")]),
+                async_parse=True,
+            )
+        )
+
+        response = asyncio.run(acall_claude(
+            model="claude-3-opus-20240229",
+            system_prompt="Test system",
+            prompt="Test input",
+            api_key="test_key"
+        ))
+
+        assert response == "Test response"
+        mock_anthropic.assert_called_once_with(api_key="test_key")
+        create = mock_anthropic.return_value.messages.with_raw_response.create
+        assert create.call_args[1]["system"] == "Test system"
+
+
+def test_acall_claude_cancellation():
+    """Test that cancelling an async Claude call propagates CancelledError."""
+    import asyncio
+    from oju.providers import acall_claude
+
+    with patch('oju.providers.anthropic.AsyncAnthropic') as mock_anthropic:
+        async def hang(**kwargs):
+            await asyncio.sleep(3600)
+
+        mock_anthropic.return_value.messages.with_raw_response.create = hang
+
+        async def run():
+            task = asyncio.ensure_future(acall_claude(
+                model="claude-3-opus-20240229",
+                system_prompt="Test system",
+                prompt="Test input",
+                api_key="test_key"
+            ))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run())
+
+
+def test_acall_gemini_success():
+    """Test successful async Gemini API call."""
+    import asyncio
+    from unittest.mock import AsyncMock
+    from oju.providers import acall_gemini
+
+    with patch('oju.providers.genai') as mock_genai, \
+         patch('oju.providers.glm') as mock_glm:
+        mock_model = MagicMock()
+        mock_model.generate_content_async = AsyncMock(
+            return_value=MagicMock(text="Test response")
+        )
+        mock_genai.GenerativeModel.return_value = mock_model
+
+        response = asyncio.run(acall_gemini(
+            model="gemini-pro",
+            system_prompt="Test system",
+            prompt="Test input",
+            api_key="test_key"
+        ))
+
+        assert response == "Test response"
+        mock_glm.GenerativeServiceAsyncClient.assert_called_once_with(
+            client_options={"api_key": "test_key"}
+        )
+        async_client = mock_glm.GenerativeServiceAsyncClient.return_value
+        assert mock_model._async_client is async_client
+        mock_model.generate_content.assert_not_called()
+
+
+def test_acall_gemini_permission_denied():
+    """Test async Gemini API call maps errors like the sync path."""
+    import asyncio
+    from unittest.mock import AsyncMock
+    from oju.providers import acall_gemini
+
+    with patch('oju.providers.genai') as mock_genai, \
+         patch('oju.providers.glm'):
+        mock_genai.GenerativeModel.return_value.generate_content_async = AsyncMock(
+            side_effect=google_exceptions.PermissionDenied("API key not valid")
+        )
+
+        with pytest.raises(ValueError) as exc_info:
+            asyncio.run(acall_gemini(
+                model="gemini-pro",
+                system_prompt="Test system",
+                prompt="Test input",
+                api_key="invalid_key"
+            ))
+
+        assert "Invalid Google AI API key" in str(exc_info.value)
+
+
+def _openai_chunk(content=None, finish_reason=None, usage=None):
+    """Build a mock chat completion chunk."""
+    chunk = MagicMock()
+    chunk.usage = usage
+    if content is None and finish_reason is None:
+        chunk.choices = []
+    else:
+        chunk.choices = [MagicMock(
+            delta=MagicMock(content=content), finish_reason=finish_reason
+        )]
+    return chunk
+
+
+def test_stream_openai_success():
+    """Test streaming an OpenAI completion."""
+    from oju.providers import stream_openai
+
+    with patch('oju.providers.OpenAI') as mock_openai:
+        sdk_stream = MagicMock()
+        sdk_stream.__iter__.return_value = iter([
+            _openai_chunk("Hello"),
+            _openai_chunk(" world"),
+            _openai_chunk(finish_reason="stop"),
+            _openai_chunk(usage=MagicMock(prompt_tokens=12, completion_tokens=2)),
+        ])
+        completions = mock_openai.return_value.chat.completions
+        completions.with_raw_response.create.return_value = _raw(sdk_stream)
+
+        stream = stream_openai(
+            model="gpt-4",
+            system_prompt="Test system",
+            prompt="Test input",
+            api_key="test_key"
+        )
+
+        assert list(stream) == ["Hello", " world"]
+        assert stream.summary.finish_reason == "stop"
+        assert stream.summary.input_tokens == 12
+        assert stream.summary.output_tokens == 2
+        call_kwargs = completions.with_raw_response.create.call_args[1]
+        assert call_kwargs["stream"] is True
+        sdk_stream.close.assert_called()
+
+
+def test_stream_openai_invalid_key():
+    """Test that stream errors at request time are translated."""
+    from oju.providers import stream_openai
+
+    with patch('oju.providers.OpenAI') as mock_openai:
+        completions = mock_openai.return_value.chat.completions
+        completions.with_raw_response.create.side_effect = OpenAIError(
+            "Incorrect API key provided"
+        )
+
+        with pytest.raises(ValueError) as excinfo:
+            stream_openai(
+                model="gpt-4",
+                system_prompt="Test system",
+                prompt="Test input",
+                api_key="invalid_key"
+            )
+
+        assert "Invalid OpenAI API key" in str(excinfo.value)
+
+
+def test_stream_claude_early_close():
+    """Test that closing a Claude stream early closes the HTTP stream."""
+    from types import SimpleNamespace
+    from oju.providers import stream_claude
+
+    events = [
+        SimpleNamespace(type="message_start", message=SimpleNamespace(
+            usage=SimpleNamespace(input_tokens=9)
+        )),
+        SimpleNamespace(type="content_block_delta", delta=SimpleNamespace(
+            type="text_delta", text="Hi"
+        )),
+        SimpleNamespace(type="content_block_delta", delta=SimpleNamespace(
+            type="text_delta", text=" there"
+        )),
+        SimpleNamespace(
+            type="message_delta",
+            delta=SimpleNamespace(stop_reason="end_turn"),
+            usage=SimpleNamespace(output_tokens=2)
+        ),
+    ]
+
+    with patch('oju.providers.anthropic.Anthropic') as mock_anthropic:
+        sdk_stream = MagicMock()
+        sdk_stream.__iter__.return_value = iter(events)
+        messages = mock_anthropic.return_value.messages
+        messages.with_raw_response.create.return_value = _raw(sdk_stream)
+
+        stream = stream_claude(
+            model="claude-3-opus-20240229",
+            system_prompt="Test system",
+            prompt="Test input",
+            api_key="test_key"
+        )
+        assert next(stream) == "Hi"
+        assert stream.summary.input_tokens == 9
+        stream.close()
+
+        sdk_stream.close.assert_called()
+        assert not stream.done
+
+        # A fully consumed stream reports the stop reason and usage
+        sdk_stream.__iter__.return_value = iter(events)
+        full = stream_claude(
+            model="claude-3-opus-20240229",
+            system_prompt="Test system",
+            prompt="Test input",
+            api_key="test_key"
+        )
+        assert full.read() == "Hi there"
+        assert full.summary.finish_reason == "end_turn"
+        assert full.summary.output_tokens == 2
+
+
+def test_stream_gemini_success():
+    """Test streaming a Gemini completion."""
+    from types import SimpleNamespace
+    from oju.providers import stream_gemini
+
+    def chunk(text, finish_reason=0, usage=None):
+        return SimpleNamespace(
+            text=text,
+            candidates=[SimpleNamespace(
+                finish_reason=SimpleNamespace(name="STOP") if finish_reason else 0
+            )],
+            usage_metadata=usage
+        )
+
+    with patch('oju.providers.genai') as mock_genai, \
+         patch('oju.providers.glm'):
+        response = MagicMock()
+        response.__iter__.return_value = iter([
+            chunk("Hel"),
+            chunk("lo", finish_reason=1, usage=SimpleNamespace(
+                prompt_token_count=5, candidates_token_count=1
+            )),
+        ])
+        mock_model = mock_genai.GenerativeModel.return_value
+        mock_model.generate_content.return_value = response
+
+        stream = stream_gemini(
+            model="gemini-pro",
+            system_prompt="Test system",
+            prompt="Test input",
+            api_key="test_key"
+        )
+
+        assert list(stream) == ["Hel", "lo"]
+        assert stream.summary.finish_reason == "STOP"
+        assert stream.summary.input_tokens == 5
+        assert mock_model.generate_content.call_args[1]["stream"] is True
+        response._iterator.cancel.assert_called()
+
+
+def test_astream_openai_success():
+    """Test async streaming of an OpenAI completion."""
+    from unittest.mock import AsyncMock
+    from oju.providers import astream_openai
+
+    class FakeAsyncStream:
+        def __init__(self, chunks):
+            self._chunks = iter(chunks)
+            self.close = AsyncMock()
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            try:
+                return next(self._chunks)
+            except StopIteration:
+                raise StopAsyncIteration
+
+    sdk_stream = FakeAsyncStream([
+        _openai_chunk("Hello"),
+        _openai_chunk(finish_reason="length"),
+    ])
+
+    with patch('oju.providers.AsyncOpenAI') as mock_openai:
+        completions = mock_openai.return_value.chat.completions
+        completions.with_raw_response.create = AsyncMock(
+            return_value=_raw(sdk_stream, {"x-ratelimit-remaining-requests": "9"})
+        )
+
+        async def run():
+            stream = await astream_openai(
+                model="gpt-4",
+                system_prompt="Test system",
+                prompt="Test input",
+                api_key="test_key"
+            )
+            return await stream.read(), stream.summary, stream.headers
+
+        text, summary, headers = asyncio.run(run())
+
+    assert text == "Hello"
+    assert summary.finish_reason == "length"
+    assert headers == {"x-ratelimit-remaining-requests": "9"}
+    sdk_stream.close.assert_awaited()
+
+
+def _run_python(code):
+    """Run code in a fresh interpreter and return its stdout."""
+    import subprocess
+    import sys
+
+    result = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", code],
+        capture_output=True, text=True, check=True
+    )
+    return result.stdout.strip()
+
+
+def test_import_does_not_load_provider_sdks():
+    """Test that importing oju modules leaves every provider SDK unloaded."""
+    loaded = _run_python(
+        "import sys\n"
+        "import oju.agent, oju.batch, oju.cache, oju.providers\n"
+        "sdks = ('openai', 'anthropic', 'google.generativeai',\n"
+        "        'google.ai.generativelanguage', 'google.api_core')\n"
+        "print(','.join(m for m in sdks if m in sys.modules))"
+    )
+
+    assert loaded == ""
+
+
+def test_provider_sdk_loaded_on_first_use():
+    """Test that only the provider actually used has its SDK imported."""
+    loaded = _run_python(
+        "import sys\n"
+        "from unittest.mock import patch\n"
+        "from oju import providers\n"
+        "with patch('oju.providers.client_pool') as pool:\n"
+        "    create = pool.get.return_value.chat.completions.with_raw_response.create\n"
+        "    response = create.return_value.parse.return_value\n"
+        "    response.choices[0].message.content = 'ok'\n"
+        "    assert providers.call_openai('gpt-4', 'system', 'input', 'key') == 'ok'\n"
+        "print(','.join(m for m in ('openai', 'anthropic', 'google.generativeai')\n"
+        "               if m in sys.modules))"
+    )
+
+    assert loaded == "openai"
+
+
+def test_import_time_budget():
+    """Guard against import-time regressions of the core modules."""
+    elapsed = float(_run_python(
+        "import time\n"
+        "start = time.perf_counter()\n"
+        "import oju.agent, oju.batch, oju.cache\n"
+        "print(time.perf_counter() - start)"
+    ))
+
+    # Importing every SDK takes seconds; without them this is tens of ms
+    assert elapsed < 0.5
+
+
+def test_missing_sdk_raises_clear_import_error(monkeypatch):
+    """Test the error raised when a provider's SDK is not installed."""
+    import sys
+    from oju import agent, providers
+
+    monkeypatch.setitem(sys.modules, "anthropic", None)
+    for name in ("anthropic", "AnthropicError", "RateLimitError", "APIConnectionError"):
+        monkeypatch.delattr(providers, name, raising=False)
+
+    with pytest.raises(ImportError) as excinfo:
+        call_claude(
+            model="claude-3-opus-20240229",
+            system_prompt="Test system",
+            prompt="Test input",
+            api_key="test_key"
+        )
+    assert "pip install anthropic" in str(excinfo.value)
+
+    # Agent surfaces the setup error instead of wrapping it as a completion error
+    with pytest.raises(ImportError):
+        agent.Agent(
+            agent_name="test_agent",
+            model="claude-3-opus-20240229",
+            provider="claude",
+            api_key="test_key",
+            prompt_input="Test input",
+            custom_system_prompt="Test prompt"
+        )
+
+
+def test_unknown_module_attribute():
+    """Test that unknown attributes still raise AttributeError."""
+    from oju import providers
+
+    with pytest.raises(AttributeError):
+        providers.not_a_provider_symbol
@@ -0,0 +1,241 @@
+"""Tests for the ratelimit module."""
+import asyncio
+import multiprocessing
+import sqlite3
+import threading
+import time
+import pytest
+from unittest.mock import Mock, patch
+
+from oju import agent
+from oju.batch import run_batch
+from oju.deadline import (
+    CallCancelledError,
+    CancelToken,
+    Deadline,
+    DeadlineExceededError,
+)
+from oju.ratelimit import RateLimiter, estimate_tokens
+
+
+def test_estimate_tokens():
+    """Test the rough characters-per-token estimate."""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+
+
+def test_requests_per_minute_queues_instead_of_rejecting():
+    """Test that calls past the burst are given increasing waits."""
+    limiter = RateLimiter(requests_per_minute=60)
+
+    waits = [limiter.reserve("openai", "gpt-4", "key") for _ in range(62)]
+
+    assert waits[:60] == [0.0] * 60
+    assert waits[60] == pytest.approx(1.0, abs=0.05)
+    assert waits[61] == pytest.approx(2.0, abs=0.05)
+
+
+def test_tokens_per_minute_budget():
+    """Test that large requests wait for the token bucket to refill."""
+    limiter = RateLimiter(tokens_per_minute=6000)
+
+    assert limiter.reserve("claude", "claude-3", "key", tokens=6000) == 0.0
+    wait = limiter.reserve("claude", "claude-3", "key", tokens=600)
+    assert wait == pytest.approx(6.0, abs=0.05)
+    # Requests without a token estimate only count against the RPM budget
+    assert limiter.reserve("claude", "claude-3", "key") == 0.0
+
+
+def test_buckets_are_keyed_by_provider_model_and_key():
+    """Test that separate keys, models and providers have separate budgets."""
+    limiter = RateLimiter(requests_per_minute=1)
+    assert limiter.reserve("openai", "gpt-4", "key-a") == 0.0
+    assert limiter.reserve("openai", "gpt-4", "key-b") == 0.0
+    assert limiter.reserve("openai", "gpt-3.5-turbo", "key-a") == 0.0
+    assert limiter.reserve("gemini", "gpt-4", "key-a") == 0.0
+    assert limiter.reserve("openai", "gpt-4", "key-a") > 0
+
+
+def test_limit_overrides():
+    """Test that model limits beat provider limits, which beat the defaults."""
+    limiter = RateLimiter(requests_per_minute=10)
+    limiter.set_limit("openai", requests_per_minute=100)
+    limiter.set_limit("openai", "gpt-4", tokens_per_minute=1000)
+
+    assert limiter.limit_for("claude", "claude-3").requests_per_minute == 10
+    assert limiter.limit_for("openai", "gpt-3.5-turbo").requests_per_minute == 100
+    gpt4 = limiter.limit_for("openai", "gpt-4")
+    assert gpt4.requests_per_minute is None
+    assert gpt4.tokens_per_minute == 1000
+
+    with pytest.raises(ValueError):
+        RateLimiter(requests_per_minute=0)
+
+
+def test_acquire_sleeps_and_aacquire_does_not_block():
+    """Test that sync callers sleep and async callers await the wait."""
+    limiter = RateLimiter(requests_per_minute=600)
+    for _ in range(600):
+        limiter.reserve("openai", "gpt-4", "key")
+
+    with patch("oju.ratelimit.time.sleep") as mock_sleep:
+        waited = limiter.acquire("openai", "gpt-4", "key")
+    mock_sleep.assert_called_once_with(waited)
+    assert waited > 0
+
+    async def run():
+        started = time.monotonic()
+        await asyncio.gather(
+            *(limiter.aacquire("openai", "gpt-4", "key") for _ in range(2))
+        )
+        return time.monotonic() - started
+
+    limiter.clear()
+    for _ in range(600):
+        limiter.reserve("openai", "gpt-4", "key")
+    assert 0.15 < asyncio.run(run()) < 1.0
+
+
+def _reserve_many(path, count, queue):
+    limiter = RateLimiter(requests_per_minute=60, path=path)
+    queue.put([limiter.reserve("openai", "gpt-4", "key") for _ in range(count)])
+
+
+def test_sqlite_backend_shares_budget_between_processes(tmp_path):
+    """Test that processes using the same file draw from one bucket."""
+    path = str(tmp_path / "limits.db")
+    context = multiprocessing.get_context(
+        "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    )
+    queue = context.Queue()
+    workers = [
+        context.Process(target=_reserve_many, args=(path, 40, queue)) for _ in range(2)
+    ]
+    for worker in workers:
+        worker.start()
+    waits = sorted(queue.get(timeout=30) + queue.get(timeout=30))
+    for worker in workers:
+        worker.join()
+
+    assert sum(1 for wait in waits if wait == 0.0) == 60
+    assert waits[-1] == pytest.approx(20.0, abs=1.0)
+
+    RateLimiter(path=path).clear()
+    limiter = RateLimiter(requests_per_minute=60, path=path)
+    assert limiter.reserve("openai", "gpt-4", "key") == 0.0
+
+
+def test_sqlite_backend_closes_its_connections(tmp_path):
+    """Test that reservations from short-lived threads leave no connection open."""
+    opened = []
+    connect = sqlite3.connect
+
+    def tracked(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        opened.append(conn)
+        return conn
+
+    with patch("oju.ratelimit.sqlite3.connect", side_effect=tracked):
+        limiter = RateLimiter(requests_per_minute=600, path=str(tmp_path / "l.db"))
+        threads = [
+            threading.Thread(target=limiter.reserve, args=("openai", "gpt-4", "key"))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        limiter.clear()
+
+    assert len(opened) == 10
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+
+
+def test_waits_end_at_the_deadline_and_give_the_budget_back():
+    """Test that bounded waits fail early and refund their reservation."""
+    limiter = RateLimiter(requests_per_minute=60)
+    for _ in range(60):
+        limiter.reserve("openai", "gpt-4", "key")
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        limiter.acquire("openai", "gpt-4", "key", deadline=Deadline.after(0.5))
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(limiter.aacquire(
+            "openai", "gpt-4", "key", deadline=Deadline.after(0.5)
+        ))
+    assert time.monotonic() - started < 0.4
+
+    token = CancelToken()
+    threading.Timer(0.05, token.cancel).start()
+    with pytest.raises(CallCancelledError):
+        limiter.acquire("openai", "gpt-4", "key", cancel=token)
+    assert time.monotonic() - started < 0.9
+    # Only the first wait of about a second is still queued
+    assert limiter.reserve("openai", "gpt-4", "key") == pytest.approx(1.0, abs=0.1)
+
+    limiter.clear()
+    for _ in range(60):
+        limiter.reserve("openai", "gpt-4", "test_key")
+    with patch("oju.providers.call_openai") as mock_call:
+        with pytest.raises(DeadlineExceededError):
+            agent.Agent(
+                agent_name="test_agent", model="gpt-4", provider="openai",
+                api_key="test_key", prompt_input="Test input",
+                custom_system_prompt="System", rate_limiter=limiter, timeout=0.5,
+            )
+    mock_call.assert_not_called()
+
+
+def test_agent_paces_every_attempt():
+    """Test that Agent acquires the budget with a token estimate before calling."""
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=100000)
+    with patch("oju.providers.call_openai", return_value="Test response"), \
+         patch.object(limiter, "acquire", wraps=limiter.acquire) as mock_acquire:
+        result = agent.Agent(
+            agent_name="test_agent",
+            model="gpt-4",
+            provider="openai",
+            api_key="test_key",
+            prompt_input="Test input",
+            custom_system_prompt="System",
+            rate_limiter=limiter,
+        )
+
+    assert result == "Test response"
+    # 2 tokens of system prompt, 3 of input, 16 of request overhead and the
+    # 2000 max_tokens of output
+    mock_acquire.assert_called_once_with(
+        "openai", "gpt-4", "test_key", 2021, None, None
+    )
+
+
+def test_async_agent_and_batch_use_the_limiter(fake_sessions):
+    """Test the async path and the batch pass-through."""
+    limiter = RateLimiter(requests_per_minute=60)
+
+    async def acall_claude(**kwargs):
+        return "Test response"
+
+    with patch("oju.providers.acall_claude", acall_claude), \
+         patch.object(limiter, "aacquire", wraps=limiter.aacquire) as mock_aacquire:
+        asyncio.run(agent.AsyncAgent(
+            agent_name="test_agent",
+            model="claude-3-opus",
+            provider="claude",
+            api_key="test_key",
+            prompt_input="Test input",
+            custom_system_prompt="System",
+            rate_limiter=limiter,
+        ))
+    assert mock_aacquire.call_count == 1
+
+    mock_agent = Mock(return_value="ok")
+    with fake_sessions(mock_agent):
+        list(run_batch(
+            ["x"], "test_agent", "gpt-4", "openai", "test_key", rate_limiter=limiter
+        ))
+    assert mock_agent.call_args.kwargs["rate_limiter"] is limiter
@@ -0,0 +1,244 @@
+"""Tests for the retry module."""
+import asyncio
+import pytest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import anthropic
+import openai
+
+from oju import agent, providers
+from oju.retry import RetryPolicy, RetryStats, is_retryable, retry_after
+
+
+def _status_error(status, headers=None):
+    response = SimpleNamespace(status_code=status, headers=headers or {}, request=None)
+    return openai.APIStatusError("error", response=response, body=None)
+
+
+def _wrapped(error):
+    """Raise and return the error the way providers.py chains SDK errors."""
+    try:
+        try:
+            raise error
+        except Exception as e:
+            raise Exception(f"OpenAI API error: {e}") from e
+    except Exception as wrapped:
+        return wrapped
+
+
+def test_is_retryable_classifies_status_codes():
+    """Test that rate limits and 5xx are retried but client errors are not."""
+    for status in (408, 409, 429, 500, 503, 529):
+        assert is_retryable(_status_error(status)), status
+    for status in (400, 401, 403, 404, 422):
+        assert not is_retryable(_status_error(status)), status
+
+
+def test_is_retryable_follows_the_cause_chain():
+    """Test that provider wrappers are classified by the SDK error they wrap."""
+    assert is_retryable(_wrapped(_status_error(429)))
+    assert not is_retryable(_wrapped(_status_error(401)))
+    assert not is_retryable(ValueError("Invalid OpenAI API key"))
+
+
+def test_is_retryable_connection_errors():
+    """Test that connection failures from every SDK are retried."""
+    assert is_retryable(openai.APIConnectionError(request=None))
+    assert is_retryable(anthropic.APIConnectionError(request=None))
+    assert is_retryable(ConnectionResetError())
+
+    from google.api_core import exceptions as google_exceptions
+    assert is_retryable(google_exceptions.ServiceUnavailable("down"))
+    assert is_retryable(google_exceptions.ResourceExhausted("quota"))
+    assert not is_retryable(google_exceptions.InvalidArgument("bad"))
+
+
+def test_retry_after_headers():
+    """Test parsing of retry-after-ms, retry-after seconds and HTTP dates."""
+    assert retry_after(_status_error(429, {"retry-after-ms": "250"})) == 0.25
+    assert retry_after(_wrapped(_status_error(429, {"retry-after": "3"}))) == 3.0
+    date_error = _status_error(429, {"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})
+    assert retry_after(date_error) == 0.0
+    assert retry_after(_status_error(429)) is None
+    assert retry_after(RuntimeError("no response")) is None
+
+
+def test_backoff_grows_and_is_capped():
+    """Test exponential growth, the per-delay cap and full jitter bounds."""
+    policy = RetryPolicy(initial_delay=1.0, max_delay=5.0, jitter=False)
+    assert [policy.delay(n) for n in range(1, 6)] == [1.0, 2.0, 4.0, 5.0, 5.0]
+
+    jittered = RetryPolicy(initial_delay=1.0, max_delay=5.0)
+    assert all(0 <= jittered.delay(3) <= 4.0 for _ in range(100))
+
+    hinted = RetryPolicy(max_retry_after=10.0)
+    assert hinted.delay(1, _status_error(429, {"retry-after": "120"})) == 10.0
+
+
+def test_call_retries_until_success():
+    """Test that transient errors are retried and recorded in the stats."""
+    func = MagicMock(side_effect=[_status_error(503), _status_error(429), "ok"])
+    stats = RetryStats()
+
+    with patch("oju.retry.time.sleep") as mock_sleep:
+        result = RetryPolicy(jitter=False).call(func, stats)
+
+    assert result == "ok"
+    assert stats.attempts == 3
+    assert stats.retries == 2
+    assert stats.errors == ["APIStatusError", "APIStatusError"]
+    assert stats.total_delay == 1.5
+    assert [c.args[0] for c in mock_sleep.call_args_list] == [0.5, 1.0]
+
+
+def test_call_does_not_retry_non_retryable_errors():
+    """Test that auth failures are raised after a single attempt."""
+    func = MagicMock(side_effect=_wrapped(_status_error(401)))
+    stats = RetryStats()
+
+    with patch("oju.retry.time.sleep") as mock_sleep:
+        with pytest.raises(Exception, match="OpenAI API error"):
+            RetryPolicy().call(func, stats)
+
+    assert func.call_count == 1
+    assert stats.retries == 0
+    mock_sleep.assert_not_called()
+
+
+def test_call_stops_at_max_attempts_and_deadline():
+    """Test that retries end at max_attempts or when the deadline would pass."""
+    func = MagicMock(side_effect=_status_error(500))
+    with patch("oju.retry.time.sleep"):
+        with pytest.raises(openai.APIStatusError):
+            RetryPolicy(max_attempts=3).call(func)
+    assert func.call_count == 3
+
+    func = MagicMock(side_effect=_status_error(429, {"retry-after": "30"}))
+    stats = RetryStats()
+    with patch("oju.retry.time.sleep") as mock_sleep:
+        with pytest.raises(openai.APIStatusError):
+            RetryPolicy(deadline=10.0).call(func, stats)
+    assert func.call_count == 1
+    mock_sleep.assert_not_called()
+
+
+def test_acall_retries_coroutines():
+    """Test the async retry loop."""
+    attempts = []
+
+    async def func():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise _status_error(502)
+        return "ok"
+
+    stats = RetryStats()
+    policy = RetryPolicy(initial_delay=0.001, jitter=False)
+    assert asyncio.run(policy.acall(func, stats)) == "ok"
+    assert stats.attempts == 3
+
+
+def test_invalid_policy():
+    """Test that nonsensical policies are rejected."""
+    with pytest.raises(ValueError):
+        RetryPolicy(max_attempts=0)
+    with pytest.raises(ValueError):
+        RetryPolicy(initial_delay=-1)
+
+
+def test_agent_retries_and_disables_sdk_retries():
+    """Test that Agent applies the policy and turns off the SDK's retries."""
+    stats = RetryStats()
+    with patch("oju.providers.call_openai") as mock_call, \
+         patch("oju.retry.time.sleep"):
+        mock_call.side_effect = [_wrapped(_status_error(429)), "Test response"]
+        result = agent.Agent(
+            agent_name="test_agent",
+            model="gpt-4",
+            provider="openai",
+            api_key="test_key",
+            prompt_input="Test input",
+            custom_system_prompt="System",
+            retry=RetryPolicy(),
+            retry_stats=stats,
+        )
+
+    assert result == "Test response"
+    assert stats.retries == 1
+    mock_call.assert_called_with(
+        model="gpt-4",
+        system_prompt="System",
+        prompt="Test input",
+        api_key="test_key",
+        sdk_retries=False,
+    )
+
+
+def test_agent_reports_final_error_after_retries():
+    """Test that the usual completion error is raised once retries run out."""
+    with patch("oju.providers.call_claude") as mock_call, \
+         patch("oju.retry.time.sleep"):
+        mock_call.side_effect = _wrapped(_status_error(503))
+        with pytest.raises(Exception, match="Error getting completion from claude"):
+            agent.Agent(
+                agent_name="test_agent",
+                model="claude-3-opus",
+                provider="claude",
+                api_key="test_key",
+                prompt_input="Test input",
+                custom_system_prompt="System",
+                retry=RetryPolicy(max_attempts=2),
+            )
+    assert mock_call.call_count == 2
+
+
+def test_async_agent_retries():
+    """Test that AsyncAgent applies the policy to the async provider call."""
+    stats = RetryStats()
+    mock_call = MagicMock()
+
+    async def acall_gemini(**kwargs):
+        mock_call(**kwargs)
+        if mock_call.call_count == 1:
+            raise ConnectionResetError()
+        return "Test response"
+
+    with patch("oju.providers.acall_gemini", acall_gemini):
+        result = asyncio.run(agent.AsyncAgent(
+            agent_name="test_agent",
+            model="gemini-pro",
+            provider="gemini",
+            api_key="test_key",
+            prompt_input="Test input",
+            custom_system_prompt="System",
+            retry=RetryPolicy(initial_delay=0.001),
+            retry_stats=stats,
+        ))
+
+    assert result == "Test response"
+    assert stats.attempts == 2
+    assert mock_call.call_args.kwargs["sdk_retries"] is False
+
+
+def test_providers_disable_sdk_retries():
+    """Test that sdk_retries=False reaches each SDK without changing defaults."""
+    with patch("oju.providers.OpenAI") as mock_openai:
+        client = mock_openai.return_value
+        no_retry = client.with_options.return_value
+        raw = no_retry.chat.completions.with_raw_response.create.return_value
+        raw.parse.return_value = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="Hi"))]
+        )
+        response = providers.call_openai("gpt-4", "S", "P", "key", sdk_retries=False)
+        assert response == "Hi"
+        client.with_options.assert_called_once_with(max_retries=0)
+
+    with patch("oju.providers.genai") as mock_genai, patch("oju.providers.glm"):
+        model = mock_genai.GenerativeModel.return_value
+        model.generate_content.return_value.text = "Hi"
+        providers.call_gemini("gemini-pro", "S", "P", "key", sdk_retries=False)
+        options = model.generate_content.call_args.kwargs["request_options"]
+        assert options == {"retry": None}
+        providers.call_gemini("gemini-pro", "S", "P", "key")
+        assert "request_options" not in model.generate_content.call_args.kwargs
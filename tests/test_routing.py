@@ -0,0 +1,194 @@
+"""Tests for the routing module."""
+import asyncio
+import threading
+import time
+import pytest
+
+from oju.deadline import CallCancelledError, CancelToken
+from oju.routing import Router, Target
+
+PRIMARY = Target("openai", "gpt-4", "openai_key")
+SECONDARY = Target("claude", "claude-3", "claude_key")
+TERTIARY = Target("gemini", "gemini-pro", "gemini_key", base_url="http://localhost:1")
+
+
+def _fake_agent(behaviour):
+    """Build an Agent stand-in mapping provider to (delay, result or error)."""
+    calls = []
+
+    def call(**kwargs):
+        calls.append(kwargs)
+        delay, outcome = behaviour[kwargs["provider"]]
+        time.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return call, calls
+
+
+def test_first_target_answers_without_hedging(fake_sessions):
+    """Test that a fast primary is the only target used."""
+    fake, calls = _fake_agent({"openai": (0, "primary")})
+    with Router([PRIMARY, SECONDARY], hedge_after=1.0) as router, \
+         fake_sessions(fake):
+        assert router.run("test_agent", "Hello", retry=None) == "primary"
+
+    assert [c["provider"] for c in calls] == ["openai"]
+    assert calls[0]["api_key"] == "openai_key" and calls[0]["retry"] is None
+    stats = router.stats()
+    assert (stats[PRIMARY].requests, stats[PRIMARY].wins) == (1, 1)
+    assert stats[SECONDARY].requests == 0
+    assert stats[PRIMARY].p50 is not None
+
+
+def test_slow_target_is_hedged_and_loses(fake_sessions):
+    """Test that a hedge goes out after the threshold and the faster answer wins."""
+    fake, calls = _fake_agent({"openai": (0.5, "primary"), "claude": (0, "hedge")})
+    with Router([PRIMARY, SECONDARY], hedge_after=0.02) as router, \
+         fake_sessions(fake):
+        started = time.perf_counter()
+        assert router.run("test_agent", "Hello") == "hedge"
+        assert time.perf_counter() - started < 0.4
+
+    stats = router.stats()
+    assert (stats[SECONDARY].hedges, stats[SECONDARY].wins) == (1, 1)
+    assert stats[PRIMARY].cancelled == 1 and stats[PRIMARY].wins == 0
+
+
+def test_sync_losers_are_cancelled(fake_sessions):
+    """Test that a losing sync request's token is cancelled, freeing its thread."""
+    released = threading.Event()
+
+    def fake(**kwargs):
+        if kwargs["provider"] == "openai":
+            if kwargs["cancel"].wait(5):
+                released.set()
+                kwargs["cancel"].raise_if_cancelled()
+            return "primary"
+        return "hedge"
+
+    with Router([PRIMARY, SECONDARY], hedge_after=0.02) as router, \
+         fake_sessions(fake):
+        assert router.run("test_agent", "Hello") == "hedge"
+        assert released.wait(1)
+
+    assert router.stats()[PRIMARY].cancelled == 1
+
+    caller = CancelToken()
+
+    def hung(**kwargs):
+        kwargs["cancel"].wait(5)
+        kwargs["cancel"].raise_if_cancelled()
+
+    with Router([PRIMARY, SECONDARY]) as router, fake_sessions(hung):
+        threading.Timer(0.05, caller.cancel).start()
+        with pytest.raises(CallCancelledError):
+            router.run("test_agent", "Hello", cancel=caller)
+
+    # The second target is not tried once the caller has given up
+    assert router.stats()[SECONDARY].requests == 0
+
+
+def test_failures_fall_through_to_the_next_target(fake_sessions):
+    """Test that an erroring target hands over at once, without hedging."""
+    fake, calls = _fake_agent({
+        "openai": (0, Exception("outage")),
+        "claude": (0, Exception("overloaded")),
+        "gemini": (0, "fallback"),
+    })
+    with Router([PRIMARY, SECONDARY, TERTIARY]) as router, \
+         fake_sessions(fake):
+        assert router.run("test_agent", "Hello") == "fallback"
+
+    assert [c["provider"] for c in calls] == ["openai", "claude", "gemini"]
+    assert calls[2]["base_url"] == "http://localhost:1"
+    stats = router.stats()
+    assert [stats[t].failures for t in (PRIMARY, SECONDARY, TERTIARY)] == [1, 1, 0]
+    assert stats[TERTIARY].hedges == 0
+
+
+def test_all_targets_failing_raises(fake_sessions):
+    """Test the error raised when no target answers."""
+    fake, _ = _fake_agent(
+        {"openai": (0, Exception("outage")), "claude": (0, ValueError("bad"))}
+    )
+    with Router([PRIMARY, SECONDARY], hedge_after=0.01) as router, \
+         fake_sessions(fake):
+        with pytest.raises(Exception, match="All routing targets failed") as exc_info:
+            router.run("test_agent", "Hello")
+
+    assert "openai:gpt-4: outage" in str(exc_info.value)
+    assert isinstance(exc_info.value.__cause__, ValueError)
+
+
+def test_async_hedge_cancels_the_loser(fake_sessions):
+    """Test that async losers are cancelled once a hedge wins."""
+    cancelled = threading.Event()
+
+    async def fake_async_agent(**kwargs):
+        if kwargs["provider"] == "openai":
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        return kwargs["provider"]
+
+    router = Router([PRIMARY, SECONDARY], hedge_after=0.01)
+    with fake_sessions(fake_async_agent):
+        async def main():
+            result = await router.arun("test_agent", "Hello")
+            await asyncio.sleep(0)
+            return result
+
+        assert asyncio.run(main()) == "claude"
+
+    assert cancelled.is_set()
+    stats = router.stats()
+    assert (stats[PRIMARY].cancelled, stats[SECONDARY].wins) == (1, 1)
+
+
+def test_async_fallback_and_total_failure(fake_sessions):
+    """Test fall-through and the all-failed error on the async path."""
+    async def fake_async_agent(**kwargs):
+        if kwargs["provider"] != "gemini":
+            raise Exception(f"{kwargs['provider']} down")
+        return "fallback"
+
+    with fake_sessions(fake_async_agent):
+        router = Router([PRIMARY, SECONDARY, TERTIARY])
+        assert asyncio.run(router.arun("test_agent", "Hello")) == "fallback"
+
+        router = Router([PRIMARY, SECONDARY])
+        with pytest.raises(Exception, match="All routing targets failed"):
+            asyncio.run(router.arun("test_agent", "Hello"))
+
+
+def test_targets_reuse_their_session(fake_sessions):
+    """Test that each target builds its session once for repeated calls."""
+    fake, calls = _fake_agent({"openai": (0, Exception("outage")), "claude": (0, "ok")})
+    with Router([PRIMARY, SECONDARY]) as router, \
+         fake_sessions(fake) as session_class:
+        for question in ("a", "b", "c"):
+            assert router.run(
+                "test_agent", question, custom_system_prompt="System",
+                return_result=False,
+            ) == "ok"
+        assert session_class.call_count == 2
+        router.run("test_agent", "d", custom_system_prompt="Other")
+        assert session_class.call_count == 4
+
+    assert [c["prompt_input"] for c in calls[:2]] == ["a", "a"]
+    assert calls[0]["return_result"] is False
+
+
+def test_invalid_configuration():
+    """Test argument validation."""
+    with pytest.raises(ValueError):
+        Router([])
+    with pytest.raises(ValueError):
+        Router([PRIMARY], hedge_after=-1)
+    with pytest.raises(ValueError, match="stream"):
+        Router([PRIMARY]).run("test_agent", "Hello", stream=True)
+    assert "openai_key" not in repr(PRIMARY)
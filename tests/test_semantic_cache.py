@@ -0,0 +1,162 @@
+"""Tests for the semantic_cache module."""
+import os
+import pytest
+from unittest.mock import patch
+
+np = pytest.importorskip("numpy")
+
+from oju import agent  # noqa: E402
+from oju.semantic_cache import HashingEmbedder, SemanticCache  # noqa: E402
+
+SCOPE = SemanticCache.make_scope("openai", "gpt-4", "System", {"temperature": 0.7})
+
+
+def test_hashing_embedder():
+    """Test that rephrasings embed close together and unrelated text does not."""
+    embedder = HashingEmbedder(dimensions=256)
+    vectors = embedder([
+        "What is a REST API?",
+        "what is a rest API",
+        "What is a REST API exactly?",
+        "How do I bake bread?",
+    ])
+
+    assert vectors.shape == (4, 256) and vectors.dtype == np.float32
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+    similarities = vectors @ vectors.T
+    assert similarities[0, 1] == pytest.approx(1.0)
+    assert similarities[0, 2] > 0.85
+    assert similarities[0, 3] < 0.2
+    assert np.array_equal(embedder(["What is a REST API?"])[0], vectors[0])
+
+
+def test_fitted_idf_discounts_common_words():
+    """Test that words shared by the corpus count for less after fitting."""
+    topics = ("rest", "grpc", "graphql", "soap")
+    corpus = [f"please explain {topic}" for topic in topics]
+    plain = HashingEmbedder(ngrams=1)
+    fitted = HashingEmbedder(ngrams=1).fit(corpus)
+
+    def similarity(embedder):
+        a, b = embedder(["please explain rest", "please explain grpc"])
+        return float(a @ b)
+
+    assert similarity(fitted) < similarity(plain)
+    with pytest.raises(ValueError):
+        HashingEmbedder(dimensions=0)
+
+
+def test_lookup_thresholds_and_scopes():
+    """Test hits above the threshold, per-agent thresholds and scope isolation."""
+    cache = SemanticCache(threshold=0.85, thresholds={"strict_agent": 0.99})
+    cache.set(SCOPE, "What is a REST API?", "REST answer")
+
+    match = cache.get(SCOPE, "What is a REST API exactly?")
+    assert match.response == "REST answer" and match.prompt == "What is a REST API?"
+    assert 0.85 <= match.similarity < 0.99
+    assert cache.get(SCOPE, "What is a REST API exactly?", "strict_agent") is None
+    assert cache.get(SCOPE, "How do I bake bread?") is None
+    other_scope = SemanticCache.make_scope("openai", "gpt-4", "Other system")
+    assert cache.get(other_scope, "What is a REST API?") is None
+
+    stats = cache.stats
+    assert (stats.hits, stats.misses, stats.writes) == (1, 3, 1)
+    assert cache.threshold_for("strict_agent") == 0.99
+
+
+def test_batched_lookup():
+    """Test that several prompts are looked up with one matrix product."""
+    cache = SemanticCache()
+    cache.set(SCOPE, "What is a REST API?", "REST")
+    cache.set(SCOPE, "How do I bake bread?", "Bread")
+
+    matches = cache.get_many(
+        SCOPE, ["how do I bake bread", "What is gRPC?", "what is a rest api"]
+    )
+
+    assert [m.response if m else None for m in matches] == ["Bread", None, "REST"]
+
+
+def test_least_recently_used_entry_is_evicted():
+    """Test capacity eviction."""
+    cache = SemanticCache(max_entries=2)
+    cache.set(SCOPE, "What is a REST API?", "REST")
+    cache.set(SCOPE, "How do I bake bread?", "Bread")
+    assert cache.get(SCOPE, "What is a REST API?").response == "REST"
+    cache.set(SCOPE, "What is gRPC?", "gRPC")
+
+    assert len(cache) == 2 and cache.stats.evictions == 1
+    assert cache.get(SCOPE, "How do I bake bread?") is None
+    assert cache.get(SCOPE, "What is gRPC?").response == "gRPC"
+
+
+def test_saved_index_is_memory_mapped_on_startup(tmp_path):
+    """Test persistence, memory-mapped loading and writes after loading."""
+    path = str(tmp_path / "semantic")
+    cache = SemanticCache(path=path)
+    cache.set(SCOPE, "What is a REST API?", "REST")
+    cache.set(SCOPE, "How do I bake bread?", "Bread")
+    cache.save()
+
+    loaded = SemanticCache(path=path, max_entries=2)
+    assert isinstance(loaded._vectors, np.memmap)
+    assert loaded.get(SCOPE, "what is a rest api").response == "REST"
+
+    loaded.set(SCOPE, "What is gRPC?", "gRPC")
+    assert loaded.stats.evictions == 1
+    loaded.save()
+    assert len([f for f in os.listdir(path) if f.endswith(".npy")]) == 1
+
+    reloaded = SemanticCache(path=path)
+    assert len(reloaded) == 2
+    assert reloaded.get(SCOPE, "What is gRPC?").response == "gRPC"
+
+    (tmp_path / "semantic" / "entries.json").write_text("{")
+    with pytest.raises(ValueError, match="Corrupt"):
+        SemanticCache(path=path)
+
+
+def test_custom_embedder_and_invalid_arguments():
+    """Test a pluggable embedder and argument validation."""
+    def embedder(texts):
+        return [[1.0, float(len(text))] for text in texts]
+
+    cache = SemanticCache(embedder=embedder, threshold=0.999)
+    cache.set(SCOPE, "abc", "short")
+    assert cache.get(SCOPE, "xyz").response == "short"
+    assert cache.get(SCOPE, "a much longer prompt") is None
+
+    with pytest.raises(ValueError):
+        SemanticCache(threshold=1.5)
+    with pytest.raises(ValueError):
+        SemanticCache(max_entries=0)
+    with pytest.raises(ValueError, match="one vector per text"):
+        SemanticCache(embedder=lambda texts: [[1.0]]).embed(["a", "b"])
+
+
+def test_agent_answers_rephrased_prompts_from_the_cache():
+    """Test that Agent returns a stored answer for a similar prompt."""
+    cache = SemanticCache()
+    kwargs = dict(
+        agent_name="test_agent",
+        model="gpt-4",
+        provider="openai",
+        api_key="test_key",
+        custom_system_prompt="Test prompt",
+        semantic_cache=cache,
+    )
+
+    with patch("oju.providers.call_openai", return_value="REST answer") as mock_call:
+        first = agent.Agent(prompt_input="What is a REST API?", **kwargs)
+        result = agent.Agent(
+            prompt_input="what is a REST API exactly", return_result=True, **kwargs
+        )
+        agent.Agent(prompt_input="How do I bake bread?", **kwargs)
+        agent.Agent(
+            prompt_input="What is a REST API?", model="gpt-3.5-turbo",
+            **{k: v for k, v in kwargs.items() if k != "model"}
+        )
+
+    assert first == result.text == "REST answer" and result.cache_hit
+    assert mock_call.call_count == 3
+    assert (cache.stats.hits, cache.stats.writes) == (1, 3)
@@ -0,0 +1,135 @@
+"""Tests for the streaming module."""
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+
+from oju.streaming import (
+    AsyncTextStream,
+    StreamSummary,
+    TextStream,
+    aiter_deltas,
+    iter_deltas,
+)
+
+
+def parse_chunk(chunk, summary):
+    """Treat None as a finish marker and everything else as text."""
+    if chunk is None:
+        summary.finish_reason = "stop"
+        return None
+    return chunk
+
+
+def test_text_stream_yields_deltas_and_summary():
+    """Test that deltas are yielded in order and the summary is filled in."""
+    summary = StreamSummary()
+    close = MagicMock()
+    stream = TextStream(
+        iter_deltas(["Hel", "", "lo", None], parse_chunk, summary, close), summary
+    )
+
+    assert list(stream) == ["Hel", "lo"]
+    assert stream.done
+    assert stream.summary.finish_reason == "stop"
+    close.assert_called_once()
+
+
+def test_text_stream_read():
+    """Test reading the rest of a stream as one string."""
+    summary = StreamSummary()
+    stream = TextStream(
+        iter_deltas(["a", "b", "c"], parse_chunk, summary, MagicMock()), summary
+    )
+
+    assert next(stream) == "a"
+    assert stream.read() == "bc"
+
+
+def test_text_stream_early_close():
+    """Test that closing mid-stream closes the SDK stream and stops iteration."""
+    summary = StreamSummary()
+    sdk_close = MagicMock()
+    stream = TextStream(
+        iter_deltas(iter(["a", "b", "c"]), parse_chunk, summary, sdk_close),
+        summary,
+        on_close=sdk_close,
+    )
+
+    with stream:
+        assert next(stream) == "a"
+
+    assert sdk_close.called
+    assert list(stream) == []
+    assert not stream.summary.finish_reason
+
+
+def test_text_stream_close_before_iterating():
+    """Test that an unstarted stream still closes the SDK stream."""
+    summary = StreamSummary()
+    sdk_close = MagicMock()
+    stream = TextStream(
+        iter_deltas(["a"], parse_chunk, summary, MagicMock()),
+        summary,
+        on_close=sdk_close,
+    )
+
+    stream.close()
+
+    sdk_close.assert_called_once()
+
+
+def test_iter_deltas_translates_errors():
+    """Test that SDK errors raised mid-stream are translated."""
+    class SDKError(Exception):
+        pass
+
+    def chunks():
+        yield "a"
+        raise SDKError("connection reset")
+
+    close = MagicMock()
+    deltas = iter_deltas(
+        chunks(), parse_chunk, StreamSummary(), close, (SDKError,),
+        lambda e: Exception(f"Translated: {e}")
+    )
+
+    assert next(deltas) == "a"
+    with pytest.raises(Exception) as excinfo:
+        next(deltas)
+    assert "Translated: connection reset" in str(excinfo.value)
+    close.assert_called_once()
+
+
+def test_async_text_stream():
+    """Test async iteration, summary and early close."""
+    async def chunks():
+        for chunk in ("x", "y", None):
+            yield chunk
+
+    async def run():
+        summary = StreamSummary()
+        closed = []
+
+        async def close():
+            closed.append(True)
+
+        stream = AsyncTextStream(
+            aiter_deltas(chunks(), parse_chunk, summary, close), summary, on_close=close
+        )
+        deltas = [delta async for delta in stream]
+        assert stream.done
+        assert stream.summary.finish_reason == "stop"
+
+        early = AsyncTextStream(
+            aiter_deltas(chunks(), parse_chunk, StreamSummary(), close),
+            StreamSummary(),
+            on_close=close,
+        )
+        async with early:
+            assert await early.__anext__() == "x"
+        return deltas, closed
+
+    deltas, closed = asyncio.run(run())
+
+    assert deltas == ["x", "y"]
+    assert len(closed) >= 2
@@ -0,0 +1,141 @@
+"""Tests for the tokens module."""
+import pytest
+from unittest.mock import MagicMock, patch
+
+from oju import agent
+from oju.tokens import (
+    ContextLengthError,
+    TokenBudget,
+    count_tokens,
+    estimate_text_tokens,
+    model_limits,
+    preflight,
+)
+
+PROMPT = "You are a helpful assistant."
+
+
+def test_estimate_text_tokens():
+    """Test the heuristic for prose, code-like text and non-ASCII text."""
+    assert estimate_text_tokens("") == 0
+    assert estimate_text_tokens("Test input") == 3
+    # Punctuation-heavy text counts by pieces rather than characters
+    assert estimate_text_tokens("a(b);c[d];") == 8
+    assert estimate_text_tokens("こんにちは") == 6
+
+
+def test_model_limits_longest_prefix_wins():
+    """Test that the most specific model prefix is used."""
+    assert model_limits("openai", "gpt-4-0613").context_window == 8_192
+    assert model_limits("openai", "gpt-4o-mini").context_window == 128_000
+    assert model_limits("claude", "claude-3-5-sonnet").max_output_tokens == 8_192
+    assert model_limits("openai", "my-fine-tune") is None
+    assert model_limits("unknown", "gpt-4") is None
+
+
+def test_count_tokens_uses_tiktoken_for_openai():
+    """Test that an installed tokenizer is preferred for OpenAI models only."""
+    encoding = MagicMock()
+    encoding.encode.return_value = [1, 2, 3, 4, 5, 6, 7]
+    with patch("oju.tokens._openai_encoding", return_value=encoding):
+        assert count_tokens("Test input", "openai", "gpt-4") == 7
+        assert count_tokens("Test input", "claude", "claude-3") == 3
+    with patch("oju.tokens._openai_encoding", return_value=None):
+        assert count_tokens("Test input", "openai", "gpt-4") == 3
+
+
+def test_preflight_keeps_defaults_when_everything_fits():
+    """Test that small requests are sent unchanged."""
+    budget = preflight("openai", "gpt-4", PROMPT, "Test input")
+
+    assert budget.prompt_input == "Test input" and not budget.truncated
+    assert budget.max_tokens is None and budget.output_tokens == 2000
+    assert budget.total_tokens == budget.input_tokens + 2000
+
+    assert preflight("openai", "gpt-4", PROMPT, "Hi", max_tokens=50).max_tokens == 50
+    # Above the model's output limit
+    assert preflight("claude", "claude-3", PROMPT, "Hi", 10_000).max_tokens == 4_096
+
+
+def test_preflight_lowers_max_tokens_to_the_room_left():
+    """Test that the response limit shrinks when the input fills the window."""
+    prompt_input = "word " * 6_000
+    budget = preflight("openai", "gpt-4", PROMPT, prompt_input)
+
+    assert budget.max_tokens == 8_192 - budget.input_tokens
+    assert budget.total_tokens == 8_192
+
+
+def test_preflight_overflow_modes():
+    """Test rejecting, truncating and ignoring inputs that do not fit."""
+    prompt_input = "word " * 20_000
+
+    with pytest.raises(ContextLengthError) as excinfo:
+        preflight("openai", "gpt-4", PROMPT, prompt_input)
+    assert excinfo.value.context_window == 8_192
+    assert excinfo.value.input_tokens > 8_192
+    assert isinstance(excinfo.value, ValueError)
+
+    budget = preflight(
+        "openai", "gpt-4", PROMPT, prompt_input, max_tokens=500, on_overflow="truncate"
+    )
+    assert budget.truncated and prompt_input.startswith(budget.prompt_input)
+    assert budget.max_tokens == 500
+    assert budget.total_tokens <= 8_192
+    assert budget.input_tokens > 8_192 - 1_000
+
+    budget = preflight("openai", "gpt-4", PROMPT, prompt_input, on_overflow="ignore")
+    assert budget.prompt_input == prompt_input and budget.max_tokens is None
+
+    with pytest.raises(ValueError, match="Unsupported on_overflow"):
+        preflight("openai", "gpt-4", PROMPT, "Hi", on_overflow="drop")
+    with pytest.raises(ValueError, match="max_tokens"):
+        preflight("openai", "gpt-4", PROMPT, "Hi", max_tokens=0)
+
+
+def test_token_budget_is_resolved_once():
+    """Test that a reusable budget gives the same answers as preflight."""
+    with patch("oju.tokens.model_limits", wraps=model_limits) as mock_limits:
+        budget = TokenBudget("claude", "claude-3-5-sonnet", PROMPT, max_tokens=8_000)
+        checks = [budget.check(text) for text in ("Hi", "Test input", "word " * 10)]
+    assert mock_limits.call_count == 1
+    assert checks[1] == preflight(
+        "claude", "claude-3-5-sonnet", PROMPT, "Test input", max_tokens=8_000
+    )
+    assert checks[0].max_tokens == 8_000
+
+
+def test_preflight_skips_unknown_models():
+    """Test that models without known limits are not checked."""
+    budget = preflight("openai", "my-fine-tune", PROMPT, "word " * 20_000)
+    assert budget.max_tokens is None and not budget.truncated
+
+
+def test_agent_checks_the_budget_before_sending():
+    """Test that Agent rejects, truncates and sizes requests before the call."""
+    kwargs = dict(
+        agent_name="test_agent",
+        model="gpt-4",
+        provider="openai",
+        api_key="test_key",
+        custom_system_prompt=PROMPT,
+    )
+    long_input = "word " * 20_000
+
+    with patch("oju.providers.call_openai", return_value="ok") as mock_call:
+        with pytest.raises(ContextLengthError):
+            agent.Agent(prompt_input=long_input, **kwargs)
+        assert mock_call.call_count == 0
+
+        agent.Agent(prompt_input="Test input", **kwargs)
+        assert "max_tokens" not in mock_call.call_args.kwargs
+
+        agent.Agent(prompt_input="Test input", max_tokens=100, **kwargs)
+        assert mock_call.call_args.kwargs["max_tokens"] == 100
+
+        agent.Agent(prompt_input=long_input, on_overflow="truncate", **kwargs)
+        sent = mock_call.call_args.kwargs
+        # Trimmed far enough to keep the default room for the response
+        assert long_input.startswith(sent["prompt"])
+        assert len(sent["prompt"]) < len(long_input)
+        assert "max_tokens" not in sent
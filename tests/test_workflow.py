@@ -0,0 +1,239 @@
+"""Tests for the workflow module."""
+import asyncio
+import threading
+import time
+import pytest
+from unittest.mock import Mock, patch
+
+from oju.workflow import Node, Workflow
+
+DEFAULTS = {"model": "gpt-4", "provider": "openai", "api_key": "test_key"}
+
+
+def _diamond(**kwargs):
+    return Workflow([
+        Node("research", "research_agent", "Research {input}"),
+        Node("summary", "summarizer_agent", "Summarize: {research}", ["research"]),
+        Node("critique", "critic_agent", "Criticize: {research}", ["research"]),
+        Node("report", "writer_agent", "{summary}\n---\n{critique}",
+             ["summary", "critique"]),
+    ], **DEFAULTS, **kwargs)
+
+
+def _answer(prompt_input, **kwargs):
+    return f"<{prompt_input}>"
+
+
+def test_outputs_feed_downstream_prompts(fake_sessions):
+    """Test that node outputs are formatted into dependent prompts."""
+    mock_agent = Mock(side_effect=_answer)
+    with fake_sessions(mock_agent):
+        result = _diamond().run("caching", base_url="http://proxy")
+
+    assert result.ok
+    assert result["research"] == "<Research caching>"
+    assert result["report"] == (
+        "<<Summarize: <Research caching>>\n---\n<Criticize: <Research caching>>>"
+    )
+    assert mock_agent.call_count == 4
+    call = mock_agent.call_args_list[0].kwargs
+    assert (call["agent_name"], call["model"], call["base_url"]) == (
+        "research_agent", "gpt-4", "http://proxy"
+    )
+
+
+def test_independent_branches_run_concurrently(fake_sessions):
+    """Test that nodes whose dependencies are done run at the same time."""
+    barrier = threading.Barrier(2, timeout=2)
+
+    def answer(prompt_input, agent_name, **kwargs):
+        if agent_name in ("summarizer_agent", "critic_agent"):
+            # Only returns if both branches are in flight together
+            barrier.wait()
+        return agent_name
+
+    with fake_sessions(answer):
+        result = _diamond().run("caching")
+
+    assert result.ok and result["report"] == "writer_agent"
+
+
+def test_critical_path_timing(fake_sessions):
+    """Test per-node timings and the critical path through the slow branch."""
+    delays = {"research_agent": 0.02, "summarizer_agent": 0.15, "critic_agent": 0.0}
+
+    def answer(prompt_input, agent_name, **kwargs):
+        time.sleep(delays.get(agent_name, 0.0))
+        return agent_name
+
+    with fake_sessions(answer):
+        result = _diamond().run("caching")
+
+    assert result.critical_path == ["research", "summary", "report"]
+    nodes = result.nodes
+    assert list(nodes) == ["research", "summary", "critique", "report"]
+    assert nodes["summary"].duration >= 0.15
+    assert nodes["summary"].started >= nodes["research"].duration
+    chain = ("research", "summary", "report")
+    assert nodes["report"].critical_path == pytest.approx(
+        sum(nodes[name].duration for name in chain)
+    )
+    assert result.critical_path_time <= result.elapsed
+
+
+def test_memoized_nodes_are_not_called_again(fake_sessions):
+    """Test that reruns reuse outputs and only call nodes whose prompt changed."""
+    workflow = Workflow([
+        Node("glossary", "glossary_agent", "List backend terms"),
+        Node("answer", "answer_agent", "{glossary}\n{input}", ["glossary"]),
+    ], **DEFAULTS)
+
+    mock_agent = Mock(side_effect=_answer)
+    with fake_sessions(mock_agent):
+        workflow.run("What is REST?")
+        again = workflow.run("What is REST?")
+        assert mock_agent.call_count == 2
+        assert again.nodes["answer"].memoized and again.nodes["answer"].duration == 0
+
+        changed = workflow.run("What is gRPC?")
+        assert mock_agent.call_count == 3
+        assert changed.nodes["glossary"].memoized
+        assert not changed.nodes["answer"].memoized
+
+        workflow.run("What is gRPC?", base_url="http://proxy")
+        assert mock_agent.call_count == 5
+
+        workflow.clear_memo()
+        workflow.run("What is gRPC?")
+        assert mock_agent.call_count == 7
+
+
+def test_memo_keys_cover_the_system_prompt_and_list_parameters(fake_sessions):
+    """Test that prompt file edits and list-valued parameters are not collapsed."""
+    workflow = Workflow([Node("answer", "answer_agent")], **DEFAULTS)
+
+    mock_agent = Mock(side_effect=_answer)
+    with fake_sessions(mock_agent), patch("oju.agent.prompt_cache") as prompts:
+        prompts.get.return_value = "Answer briefly"
+        workflow.run("What is REST?")
+        assert workflow.run("What is REST?").nodes["answer"].memoized
+        assert mock_agent.call_count == 1
+
+        prompts.get.return_value = "Answer in detail"
+        assert not workflow.run("What is REST?").nodes["answer"].memoized
+        assert mock_agent.call_count == 2
+
+        workflow.run("What is REST?", stop=["\n"])
+        workflow.run("What is REST?", stop=["."])
+        assert workflow.run("What is REST?", stop=["."]).nodes["answer"].memoized
+        assert mock_agent.call_count == 4
+
+        # Parameters without a stable encoding are not memoized
+        workflow.run("What is REST?", stop=[object()])
+        workflow.run("What is REST?", stop=[object()])
+        assert mock_agent.call_count == 6
+
+
+def test_nodes_reuse_their_session_across_runs(fake_sessions):
+    """Test that each node setup gets one session, shared by later runs."""
+    workflow = Workflow([
+        Node("draft", "writer_agent", custom_system_prompt="Write"),
+        Node("review", "critic_agent", "{draft}", ["draft"],
+             custom_system_prompt="Review"),
+    ], memoize=False, **DEFAULTS)
+
+    with fake_sessions(_answer) as session_class:
+        for question in ("REST", "gRPC", "GraphQL"):
+            assert workflow.run(question).ok
+        assert session_class.call_count == 2
+
+        workflow.run("REST", base_url="http://proxy")
+        assert session_class.call_count == 4
+
+
+def test_failures_skip_dependents_only(fake_sessions):
+    """Test that a failing node skips its dependents while other branches finish."""
+    def answer(prompt_input, agent_name, **kwargs):
+        if agent_name == "critic_agent":
+            raise Exception("upstream error")
+        return agent_name
+
+    mock_agent = Mock(side_effect=answer)
+    with fake_sessions(mock_agent):
+        workflow = _diamond()
+        result = workflow.run("caching")
+
+    assert not result.ok
+    assert result["summary"] == "summarizer_agent"
+    assert result.outputs == {
+        "research": "research_agent", "summary": "summarizer_agent"
+    }
+    assert result.nodes["report"].skipped
+    with pytest.raises(Exception, match="Skipped because node 'critique' failed"):
+        result["report"]
+    assert mock_agent.call_count == 3
+
+    # Completed nodes are memoized, so a rerun retries only the failed part
+    mock_agent = Mock(side_effect=_answer)
+    with fake_sessions(mock_agent):
+        assert workflow.run("caching").ok
+    assert mock_agent.call_count == 2
+
+
+def test_callable_prompts_and_node_settings(fake_sessions):
+    """Test callable prompts and per-node provider settings."""
+    workflow = Workflow([
+        Node("draft", "writer_agent", lambda values: values["input"].upper()),
+        Node("review", "critic_agent", lambda values: f"Review {values['draft']}",
+             ["draft"], model="claude-3", provider="claude", api_key="other_key",
+             agent_kwargs={"base_url": "http://proxy"}),
+    ], **DEFAULTS)
+
+    mock_agent = Mock(side_effect=_answer)
+    with fake_sessions(mock_agent):
+        result = workflow.run("text")
+
+    assert result["review"] == "<Review <TEXT>>"
+    call = mock_agent.call_args_list[1].kwargs
+    assert (call["provider"], call["model"], call["api_key"], call["base_url"]) == (
+        "claude", "claude-3", "other_key", "http://proxy"
+    )
+
+
+def test_invalid_graphs():
+    """Test validation of the graph when the workflow is created."""
+    cases = [
+        ([Node("a", "x"), Node("a", "x")], "Duplicate"),
+        ([Node("a", "x", depends_on=["b"])], "unknown node 'b'"),
+        ([Node("a", "x", "{b}", ["b"]), Node("b", "x", "{a}", ["a"])], "cycle: a, b"),
+        ([Node("a", "x", "{missing}")], "refers to '{missing}'"),
+        ([Node("input", "x")], "reserved"),
+        ([Node("a", "x", agent_kwargs={"stream": True})], "stream"),
+    ]
+    for nodes, message in cases:
+        with pytest.raises(ValueError, match=message):
+            Workflow(nodes, **DEFAULTS)
+    with pytest.raises(ValueError, match="has no model"):
+        Workflow([Node("a", "x")], provider="openai", api_key="test_key")
+    with pytest.raises(ValueError, match="stream"):
+        Workflow([Node("a", "x")], **DEFAULTS).run("hi", stream=True)
+
+
+def test_async_run(fake_sessions):
+    """Test the asyncio executor with concurrent branches."""
+    async def answer(prompt_input, agent_name, **kwargs):
+        await asyncio.sleep(0.1 if agent_name != "writer_agent" else 0)
+        return f"<{prompt_input}>"
+
+    mock_agent = Mock(side_effect=answer)
+    with fake_sessions(mock_agent):
+        result = asyncio.run(_diamond().arun("caching"))
+
+    assert result["report"] == (
+        "<<Summarize: <Research caching>>\n---\n<Criticize: <Research caching>>>"
+    )
+    assert mock_agent.call_count == 4
+    # The two branches overlapped, so the run took about three steps, not four
+    assert result.elapsed < 0.38
+    assert result.critical_path[0] == "research"
+    assert result.critical_path[-1] == "report"